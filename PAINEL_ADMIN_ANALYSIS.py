@@ -0,0 +1,786 @@
+# backend/app/analysis.py
+# Pipeline assíncrono de análise IA dos leads:
+# fila (analise_jobs) -> cache por descrição -> analisador em lotes -> gravação -> notificação
+#
+# Uso:
+#   python -m app.analysis                                 # worker em processo dedicado
+#   ANALYZER=app.ia_openai:OpenAIAnalyzer python -m app.analysis
+#
+# Normalmente sobe junto com os demais workers (lifespan da API ou
+# python -m app.workers, ver workers.py). Em processo dedicado os eventos
+# "lead_analisado" chegam ao painel via pg_notify (realtime.PgEventBridge).
+
+import hashlib
+import importlib
+import logging
+import os
+import random
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import bindparam, delete, func, insert, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from .geo import add_geo_delta, apply_geo_deltas_sync, geo_key
+from .matching import normalize
+from .models import AnaliseCache, AnaliseJob, Lead, gen_uuid
+from .stats import apply_lead_counter_deltas_sync
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# CONFIGURAÇÕES
+# ============================================================================
+
+ANALYSIS_ENABLED = os.getenv("ANALYSIS_ENABLED", "true").lower() == "true"
+ANALYZER = os.getenv("ANALYZER", "")  # "modulo:Classe"; vazio = RuleBasedAnalyzer
+
+ANALYSIS_BATCH_SIZE = int(os.getenv("ANALYSIS_BATCH_SIZE", 100))  # jobs reivindicados por ciclo
+ANALYZER_BATCH_SIZE = int(os.getenv("ANALYZER_BATCH_SIZE", 20))  # descrições por chamada ao analisador
+ANALYSIS_CONCURRENCY = int(os.getenv("ANALYSIS_CONCURRENCY", 4))  # chamadas simultâneas ao analisador
+ANALYSIS_POLL_SECONDS = float(os.getenv("ANALYSIS_POLL_SECONDS", 2))
+ANALYSIS_LEASE_SECONDS = int(os.getenv("ANALYSIS_LEASE_SECONDS", 300))
+ANALYSIS_MAX_ATTEMPTS = int(os.getenv("ANALYSIS_MAX_ATTEMPTS", 5))
+ANALYSIS_BACKOFF_BASE = float(os.getenv("ANALYSIS_BACKOFF_BASE", 30))  # segundos
+ANALYSIS_BACKOFF_MAX = float(os.getenv("ANALYSIS_BACKOFF_MAX", 3600))
+ANALYSIS_CACHE_SIZE = int(os.getenv("ANALYSIS_CACHE_SIZE", 10000))  # entradas do LRU em memória
+ANALYSIS_RETENTION_DAYS = int(os.getenv("ANALYSIS_RETENTION_DAYS", 7))  # jobs concluídos
+ANALYSIS_PURGE_SECONDS = int(os.getenv("ANALYSIS_PURGE_SECONDS", 3600))
+ANALYSIS_PURGE_BATCH = int(os.getenv("ANALYSIS_PURGE_BATCH", 5000))
+
+# Abaixo desta confiança a área e a urgência informadas pelo cliente são mantidas
+ANALYSIS_MIN_CONFIDENCE = float(os.getenv("ANALYSIS_MIN_CONFIDENCE", 0.6))
+
+URGENCIAS = ("baixa", "media", "alta", "urgente")
+
+# Amostras recentes usadas nos percentis de latência por estágio
+STAGE_SAMPLES = 1000
+
+# Snapshot de um job reivindicado: não depende da sessão, seguro entre threads
+_Job = namedtuple("_Job", "id lead_id descricao tentativas criado_em")
+
+
+# ============================================================================
+# ENFILEIRAMENTO (usado pelos endpoints e pela importação em lote)
+# ============================================================================
+
+def enqueue_analysis(db, lead_id: str) -> Optional[AnaliseJob]:
+    """
+    Registra o lead na fila de análise (Session ou AsyncSession).
+    O commit fica a cargo do chamador, junto com a criação do lead.
+    """
+    if not ANALYSIS_ENABLED:
+        return None
+    job = AnaliseJob(lead_id=lead_id)
+    db.add(job)
+    return job
+
+async def enqueue_analysis_many(db: AsyncSession, lead_ids: Iterable[str]):
+    """Enfileira vários leads com um único executemany (importação em lote)"""
+    rows = [{"id": gen_uuid(), "lead_id": lead_id} for lead_id in lead_ids]
+    if ANALYSIS_ENABLED and rows:
+        await db.execute(insert(AnaliseJob), rows)
+
+async def analysis_status_counts(db: AsyncSession) -> dict:
+    """Quantidade de jobs por status (uma query agregada)"""
+    result = await db.execute(
+        select(AnaliseJob.status, func.count(AnaliseJob.id)).group_by(AnaliseJob.status)
+    )
+    return {status: total for status, total in result.all()}
+
+
+# ============================================================================
+# CHAVE DO CACHE
+# ============================================================================
+
+def normalize_descricao(descricao: Optional[str]) -> str:
+    """Sem acentos, minúsculo, sem pontuação e com espaços colapsados"""
+    return " ".join(re.sub(r"[^\w]+", " ", normalize(descricao)).split())
+
+def descricao_hash(analisador: str, descricao: Optional[str]) -> str:
+    """
+    Chave do cache: o nome do analisador entra no hash para que trocar
+    de analisador (ou de versão) não reaproveite resultados antigos.
+    """
+    return hashlib.sha256(f"{analisador}\0{normalize_descricao(descricao)}".encode()).hexdigest()
+
+
+# ============================================================================
+# ANALISADORES
+# ============================================================================
+
+class LeadAnalyzer(ABC):
+    """
+    Interface dos analisadores. Recebe um lote de descrições e devolve um
+    resultado por descrição, na mesma ordem, no formato analiseIA de
+    API_INTEGRATION.md (categoria, areaDireito, urgencia, scoreConfianca,
+    documentosNecessarios, recomendacoes, ...).
+    Uma exceção falha o lote inteiro (os jobs voltam para a fila com backoff).
+    O resultado deve depender só da descrição: ele é cacheado por ela.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def analyze_batch(self, descricoes: List[str]) -> List[dict]:
+        ...
+
+
+# area, categoria, termos (texto normalizado), documentos, recomendações
+REGRAS = (
+    ("Trabalho", "Rescisão Contratual",
+     ("demiti", "demiss", "rescis", "justa causa", "aviso previo", "verbas", "fgts"),
+     ["Contrato de trabalho / CTPS", "Comprovante de demissão", "Contracheques dos últimos 3 meses", "Extrato do FGTS"],
+     ["Coletar a documentação da demissão", "Calcular verbas devidas (13º, férias, aviso prévio)"]),
+    ("Trabalho", "Horas Extras",
+     ("hora extra", "horas extras", "jornada", "banco de horas", "adicional noturno"),
+     ["Cartões de ponto", "Contracheques", "Escalas de trabalho"],
+     ["Levantar a jornada efetivamente cumprida", "Identificar testemunhas"]),
+    ("Família", "Divórcio",
+     ("divorci", "separacao", "separar", "partilha", "uniao estavel"),
+     ["Certidão de casamento", "Documentos dos bens", "Certidão de nascimento dos filhos"],
+     ["Verificar possibilidade de divórcio consensual", "Relacionar bens a partilhar"]),
+    ("Família", "Pensão Alimentícia",
+     ("pensao", "alimentos", "alimenticia"),
+     ["Certidão de nascimento", "Comprovantes de despesas do alimentando", "Comprovantes de renda"],
+     ["Levantar despesas mensais do alimentando", "Verificar renda do alimentante"]),
+    ("Família", "Guarda e Visitas",
+     ("guarda", "visita", "convivencia"),
+     ["Certidão de nascimento", "Comprovante de residência"],
+     ["Avaliar guarda compartilhada", "Registrar o histórico de convivência"]),
+    ("Consumidor", "Cobrança Indevida",
+     ("cobranca indevida", "negativ", "serasa", "spc", "cobrado"),
+     ["Faturas e boletos", "Comprovante de negativação", "Protocolos de atendimento"],
+     ["Reunir protocolos de reclamação", "Avaliar pedido de dano moral"]),
+    ("Consumidor", "Produto ou Serviço com Defeito",
+     ("defeito", "garantia", "produto", "procon", "troca", "reembolso"),
+     ["Nota fiscal", "Fotos do defeito", "Protocolos de atendimento"],
+     ["Registrar reclamação formal no fornecedor", "Observar prazos do CDC"]),
+    ("Previdenciário", "Aposentadoria",
+     ("aposentad", "tempo de contribuicao", "cnis"),
+     ["Extrato do CNIS", "CTPS", "Carnês de contribuição"],
+     ["Simular regras de transição", "Conferir vínculos no CNIS"]),
+    ("Previdenciário", "Benefício por Incapacidade",
+     ("auxilio", "inss", "pericia", "afastad", "bpc", "loas"),
+     ["Laudos e atestados médicos", "Comunicação de decisão do INSS", "Extrato do CNIS"],
+     ["Reunir laudos atualizados", "Verificar prazo de recurso administrativo"]),
+    ("Criminal", "Defesa Criminal",
+     ("preso", "prisao", "flagrante", "delegacia", "inquerito", "boletim de ocorrencia", "denuncia"),
+     ["Boletim de ocorrência", "Cópia do inquérito ou processo", "Documentos pessoais"],
+     ["Obter cópia integral dos autos", "Avaliar pedido de liberdade"]),
+    ("Cível", "Indenização",
+     ("indeniz", "dano moral", "danos materiais", "acidente"),
+     ["Comprovantes do dano", "Fotos e testemunhas", "Orçamentos"],
+     ["Quantificar os danos", "Reunir provas do nexo causal"]),
+    ("Cível", "Contratos e Locação",
+     ("contrato", "aluguel", "despejo", "locacao", "inquilino"),
+     ["Contrato", "Comprovantes de pagamento", "Notificações trocadas"],
+     ["Analisar cláusulas de multa e rescisão", "Notificar a outra parte formalmente"]),
+    ("Tributário", "Débitos Fiscais",
+     ("imposto", "receita federal", "tribut", "icms", "divida ativa", "execucao fiscal"),
+     ["Notificações do fisco", "Certidões de débito", "Declarações entregues"],
+     ["Verificar prescrição e decadência", "Avaliar parcelamento ou defesa"]),
+)
+
+# Termos que elevam a urgência (texto normalizado), do mais grave ao menos grave
+TERMOS_URGENCIA = (
+    ("urgente", ("preso", "prisao", "flagrante", "liminar", "despejo", "amanha", "hoje")),
+    ("alta", ("prazo", "audiencia", "urgente", "intimacao", "citacao", "bloqueio", "penhora")),
+)
+
+
+class RuleBasedAnalyzer(LeadAnalyzer):
+    """
+    Classificador local por palavras-chave. Serve de analisador padrão
+    (desenvolvimento, testes, fallback sem API externa): a categoria com mais
+    termos encontrados vence e a confiança cresce com o número de termos.
+    """
+
+    name = "regras-v1"
+
+    def analyze_one(self, descricao: str) -> dict:
+        texto = f" {normalize_descricao(descricao)} "
+        melhor, encontrados = None, []
+        for regra in REGRAS:
+            termos = [termo for termo in regra[2] if termo in texto]
+            if len(termos) > len(encontrados):
+                melhor, encontrados = regra, termos
+
+        urgencia = "media"
+        for nivel, termos in TERMOS_URGENCIA:
+            if any(f" {termo}" in texto for termo in termos):
+                urgencia = nivel
+                break
+
+        if melhor is None:
+            return {
+                "categoria": None,
+                "areaDireito": None,
+                "urgencia": urgencia,
+                "scoreConfianca": 0.2,
+                "documentosNecessarios": ["Documentos pessoais"],
+                "recomendacoes": ["Agendar conversa inicial para entender o caso"],
+                "palavrasChave": [],
+            }
+
+        area, categoria, _, documentos, recomendacoes = melhor
+        return {
+            "categoria": categoria,
+            "areaDireito": area,
+            "urgencia": urgencia,
+            "scoreConfianca": round(min(0.95, 0.5 + 0.15 * len(encontrados)), 2),
+            "documentosNecessarios": list(documentos),
+            "recomendacoes": list(recomendacoes),
+            "palavrasChave": encontrados,
+        }
+
+    def analyze_batch(self, descricoes: List[str]) -> List[dict]:
+        return [self.analyze_one(descricao) for descricao in descricoes]
+
+
+def load_analyzer(spec: str = ANALYZER) -> LeadAnalyzer:
+    """Instancia o analisador configurado em ANALYZER ("modulo:Classe")"""
+    if not spec:
+        return RuleBasedAnalyzer()
+    module_name, _, class_name = spec.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+def _clean_result(resultado) -> dict:
+    """Valida o que veio do analisador (analisadores externos não são confiáveis)"""
+    if not isinstance(resultado, dict):
+        raise ValueError(f"Resultado inválido: {type(resultado).__name__}")
+    resultado = dict(resultado)
+    if resultado.get("urgencia") not in URGENCIAS:
+        resultado["urgencia"] = None
+    try:
+        resultado["scoreConfianca"] = max(0.0, min(1.0, float(resultado.get("scoreConfianca") or 0)))
+    except (TypeError, ValueError):
+        resultado["scoreConfianca"] = 0.0
+    return resultado
+
+
+# ============================================================================
+# CACHE DE RESULTADOS
+# ============================================================================
+
+class AnalysisCache:
+    """
+    LRU em memória na frente da tabela analise_cache.
+    A tabela é compartilhada entre workers e sobrevive a reinícios;
+    o LRU evita ida ao banco para descrições repetidas no mesmo processo.
+    """
+
+    def __init__(self, max_size: int = ANALYSIS_CACHE_SIZE):
+        self.max_size = max_size
+        self._items: "OrderedDict[str, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def _remember(self, key: str, resultado: dict):
+        self._items[key] = resultado
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def get_many(self, db: Session, keys: Iterable[str]) -> Dict[str, dict]:
+        keys = set(keys)
+        encontrados = {}
+        with self._lock:
+            for key in keys:
+                resultado = self._items.get(key)
+                if resultado is not None:
+                    self._items.move_to_end(key)
+                    encontrados[key] = resultado
+            self.memory_hits += len(encontrados)
+
+        faltando = keys - encontrados.keys()
+        if faltando:
+            rows = db.execute(
+                select(AnaliseCache.hash, AnaliseCache.resultado).where(AnaliseCache.hash.in_(faltando))
+            ).all()
+            with self._lock:
+                for key, resultado in rows:
+                    encontrados[key] = resultado
+                    self._remember(key, resultado)
+                self.db_hits += len(rows)
+                self.misses += len(faltando) - len(rows)
+
+        if encontrados:
+            db.execute(
+                update(AnaliseCache)
+                .where(AnaliseCache.hash.in_(encontrados.keys()))
+                .values(hits=AnaliseCache.hits + 1)
+            )
+        return encontrados
+
+    def put_many(self, db: Session, analisador: str, resultados: Dict[str, dict]):
+        """Grava na mesma transação dos leads; outro worker pode ter gravado antes (DO NOTHING)"""
+        if not resultados:
+            return
+        dialect = sqlite if db.get_bind().dialect.name == "sqlite" else postgresql
+        db.execute(
+            dialect.insert(AnaliseCache).on_conflict_do_nothing(index_elements=[AnaliseCache.hash]),
+            [{"hash": key, "analisador": analisador, "resultado": resultado, "hits": 0}
+             for key, resultado in resultados.items()],
+        )
+        with self._lock:
+            for key, resultado in resultados.items():
+                self._remember(key, resultado)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            consultas = self.memory_hits + self.db_hits + self.misses
+            return {
+                "size": len(self._items),
+                "memory_hits": self.memory_hits,
+                "db_hits": self.db_hits,
+                "misses": self.misses,
+                "hit_ratio": round((self.memory_hits + self.db_hits) / consultas, 3) if consultas else 0,
+            }
+
+
+# ============================================================================
+# MÉTRICAS POR ESTÁGIO
+# ============================================================================
+
+class StageStats:
+    """Latência por estágio do pipeline (contagem, média, p50/p95 das amostras recentes, máximo)"""
+
+    STAGES = ("claim", "cache", "analyze", "write", "notify", "batch", "queue")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = {stage: deque(maxlen=STAGE_SAMPLES) for stage in self.STAGES}
+        self._count = dict.fromkeys(self.STAGES, 0)
+        self._total_ms = dict.fromkeys(self.STAGES, 0.0)
+        self._max_ms = dict.fromkeys(self.STAGES, 0.0)
+
+    def record(self, stage: str, ms: float):
+        with self._lock:
+            self._samples[stage].append(ms)
+            self._count[stage] += 1
+            self._total_ms[stage] += ms
+            self._max_ms[stage] = max(self._max_ms[stage], ms)
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - started) * 1000)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            result = {}
+            for stage in self.STAGES:
+                count = self._count[stage]
+                if not count:
+                    continue
+                samples = sorted(self._samples[stage])
+                result[stage] = {
+                    "count": count,
+                    "avg_ms": round(self._total_ms[stage] / count, 2),
+                    "p50_ms": round(samples[len(samples) // 2], 2),
+                    "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 2),
+                    "max_ms": round(self._max_ms[stage], 2),
+                }
+            return result
+
+
+# Compartilhadas pelos workers do processo (expostas em /auth/metrics)
+analysis_cache = AnalysisCache()
+analysis_stats = StageStats()
+
+
+# ============================================================================
+# WORKER
+# ============================================================================
+
+def backoff_delay(tentativas: int) -> float:
+    """Backoff exponencial com jitter: base * 2^(n-1), limitado a ANALYSIS_BACKOFF_MAX"""
+    delay = min(ANALYSIS_BACKOFF_BASE * (2 ** max(tentativas - 1, 0)), ANALYSIS_BACKOFF_MAX)
+    return delay * random.uniform(0.5, 1.5)
+
+
+class AnalysisWorker:
+    """
+    Consome a fila de análise em lotes:
+    1. reivindica até `batch_size` jobs com FOR UPDATE SKIP LOCKED e lease
+       (vários workers podem rodar em paralelo);
+    2. resolve pelo cache as descrições já analisadas;
+    3. agrupa as descrições restantes (sem repetição) em chamadas de até
+       `analyzer_batch_size` e executa no máximo `concurrency` chamadas ao
+       mesmo tempo;
+    4. grava analise_ia, area_direito e urgencia (com os contadores do
+       dashboard) e o cache, em uma transação;
+    5. notifica cada lead analisado via `notifier(advogado_id, lead_id, evento)`.
+    """
+
+    def __init__(self, session_factory, analyzer: Optional[LeadAnalyzer] = None,
+                 notifier: Optional[Callable[[str, str, dict], None]] = None,
+                 batch_size: int = ANALYSIS_BATCH_SIZE, analyzer_batch_size: int = ANALYZER_BATCH_SIZE,
+                 concurrency: int = ANALYSIS_CONCURRENCY, poll_interval: float = ANALYSIS_POLL_SECONDS,
+                 cache: Optional[AnalysisCache] = None, stats: Optional[StageStats] = None):
+        self.session_factory = session_factory
+        self.analyzer = analyzer or load_analyzer()
+        self.notifier = notifier
+        self.batch_size = batch_size
+        self.analyzer_batch_size = max(1, analyzer_batch_size)
+        self.poll_interval = poll_interval
+        self.cache = cache or analysis_cache
+        self.stats = stats or analysis_stats
+        self._executor = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="analysis")
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._analyzed = 0
+        self._cached = 0
+        self._retried = 0
+        self._failed = 0
+        self._analyzer_calls = 0
+        self._notified = 0
+        self._batches = 0
+        self._purged = 0
+        self._last_purge = 0.0
+
+    # --- ciclo -------------------------------------------------------------
+
+    def _claim(self, db: Session) -> List[_Job]:
+        """
+        Reivindica o lote contando a tentativa: um job que derruba o worker
+        volta pelo lease expirado ("analisando") e esgota ANALYSIS_MAX_ATTEMPTS
+        em vez de ser reprocessado para sempre
+        """
+        agora = datetime.utcnow()
+        jobs = db.query(AnaliseJob).filter(
+            or_(AnaliseJob.status == "pendente", AnaliseJob.status == "analisando"),
+            AnaliseJob.proxima_tentativa <= agora
+        ).order_by(
+            AnaliseJob.proxima_tentativa
+        ).limit(self.batch_size).with_for_update(skip_locked=True).all()
+        if not jobs:
+            db.commit()
+            return []
+
+        descricoes = dict(db.execute(
+            select(Lead.id, Lead.descricao_caso).where(Lead.id.in_({job.lead_id for job in jobs}))
+        ).all())
+
+        lease = agora + timedelta(seconds=ANALYSIS_LEASE_SECONDS)
+        claimed = []
+        mortos = 0
+        for job in jobs:
+            if job.lead_id not in descricoes:
+                job.status = "falhou"
+                job.ultimo_erro = "Lead removido"
+                job.concluido_em = agora
+                continue
+            if job.tentativas >= ANALYSIS_MAX_ATTEMPTS:
+                job.status = "falhou"
+                job.ultimo_erro = "Lease expirado na última tentativa (worker interrompido durante a análise)"
+                job.concluido_em = agora
+                mortos += 1
+                logger.error("Análise do lead %s descartada após %s tentativas: lease expirado",
+                             job.lead_id, job.tentativas)
+                continue
+            job.status = "analisando"
+            job.tentativas += 1
+            job.proxima_tentativa = lease
+            claimed.append(_Job(job.id, job.lead_id, descricoes[job.lead_id], job.tentativas, job.criado_em))
+        db.commit()
+        if mortos:
+            with self._lock:
+                self._failed += mortos
+        return claimed
+
+    def _call_analyzer(self, chunk: List[Tuple[str, str]]) -> Dict[str, dict]:
+        resultados = self.analyzer.analyze_batch([descricao for _, descricao in chunk])
+        if len(resultados) != len(chunk):
+            raise ValueError(f"Analisador devolveu {len(resultados)} resultados para {len(chunk)} descrições")
+        return {key: _clean_result(resultado) for (key, _), resultado in zip(chunk, resultados)}
+
+    def _analyze(self, pendentes: Dict[str, str]) -> Tuple[Dict[str, dict], Dict[str, str]]:
+        """Executa as chamadas em paralelo (limitado pelo executor); retorna (resultados, erros) por hash"""
+        items = list(pendentes.items())
+        chunks = [items[i:i + self.analyzer_batch_size] for i in range(0, len(items), self.analyzer_batch_size)]
+        futures = [(chunk, self._executor.submit(self._call_analyzer, chunk)) for chunk in chunks]
+
+        resultados, erros = {}, {}
+        for chunk, future in futures:
+            try:
+                resultados.update(future.result())
+            except Exception as e:
+                erro = f"{type(e).__name__}: {e}"[:1000]
+                logger.warning("Falha no analisador %s: %s", self.analyzer.name, erro)
+                erros.update((key, erro) for key, _ in chunk)
+        with self._lock:
+            self._analyzer_calls += len(chunks)
+        return resultados, erros
+
+    def _write(self, db: Session, jobs: List[_Job], chaves: Dict[str, str],
+               resultados: Dict[str, dict], erros: Dict[str, str], cacheados: set) -> list:
+        """Grava leads, jobs e contadores; retorna os eventos a notificar"""
+        agora = datetime.utcnow()
+        concluidos = [job for job in jobs if chaves[job.id] in resultados]
+
+        # Valores atuais sob lock: o advogado pode ter editado o lead desde o claim
+        leads = {}
+        if concluidos:
+            rows = db.execute(
+                select(Lead.id, Lead.advogado_id, Lead.area_direito, Lead.urgencia, Lead.analise_ia.isnot(None),
+                       Lead.uf, Lead.cidade, Lead.status, Lead.criado_em)
+                .where(Lead.id.in_([job.lead_id for job in concluidos]))
+                .with_for_update()
+            ).all()
+            leads = {row[0]: row for row in rows}
+
+        updates, eventos, deltas, geo_deltas = [], [], {}, {}
+        for job in concluidos:
+            lead = leads.get(job.lead_id)
+            if lead is None or lead[4]:
+                continue  # removido ou já analisado manualmente (PUT /leads/{id})
+            _, advogado_id, area, urgencia, _, uf, cidade, status, criado_em = lead
+            resultado = resultados[chaves[job.id]]
+            confiavel = resultado["scoreConfianca"] >= ANALYSIS_MIN_CONFIDENCE
+            nova_area = (confiavel and resultado.get("areaDireito")) or area
+            nova_urgencia = (confiavel and resultado.get("urgencia")) or urgencia
+
+            updates.append({
+                "b_id": job.lead_id,
+                "b_analise": {**resultado, "analisador": self.analyzer.name, "dataAnalise": agora.isoformat()},
+                "b_area": nova_area,
+                "b_urgencia": nova_urgencia,
+            })
+            por_advogado = deltas.setdefault(advogado_id, {})
+            for dimensao, antes, depois in (("area_direito", area, nova_area), ("urgencia", urgencia, nova_urgencia)):
+                if antes != depois:
+                    por_advogado[(dimensao, antes or "")] = por_advogado.get((dimensao, antes or ""), 0) - 1
+                    por_advogado[(dimensao, depois or "")] = por_advogado.get((dimensao, depois or ""), 0) + 1
+            if area != nova_area:
+                geo_advogado = geo_deltas.setdefault(advogado_id, {})
+                add_geo_delta(geo_advogado, geo_key(uf, cidade, area, status, criado_em), -1)
+                add_geo_delta(geo_advogado, geo_key(uf, cidade, nova_area, status, criado_em), 1)
+            eventos.append((advogado_id, job.lead_id, {
+                "type": "lead_analisado",
+                "categoria": resultado.get("categoria"),
+                "area_direito": nova_area,
+                "urgencia": nova_urgencia,
+                "score_confianca": resultado["scoreConfianca"],
+                "analisado_em": agora,
+            }))
+
+        if updates:
+            table = Lead.__table__
+            db.execute(
+                update(table)
+                .where(table.c.id == bindparam("b_id"))
+                .values(
+                    analise_ia=bindparam("b_analise"),
+                    area_direito=bindparam("b_area"),
+                    urgencia=bindparam("b_urgencia"),
+                    atualizado_em=agora,
+                ),
+                updates,
+            )
+        for advogado_id, delta in deltas.items():
+            apply_lead_counter_deltas_sync(db, advogado_id, delta)
+        for advogado_id, delta in geo_deltas.items():
+            apply_geo_deltas_sync(db, advogado_id, delta)
+
+        jobs_table = AnaliseJob.__table__
+        if concluidos:
+            db.execute(
+                update(jobs_table)
+                .where(jobs_table.c.id == bindparam("b_id"))
+                .values(status="concluido", concluido_em=agora, ultimo_erro=None, cache_hit=bindparam("b_cache")),
+                [{"b_id": job.id, "b_cache": chaves[job.id] in cacheados} for job in concluidos],
+            )
+
+        falhas = []
+        retried = failed = 0
+        for job in jobs:
+            erro = erros.get(chaves[job.id])
+            if erro is None:
+                continue
+            tentativas = job.tentativas  # já contada em _claim
+            definitivo = tentativas >= ANALYSIS_MAX_ATTEMPTS
+            falhas.append({
+                "b_id": job.id,
+                "b_status": "falhou" if definitivo else "pendente",
+                "b_tentativas": tentativas,
+                "b_proxima": agora + timedelta(seconds=backoff_delay(tentativas)),
+                "b_erro": erro,
+            })
+            if definitivo:
+                failed += 1
+                logger.error("Análise do lead %s descartada após %s tentativas: %s", job.lead_id, tentativas, erro)
+            else:
+                retried += 1
+        if falhas:
+            db.execute(
+                update(jobs_table)
+                .where(jobs_table.c.id == bindparam("b_id"))
+                .values(
+                    status=bindparam("b_status"),
+                    tentativas=bindparam("b_tentativas"),
+                    proxima_tentativa=bindparam("b_proxima"),
+                    ultimo_erro=bindparam("b_erro"),
+                ),
+                falhas,
+            )
+
+        with self._lock:
+            self._analyzed += len(updates)
+            self._cached += sum(1 for job in concluidos if chaves[job.id] in cacheados)
+            self._retried += retried
+            self._failed += failed
+        for job in concluidos:
+            if job.criado_em:
+                self.stats.record("queue", (agora - job.criado_em).total_seconds() * 1000)
+        return eventos
+
+    def _notify(self, eventos: list):
+        if self.notifier is None:
+            return
+        for advogado_id, lead_id, evento in eventos:
+            try:
+                self.notifier(advogado_id, lead_id, evento)
+            except Exception:
+                logger.exception("Falha ao notificar análise do lead %s", lead_id)
+            else:
+                with self._lock:
+                    self._notified += 1
+
+    def run_once(self) -> int:
+        """Processa um lote; retorna quantos jobs foram reivindicados"""
+        started = time.perf_counter()
+        db = self.session_factory()
+        try:
+            with self.stats.stage("claim"):
+                jobs = self._claim(db)
+            if not jobs:
+                return 0
+
+            with self.stats.stage("cache"):
+                chaves = {job.id: descricao_hash(self.analyzer.name, job.descricao) for job in jobs}
+                resultados = self.cache.get_many(db, chaves.values())
+            cacheados = set(resultados)
+
+            # Descrições repetidas dentro do lote viram uma única análise
+            pendentes = {}
+            for job in jobs:
+                if chaves[job.id] not in resultados:
+                    pendentes.setdefault(chaves[job.id], job.descricao)
+
+            novos, erros = {}, {}
+            if pendentes:
+                with self.stats.stage("analyze"):
+                    novos, erros = self._analyze(pendentes)
+                resultados.update(novos)
+
+            with self.stats.stage("write"):
+                self.cache.put_many(db, self.analyzer.name, novos)
+                eventos = self._write(db, jobs, chaves, resultados, erros, cacheados)
+                db.commit()
+
+            with self.stats.stage("notify"):
+                self._notify(eventos)
+
+            with self._lock:
+                self._batches += 1
+            self.stats.record("batch", (time.perf_counter() - started) * 1000)
+            return len(jobs)
+        finally:
+            db.close()
+
+    def purge(self) -> int:
+        """
+        Remove um lote de jobs concluídos há mais de ANALYSIS_RETENTION_DAYS dias;
+        os que falharam ficam (fila de mortos, visível em analysis_status_counts)
+        """
+        limite = datetime.utcnow() - timedelta(days=ANALYSIS_RETENTION_DAYS)
+        db = self.session_factory()
+        try:
+            ids = select(AnaliseJob.id).where(
+                AnaliseJob.status == "concluido", AnaliseJob.concluido_em < limite
+            ).limit(ANALYSIS_PURGE_BATCH)
+            removidos = db.execute(delete(AnaliseJob).where(AnaliseJob.id.in_(ids))).rowcount
+            db.commit()
+        finally:
+            db.close()
+        with self._lock:
+            self._purged += removidos
+        return removidos
+
+    def run_forever(self):
+        while not self._stop.is_set():
+            try:
+                processed = self.run_once()
+                if time.monotonic() - self._last_purge > ANALYSIS_PURGE_SECONDS:
+                    self._last_purge = time.monotonic()
+                    self.purge()
+            except Exception:
+                logger.exception("Erro no worker de análise")
+                processed = 0
+            # Lote cheio: provavelmente há mais na fila, não espera
+            if processed < self.batch_size:
+                self._stop.wait(self.poll_interval)
+
+    def start(self) -> threading.Thread:
+        """Roda o worker em uma thread daemon (para uso dentro do processo da API)"""
+        self._thread = threading.Thread(target=self.run_forever, name="analysis", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._executor.shutdown(wait=True)
+
+    # --- métricas ----------------------------------------------------------
+
+    def metrics(self) -> dict:
+        with self._lock:
+            counters = {
+                "analyzer": self.analyzer.name,
+                "analyzed": self._analyzed,
+                "from_cache": self._cached,
+                "retried": self._retried,
+                "failed": self._failed,
+                "analyzer_calls": self._analyzer_calls,
+                "notified": self._notified,
+                "batches": self._batches,
+                "purged": self._purged,
+            }
+        return {**counters, "cache": self.cache.metrics(), "stages": self.stats.metrics()}
+
+
+if __name__ == "__main__":
+    import functools
+
+    from .database import SessionLocal, engine
+    from .realtime import notify_lead_event_pg
+
+    logging.basicConfig(level=logging.INFO)
+    notifier = None
+    if engine.dialect.name == "postgresql":
+        notifier = functools.partial(notify_lead_event_pg, SessionLocal)
+    worker = AnalysisWorker(SessionLocal, notifier=notifier)
+    try:
+        worker.run_forever()
+    except KeyboardInterrupt:
+        worker.stop()
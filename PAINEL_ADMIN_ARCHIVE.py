@@ -0,0 +1,292 @@
+# backend/app/archive.py
+# Arquivamento de casos encerrados: leads fechados/rejeitados antigos saem das
+# tabelas quentes (leads, conversas, mensagens, anotacoes) para leads_arquivo,
+# um JSON comprimido por caso em partições mensais; leituras caem no arquivo
+#
+# Uso (via migrações):
+#   python -m app.migrations arquivo-particoes
+#   python -m app.migrations arquivar [--batch-size 200]
+
+import json
+import logging
+import os
+import zlib
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import delete, exists, insert, select, text, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from .models import (
+    AnaliseJob, Anotacao, Conversa, Lead, LeadArquivo, LeadAssinatura, Mensagem, Tarefa
+)
+from .search import search_index
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# CONFIGURAÇÕES
+# ============================================================================
+
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", 365))  # sem atividade desde então
+ARCHIVE_STATUSES = tuple(
+    s.strip() for s in os.getenv("ARCHIVE_STATUSES", "fechado,rejeitado").split(",") if s.strip()
+)
+ARCHIVE_COMPRESSION_LEVEL = int(os.getenv("ARCHIVE_COMPRESSION_LEVEL", 6))
+ARCHIVE_PARTITION_MONTHS_AHEAD = int(os.getenv("ARCHIVE_PARTITION_MONTHS_AHEAD", 3))
+
+ARCHIVE_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS leads_arquivo (
+        id UUID NOT NULL,
+        criado_em TIMESTAMP NOT NULL,
+        advogado_id UUID NOT NULL,
+        status VARCHAR(50),
+        area_direito VARCHAR(100),
+        urgencia VARCHAR(50),
+        uf VARCHAR(2),
+        cidade VARCHAR(120),
+        dados BYTEA NOT NULL,
+        bytes_original INTEGER NOT NULL,
+        arquivado_em TIMESTAMP,
+        PRIMARY KEY (id, criado_em)
+    ) PARTITION BY RANGE (criado_em)
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_leads_arquivo_advogado_id ON leads_arquivo (advogado_id, id)",
+    # dados já vem comprimido: sem nova compressão pelo TOAST
+    "ALTER TABLE leads_arquivo ALTER COLUMN dados SET STORAGE EXTERNAL",
+    # Datas sem partição mensal (ex.: leads muito antigos) não falham o insert
+    "CREATE TABLE IF NOT EXISTS leads_arquivo_padrao PARTITION OF leads_arquivo DEFAULT",
+]
+
+
+# ============================================================================
+# PARTIÇÕES MENSAIS
+# ============================================================================
+
+def _mes(value) -> date:
+    return date(value.year, value.month, 1)
+
+def _proximo_mes(mes: date) -> date:
+    return date(mes.year + mes.month // 12, mes.month % 12 + 1, 1)
+
+def partition_name(mes: date) -> str:
+    return f"leads_arquivo_p{mes:%Y%m}"
+
+_particoes_criadas: Set[date] = set()
+
+def ensure_partitions(db: Session, meses: Iterable[date]):
+    """Cria as partições mensais que ainda não existem (só Postgres; idempotente)"""
+    if db.get_bind().dialect.name != "postgresql":
+        return
+    for mes in sorted(set(meses) - _particoes_criadas):
+        db.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {partition_name(mes)} PARTITION OF leads_arquivo "
+            f"FOR VALUES FROM ('{mes:%Y-%m-%d}') TO ('{_proximo_mes(mes):%Y-%m-%d}')"
+        ))
+        _particoes_criadas.add(mes)
+
+def create_archive_partitions(db: Session, batch_size: int = 500) -> int:
+    """
+    Cria leads_arquivo (se preciso) e uma partição por mês, do lead mais antigo
+    até ARCHIVE_PARTITION_MONTHS_AHEAD meses à frente. Retorna quantos meses.
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        LeadArquivo.__table__.create(db.get_bind(), checkfirst=True)
+        return 0
+    for ddl in ARCHIVE_DDL:
+        db.execute(text(ddl))
+    db.commit()
+
+    mais_antigo = db.scalar(select(Lead.criado_em).order_by(Lead.criado_em).limit(1))
+    mes = _mes(mais_antigo or datetime.utcnow())
+    fim = _mes(datetime.utcnow())
+    for _ in range(ARCHIVE_PARTITION_MONTHS_AHEAD):
+        fim = _proximo_mes(fim)
+    meses = []
+    while mes <= fim:
+        meses.append(mes)
+        mes = _proximo_mes(mes)
+    ensure_partitions(db, meses)
+    db.commit()
+    return len(meses)
+
+
+# ============================================================================
+# SERIALIZAÇÃO DO CASO
+# ============================================================================
+
+def _row_dict(row) -> dict:
+    return {k: v for k, v in row.items() if k != "busca"}
+
+def _json_default(value):
+    return value.isoformat() if isinstance(value, (datetime, date)) else str(value)
+
+def compress_case(caso: dict) -> tuple:
+    """(zlib(JSON), tamanho original); datas em ISO 8601, como na API"""
+    raw = json.dumps(caso, default=_json_default, ensure_ascii=False, separators=(",", ":")).encode()
+    return zlib.compress(raw, ARCHIVE_COMPRESSION_LEVEL), len(raw)
+
+def decompress_case(dados: bytes) -> dict:
+    return json.loads(zlib.decompress(bytes(dados)))
+
+
+# ============================================================================
+# JOB DE ARQUIVAMENTO
+# ============================================================================
+
+def _candidates(db: Session, limite: datetime, batch_size: int, cursor) -> list:
+    """Leads encerrados sem atividade desde `limite` e sem tarefa pendente"""
+    tarefa_pendente = exists().where(Tarefa.lead_id == Lead.id, Tarefa.concluida.is_(False))
+    query = select(Lead.id, Lead.atualizado_em).where(
+        Lead.status.in_(ARCHIVE_STATUSES),
+        Lead.atualizado_em < limite,
+        ~tarefa_pendente,
+    )
+    if cursor is not None:
+        query = query.where(tuple_(Lead.atualizado_em, Lead.id) > tuple_(*cursor))
+    return db.execute(
+        query.order_by(Lead.atualizado_em, Lead.id).limit(batch_size).with_for_update(skip_locked=True)
+    ).all()
+
+def _archive_batch(db: Session, lead_ids: List[str]) -> int:
+    """Monta o caso de cada lead, grava em leads_arquivo e remove das tabelas quentes"""
+    leads = [_row_dict(row) for row in db.execute(
+        select(Lead.__table__).where(Lead.id.in_(lead_ids))
+    ).mappings()]
+
+    conversas: Dict[str, List[dict]] = {}
+    por_conversa: Dict[str, dict] = {}
+    for row in db.execute(select(Conversa.__table__).where(Conversa.lead_id.in_(lead_ids))).mappings():
+        conversa = {**_row_dict(row), "historico": []}
+        conversas.setdefault(row["lead_id"], []).append(conversa)
+        por_conversa[row["id"]] = conversa
+    if por_conversa:
+        for row in db.execute(
+            select(Mensagem.__table__).where(Mensagem.conversa_id.in_(por_conversa.keys()))
+            .order_by(Mensagem.timestamp, Mensagem.id)
+        ).mappings():
+            por_conversa[row["conversa_id"]]["historico"].append(_row_dict(row))
+
+    filhos = {}
+    for nome, model in (("anotacoes", Anotacao), ("tarefas", Tarefa)):
+        for row in db.execute(select(model.__table__).where(model.lead_id.in_(lead_ids))).mappings():
+            filhos.setdefault((nome, row["lead_id"]), []).append(_row_dict(row))
+
+    linhas = []
+    for lead in leads:
+        legado = [c.pop("mensagens") for c in conversas.get(lead["id"], [])]
+        dados, tamanho = compress_case({
+            "lead": lead,
+            "conversas": conversas.get(lead["id"], []),
+            "anotacoes": filhos.get(("anotacoes", lead["id"]), []),
+            "tarefas": filhos.get(("tarefas", lead["id"]), []),
+            "mensagens_legado": [m for m in legado if m],
+        })
+        linhas.append({
+            "id": lead["id"],
+            "criado_em": lead["criado_em"],
+            "advogado_id": lead["advogado_id"],
+            "status": lead["status"],
+            "area_direito": lead["area_direito"],
+            "urgencia": lead["urgencia"],
+            "uf": lead.get("uf"),
+            "cidade": lead.get("cidade"),
+            "dados": dados,
+            "bytes_original": tamanho,
+            "arquivado_em": datetime.utcnow(),
+        })
+    if not linhas:
+        return 0
+
+    ensure_partitions(db, (_mes(linha["criado_em"]) for linha in linhas))
+    db.execute(insert(LeadArquivo), linhas)
+
+    # Remoção dos filhos antes do lead (FKs sem CASCADE)
+    if por_conversa:
+        db.execute(delete(Mensagem).where(Mensagem.conversa_id.in_(por_conversa.keys())))
+    ids = [linha["id"] for linha in linhas]
+    for model in (Conversa, Anotacao, Tarefa, AnaliseJob, LeadAssinatura):
+        db.execute(delete(model).where(model.lead_id.in_(ids)))
+    db.execute(update(Lead).where(Lead.duplicado_de.in_(ids)).values(duplicado_de=None))
+    db.execute(delete(Lead).where(Lead.id.in_(ids)))
+    return len(linhas)
+
+def archive_leads(db: Session, batch_size: int = 200, dias: int = ARCHIVE_AFTER_DAYS) -> int:
+    """
+    Move para leads_arquivo os casos com status em ARCHIVE_STATUSES sem
+    atualização há `dias` dias. Um lote por transação (SKIP LOCKED: pode
+    rodar em paralelo com a API); interrompível e reexecutável.
+    Contadores do dashboard e o rollup do mapa continuam contando os casos
+    arquivados (são histórico), então não são alterados.
+    """
+    limite = datetime.utcnow() - timedelta(days=dias)
+    arquivados = 0
+    cursor = None
+    while True:
+        rows = _candidates(db, limite, batch_size, cursor)
+        if not rows:
+            break
+        ids = [row.id for row in rows]
+        arquivados += _archive_batch(db, ids)
+        db.commit()
+        for lead_id in ids:
+            search_index.remove_lead(lead_id)
+        cursor = tuple(rows[-1])
+        logger.info("Arquivados %d casos", arquivados)
+    return arquivados
+
+
+# ============================================================================
+# LEITURA (queda para o arquivo)
+# ============================================================================
+
+async def load_archived_case(db: AsyncSession, advogado_id: str, lead_id: str) -> Optional[dict]:
+    """Caso arquivado do advogado, descomprimido; None se não existe no arquivo"""
+    dados = await db.scalar(
+        select(LeadArquivo.dados).where(LeadArquivo.id == lead_id, LeadArquivo.advogado_id == advogado_id)
+    )
+    return decompress_case(dados) if dados is not None else None
+
+def archived_lead_body(caso: dict) -> dict:
+    """Detalhe do lead no mesmo formato de serialize_lead, marcado como arquivado"""
+    lead = caso["lead"]
+    return {
+        "id": lead["id"],
+        "nome_cliente": lead["nome_cliente"],
+        "email_cliente": lead["email_cliente"],
+        "telefone_cliente": lead["telefone_cliente"],
+        "area_direito": lead["area_direito"],
+        "descricao_caso": lead["descricao_caso"],
+        "status": lead["status"],
+        "urgencia": lead["urgencia"],
+        "qualificacao": lead.get("qualificacao"),
+        "analise_ia": lead.get("analise_ia"),
+        "endereco": lead.get("endereco"),
+        "uf": lead.get("uf"),
+        "cidade": lead.get("cidade"),
+        "canal_preferido": lead.get("canal_preferido"),
+        "duplicado_de": lead.get("duplicado_de"),
+        "submissoes": lead.get("submissoes"),
+        "criado_em": lead["criado_em"],
+        "arquivado": True
+    }
+
+def archived_messages(caso: dict) -> List[dict]:
+    """Mensagens do caso em ordem cronológica, no formato de serialize_mensagem"""
+    mensagens = [m for conversa in caso.get("conversas", []) for m in conversa.get("historico", [])]
+    mensagens.sort(key=lambda m: (m["timestamp"], m["id"]))
+    return [
+        {"id": m["id"], "tipo": m["tipo"], "texto": m["texto"], "timestamp": m["timestamp"], "lido": m["lido"]}
+        for m in mensagens
+    ]
+
+def archived_anotacoes(caso: dict) -> List[dict]:
+    """Anotações do caso, mais recentes primeiro, no formato de serialize_anotacao"""
+    anotacoes = sorted(caso.get("anotacoes", []), key=lambda a: a["criada_em"] or "", reverse=True)
+    return [
+        {"id": a["id"], "titulo": a["titulo"], "conteudo": a["conteudo"],
+         "prioridade": a["prioridade"], "criada_em": a["criada_em"]}
+        for a in anotacoes
+    ]
@@ -0,0 +1,911 @@
+# backend/benchmarks/painel_api.py
+# Benchmarks do Painel do Advogado
+#
+# Uso (a partir de backend/, com DATABASE_URL apontando para um Postgres de teste
+# ou para um SQLite descartável, ex.: DATABASE_URL=sqlite:///bench.db):
+#   python -m benchmarks.painel_api seed --leads 100000 --firms 200 --create-schema
+#   python -m benchmarks.painel_api mixed --requests 20000 --users 50 --output atual.json
+#   python -m benchmarks.painel_api compare base.json atual.json --threshold 0.10
+#   python -m benchmarks.painel_api micro --output micro.json
+#   python -m benchmarks.painel_api search --docs 1000000 --firms 500 --output busca.json
+#   python -m benchmarks.painel_api async-db --requests 2000 --concurrency 50
+#   python -m benchmarks.painel_api async-db --latency-ms 2 --output resultado.json
+#   python -m benchmarks.painel_api polling --rounds 200 --users 20 --output polling.json
+#   python -m benchmarks.painel_api caso --opens 50 --users 20 --output caso.json
+
+import argparse
+import asyncio
+import contextvars
+import json
+import random
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, insert, select, text
+
+from app.database import (
+    AsyncSessionLocal, SessionLocal, async_engine, engine, DB_POOL_SIZE, DB_MAX_OVERFLOW,
+)
+from app.models import (
+    Base, User, AdvogadoProfile, Lead, Conversa, Mensagem, Anotacao, Tarefa,
+)
+
+# Precisa passar no EmailStr do login: o email-validator rejeita TLDs de uso
+# especial (.test, .example, .invalid) e todo login voltaria 422
+BENCH_EMAIL_DOMAIN = "bench-advocacia.com.br"
+BENCH_PASSWORD = "benchmark-123"
+
+
+def percentiles(samples_ms: list) -> dict:
+    if not samples_ms:
+        return {"p50_ms": 0, "p95_ms": 0, "p99_ms": 0}
+    ordered = sorted(samples_ms)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {
+        "p50_ms": round(pick(0.50), 3),
+        "p95_ms": round(pick(0.95), 3),
+        "p99_ms": round(pick(0.99), 3),
+        "mean_ms": round(statistics.fmean(ordered), 3),
+    }
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "desconhecido"
+
+def _metadata(scenario: str, config: dict) -> dict:
+    return {
+        "scenario": scenario,
+        "commit": _git_commit(),
+        "created_at": datetime.utcnow().isoformat(),
+        "database": engine.dialect.name,
+        "python": sys.version.split()[0],
+        "config": config,
+    }
+
+def _error_count(result) -> int:
+    """Soma dos contadores "errors" por endpoint (ignora o agregado "total")"""
+    if isinstance(result, dict):
+        return sum(
+            valor if chave == "errors" and isinstance(valor, int) else _error_count(valor)
+            for chave, valor in result.items() if chave != "total"
+        )
+    return 0
+
+def _save(result: dict, output: str = None):
+    """
+    Imprime e grava o resultado. Se alguma requisição falhou (4xx/5xx) o
+    processo sai com código 1: latências de respostas de erro não servem
+    de linha de base.
+    """
+    print(json.dumps(result, indent=2, default=str))
+    if output:
+        with open(output, "w") as f:
+            json.dump(result, f, indent=2, default=str)
+    erros = _error_count(result)
+    if erros:
+        print(f"\n{erros} requisições com erro: resultado inválido como baseline", file=sys.stderr)
+        sys.exit(1)
+
+
+# ============================================================================
+# DADOS SINTÉTICOS
+# ============================================================================
+#
+# Escritórios fictícios (User + AdvogadoProfile) com leads, conversas,
+# mensagens, anotações e tarefas. A geração é determinística (--seed) para
+# que resultados de commits diferentes sejam comparáveis.
+
+AREAS = ["Trabalho", "Cível", "Família", "Consumidor", "Previdenciário", "Tributário", "Criminal"]
+CIDADES = [
+    ("São Paulo", "SP"), ("Campinas", "SP"), ("Rio de Janeiro", "RJ"), ("Belo Horizonte", "MG"),
+    ("Curitiba", "PR"), ("Porto Alegre", "RS"), ("Salvador", "BA"), ("Recife", "PE"),
+]
+STATUS = ["novo", "em_contato", "em_andamento", "fechado", "rejeitado"]
+STATUS_PESOS = [30, 20, 25, 15, 10]
+URGENCIAS = ["baixa", "media", "alta", "urgente"]
+URGENCIA_PESOS = [20, 50, 20, 10]
+
+SEED_BATCH_SIZE = 5000
+
+
+def _bench_email(indice: int) -> str:
+    return f"advogado-{indice}@{BENCH_EMAIL_DOMAIN}"
+
+def _fake_lead(rng: random.Random, advogado_id: str, criado_em: datetime) -> dict:
+    cidade, estado = rng.choice(CIDADES)
+    numero = rng.randrange(10**10, 10**11)
+    return {
+        "id": str(uuid.uuid4()),
+        "advogado_id": advogado_id,
+        "nome_cliente": f"Cliente {numero}",
+        "email_cliente": f"cliente{numero}@exemplo.com.br",
+        "telefone_cliente": f"(11) 9{numero % 10**8:08d}",
+        "tipo_cliente": "PF",
+        "cpf_cnpj": f"{numero:011d}",
+        "area_direito": rng.choice(AREAS),
+        "descricao_caso": "Caso sintético gerado para benchmark. " * rng.randint(2, 12),
+        "urgencia": rng.choices(URGENCIAS, URGENCIA_PESOS)[0],
+        "status": rng.choices(STATUS, STATUS_PESOS)[0],
+        "endereco": {"cidade": cidade, "estado": estado},
+        "criado_em": criado_em,
+        "atualizado_em": criado_em,
+    }
+
+def _flush(db, model, rows: list):
+    if rows:
+        db.execute(insert(model), rows)
+        rows.clear()
+
+def seed(db, leads: int, firms: int, chat_ratio: float = 0.3, messages_per_chat: int = 20,
+         seed_value: int = 42, days: int = 730) -> dict:
+    """
+    Popula o banco com `firms` escritórios e `leads` leads distribuídos entre eles.
+
+    Cada lote de SEED_BATCH_SIZE leads é inserido com executemany e comitado,
+    então 1M de leads cabe em memória constante. Todos os usuários usam a
+    mesma senha (BENCH_PASSWORD), com o hash calculado uma única vez.
+    """
+    from app.security import hash_password_sync
+
+    rng = random.Random(seed_value)
+    password_hash = hash_password_sync(BENCH_PASSWORD)
+    agora = datetime.utcnow()
+
+    advogados = []
+    users, profiles = [], []
+    for indice in range(firms):
+        user_id = str(uuid.uuid4())
+        advogados.append(user_id)
+        cidade, estado = rng.choice(CIDADES)
+        users.append({
+            "id": user_id, "email": _bench_email(indice), "full_name": f"Advogado Bench {indice}",
+            "password_hash": password_hash, "is_active": True, "email_verified": True,
+            "created_at": agora, "updated_at": agora,
+        })
+        profiles.append({
+            "id": str(uuid.uuid4()), "user_id": user_id, "nome": f"Escritório Bench {indice}",
+            "tipo": "individual", "oab_numero": f"BENCH{indice:07d}", "oab_estado": estado,
+            "areas": rng.sample(AREAS, rng.randint(1, 3)), "cidades": [cidade], "estados": [estado],
+            "horario_atendimento": {"mon": "09:00-18:00", "tue": "09:00-18:00", "wed": "09:00-18:00",
+                                    "thu": "09:00-18:00", "fri": "09:00-18:00"},
+            "plano": {"tipo": "basico", "limite_leads": 1000},
+            "ativo": True, "created_at": agora, "updated_at": agora,
+        })
+    _flush(db, User, users)
+    _flush(db, AdvogadoProfile, profiles)
+    db.commit()
+
+    counts = {"users": firms, "advogados": firms, "leads": 0, "conversas": 0,
+              "mensagens": 0, "anotacoes": 0, "tarefas": 0}
+    lead_rows, conversa_rows, mensagem_rows, anotacao_rows, tarefa_rows = [], [], [], [], []
+
+    for n in range(leads):
+        advogado_id = advogados[n % firms]
+        criado_em = agora - timedelta(seconds=rng.randrange(days * 86400))
+        lead = _fake_lead(rng, advogado_id, criado_em)
+        lead_rows.append(lead)
+        counts["leads"] += 1
+
+        if rng.random() < chat_ratio:
+            conversa_id = str(uuid.uuid4())
+            quando = criado_em
+            for m in range(messages_per_chat):
+                quando += timedelta(minutes=rng.randint(1, 600))
+                mensagem_rows.append({
+                    "id": str(uuid.uuid4()), "conversa_id": conversa_id,
+                    "tipo": "cliente" if m % 2 == 0 else "advogado",
+                    "texto": f"Mensagem sintética {m}", "lido": True, "timestamp": quando,
+                })
+            conversa_rows.append({
+                "id": conversa_id, "lead_id": lead["id"], "advogado_id": advogado_id,
+                "ativa": True, "ultima_mensagem": quando, "criada_em": criado_em, "atualizada_em": quando,
+            })
+            counts["conversas"] += 1
+            counts["mensagens"] += messages_per_chat
+
+        if rng.random() < 0.5:
+            anotacao_rows.append({
+                "id": str(uuid.uuid4()), "lead_id": lead["id"], "advogado_id": advogado_id,
+                "titulo": "Anotação", "conteudo": "Conteúdo sintético da anotação.",
+                "prioridade": rng.choice(["baixa", "media", "alta"]),
+                "criada_em": criado_em, "atualizada_em": criado_em,
+            })
+            counts["anotacoes"] += 1
+
+        if rng.random() < 0.2:
+            tarefa_rows.append({
+                "id": str(uuid.uuid4()), "advogado_id": advogado_id, "lead_id": lead["id"],
+                "titulo": "Retornar contato", "concluida": rng.random() < 0.6,
+                "prioridade": "media", "data_vencimento": criado_em + timedelta(days=rng.randint(1, 30)),
+                "criada_em": criado_em, "atualizada_em": criado_em,
+            })
+            counts["tarefas"] += 1
+
+        if len(lead_rows) >= SEED_BATCH_SIZE:
+            # Ordem respeita as FKs: leads -> conversas -> mensagens
+            for model, rows in ((Lead, lead_rows), (Conversa, conversa_rows), (Mensagem, mensagem_rows),
+                                (Anotacao, anotacao_rows), (Tarefa, tarefa_rows)):
+                _flush(db, model, rows)
+            db.commit()
+
+    for model, rows in ((Lead, lead_rows), (Conversa, conversa_rows), (Mensagem, mensagem_rows),
+                        (Anotacao, anotacao_rows), (Tarefa, tarefa_rows)):
+        _flush(db, model, rows)
+    db.commit()
+    return counts
+
+
+def load_firms(db, limit: int) -> list:
+    """Escritórios sintéticos já semeados, com alguns leads que têm conversa (para polling)"""
+    firms = []
+    users = db.execute(
+        select(User.id, User.email)
+        .where(User.email.like(f"%@{BENCH_EMAIL_DOMAIN}"))
+        .order_by(User.email)
+        .limit(limit)
+    ).all()
+    for user_id, email in users:
+        chat_leads = db.scalars(
+            select(Conversa.lead_id).where(Conversa.advogado_id == user_id).limit(20)
+        ).all()
+        firms.append({"user_id": user_id, "email": email, "chat_leads": list(chat_leads)})
+    return firms
+
+
+# ============================================================================
+# CONTAGEM DE QUERIES
+# ============================================================================
+#
+# Cada requisição do driver roda com o seu próprio contador em um ContextVar;
+# o listener do engine incrementa o contador da requisição corrente (o contexto
+# é propagado até o greenlet que executa o cursor da AsyncSession).
+
+_query_counter: contextvars.ContextVar = contextvars.ContextVar("bench_query_counter", default=None)
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    counter = _query_counter.get()
+    if counter is not None:
+        counter[0] += 1
+
+def install_query_counter():
+    for target in (async_engine.sync_engine, engine):
+        if not event.contains(target, "before_cursor_execute", _count_query):
+            event.listen(target, "before_cursor_execute", _count_query)
+
+
+# ============================================================================
+# CENÁRIO: carga mista pela API (in-process)
+# ============================================================================
+#
+# A aplicação é chamada diretamente via transporte ASGI do httpx: mede o
+# custo do endpoint (validação, auth, ORM, serialização) sem rede no meio.
+
+WORKLOAD_MIX = {
+    "login": 5,
+    "dashboard": 15,
+    "leads_page": 30,
+    "chat_poll": 40,
+    "create_lead": 10,
+}
+LEADS_PAGES_PER_VISIT = 3  # páginas seguidas por next_cursor em cada visita à lista
+
+
+def build_app():
+    from fastapi import FastAPI
+    from app.profiling import install_profiling
+    from app.routers.auth import router
+
+    app = FastAPI(title="advocacia.ai (benchmark)")
+    app.include_router(router)
+    install_profiling(app)
+    return app
+
+
+class EndpointStats:
+    def __init__(self):
+        self.latencies = []
+        self.queries = []
+        self.errors = 0
+
+    def record(self, elapsed_ms: float, queries: int, ok: bool):
+        self.latencies.append(elapsed_ms)
+        self.queries.append(queries)
+        if not ok:
+            self.errors += 1
+
+    def summary(self, elapsed_s: float) -> dict:
+        return {
+            "requests": len(self.latencies),
+            "errors": self.errors,
+            "error_rate": round(self.errors / len(self.latencies), 4) if self.latencies else 0,
+            "throughput_rps": round(len(self.latencies) / elapsed_s, 1) if elapsed_s else 0,
+            **percentiles(self.latencies),
+            "queries_mean": round(statistics.fmean(self.queries), 2) if self.queries else 0,
+            "queries_max": max(self.queries, default=0),
+        }
+
+
+class VirtualUser:
+    """Um advogado com o painel aberto: token, cursores de paginação e de polling"""
+
+    def __init__(self, client, firm: dict, stats: dict, rng: random.Random):
+        self.client = client
+        self.firm = firm
+        self.stats = stats
+        self.rng = rng
+        self.headers = {}
+        self.since = {}  # lead_id -> since_cursor
+
+    async def _call(self, name: str, method: str, url: str, headers: dict = None, **kwargs):
+        counter = [0]
+        token = _query_counter.set(counter)
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, headers={**self.headers, **(headers or {})}, **kwargs)
+        finally:
+            _query_counter.reset(token)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if self.stats is not None:
+            self.stats.setdefault(name, EndpointStats()).record(elapsed_ms, counter[0], response.status_code < 400)
+        return response
+
+    async def login(self):
+        response = await self._call("login", "POST", "/auth/login", json={
+            "email": self.firm["email"], "password": BENCH_PASSWORD,
+        })
+        if response.status_code != 200:
+            raise SystemExit(
+                f"Login de {self.firm['email']} falhou ({response.status_code}): {response.text[:200]}"
+            )
+        self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    async def dashboard(self):
+        await self._call("dashboard", "GET", "/auth/dashboard/stats")
+
+    async def leads_page(self):
+        params = {"limit": 20}
+        for _ in range(LEADS_PAGES_PER_VISIT):
+            response = await self._call("leads_page", "GET", "/auth/leads", params=params)
+            if response.status_code != 200:
+                return
+            cursor = response.json().get("next_cursor")
+            if not cursor:
+                return
+            params = {"limit": 20, "cursor": cursor}
+
+    async def chat_poll(self):
+        if not self.firm["chat_leads"]:
+            return await self.dashboard()
+        lead_id = self.rng.choice(self.firm["chat_leads"])
+        params = {"since": self.since[lead_id]} if lead_id in self.since else {}
+        response = await self._call("chat_poll", "GET", f"/auth/leads/{lead_id}/mensagens", params=params)
+        if response.status_code == 200:
+            cursor = response.json().get("since_cursor")
+            if cursor:
+                self.since[lead_id] = cursor
+
+    async def create_lead(self):
+        lead = _fake_lead(self.rng, self.firm["user_id"], datetime.utcnow())
+        payload = {k: lead[k] for k in (
+            "nome_cliente", "email_cliente", "telefone_cliente", "tipo_cliente",
+            "cpf_cnpj", "area_direito", "descricao_caso", "urgencia", "endereco",
+        )}
+        await self._call("create_lead", "POST", "/auth/leads", json=payload)
+
+
+async def bench_mixed(requests: int, users: int, seed_value: int = 42, mix: dict = None) -> dict:
+    import httpx
+
+    mix = mix or WORKLOAD_MIX
+    with SessionLocal() as db:
+        firms = load_firms(db, users)
+    if not firms:
+        raise SystemExit("Nenhum escritório sintético encontrado: rode `seed` antes")
+
+    install_query_counter()
+    operations, weights = zip(*mix.items())
+    stats = {}
+    remaining = [requests]
+
+    transport = httpx.ASGITransport(app=build_app())
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        vus = [
+            VirtualUser(client, firms[i % len(firms)], stats, random.Random(seed_value + i))
+            for i in range(users)
+        ]
+
+        # Aquecimento (fora da medição): login e primeira carga do dashboard,
+        # que reconstrói os contadores de quem ainda não tinha
+        for vu in vus:
+            vu.stats = None
+            await vu.login()
+            await vu.dashboard()
+            vu.stats = stats
+
+        async def run_user(vu: VirtualUser):
+            while remaining[0] > 0:
+                remaining[0] -= 1
+                operation = vu.rng.choices(operations, weights)[0]
+                await getattr(vu, operation)()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(run_user(vu) for vu in vus))
+        elapsed = time.perf_counter() - started
+
+    all_latencies = [ms for s in stats.values() for ms in s.latencies]
+    return {
+        **_metadata("mixed", {"requests": requests, "users": users, "seed": seed_value, "mix": mix,
+                              "pool": {"size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW}}),
+        "elapsed_s": round(elapsed, 3),
+        "total": {
+            "requests": len(all_latencies),
+            "errors": sum(s.errors for s in stats.values()),
+            "error_rate": round(sum(s.errors for s in stats.values()) / len(all_latencies), 4) if all_latencies else 0,
+            "throughput_rps": round(len(all_latencies) / elapsed, 1) if elapsed else 0,
+            **percentiles(all_latencies),
+        },
+        "endpoints": {name: s.summary(elapsed) for name, s in sorted(stats.items())},
+    }
+
+
+# ============================================================================
+# CENÁRIO: polling do painel com e sem ETag
+# ============================================================================
+#
+# O painel aberto relê perfil, lead, mensagens e anotações a cada poucos
+# segundos. O mesmo roteiro (mesma semente, mesmas escritas) roda duas vezes:
+# sem cabeçalho condicional e reenviando o ETag em If-None-Match. Compara
+# bytes transferidos, latência e consultas por requisição.
+
+POLLING_WRITE_RATIO = 0.05  # fração das rodadas em que chega uma mensagem nova
+
+
+async def _polling_run(client, firms: list, users: int, rounds: int, seed_value: int, conditional: bool) -> dict:
+    from app.http_cache import response_cache
+
+    response_cache.clear()
+    stats, sent_bytes, not_modified = {}, {}, {}
+    etags = {}
+    vus = [
+        VirtualUser(client, firms[i % len(firms)], None, random.Random(seed_value + i))
+        for i in range(users)
+    ]
+    for vu in vus:
+        await vu.login()
+        vu.stats = stats
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for i, vu in enumerate(vus):
+            lead_id = vu.rng.choice(vu.firm["chat_leads"][:3])
+            if vu.rng.random() < POLLING_WRITE_RATIO:
+                await vu._call("escrita", "POST", f"/auth/leads/{lead_id}/mensagens", params={"mensagem": "ok"})
+            for name, url in (
+                ("profile", "/auth/profile"),
+                ("lead", f"/auth/leads/{lead_id}"),
+                ("mensagens", f"/auth/leads/{lead_id}/mensagens"),
+                ("anotacoes", f"/auth/leads/{lead_id}/anotacoes"),
+            ):
+                headers = {}
+                if conditional and (i, url) in etags:
+                    headers["If-None-Match"] = etags[(i, url)]
+                response = await vu._call(name, "GET", url, headers=headers)
+                sent_bytes[name] = sent_bytes.get(name, 0) + len(response.content)
+                if response.status_code == 304:
+                    not_modified[name] = not_modified.get(name, 0) + 1
+                if "etag" in response.headers:
+                    etags[(i, url)] = response.headers["etag"]
+    elapsed = time.perf_counter() - started
+
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "bytes": sum(sent_bytes.values()),
+        "endpoints": {
+            name: {
+                **s.summary(elapsed),
+                "bytes": sent_bytes.get(name, 0),
+                "not_modified": not_modified.get(name, 0),
+            }
+            for name, s in sorted(stats.items())
+        },
+        "http_cache": response_cache.metrics(),
+    }
+
+
+async def bench_polling(rounds: int, users: int, seed_value: int = 42) -> dict:
+    import httpx
+
+    with SessionLocal() as db:
+        firms = [firm for firm in load_firms(db, users) if firm["chat_leads"]]
+    if not firms:
+        raise SystemExit("Nenhum escritório sintético com conversas: rode `seed` antes")
+
+    install_query_counter()
+    transport = httpx.ASGITransport(app=build_app())
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        sem_etag = await _polling_run(client, firms, users, rounds, seed_value, conditional=False)
+        com_etag = await _polling_run(client, firms, users, rounds, seed_value, conditional=True)
+
+    economia = {}
+    for name, base in sem_etag["endpoints"].items():
+        atual = com_etag["endpoints"].get(name)
+        if atual is None or name == "escrita":
+            continue
+        economia[name] = {
+            "bytes_pct": round((1 - atual["bytes"] / base["bytes"]) * 100, 1) if base["bytes"] else 0,
+            "p50_pct": round((1 - atual["p50_ms"] / base["p50_ms"]) * 100, 1) if base["p50_ms"] else 0,
+            "queries_mean": [base["queries_mean"], atual["queries_mean"]],
+        }
+
+    return {
+        **_metadata("polling", {"rounds": rounds, "users": users, "seed": seed_value,
+                                "write_ratio": POLLING_WRITE_RATIO}),
+        "sem_etag": sem_etag,
+        "com_etag": com_etag,
+        "economia": economia,
+    }
+
+
+# ============================================================================
+# CENÁRIO: abrir um caso (chamadas separadas vs /leads/{id}/full)
+# ============================================================================
+#
+# O LeadDetail abre um caso buscando lead, mensagens e anotações. Mede o
+# tempo de abertura completo (soma das chamadas) e as consultas por caso.
+
+async def bench_caso(opens: int, users: int, seed_value: int = 42) -> dict:
+    import httpx
+
+    with SessionLocal() as db:
+        firms = [firm for firm in load_firms(db, users) if firm["chat_leads"]]
+    if not firms:
+        raise SystemExit("Nenhum escritório sintético com conversas: rode `seed` antes")
+
+    install_query_counter()
+    roteiros = {
+        "separado": lambda lead_id: (
+            ("lead", f"/auth/leads/{lead_id}"),
+            ("mensagens", f"/auth/leads/{lead_id}/mensagens"),
+            ("anotacoes", f"/auth/leads/{lead_id}/anotacoes"),
+        ),
+        "full": lambda lead_id: (("full", f"/auth/leads/{lead_id}/full"),),
+    }
+    resultados = {}
+    transport = httpx.ASGITransport(app=build_app())
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for nome, roteiro in roteiros.items():
+            stats = {}
+            vus = [
+                VirtualUser(client, firms[i % len(firms)], None, random.Random(seed_value + i))
+                for i in range(users)
+            ]
+            for vu in vus:
+                await vu.login()
+                vu.stats = stats
+            aberturas = []
+            for _ in range(opens):
+                for vu in vus:
+                    lead_id = vu.rng.choice(vu.firm["chat_leads"])
+                    started = time.perf_counter()
+                    for name, url in roteiro(lead_id):
+                        await vu._call(name, "GET", url)
+                    aberturas.append((time.perf_counter() - started) * 1000)
+            resultados[nome] = {
+                "abertura": percentiles(aberturas),
+                "queries_por_caso": round(sum(sum(s.queries) for s in stats.values()) / len(aberturas), 2),
+                "endpoints": {name: s.summary(sum(aberturas) / 1000) for name, s in sorted(stats.items())},
+            }
+
+    base, atual = resultados["separado"]["abertura"], resultados["full"]["abertura"]
+    return {
+        **_metadata("caso", {"opens": opens, "users": users, "seed": seed_value}),
+        **resultados,
+        "p50_ratio": round(atual["p50_ms"] / base["p50_ms"], 3) if base["p50_ms"] else None,
+    }
+
+
+# ============================================================================
+# CENÁRIO: micro-benchmarks dos helpers do caminho quente
+# ============================================================================
+
+def _per_call_us(fn, number: int) -> float:
+    return round(min(timeit.repeat(fn, number=number, repeat=3)) / number * 1e6, 3)
+
+def bench_micro(profiles: int = 5000) -> dict:
+    from app.matching import MatchingIndex, ProfileEntry
+    from app.models import encrypt_data, decrypt_data, encrypt_many, decrypt_many
+    from app.routers.auth import encode_cursor, decode_cursor
+    from app.security import Principal, PrincipalCache, hash_password_sync, verify_password_sync
+
+    results = {}
+
+    cursor = encode_cursor(datetime.utcnow().isoformat(), str(uuid.uuid4()))
+    results["encode_cursor_us"] = _per_call_us(lambda: encode_cursor("2024-01-01T00:00:00", "abc"), 20000)
+    results["decode_cursor_us"] = _per_call_us(lambda: decode_cursor(cursor), 20000)
+
+    cache = PrincipalCache(max_entries=10000, ttl=300)
+    principal = Principal(id=str(uuid.uuid4()), email="bench@exemplo.com", full_name="Bench",
+                          is_active=True, email_verified=True)
+    cache.put("token", principal)
+    results["principal_cache_hit_us"] = _per_call_us(lambda: cache.get("token"), 50000)
+
+    token = encrypt_data("12345678901")
+    results["encrypt_us"] = _per_call_us(lambda: encrypt_data("12345678901"), 2000)
+    results["decrypt_us"] = _per_call_us(lambda: decrypt_data(token), 2000)
+    lote = [f"{n:011d}" for n in range(100)]
+    cifrados = encrypt_many(lote)
+    results["encrypt_many_100_us"] = _per_call_us(lambda: encrypt_many(lote), 50)
+    results["decrypt_many_100_us"] = _per_call_us(lambda: decrypt_many(cifrados), 50)
+
+    hashed = hash_password_sync(BENCH_PASSWORD)
+    results["bcrypt_verify_ms"] = round(_per_call_us(lambda: verify_password_sync(BENCH_PASSWORD, hashed), 3) / 1000, 3)
+
+    rng = random.Random(42)
+    index = MatchingIndex()
+    for n in range(profiles):
+        cidade, estado = rng.choice(CIDADES)
+        entry = ProfileEntry(
+            profile_id=str(n), user_id=str(n), nome=f"Advogado {n}",
+            areas={a.casefold() for a in rng.sample(AREAS, 2)},
+            cidades={cidade.casefold()}, estados={estado.casefold()}, limite_leads=100,
+        )
+        index._profiles[entry.profile_id] = entry
+        index._index(entry)
+    results[f"matching_{profiles}_profiles_us"] = _per_call_us(
+        lambda: index.match("Trabalho", cidade="Campinas", estado="SP"), 200
+    )
+
+    return {**_metadata("micro", {"profiles": profiles}), "results": results}
+
+
+# ============================================================================
+# CENÁRIO: busca textual (índice invertido em Python e, no Postgres, tsvector)
+# ============================================================================
+
+VOCABULARIO = (
+    "demissão justa causa rescisão indireta verbas rescisórias horas extras férias décimo terceiro "
+    "FGTS multa aviso prévio assédio moral acidente trabalho insalubridade periculosidade divórcio "
+    "consensual litigioso guarda compartilhada pensão alimentícia partilha bens inventário herança "
+    "testamento contrato aluguel despejo indenização danos morais materiais consumidor produto defeito "
+    "cobrança indevida negativação plano saúde cirurgia negada aposentadoria invalidez auxílio doença "
+    "benefício INSS revisão tributo imposto execução fiscal penhora conta bloqueada audiência prazo recurso"
+).split()
+
+def _fake_text(rng: random.Random, palavras: int) -> str:
+    # Distribuição aproximadamente Zipf: poucos termos muito frequentes
+    return " ".join(VOCABULARIO[min(len(VOCABULARIO) - 1, int(rng.paretovariate(1.2)) - 1)]
+                    if rng.random() < 0.5 else rng.choice(VOCABULARIO) for _ in range(palavras))
+
+SEARCH_BENCH_LIMIT = 20
+
+async def bench_search(docs: int, firms: int, queries: int, seed_value: int = 42) -> dict:
+    from app.search import InvertedIndex, search_postgres
+
+    rng = random.Random(seed_value)
+    index = InvertedIndex()
+    tipos = ("lead", "anotacao", "mensagem")
+
+    started = time.perf_counter()
+    for n in range(docs):
+        index.add(f"firm-{n % firms}", tipos[n % 3], str(n), str(n // 3), None, _fake_text(rng, rng.randint(10, 60)))
+    build_s = time.perf_counter() - started
+
+    consultas = [
+        (f"firm-{rng.randrange(firms)}", " ".join(rng.sample(VOCABULARIO, rng.randint(1, 3))))
+        for _ in range(queries)
+    ]
+    latencies = []
+    for advogado_id, q in consultas:
+        t0 = time.perf_counter()
+        index.search(advogado_id, q, SEARCH_BENCH_LIMIT)
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+    result = {
+        **_metadata("search", {"docs": docs, "firms": firms, "queries": queries, "seed": seed_value}),
+        "python_index": {
+            "build_s": round(build_s, 2),
+            "docs_per_s": round(docs / build_s, 1) if build_s else 0,
+            **index.metrics(),
+            **percentiles(latencies),
+        },
+    }
+
+    # No Postgres (com a migração "busca" aplicada) mede a mesma carga sobre os dados semeados
+    if async_engine.dialect.name == "postgresql":
+        with SessionLocal() as db:
+            firmas = [f["user_id"] for f in load_firms(db, 50)]
+        if firmas:
+            latencies = []
+            async with AsyncSessionLocal() as session:
+                for _, q in consultas:
+                    t0 = time.perf_counter()
+                    await search_postgres(session, rng.choice(firmas), q, SEARCH_BENCH_LIMIT, 0)
+                    latencies.append((time.perf_counter() - t0) * 1000)
+            result["postgres_tsvector"] = percentiles(latencies)
+
+    return result
+
+
+# ============================================================================
+# CENÁRIO: Session síncrona vs AsyncSession dentro do event loop
+# ============================================================================
+#
+# Reproduz o que um endpoint `async def` faz com cada tipo de sessão:
+# com Session síncrona cada query bloqueia o loop inteiro, então as
+# "requisições" concorrentes acabam serializadas.
+
+def _statement(latency_ms: float):
+    # pg_sleep simula a latência de rede até o banco (o custo que o loop bloqueado paga)
+    if latency_ms > 0:
+        return text("SELECT pg_sleep(:s), count(*) FROM leads"), {"s": latency_ms / 1000}
+    return text("SELECT count(*) FROM leads"), {}
+
+async def _run(handler, requests: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            await handler()
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(requests / elapsed, 1),
+        **percentiles(latencies),
+    }
+
+async def bench_async_db(requests: int, concurrency: int, latency_ms: float) -> dict:
+    statement, params = _statement(latency_ms)
+
+    async def sync_handler():
+        with SessionLocal() as session:
+            session.execute(statement, params).all()
+
+    async def async_handler():
+        async with AsyncSessionLocal() as session:
+            (await session.execute(statement, params)).all()
+
+    return {
+        **_metadata("async-db", {"requests": requests, "concurrency": concurrency, "latency_ms": latency_ms}),
+        "latency_ms": latency_ms,
+        "pool": {"size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW},
+        "sync_session": await _run(sync_handler, requests, concurrency),
+        "async_session": await _run(async_handler, requests, concurrency),
+    }
+
+
+# ============================================================================
+# COMPARAÇÃO ENTRE EXECUÇÕES
+# ============================================================================
+
+def compare(base: dict, atual: dict, threshold: float) -> list:
+    """
+    Compara dois resultados do cenário mixed por endpoint.
+    Regressão: p95 ou média de queries piorou mais que `threshold` (fração),
+    ou a vazão caiu mais que `threshold`.
+    """
+    regressoes = []
+    print(f"{'endpoint':<14} {'p95 base':>10} {'p95 atual':>10} {'Δ%':>7} "
+          f"{'rps base':>9} {'rps atual':>9} {'queries':>11}")
+    for name in sorted(set(base["endpoints"]) | set(atual["endpoints"])):
+        b = base["endpoints"].get(name)
+        a = atual["endpoints"].get(name)
+        if not b or not a:
+            print(f"{name:<14} {'(ausente em uma das execuções)':>40}")
+            continue
+        delta_p95 = (a["p95_ms"] - b["p95_ms"]) / b["p95_ms"] if b["p95_ms"] else 0
+        delta_rps = (b["throughput_rps"] - a["throughput_rps"]) / b["throughput_rps"] if b["throughput_rps"] else 0
+        queries = f"{b['queries_mean']}→{a['queries_mean']}"
+        print(f"{name:<14} {b['p95_ms']:>10} {a['p95_ms']:>10} {delta_p95 * 100:>6.1f}% "
+              f"{b['throughput_rps']:>9} {a['throughput_rps']:>9} {queries:>11}")
+        if delta_p95 > threshold or delta_rps > threshold or a["queries_mean"] > b["queries_mean"] * (1 + threshold):
+            regressoes.append(name)
+    return regressoes
+
+
+# ============================================================================
+# CLI
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks do Painel do Advogado")
+    sub = parser.add_subparsers(dest="scenario", required=True)
+
+    seed_cmd = sub.add_parser("seed", help="Popula o banco com escritórios sintéticos")
+    seed_cmd.add_argument("--leads", type=int, default=10000)
+    seed_cmd.add_argument("--firms", type=int, default=50)
+    seed_cmd.add_argument("--chat-ratio", type=float, default=0.3)
+    seed_cmd.add_argument("--messages-per-chat", type=int, default=20)
+    seed_cmd.add_argument("--seed", type=int, default=42)
+    seed_cmd.add_argument("--create-schema", action="store_true", help="Cria as tabelas antes (banco vazio)")
+
+    mixed = sub.add_parser("mixed", help="Carga mista pela API: login, dashboard, lista, chat, criação")
+    mixed.add_argument("--requests", type=int, default=5000)
+    mixed.add_argument("--users", type=int, default=20)
+    mixed.add_argument("--seed", type=int, default=42)
+    mixed.add_argument("--output", help="Arquivo JSON para salvar o resultado")
+
+    micro = sub.add_parser("micro", help="Micro-benchmarks dos helpers (cursor, cache, cripto, matching)")
+    micro.add_argument("--profiles", type=int, default=5000)
+    micro.add_argument("--output", help="Arquivo JSON para salvar o resultado")
+
+    search_cmd = sub.add_parser("search", help="Busca textual: índice em Python e tsvector no Postgres")
+    search_cmd.add_argument("--docs", type=int, default=1_000_000)
+    search_cmd.add_argument("--firms", type=int, default=500)
+    search_cmd.add_argument("--queries", type=int, default=2000)
+    search_cmd.add_argument("--seed", type=int, default=42)
+    search_cmd.add_argument("--output", help="Arquivo JSON para salvar o resultado")
+
+    cmp_cmd = sub.add_parser("compare", help="Compara dois resultados do cenário mixed")
+    cmp_cmd.add_argument("base")
+    cmp_cmd.add_argument("atual")
+    cmp_cmd.add_argument("--threshold", type=float, default=0.10)
+
+    async_db = sub.add_parser("async-db", help="Session síncrona vs AsyncSession sob concorrência")
+    async_db.add_argument("--requests", type=int, default=2000)
+    async_db.add_argument("--concurrency", type=int, default=50)
+    async_db.add_argument("--latency-ms", type=float, default=2.0)
+    async_db.add_argument("--output", help="Arquivo JSON para salvar o resultado")
+
+    polling = sub.add_parser("polling", help="Polling de perfil/lead/mensagens/anotações com e sem ETag")
+    polling.add_argument("--rounds", type=int, default=200)
+    polling.add_argument("--users", type=int, default=20)
+    polling.add_argument("--seed", type=int, default=42)
+    polling.add_argument("--output", help="Arquivo JSON para salvar o resultado")
+
+    caso = sub.add_parser("caso", help="Abertura de um caso: lead+mensagens+anotações vs /leads/{id}/full")
+    caso.add_argument("--opens", type=int, default=50)
+    caso.add_argument("--users", type=int, default=20)
+    caso.add_argument("--seed", type=int, default=42)
+    caso.add_argument("--output", help="Arquivo JSON para salvar o resultado")
+
+    args = parser.parse_args()
+
+    if args.scenario == "seed":
+        if args.create_schema:
+            Base.metadata.create_all(engine)
+        started = time.perf_counter()
+        with SessionLocal() as db:
+            counts = seed(db, args.leads, args.firms, args.chat_ratio, args.messages_per_chat, args.seed)
+        print(json.dumps({"seeded": counts, "elapsed_s": round(time.perf_counter() - started, 1)}, indent=2))
+    elif args.scenario == "mixed":
+        _save(asyncio.run(bench_mixed(args.requests, args.users, args.seed)), args.output)
+    elif args.scenario == "micro":
+        _save(bench_micro(args.profiles), args.output)
+    elif args.scenario == "polling":
+        _save(asyncio.run(bench_polling(args.rounds, args.users, args.seed)), args.output)
+    elif args.scenario == "caso":
+        _save(asyncio.run(bench_caso(args.opens, args.users, args.seed)), args.output)
+    elif args.scenario == "search":
+        _save(asyncio.run(bench_search(args.docs, args.firms, args.queries, args.seed)), args.output)
+    elif args.scenario == "compare":
+        with open(args.base) as f:
+            base = json.load(f)
+        with open(args.atual) as f:
+            atual = json.load(f)
+        regressoes = compare(base, atual, args.threshold)
+        if regressoes:
+            print(f"\nRegressões (> {args.threshold:.0%}): {', '.join(regressoes)}")
+            sys.exit(1)
+    else:
+        _save(asyncio.run(bench_async_db(args.requests, args.concurrency, args.latency_ms)), args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,659 @@
+# backend/app/dedup.py
+# Detecção de leads duplicados na entrada (reenvios do formulário, várias campanhas):
+# chaves exatas (CPF/CNPJ, email, telefone normalizados) + MinHash/LSH de nome e descrição
+#
+# Uso (deduplicar a base existente):
+#   python -m app.migrations deduplicar            # só vincula (duplicado_de)
+#   python -m app.migrations deduplicar-mesclar    # mescla e remove os duplicados
+
+import hashlib
+import hmac
+import os
+import random
+import re
+from array import array
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from sqlalchemy import bindparam, delete, func, insert, select, text, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from .analysis import normalize_descricao
+from .geo import add_geo_delta, apply_geo_deltas_sync, geo_key
+from .matching import normalize
+from .models import AnaliseJob, Anotacao, Conversa, Lead, LeadAssinatura, Mensagem, Tarefa, preview_mensagem
+from .search import search_index
+from .stats import LEAD_COUNTER_DIMENSIONS, apply_lead_counter_deltas_sync
+
+# ============================================================================
+# CONFIGURAÇÕES
+# ============================================================================
+
+DEDUP_MODE = os.getenv("DEDUP_MODE", "mesclar")  # mesclar | vincular | desligado
+DEDUP_HASH_KEY = os.getenv("DEDUP_HASH_KEY") or os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
+
+DEDUP_SIMILARIDADE = float(os.getenv("DEDUP_SIMILARIDADE", 0.7))  # Jaccard de nome + descrição
+DEDUP_NOME_MIN = float(os.getenv("DEDUP_NOME_MIN", 0.5))  # Jaccard mínimo dos nomes
+DEDUP_JANELA_DIAS = int(os.getenv("DEDUP_JANELA_DIAS", 180))  # depois disso é um caso novo: só vincula
+DEDUP_MAX_CANDIDATOS = int(os.getenv("DEDUP_MAX_CANDIDATOS", 20))
+
+# MinHash com 64 permutações em 16 bandas de 4 linhas: pares com Jaccard
+# acima de ~0.5 caem na mesma banda com alta probabilidade
+MINHASH_PERMUTACOES = 64
+LSH_BANDAS = 16
+LSH_LINHAS = MINHASH_PERMUTACOES // LSH_BANDAS
+MINHASH_MIN_SHINGLES = 3
+
+# Cada "permutação" é um XOR do hash de 64 bits com uma máscara aleatória:
+# min(map(mascara.__xor__, hashes)) roda em C e custa ~1/3 do (a*x + b) mod p.
+# Semente fixa: as assinaturas precisam ser estáveis entre processos.
+_MASCARAS = [random.Random(20241124 + i).getrandbits(64) for i in range(MINHASH_PERMUTACOES)]
+
+NOME_STOPWORDS = {"de", "da", "do", "das", "dos", "e"}
+
+# Prefixo da chave -> motivo do casamento (do mais forte ao mais fraco)
+PREFIXOS = {"cpf_cnpj": "cpf", "email": "email", "telefone": "tel"}
+FORCA = {"cpf_cnpj": 3, "email": 2, "telefone": 2, "similar": 1}
+
+
+def motivo_da_chave(chave: str) -> str:
+    prefixo = chave.split(":", 1)[0]
+    if prefixo.startswith("lsh"):
+        return "similar"
+    return {v: k for k, v in PREFIXOS.items()}[prefixo]
+
+
+# ============================================================================
+# NORMALIZAÇÃO
+# ============================================================================
+
+def canonical_cpf_cnpj(value: Optional[str]) -> str:
+    """
+    Forma gravada em Lead.cpf_cnpj: só os dígitos (ou o texto original sem
+    espaços, se não houver dígitos). Única regra para o cadastro unitário,
+    a importação em lote e a migração "cpf-cnpj"
+    """
+    return re.sub(r"\D", "", value or "") or (value or "").strip()
+
+def normalize_cpf_cnpj(value: Optional[str]) -> str:
+    digitos = re.sub(r"\D", "", value or "")
+    return digitos if len(digitos) in (11, 14) else ""
+
+def normalize_email(value: Optional[str]) -> str:
+    """Minúsculo, sem +tag; no Gmail também sem pontos no usuário"""
+    email = (value or "").strip().lower()
+    if "@" not in email:
+        return ""
+    usuario, dominio = email.rsplit("@", 1)
+    usuario = usuario.split("+", 1)[0]
+    if dominio in ("gmail.com", "googlemail.com"):
+        usuario, dominio = usuario.replace(".", ""), "gmail.com"
+    return f"{usuario}@{dominio}" if usuario else ""
+
+def normalize_telefone(value: Optional[str]) -> str:
+    """DDD + número (10 ou 11 dígitos), sem DDI 55 nem zero de operadora"""
+    digitos = re.sub(r"\D", "", value or "")
+    if len(digitos) in (12, 13) and digitos.startswith("55"):
+        digitos = digitos[2:]
+    digitos = digitos.lstrip("0")
+    return digitos if len(digitos) in (10, 11) else ""
+
+def _keyed_hash(tipo: str, valor: str) -> str:
+    """HMAC: o índice não permite recuperar CPF/telefone por força bruta sem a chave"""
+    return hmac.new(DEDUP_HASH_KEY.encode(), f"{tipo}:{valor}".encode(), hashlib.sha256).hexdigest()[:40]
+
+
+# ============================================================================
+# MINHASH / LSH
+# ============================================================================
+
+def nome_tokens(nome: Optional[str]) -> FrozenSet[str]:
+    return frozenset(t for t in normalize_descricao(nome).split() if t not in NOME_STOPWORDS)
+
+def shingles(nome: FrozenSet[str], descricao: Optional[str]) -> FrozenSet[str]:
+    """Tokens do nome + bigramas de palavras da descrição"""
+    palavras = normalize_descricao(descricao).split()
+    bigramas = {f"d:{a} {b}" for a, b in zip(palavras, palavras[1:])}
+    if len(palavras) == 1:
+        bigramas.add(f"d:{palavras[0]}")
+    return frozenset({f"n:{t}" for t in nome} | bigramas)
+
+def minhash(conjunto: Iterable[str]) -> array:
+    base = [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "big") for s in conjunto]
+    return array("Q", (min(map(mascara.__xor__, base)) for mascara in _MASCARAS))
+
+def lsh_bandas(assinatura: array) -> List[str]:
+    chaves = []
+    for banda in range(LSH_BANDAS):
+        fatia = assinatura[banda * LSH_LINHAS:(banda + 1) * LSH_LINHAS]
+        chaves.append(f"lsh{banda}:{hashlib.blake2b(fatia.tobytes(), digest_size=10).hexdigest()}")
+    return chaves
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+def minhash_similarity(a: Optional[array], b: Optional[array]) -> float:
+    """Estimativa do Jaccard pela fração de posições iguais nas assinaturas"""
+    if a is None or b is None:
+        return 0.0
+    return sum(1 for x, y in zip(a, b) if x == y) / MINHASH_PERMUTACOES
+
+
+@dataclass
+class LeadFingerprint:
+    """Tudo que a deduplicação precisa de um lead, calculado uma vez"""
+    chaves: Dict[str, str]  # motivo -> chave exata
+    bandas: List[str]
+    nome: FrozenSet[str]
+    conjunto: FrozenSet[str]
+    assinatura: Optional[array]
+
+    def keys(self) -> List[str]:
+        return list(self.chaves.values()) + self.bandas
+
+
+def lead_fingerprint(nome: Optional[str], email: Optional[str], telefone: Optional[str],
+                     cpf_cnpj: Optional[str], descricao: Optional[str]) -> LeadFingerprint:
+    chaves = {}
+    for motivo, valor in (("cpf_cnpj", normalize_cpf_cnpj(cpf_cnpj)),
+                          ("email", normalize_email(email)),
+                          ("telefone", normalize_telefone(telefone))):
+        if valor:
+            chaves[motivo] = f"{PREFIXOS[motivo]}:{_keyed_hash(motivo, valor)}"
+    nome_set = nome_tokens(nome)
+    conjunto = shingles(nome_set, descricao)
+    assinatura = minhash(conjunto) if len(conjunto) >= MINHASH_MIN_SHINGLES else None
+    return LeadFingerprint(chaves, lsh_bandas(assinatura) if assinatura else [], nome_set, conjunto, assinatura)
+
+def signature_rows(advogado_id: str, lead_id: str, fp: LeadFingerprint) -> List[dict]:
+    return [{"advogado_id": advogado_id, "chave": chave, "lead_id": lead_id} for chave in fp.keys()]
+
+
+# ============================================================================
+# DECISÃO
+# ============================================================================
+
+@dataclass
+class Candidato:
+    id: str
+    raiz: str  # lead original do grupo (duplicado_de ou o próprio id)
+    nome: FrozenSet[str]
+    area_direito: Optional[str]
+    criado_em: Optional[datetime]
+    motivos: set
+    similaridade: float
+
+
+@dataclass
+class DedupMatch:
+    lead_id: str  # lead que recebe a submissão (mesclar) ou ao qual o novo lead é vinculado
+    acao: str  # mesclar | vincular
+    motivo: str  # cpf_cnpj | email | telefone | similar
+    similaridade: float
+
+    def as_dict(self) -> dict:
+        return {"lead_id": self.lead_id, "acao": self.acao, "motivo": self.motivo,
+                "similaridade": round(self.similaridade, 3)}
+
+
+def choose_match(fp: LeadFingerprint, area_direito: Optional[str], quando: datetime,
+                 candidatos: Iterable[Candidato], mode: str = DEDUP_MODE) -> Optional[DedupMatch]:
+    """
+    Regras:
+    - mesmo CPF/CNPJ: mesma pessoa;
+    - mesmo email ou telefone: mesma pessoa se os nomes também forem parecidos
+      (famílias compartilham telefone);
+    - só similaridade (LSH): nome e nome + descrição acima dos limites.
+    A submissão é mesclada quando a pessoa é a mesma (chave exata), a área é a
+    mesma e o lead existente está dentro da janela; nos demais casos o novo
+    lead é criado e vinculado ao grupo.
+    """
+    if mode == "desligado":
+        return None
+    melhor, melhor_ordem = None, None
+    area = normalize(area_direito)
+    for candidato in candidatos:
+        nome_sim = jaccard(fp.nome, candidato.nome)
+        if "cpf_cnpj" in candidato.motivos:
+            motivo = "cpf_cnpj"
+        elif candidato.motivos & {"email", "telefone"} and nome_sim >= DEDUP_NOME_MIN:
+            motivo = "email" if "email" in candidato.motivos else "telefone"
+        elif (candidato.similaridade >= DEDUP_SIMILARIDADE and nome_sim >= DEDUP_NOME_MIN
+              and (candidato.motivos & {"similar", "email", "telefone"})):
+            motivo = "similar"
+        else:
+            continue
+
+        dentro_janela = candidato.criado_em is None or quando - candidato.criado_em <= timedelta(days=DEDUP_JANELA_DIAS)
+        mesclar = (mode == "mesclar" and motivo != "similar" and dentro_janela
+                   and normalize(candidato.area_direito) == area)
+        ordem = (FORCA[motivo], mesclar, candidato.similaridade,
+                 -(candidato.criado_em.timestamp() if candidato.criado_em else 0))
+        if melhor_ordem is None or ordem > melhor_ordem:
+            melhor_ordem = ordem
+            melhor = DedupMatch(candidato.id if mesclar else candidato.raiz,
+                                "mesclar" if mesclar else "vincular", motivo, candidato.similaridade)
+    return melhor
+
+
+# ============================================================================
+# INGESTÃO (endpoints)
+# ============================================================================
+
+def _ordenar_candidatos(motivos: Dict[str, set]) -> List[str]:
+    """Ids mais fortes primeiro (CPF/CNPJ > email/telefone > similar), até DEDUP_MAX_CANDIDATOS"""
+    ids = sorted(motivos, key=lambda i: (-max(FORCA[m] for m in motivos[i]), -len(motivos[i])))
+    return ids[:DEDUP_MAX_CANDIDATOS]
+
+async def _signature_hits(db: AsyncSession, advogado_id: str, chaves: Iterable[str]) -> Dict[str, List[str]]:
+    """Consulta pela PK de lead_assinaturas: chave -> leads que a compartilham"""
+    result = await db.execute(
+        select(LeadAssinatura.lead_id, LeadAssinatura.chave).where(
+            LeadAssinatura.advogado_id == advogado_id,
+            LeadAssinatura.chave.in_(set(chaves)),
+        )
+    )
+    por_chave: Dict[str, List[str]] = {}
+    for lead_id, chave in result.all():
+        por_chave.setdefault(chave, []).append(lead_id)
+    return por_chave
+
+async def _load_leads(db: AsyncSession, advogado_id: str, ids: Iterable[str]) -> dict:
+    ids = set(ids)
+    if not ids:
+        return {}
+    result = await db.execute(
+        select(Lead.id, Lead.nome_cliente, Lead.descricao_caso, Lead.area_direito,
+               Lead.criado_em, Lead.duplicado_de)
+        .where(Lead.advogado_id == advogado_id, Lead.id.in_(ids))
+    )
+    return {row.id: row for row in result.all()}
+
+def _motivos(fp: LeadFingerprint, por_chave: Dict[str, List[str]]) -> Dict[str, set]:
+    motivos: Dict[str, set] = {}
+    for chave in fp.keys():
+        for lead_id in por_chave.get(chave, ()):
+            motivos.setdefault(lead_id, set()).add(motivo_da_chave(chave))
+    return motivos
+
+def _candidato(row, motivos: set, fp: LeadFingerprint) -> Candidato:
+    nome = nome_tokens(row.nome_cliente)
+    return Candidato(
+        id=row.id,
+        raiz=row.duplicado_de or row.id,
+        nome=nome,
+        area_direito=row.area_direito,
+        criado_em=row.criado_em,
+        motivos=motivos,
+        similaridade=jaccard(fp.conjunto, shingles(nome, row.descricao_caso)),
+    )
+
+async def find_duplicate(db: AsyncSession, advogado_id: str, fp: LeadFingerprint,
+                         area_direito: Optional[str]) -> Optional[DedupMatch]:
+    """
+    Uma consulta pela PK de lead_assinaturas traz os leads que compartilham
+    alguma chave; só esses candidatos (no máximo DEDUP_MAX_CANDIDATOS) são
+    carregados e comparados. O custo não depende do total de leads.
+    """
+    chaves = fp.keys()
+    if DEDUP_MODE == "desligado" or not chaves:
+        return None
+
+    motivos = _motivos(fp, await _signature_hits(db, advogado_id, chaves))
+    if not motivos:
+        return None
+    ids = _ordenar_candidatos(motivos)
+    linhas = await _load_leads(db, advogado_id, ids)
+    candidatos = [_candidato(linhas[i], motivos[i], fp) for i in ids if i in linhas]
+    return choose_match(fp, area_direito, datetime.utcnow(), candidatos)
+
+
+@dataclass
+class _LoteLead:
+    """Lead do próprio lote de importação, ainda não gravado"""
+    id: str
+    nome_cliente: str
+    descricao_caso: str
+    area_direito: Optional[str]
+    criado_em: datetime
+    duplicado_de: Optional[str]
+
+
+class DedupBatch:
+    """
+    find_duplicate para um lote de submissões (importação em lote), com as
+    mesmas regras e o mesmo índice: `load` faz as duas consultas para as
+    chaves do lote inteiro e `match` decide cada submissão considerando
+    também as anteriores do lote (registradas com `add`).
+    """
+
+    def __init__(self, advogado_id: str):
+        self.advogado_id = advogado_id
+        self._por_chave: Dict[str, List[str]] = {}
+        self._linhas: dict = {}
+
+    async def load(self, db: AsyncSession, fps: List[LeadFingerprint]):
+        chaves = {chave for fp in fps for chave in fp.keys()}
+        if DEDUP_MODE == "desligado" or not chaves:
+            return
+        self._por_chave = await _signature_hits(db, self.advogado_id, chaves)
+        ids = {i for fp in fps for i in _ordenar_candidatos(_motivos(fp, self._por_chave))}
+        self._linhas = await _load_leads(db, self.advogado_id, ids)
+
+    def match(self, fp: LeadFingerprint, area_direito: Optional[str], quando: datetime) -> Optional[DedupMatch]:
+        if DEDUP_MODE == "desligado":
+            return None
+        motivos = _motivos(fp, self._por_chave)
+        candidatos = [
+            _candidato(self._linhas[i], motivos[i], fp)
+            for i in _ordenar_candidatos(motivos) if i in self._linhas
+        ]
+        if not candidatos:
+            return None
+        return choose_match(fp, area_direito, quando, candidatos)
+
+    def add(self, lead_id: str, fp: LeadFingerprint, nome_cliente: str, descricao_caso: str,
+            area_direito: Optional[str], criado_em: datetime, duplicado_de: Optional[str] = None):
+        self._linhas[lead_id] = _LoteLead(lead_id, nome_cliente, descricao_caso, area_direito,
+                                          criado_em, duplicado_de)
+        for chave in fp.keys():
+            self._por_chave.setdefault(chave, []).append(lead_id)
+
+async def index_lead(db: AsyncSession, advogado_id: str, lead_id: str, fp: LeadFingerprint):
+    """Grava as chaves do lead na mesma transação da criação"""
+    rows = signature_rows(advogado_id, lead_id, fp)
+    if rows:
+        await db.execute(insert(LeadAssinatura), rows)
+
+async def index_leads(db: AsyncSession, advogado_id: str, leads: Iterable[Tuple[str, LeadFingerprint]]):
+    """Versão em lote (importação): um executemany para todas as chaves"""
+    rows = [row for lead_id, fp in leads for row in signature_rows(advogado_id, lead_id, fp)]
+    if rows:
+        await db.execute(insert(LeadAssinatura), rows)
+
+async def merge_submission(db: AsyncSession, advogado_id: str, lead_id: str, lead_data) -> Lead:
+    """
+    Mescla um reenvio no lead existente: conta a submissão, guarda um telefone
+    novo como alternativo e registra a descrição nova como anotação.
+    Não cria lead (o total do dashboard não infla) nem nova análise.
+    """
+    result = await db.execute(
+        select(Lead).where(Lead.id == lead_id, Lead.advogado_id == advogado_id).with_for_update()
+    )
+    lead = result.scalar_one()
+    lead.submissoes = (lead.submissoes or 1) + 1
+    lead.atualizado_em = datetime.utcnow()
+
+    telefone = normalize_telefone(lead_data.telefone_cliente)
+    if (telefone and telefone != normalize_telefone(lead.telefone_cliente)
+            and not lead.telefone_alternativo):
+        lead.telefone_alternativo = lead_data.telefone_cliente
+    if normalize_descricao(lead_data.descricao_caso) != normalize_descricao(lead.descricao_caso):
+        db.add(Anotacao(
+            lead_id=lead.id,
+            advogado_id=advogado_id,
+            titulo=f"Nova submissão ({lead.submissoes}ª)",
+            conteudo=lead_data.descricao_caso[:2000],
+        ))
+    return lead
+
+def merge_webhook_data(lead: Lead) -> dict:
+    """Dados do evento de webhook "lead.mesclado" (POST /leads e /leads/bulk)"""
+    return {
+        "lead_id": lead.id,
+        "submissoes": lead.submissoes,
+        "telefone_alternativo": lead.telefone_alternativo,
+        "atualizado_em": lead.atualizado_em,
+    }
+
+
+# ============================================================================
+# DEDUPLICAÇÃO DA BASE EXISTENTE (job em lote)
+# ============================================================================
+
+DEDUP_DDL = [
+    "ALTER TABLE leads ADD COLUMN IF NOT EXISTS duplicado_de UUID REFERENCES leads(id) ON DELETE SET NULL",
+    "ALTER TABLE leads ADD COLUMN IF NOT EXISTS submissoes INTEGER NOT NULL DEFAULT 1",
+    "CREATE INDEX IF NOT EXISTS ix_leads_duplicado_de ON leads (duplicado_de)",
+]
+
+
+def refresh_conversa_resumo(db: Session, conversa_ids: List[str]) -> int:
+    """
+    Recalcula ultima_mensagem, trecho, tipo e nao_lidas das conversas a partir
+    da tabela mensagens: uma consulta de última mensagem (row_number), uma de
+    não lidas e um executemany. Retorna quantas conversas têm mensagens.
+    """
+    if not conversa_ids:
+        return 0
+    ordem = func.row_number().over(
+        partition_by=Mensagem.conversa_id,
+        order_by=(Mensagem.timestamp.desc(), Mensagem.id.desc()),
+    ).label("ordem")
+    recentes = (
+        select(Mensagem.conversa_id, Mensagem.texto, Mensagem.tipo, Mensagem.timestamp, ordem)
+        .where(Mensagem.conversa_id.in_(conversa_ids))
+        .subquery()
+    )
+    ultimas = {
+        row.conversa_id: row
+        for row in db.execute(select(recentes).where(recentes.c.ordem == 1)).all()
+    }
+    nao_lidas = dict(db.execute(
+        select(Mensagem.conversa_id, func.count(Mensagem.id))
+        .where(Mensagem.conversa_id.in_(conversa_ids), Mensagem.tipo == "cliente", Mensagem.lido.is_(False))
+        .group_by(Mensagem.conversa_id)
+    ).all())
+
+    table = Conversa.__table__
+    params = [
+        {
+            "b_id": conversa_id,
+            "b_ultima": ultimas[conversa_id].timestamp,
+            "b_texto": preview_mensagem(ultimas[conversa_id].texto),
+            "b_tipo": ultimas[conversa_id].tipo,
+            "b_nao_lidas": nao_lidas.get(conversa_id, 0),
+        }
+        for conversa_id in conversa_ids
+        if conversa_id in ultimas
+    ]
+    if params:
+        db.execute(
+            update(table)
+            .where(table.c.id == bindparam("b_id"))
+            .values(
+                ultima_mensagem=bindparam("b_ultima"),
+                ultima_mensagem_texto=bindparam("b_texto"),
+                ultima_mensagem_tipo=bindparam("b_tipo"),
+                nao_lidas=bindparam("b_nao_lidas"),
+            ),
+            params,
+        )
+    return len(params)
+
+
+def _merge_conversas(db: Session, mesclas: Dict[str, str]):
+    """
+    Uma conversa por lead (send_message e o painel assumem isso): as mensagens
+    das conversas do duplicado passam para a conversa do lead que fica e as
+    conversas esvaziadas são removidas. Se o lead que fica não tem conversa, a
+    mais antiga do duplicado passa a ser dele. O resumo da caixa de entrada das
+    conversas que receberam mensagens é recalculado.
+    Rodar depois da migração "mensagens" (o JSON legado não é movido).
+    """
+    rows = db.execute(
+        select(Conversa.id, Conversa.lead_id)
+        .where(Conversa.lead_id.in_(set(mesclas) | set(mesclas.values())))
+        .order_by(Conversa.criada_em, Conversa.id)
+    ).all()
+    grupos: Dict[str, list] = {}
+    for row in rows:
+        grupos.setdefault(mesclas.get(row.lead_id, row.lead_id), []).append(row)
+
+    movidas, removidas, reparentadas, alteradas = [], [], [], []
+    for alvo, conversas in grupos.items():
+        proprias = [c for c in conversas if c.lead_id == alvo]
+        fica = (proprias or conversas)[0]
+        if fica.lead_id != alvo:
+            reparentadas.append({"b_id": fica.id, "b_alvo": alvo})
+        outras = [c.id for c in conversas if c.id != fica.id]
+        movidas.extend({"b_origem": origem, "b_destino": fica.id} for origem in outras)
+        removidas.extend(outras)
+        if outras:
+            alteradas.append(fica.id)
+
+    conversas_t, mensagens_t = Conversa.__table__, Mensagem.__table__
+    if movidas:
+        db.execute(
+            update(mensagens_t).where(mensagens_t.c.conversa_id == bindparam("b_origem"))
+            .values(conversa_id=bindparam("b_destino")),
+            movidas,
+        )
+        db.execute(delete(conversas_t).where(conversas_t.c.id.in_(removidas)))
+    if reparentadas:
+        db.execute(
+            update(conversas_t).where(conversas_t.c.id == bindparam("b_id")).values(lead_id=bindparam("b_alvo")),
+            reparentadas,
+        )
+    refresh_conversa_resumo(db, alteradas)
+
+
+@dataclass
+class _Indexado:
+    raiz: str
+    nome: FrozenSet[str]
+    assinatura: Optional[array]
+    area_direito: Optional[str]
+    criado_em: Optional[datetime]
+
+
+def _deduplicate_advogado(db: Session, advogado_id: str, batch_size: int, mesclar: bool) -> int:
+    """
+    Percorre os leads do advogado do mais antigo ao mais novo (keyset em
+    criado_em, id) com um índice em memória chave -> leads; cada lead é
+    comparado só com os que compartilham alguma chave (O(1) esperado).
+    Reconstrói lead_assinaturas do advogado no caminho.
+    """
+    db.execute(delete(LeadAssinatura).where(LeadAssinatura.advogado_id == advogado_id))
+    db.commit()
+
+    indice: Dict[str, List[str]] = {}
+    leads: Dict[str, _Indexado] = {}
+    encontrados = 0
+    cursor = None
+    lead_table, jobs_table = Lead.__table__, AnaliseJob.__table__
+
+    while True:
+        query = select(
+            Lead.id, Lead.nome_cliente, Lead.email_cliente, Lead.telefone_cliente, Lead.cpf_cnpj,
+            Lead.descricao_caso, Lead.area_direito, Lead.urgencia, Lead.status, Lead.criado_em,
+            Lead.duplicado_de, Lead.uf, Lead.cidade,
+        ).where(Lead.advogado_id == advogado_id)
+        if cursor is not None:
+            query = query.where(tuple_(Lead.criado_em, Lead.id) > tuple_(*cursor))
+        rows = db.execute(query.order_by(Lead.criado_em, Lead.id).limit(batch_size)).all()
+        if not rows:
+            break
+
+        assinaturas, vinculos, mesclas, deltas, geo_deltas = [], [], {}, {}, {}
+        for row in rows:
+            fp = lead_fingerprint(row.nome_cliente, row.email_cliente, row.telefone_cliente,
+                                  row.cpf_cnpj, row.descricao_caso)
+            motivos: Dict[str, set] = {}
+            for chave in fp.keys():
+                for lead_id in indice.get(chave, ()):
+                    motivos.setdefault(lead_id, set()).add(motivo_da_chave(chave))
+            candidatos = [
+                Candidato(lead_id, leads[lead_id].raiz, leads[lead_id].nome, leads[lead_id].area_direito,
+                          leads[lead_id].criado_em, m, minhash_similarity(fp.assinatura, leads[lead_id].assinatura))
+                for lead_id, m in motivos.items()
+            ]
+            match = choose_match(fp, row.area_direito, row.criado_em or datetime.utcnow(), candidatos,
+                                 mode="mesclar" if mesclar else "vincular")
+
+            if match is not None and match.acao == "mesclar":
+                mesclas[row.id] = match.lead_id
+                for dimensao in LEAD_COUNTER_DIMENSIONS:
+                    chave = (dimensao, getattr(row, dimensao) or "")
+                    deltas[chave] = deltas.get(chave, 0) - 1
+                add_geo_delta(geo_deltas, geo_key(row.uf, row.cidade, row.area_direito, row.status,
+                                                  row.criado_em), -1)
+                encontrados += 1
+                continue
+
+            raiz = match.lead_id if match is not None else row.id
+            if match is not None:
+                encontrados += 1
+            if (row.duplicado_de or None) != (match.lead_id if match else None):
+                vinculos.append({"b_id": row.id, "b_raiz": match.lead_id if match else None})
+            leads[row.id] = _Indexado(raiz, fp.nome, fp.assinatura, row.area_direito, row.criado_em)
+            for chave in fp.keys():
+                indice.setdefault(chave, []).append(row.id)
+            assinaturas.extend(signature_rows(advogado_id, row.id, fp))
+
+        if vinculos:
+            db.execute(
+                update(lead_table).where(lead_table.c.id == bindparam("b_id"))
+                .values(duplicado_de=bindparam("b_raiz"), atualizado_em=datetime.utcnow()),
+                vinculos,
+            )
+        if mesclas:
+            # Filhos do duplicado passam para o lead que fica; depois ele é removido
+            _merge_conversas(db, mesclas)
+            params = [{"b_dup": dup, "b_alvo": alvo} for dup, alvo in mesclas.items()]
+            for model in (Anotacao, Tarefa):
+                table = model.__table__
+                db.execute(
+                    update(table).where(table.c.lead_id == bindparam("b_dup")).values(lead_id=bindparam("b_alvo")),
+                    params,
+                )
+            por_alvo = {}
+            for alvo in mesclas.values():
+                por_alvo[alvo] = por_alvo.get(alvo, 0) + 1
+            db.execute(
+                update(lead_table).where(lead_table.c.id == bindparam("b_id"))
+                .values(submissoes=lead_table.c.submissoes + bindparam("b_n"), atualizado_em=datetime.utcnow()),
+                [{"b_id": alvo, "b_n": n} for alvo, n in por_alvo.items()],
+            )
+            db.execute(delete(jobs_table).where(jobs_table.c.lead_id.in_(mesclas.keys())))
+            db.execute(update(lead_table).where(lead_table.c.duplicado_de.in_(mesclas.keys()))
+                       .values(duplicado_de=None))
+            db.execute(delete(lead_table).where(lead_table.c.id.in_(mesclas.keys())))
+            apply_lead_counter_deltas_sync(db, advogado_id, deltas)
+            apply_geo_deltas_sync(db, advogado_id, geo_deltas)
+        if assinaturas:
+            db.execute(insert(LeadAssinatura), assinaturas)
+        db.commit()
+        for dup in mesclas:
+            search_index.remove_lead(dup)
+
+        cursor = (rows[-1].criado_em, rows[-1].id)
+
+    return encontrados
+
+
+def deduplicate_leads(db: Session, batch_size: int = 500, mesclar: bool = False) -> int:
+    """
+    Deduplica a tabela leads inteira, um advogado por vez (duplicados nunca
+    cruzam advogados), e reconstrói o índice lead_assinaturas.
+    Sem `mesclar` apenas preenche duplicado_de; com `mesclar` os reenvios da
+    mesma pessoa na mesma área são incorporados ao lead mais antigo (mensagens
+    vão para a conversa dele; anotações e tarefas migram) e removidos, com os
+    contadores ajustados.
+    Pode ser reexecutado: o resultado é o mesmo.
+
+    Retorna o número de duplicados encontrados.
+    """
+    engine = db.get_bind()
+    if engine.dialect.name == "postgresql":
+        for statement in DEDUP_DDL:
+            db.execute(text(statement))
+    LeadAssinatura.__table__.create(engine, checkfirst=True)
+    db.commit()
+
+    advogados = [row[0] for row in db.execute(select(Lead.advogado_id).distinct()).all()]
+    return sum(_deduplicate_advogado(db, advogado_id, batch_size, mesclar) for advogado_id in advogados)
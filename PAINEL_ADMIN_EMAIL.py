@@ -0,0 +1,398 @@
+# backend/app/email_outbox.py
+# Fila durável de emails (outbox) e worker com pool de conexões SMTP
+#
+# Uso:
+#   python -m app.email_outbox            # worker em processo dedicado
+#
+# Teste local com um servidor SMTP de mentira (aiosmtpd):
+#   python -m aiosmtpd -n -l localhost:8025
+#   SMTP_SERVER=localhost SMTP_PORT=8025 SMTP_STARTTLS=false SMTP_USER= python -m app.email_outbox
+
+import logging
+import os
+import queue
+import random
+import smtplib
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from typing import Optional
+
+from sqlalchemy import bindparam, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from .models import EmailOutbox
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# CONFIGURAÇÕES
+# ============================================================================
+
+SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
+SMTP_USER = os.getenv("SMTP_USER", "your-email@gmail.com")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", "your-password")
+SMTP_FROM = os.getenv("SMTP_FROM", SMTP_USER or "noreply@advocacia.ai")
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() == "true"
+SMTP_TIMEOUT = int(os.getenv("SMTP_TIMEOUT", 30))
+
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", 4))
+SMTP_MAX_MESSAGES_PER_CONNECTION = int(os.getenv("SMTP_MAX_MESSAGES_PER_CONNECTION", 100))
+SMTP_IDLE_CHECK_SECONDS = int(os.getenv("SMTP_IDLE_CHECK_SECONDS", 30))
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 50))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", 2))
+OUTBOX_LEASE_SECONDS = int(os.getenv("OUTBOX_LEASE_SECONDS", 300))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 6))
+OUTBOX_BACKOFF_BASE = float(os.getenv("OUTBOX_BACKOFF_BASE", 30))  # segundos
+OUTBOX_BACKOFF_MAX = float(os.getenv("OUTBOX_BACKOFF_MAX", 3600))
+
+# Snapshot de um email reivindicado: não depende da sessão, seguro entre threads
+_Envio = namedtuple("_Envio", "id destinatario assunto corpo tentativas")
+
+# Falhas de conexão: a conexão é descartada e o email volta para a fila
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, OSError)
+
+
+# ============================================================================
+# ENFILEIRAMENTO (usado pelos endpoints)
+# ============================================================================
+
+def enqueue_email(db, to_email: str, subject: str, body: str) -> EmailOutbox:
+    """
+    Registra um email na outbox (Session ou AsyncSession). Não faz I/O de rede:
+    o envio acontece no worker. O commit fica a cargo do chamador, junto com a
+    operação que gerou o email.
+    """
+    item = EmailOutbox(destinatario=to_email, assunto=subject, corpo=body)
+    db.add(item)
+    return item
+
+async def outbox_status_counts(db: AsyncSession) -> dict:
+    """Quantidade de emails por status (uma query agregada)"""
+    result = await db.execute(
+        select(EmailOutbox.status, func.count(EmailOutbox.id)).group_by(EmailOutbox.status)
+    )
+    return {status: total for status, total in result.all()}
+
+
+# ============================================================================
+# POOL DE CONEXÕES SMTP
+# ============================================================================
+
+class _PooledConnection:
+    def __init__(self, server: smtplib.SMTP):
+        self.server = server
+        self.sent = 0
+        self.last_used = time.monotonic()
+
+
+class SMTPConnectionPool:
+    """
+    Mantém até `size` conexões SMTP já autenticadas (STARTTLS + login feitos uma vez).
+    Conexões ociosas são validadas com NOOP antes do reuso e recicladas após
+    SMTP_MAX_MESSAGES_PER_CONNECTION mensagens.
+    """
+
+    def __init__(self, host: str = SMTP_SERVER, port: int = SMTP_PORT,
+                 user: Optional[str] = SMTP_USER, password: Optional[str] = SMTP_PASSWORD,
+                 starttls: bool = SMTP_STARTTLS, size: int = SMTP_POOL_SIZE,
+                 max_messages: int = SMTP_MAX_MESSAGES_PER_CONNECTION):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.size = size
+        self.max_messages = max_messages
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.discarded = 0
+
+    def _connect(self) -> _PooledConnection:
+        server = smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT)
+        if self.starttls:
+            server.starttls()
+        if self.user:
+            server.login(self.user, self.password)
+        with self._lock:
+            self.opened += 1
+        return _PooledConnection(server)
+
+    def _acquire(self) -> _PooledConnection:
+        self._slots.acquire()
+        try:
+            while True:
+                try:
+                    conn = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._connect()
+                if time.monotonic() - conn.last_used < SMTP_IDLE_CHECK_SECONDS:
+                    return conn
+                try:
+                    conn.server.noop()
+                    return conn
+                except CONNECTION_ERRORS:
+                    self._close(conn)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _release(self, conn: _PooledConnection):
+        conn.last_used = time.monotonic()
+        if conn.sent >= self.max_messages:
+            self._close(conn)
+        else:
+            self._idle.put(conn)
+        self._slots.release()
+
+    def _close(self, conn: _PooledConnection):
+        with self._lock:
+            self.discarded += 1
+        try:
+            conn.server.quit()
+        except Exception:
+            pass
+
+    @contextmanager
+    def connection(self):
+        """Empresta uma conexão; em falha de conexão ela é descartada em vez de devolvida"""
+        conn = self._acquire()
+        try:
+            yield conn
+        except CONNECTION_ERRORS:
+            self._close(conn)
+            self._slots.release()
+            raise
+        except Exception:
+            self._release(conn)
+            raise
+        else:
+            conn.sent += 1
+            self._release(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._close(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+
+# ============================================================================
+# WORKER
+# ============================================================================
+
+def build_message(item) -> MIMEMultipart:
+    msg = MIMEMultipart()
+    msg["From"] = SMTP_FROM
+    msg["To"] = item.destinatario
+    msg["Subject"] = item.assunto
+    msg.attach(MIMEText(item.corpo, "html"))
+    return msg
+
+def backoff_delay(tentativas: int) -> float:
+    """Backoff exponencial com jitter: base * 2^(n-1), limitado a OUTBOX_BACKOFF_MAX"""
+    delay = min(OUTBOX_BACKOFF_BASE * (2 ** max(tentativas - 1, 0)), OUTBOX_BACKOFF_MAX)
+    return delay * random.uniform(0.5, 1.5)
+
+
+class OutboxWorker:
+    """
+    Consome a outbox em lotes:
+    1. reivindica até `batch_size` emails com FOR UPDATE SKIP LOCKED e marca
+       como "enviando" com um lease (vários workers podem rodar em paralelo);
+    2. envia em paralelo pelo pool SMTP;
+    3. grava o resultado: enviado, nova tentativa com backoff ou falhou.
+    Emails com lease vencido (worker morreu no meio) voltam a ser reivindicados.
+    """
+
+    def __init__(self, session_factory, pool: Optional[SMTPConnectionPool] = None,
+                 batch_size: int = OUTBOX_BATCH_SIZE, poll_interval: float = OUTBOX_POLL_SECONDS):
+        self.session_factory = session_factory
+        self.pool = pool or SMTPConnectionPool()
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._executor = ThreadPoolExecutor(max_workers=self.pool.size, thread_name_prefix="smtp")
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._sent = 0
+        self._retried = 0
+        self._failed = 0
+        self._batches = 0
+        self._last_batch_size = 0
+        self._last_batch_ms = 0.0
+        self._started_at = time.monotonic()
+
+    # --- ciclo -------------------------------------------------------------
+
+    def _claim(self, db: Session) -> list:
+        """
+        Reivindica o lote e conta a tentativa já aqui: um email que trava ou
+        derruba o worker volta pelo lease expirado ("enviando") e, sem isso,
+        seria reenviado para sempre sem chegar a OUTBOX_MAX_ATTEMPTS
+        """
+        agora = datetime.utcnow()
+        items = db.query(EmailOutbox).filter(
+            or_(EmailOutbox.status == "pendente", EmailOutbox.status == "enviando"),
+            EmailOutbox.proxima_tentativa <= agora
+        ).order_by(
+            EmailOutbox.proxima_tentativa
+        ).limit(self.batch_size).with_for_update(skip_locked=True).all()
+
+        lease = agora + timedelta(seconds=OUTBOX_LEASE_SECONDS)
+        envios = []
+        mortos = 0
+        for item in items:
+            if item.tentativas >= OUTBOX_MAX_ATTEMPTS:
+                item.status = "falhou"
+                item.ultimo_erro = "Lease expirado na última tentativa (worker interrompido durante o envio)"
+                mortos += 1
+                logger.error("Email %s descartado após %s tentativas: lease expirado", item.id, item.tentativas)
+                continue
+            item.status = "enviando"
+            item.tentativas += 1
+            item.proxima_tentativa = lease
+            envios.append(_Envio(item.id, item.destinatario, item.assunto, item.corpo, item.tentativas))
+        db.commit()
+        if mortos:
+            with self._lock:
+                self._failed += mortos
+        return envios
+
+    def _send(self, item: _Envio) -> Optional[str]:
+        """Envia um email; retorna a mensagem de erro ou None em caso de sucesso"""
+        try:
+            with self.pool.connection() as conn:
+                conn.server.send_message(build_message(item))
+            return None
+        except Exception as e:
+            return f"{type(e).__name__}: {e}"[:1000]
+
+    def run_once(self) -> int:
+        """Processa um lote; retorna quantos emails foram tentados"""
+        started = time.perf_counter()
+        db = self.session_factory()
+        try:
+            items = self._claim(db)
+            if not items:
+                return 0
+
+            erros = list(self._executor.map(self._send, items))
+
+            agora = datetime.utcnow()
+            enviados = [item.id for item, erro in zip(items, erros) if erro is None]
+            falhas = []
+            sent = retried = failed = 0
+            for item, erro in zip(items, erros):
+                if erro is None:
+                    sent += 1
+                    continue
+                tentativas = item.tentativas  # já contada em _claim
+                definitivo = tentativas >= OUTBOX_MAX_ATTEMPTS
+                falhas.append({
+                    "b_id": item.id,
+                    "b_status": "falhou" if definitivo else "pendente",
+                    "b_tentativas": tentativas,
+                    "b_proxima": agora + timedelta(seconds=backoff_delay(tentativas)),
+                    "b_erro": erro,
+                })
+                if definitivo:
+                    failed += 1
+                    logger.error("Email %s descartado após %s tentativas: %s", item.id, tentativas, erro)
+                else:
+                    retried += 1
+
+            if enviados:
+                db.execute(
+                    update(EmailOutbox)
+                    .where(EmailOutbox.id.in_(enviados))
+                    .values(status="enviado", enviado_em=agora, ultimo_erro=None)
+                )
+            if falhas:
+                table = EmailOutbox.__table__
+                db.execute(
+                    update(table)
+                    .where(table.c.id == bindparam("b_id"))
+                    .values(
+                        status=bindparam("b_status"),
+                        tentativas=bindparam("b_tentativas"),
+                        proxima_tentativa=bindparam("b_proxima"),
+                        ultimo_erro=bindparam("b_erro"),
+                    ),
+                    falhas,
+                )
+            db.commit()
+
+            with self._lock:
+                self._sent += sent
+                self._retried += retried
+                self._failed += failed
+                self._batches += 1
+                self._last_batch_size = len(items)
+                self._last_batch_ms = (time.perf_counter() - started) * 1000
+            return len(items)
+        finally:
+            db.close()
+
+    def run_forever(self):
+        while not self._stop.is_set():
+            try:
+                processed = self.run_once()
+            except Exception:
+                logger.exception("Erro no worker da outbox de email")
+                processed = 0
+            # Lote cheio: provavelmente há mais na fila, não espera
+            if processed < self.batch_size:
+                self._stop.wait(self.poll_interval)
+
+    def start(self) -> threading.Thread:
+        """Roda o worker em uma thread daemon (para uso dentro do processo da API)"""
+        self._thread = threading.Thread(target=self.run_forever, name="email-outbox", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._executor.shutdown(wait=True)
+        self.pool.close()
+
+    # --- métricas ----------------------------------------------------------
+
+    def metrics(self) -> dict:
+        with self._lock:
+            elapsed = time.monotonic() - self._started_at
+            return {
+                "sent": self._sent,
+                "retried": self._retried,
+                "failed": self._failed,
+                "batches": self._batches,
+                "last_batch_size": self._last_batch_size,
+                "last_batch_ms": round(self._last_batch_ms, 2),
+                "throughput_per_sec": round(self._sent / elapsed, 2) if elapsed else 0,
+                "smtp_connections_opened": self.pool.opened,
+                "smtp_connections_discarded": self.pool.discarded,
+            }
+
+
+if __name__ == "__main__":
+    from .database import SessionLocal
+
+    logging.basicConfig(level=logging.INFO)
+    worker = OutboxWorker(SessionLocal)
+    try:
+        worker.run_forever()
+    except KeyboardInterrupt:
+        worker.stop()
@@ -1,22 +1,53 @@
 # backend/app/routers/auth.py
 # Endpoints FastAPI para Autenticação e Gerenciamento de Advogados
 
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, status, Request
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from pydantic import BaseModel, EmailStr, Field
-from datetime import datetime, timedelta
-from typing import Optional
+from sqlalchemy import func, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only, selectinload
+from pydantic import BaseModel, EmailStr, Field, field_validator
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Literal, Optional
+import asyncio
+import base64
+import hmac
+import json
 import jwt
-import bcrypt
 import os
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-import smtplib
 
 # Importar modelos
-from ..models import User, AdvogadoProfile, Lead, Conversa, Anotacao, Tarefa
-from ..database import get_db
+from ..models import (
+    User, AdvogadoProfile, Lead, Conversa, Mensagem, Anotacao, Tarefa, Exportacao, Webhook, WebhookEvento,
+    encrypt_data, preview_mensagem
+)
+from ..database import AsyncSessionLocal, SessionLocal, get_db
+from ..matching import matching_index
+from ..email_outbox import enqueue_email, outbox_status_counts
+from ..analysis import analysis_cache, analysis_stats, analysis_status_counts, enqueue_analysis
+from ..dedup import (
+    canonical_cpf_cnpj, find_duplicate, index_lead, lead_fingerprint, merge_submission, merge_webhook_data
+)
+from ..http_cache import (
+    anotacoes_version, conditional_json, lead_version, mensagens_version, profile_version, response_cache
+)
+from ..archive import archived_anotacoes, archived_lead_body, archived_messages, load_archived_case
+from ..geo import apply_geo_deltas, geo_from_endereco, geo_rollup, geo_transition, lead_geo_key, normalize_cidade, normalize_uf
+from ..stats import get_lead_stats, apply_lead_counters, lead_counter_values
+from ..export import EXPORT_WRITERS, expire_stale_exports, export_filename, run_export_job, serialize_exportacao, stream_export
+from ..search import SEARCH_MAX_OFFSET, SEARCH_PAGE_SIZE, search, search_index
+from ..lead_import import LEADS_BULK_BATCH_SIZE, ImportFormatError, detect_format, import_leads, iter_records
+from ..tarefas import tarefa_scheduler
+from ..webhooks import (
+    WEBHOOK_MAX_POR_ADVOGADO, check_webhook_destination, enqueue_webhook_event, new_webhook_secret,
+    requeue_failed, validate_eventos, validate_webhook_url, webhook_registry, webhook_status_counts
+)
+from ..workers import background_workers
+from ..realtime import broker, publish_lead_event, sse_stream, advogado_channel, lead_channel
+from ..rate_limit import RateLimited, client_ip, rate_limiter
+from ..security import password_hasher, principal_cache, Principal, PasswordPoolSaturated
+from ..profiling import ProfiledJSONResponse, profiling_registry, span, timed
 from ..schemas import (
     UserCreate, UserLogin, Token, AdvogadoProfileCreate, 
     AdvogadoProfileUpdate, LeadCreate, LeadUpdate
@@ -29,13 +60,18 @@ from ..schemas import (
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
-SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
-SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
-SMTP_USER = os.getenv("SMTP_USER", "your-email@gmail.com")
-SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", "your-password")
+PAGE_SIZE_DEFAULT = 20
+PAGE_SIZE_MAX = 100
+MESSAGES_PAGE_SIZE = 50
+MENSAGEM_MAX_CHARS = 4000  # Mensagem.texto é String(4000)
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+# Token de ?token= dos streams SSE: só abre a conexão, então pode durar pouco
+STREAM_TOKEN_SECONDS = int(os.getenv("STREAM_TOKEN_SECONDS", 60))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")  # vazio: /metrics desabilitado
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
-router = APIRouter(prefix="/auth", tags=["auth"])
+oauth2_scheme_optional = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
+router = APIRouter(prefix="/auth", tags=["auth"], default_response_class=ProfiledJSONResponse)
 
 
 # ============================================================================
@@ -79,17 +115,25 @@ class AdvogadoProfileUpdate(BaseModel):
     ativo: Optional[bool] = None
 
 class LeadCreate(BaseModel):
-    nome_cliente: str
+    # Limites iguais aos das colunas de Lead: um valor longo vira erro de
+    # validação (linha no relatório de /leads/bulk), não DataError no INSERT
+    nome_cliente: str = Field(..., max_length=255)
     email_cliente: EmailStr
-    telefone_cliente: str
-    tipo_cliente: str  # PF | PJ
-    cpf_cnpj: str
-    area_direito: str
-    descricao_caso: str
-    urgencia: str = "media"
+    telefone_cliente: str = Field(..., max_length=40)
+    tipo_cliente: str = Field(..., max_length=50)  # PF | PJ
+    cpf_cnpj: str = Field(..., max_length=20)
+    area_direito: str = Field(..., max_length=100)
+    descricao_caso: str = Field(..., max_length=2000)
+    urgencia: str = Field("media", max_length=50)
     endereco: dict = {}
-    canal_preferido: Optional[str] = None
-    horario_preferido: Optional[str] = None
+    canal_preferido: Optional[str] = Field(None, max_length=50)
+    horario_preferido: Optional[str] = Field(None, max_length=100)
+
+    @field_validator("cpf_cnpj")
+    @classmethod
+    def cpf_cnpj_canonico(cls, value: str) -> str:
+        # Mesma forma gravada por POST /leads, /leads/intake e /leads/bulk
+        return canonical_cpf_cnpj(value)
 
 class LeadUpdate(BaseModel):
     status: Optional[str] = None
@@ -97,18 +141,84 @@ class LeadUpdate(BaseModel):
     urgencia: Optional[str] = None
     analise_ia: Optional[dict] = None
 
+class ConversasLidas(BaseModel):
+    conversa_ids: Optional[List[str]] = Field(None, max_length=500)  # None: todas as conversas
+
+def utc_naive(value: Optional[datetime]) -> Optional[datetime]:
+    """Datas com fuso viram UTC sem fuso (as colunas DateTime do banco são UTC naive)"""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+class TarefaCreate(BaseModel):
+    titulo: str = Field(..., min_length=1, max_length=255)
+    descricao: Optional[str] = Field(None, max_length=2000)
+    lead_id: Optional[str] = None
+    prioridade: Literal["baixa", "media", "alta"] = "media"
+    data_vencimento: Optional[datetime] = None
+
+    @field_validator("data_vencimento")
+    @classmethod
+    def data_vencimento_utc(cls, value: Optional[datetime]) -> Optional[datetime]:
+        return utc_naive(value)
+
+class TarefaUpdate(BaseModel):
+    titulo: Optional[str] = Field(None, min_length=1, max_length=255)
+    descricao: Optional[str] = Field(None, max_length=2000)
+    prioridade: Optional[Literal["baixa", "media", "alta"]] = None
+    data_vencimento: Optional[datetime] = None
+    concluida: Optional[bool] = None
+
+    @field_validator("data_vencimento")
+    @classmethod
+    def data_vencimento_utc(cls, value: Optional[datetime]) -> Optional[datetime]:
+        return utc_naive(value)
+
+class WebhookCreate(BaseModel):
+    url: str = Field(..., max_length=500)
+    eventos: List[str] = Field(..., min_length=1)  # lead.criado | lead.atualizado | lead.mesclado | mensagem.criada
+    max_concorrencia: int = Field(4, ge=1, le=16)
+
 
 # ============================================================================
 # FUNÇÕES AUXILIARES
 # ============================================================================
 
-def hash_password(password: str) -> str:
-    """Faz hash da senha com bcrypt"""
-    return bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+def _password_pool_busy() -> HTTPException:
+    """Resposta 503 quando o pool de hash de senhas está saturado"""
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Serviço temporariamente sobrecarregado, tente novamente",
+        headers={"Retry-After": "1"},
+    )
 
-def verify_password(password: str, hashed: str) -> bool:
-    """Verifica senha com bcrypt"""
-    return bcrypt.checkpw(password.encode(), hashed.encode())
+async def enforce_rate_limit(request: Request, rota: str, **valores: Optional[str]):
+    """
+    Consome os buckets da rota (IP + dimensões extras) antes de qualquer
+    hash, consulta ou email; bucket vazio responde 429 com Retry-After.
+    """
+    try:
+        await rate_limiter.check(rota, ip=client_ip(request), **valores)
+    except RateLimited as exc:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Muitas tentativas, tente novamente mais tarde",
+            headers={"Retry-After": str(exc.retry_after)},
+        )
+
+async def hash_password(password: str) -> str:
+    """Faz hash da senha com bcrypt (pool dedicado, fora do event loop)"""
+    try:
+        return await password_hasher.hash(password)
+    except PasswordPoolSaturated:
+        raise _password_pool_busy()
+
+async def verify_password(password: str, hashed: str) -> bool:
+    """Verifica senha com bcrypt (pool dedicado, fora do event loop)"""
+    try:
+        return await password_hasher.verify(password, hashed)
+    except PasswordPoolSaturated:
+        raise _password_pool_busy()
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Cria JWT token"""
@@ -118,54 +228,132 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    with span("jwt"):
+        encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
-    """Valida JWT token e retorna usuário"""
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> Principal:
+    """
+    Valida JWT token e retorna o usuário autenticado.
+    Tokens já verificados são servidos do cache sem consultar a tabela users.
+    """
+    principal = principal_cache.get(token)
+    if principal is not None:
+        return principal
+    
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Credenciais inválidas",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        with span("jwt"):
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
-        if email is None:
+        if email is None or payload.get("type") == "stream":
             raise credentials_exception
     except jwt.PyJWTError:
         raise credentials_exception
     
-    user = db.query(User).filter(User.email == email).first()
+    principal = await _load_principal(db, email, credentials_exception)
+    principal_cache.put(token, principal, payload.get("exp"))
+    return principal
+
+async def _load_principal(db: AsyncSession, email: str, credentials_exception: HTTPException) -> Principal:
+    result = await db.execute(select(User).where(User.email == email))
+    user = result.scalar_one_or_none()
     if user is None:
         raise credentials_exception
-    return user
+    if not user.is_active:
+        raise HTTPException(status_code=403, detail="Usuário inativo")
+    return Principal.from_user(user)
+
+def create_stream_token(principal: Principal) -> str:
+    """JWT de STREAM_TOKEN_SECONDS aceito só em ?token= dos streams SSE"""
+    return create_access_token(
+        {"sub": principal.email, "type": "stream"}, timedelta(seconds=STREAM_TOKEN_SECONDS)
+    )
+
+async def get_stream_user(
+    request: Request,
+    bearer: Optional[str] = Depends(oauth2_scheme_optional)
+) -> Principal:
+    """
+    Autenticação para streams SSE: o EventSource do navegador não envia
+    headers customizados, então ?token= aceita um token de stream
+    (POST /eventos/token, STREAM_TOKEN_SECONDS): o JWT de acesso não vai
+    parar em logs de acesso e de proxies, e o que vaza expira em segundos.
+    Usa uma sessão própria, fechada antes de o stream começar: get_db
+    seguraria uma conexão do pool enquanto a aba estiver aberta.
+    """
+    if bearer:
+        principal = principal_cache.get(bearer)
+        if principal is not None:
+            return principal
+        async with AsyncSessionLocal() as db:
+            return await get_current_user(bearer, db)
+    
+    credentials_exception = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token de stream inválido")
+    try:
+        with span("jwt"):
+            payload = jwt.decode(request.query_params.get("token") or "", SECRET_KEY, algorithms=[ALGORITHM])
+    except jwt.PyJWTError:
+        raise credentials_exception
+    if payload.get("type") != "stream" or payload.get("sub") is None:
+        raise credentials_exception
+    async with AsyncSessionLocal() as db:
+        return await _load_principal(db, payload["sub"], credentials_exception)
+
+def require_metrics_token(request: Request):
+    """
+    Protege /metrics e /metrics/prometheus: exige METRICS_TOKEN em
+    `Authorization: Bearer` ou `X-Metrics-Token` (comparação em tempo constante).
+    Sem METRICS_TOKEN configurado as rotas respondem 404.
+    """
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    
+    auth = request.headers.get("Authorization", "")
+    token = auth[7:] if auth[:7].lower() == "bearer " else request.headers.get("X-Metrics-Token", "")
+    if not hmac.compare_digest(token.encode(), METRICS_TOKEN.encode()):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token de métricas inválido",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+def encode_cursor(*values) -> str:
+    """Codifica a posição de paginação keyset (ex.: criado_em, id) em um token opaco"""
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
 
-def send_email(to_email: str, subject: str, body: str):
-    """Envia email"""
+def decode_cursor(cursor: str) -> list:
+    """Decodifica um cursor gerado por encode_cursor (400 se inválido)"""
     try:
-        msg = MIMEMultipart()
-        msg["From"] = SMTP_USER
-        msg["To"] = to_email
-        msg["Subject"] = subject
-        msg.attach(MIMEText(body, "html"))
-        
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()
-            server.login(SMTP_USER, SMTP_PASSWORD)
-            server.send_message(msg)
-    except Exception as e:
-        print(f"Erro ao enviar email: {e}")
-
-def send_confirmation_email(background_tasks: BackgroundTasks, email: str, token: str):
-    """Envia email de confirmação em background"""
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+@timed("serialization")
+def serialize_mensagem(m: Mensagem) -> dict:
+    """Formato de mensagem exposto pela API"""
+    return {
+        "id": m.id,
+        "tipo": m.tipo,
+        "texto": m.texto,
+        "timestamp": m.timestamp.isoformat(),
+        "lido": m.lido
+    }
+
+def send_confirmation_email(db: AsyncSession, email: str, token: str):
+    """Enfileira email de confirmação na outbox (enviado pelo worker)"""
     confirmation_url = f"https://seu-dominio.com/confirmar-email?token={token}"
     body = f"""
     <h2>Confirme seu email</h2>
     <p>Clique no link abaixo para confirmar seu email:</p>
     <a href="{confirmation_url}">Confirmar Email</a>
     """
-    background_tasks.add_task(send_email, email, "Confirme seu email", body)
+    enqueue_email(db, email, "Confirme seu email", body)
 
 
 # ============================================================================
@@ -174,10 +362,10 @@ def send_confirmation_email(background_tasks: BackgroundTasks, email: str, token
 
 @router.post("/register/advogado", response_model=Token)
 async def register_advogado(
+    request: Request,
     user_data: UserCreate,
     advogado_data: AdvogadoProfileCreate,
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Registra novo advogado com perfil profissional.
@@ -189,27 +377,31 @@ async def register_advogado(
     4. Retorna token de acesso
     """
     
+    await enforce_rate_limit(request, "register")
+    
     # Verificar se email já existe
-    existing_user = db.query(User).filter(User.email == user_data.email).first()
-    if existing_user:
+    result = await db.execute(select(User.id).where(User.email == user_data.email))
+    if result.first():
         raise HTTPException(status_code=400, detail="Email já cadastrado")
     
     # Verificar se OAB já existe
-    existing_oab = db.query(AdvogadoProfile).filter(
-        AdvogadoProfile.oab_numero == advogado_data.oab_numero,
-        AdvogadoProfile.oab_estado == advogado_data.oab_estado
-    ).first()
-    if existing_oab:
+    result = await db.execute(
+        select(AdvogadoProfile.id).where(
+            AdvogadoProfile.oab_numero == advogado_data.oab_numero,
+            AdvogadoProfile.oab_estado == advogado_data.oab_estado
+        )
+    )
+    if result.first():
         raise HTTPException(status_code=400, detail="OAB já cadastrada")
     
     # Criar usuário
     user = User(
         email=user_data.email,
         full_name=user_data.full_name,
-        password_hash=hash_password(user_data.password)
+        password_hash=await hash_password(user_data.password)
     )
     db.add(user)
-    db.flush()  # Flush para obter o ID
+    await db.flush()  # Flush para obter o ID
     
     # Criar perfil do advogado
     profile = AdvogadoProfile(
@@ -227,11 +419,12 @@ async def register_advogado(
         horario_atendimento=advogado_data.horario_atendimento
     )
     db.add(profile)
-    db.commit()
     
-    # Enviar email de confirmação
+    # Enfileirar email de confirmação (mesma transação do cadastro)
     token = create_access_token({"sub": user.email})
-    send_confirmation_email(background_tasks, user.email, token)
+    send_confirmation_email(db, user.email, token)
+    await db.commit()
+    matching_index.upsert(profile)
     
     return {
         "access_token": token,
@@ -243,22 +436,35 @@ async def register_advogado(
 
 @router.post("/login", response_model=Token)
 async def login(
+    request: Request,
     form_data: UserLogin,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Login do advogado.
     Retorna JWT token para usar em requisições autenticadas.
+    Limitado por IP e por email (429 antes do bcrypt).
     """
     
+    await enforce_rate_limit(request, "login", email=form_data.email)
+    
     # Buscar usuário
-    user = db.query(User).filter(User.email == form_data.email).first()
-    if not user or not verify_password(form_data.password, user.password_hash):
+    result = await db.execute(select(User).where(User.email == form_data.email))
+    user = result.scalar_one_or_none()
+    if not user or not await verify_password(form_data.password, user.password_hash):
         raise HTTPException(status_code=401, detail="Email ou senha inválidos")
     
     if not user.is_active:
         raise HTTPException(status_code=403, detail="Usuário inativo")
     
+    # Rehash transparente quando BCRYPT_ROUNDS muda
+    if password_hasher.needs_rehash(user.password_hash):
+        try:
+            user.password_hash = await password_hasher.hash(form_data.password)
+            await db.commit()
+        except PasswordPoolSaturated:
+            pass  # Tenta novamente no próximo login
+    
     # Criar token
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
@@ -276,13 +482,16 @@ async def login(
 
 @router.post("/reset-password")
 async def reset_password(
+    request: Request,
     email: str,
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    """Envia link para resetar senha"""
+    """Envia link para resetar senha (limitado por IP e por email)"""
+    
+    await enforce_rate_limit(request, "reset-password", email=email)
     
-    user = db.query(User).filter(User.email == email).first()
+    result = await db.execute(select(User).where(User.email == email))
+    user = result.scalar_one_or_none()
     if not user:
         raise HTTPException(status_code=404, detail="Usuário não encontrado")
     
@@ -296,7 +505,8 @@ async def reset_password(
     <p>Clique no link abaixo para resetar sua senha:</p>
     <a href="{reset_url}">Resetar Senha</a>
     """
-    background_tasks.add_task(send_email, email, "Reset de Senha", body)
+    enqueue_email(db, email, "Reset de Senha", body)
+    await db.commit()
     
     return {"message": "Email de reset enviado"}
 
@@ -307,18 +517,30 @@ async def reset_password(
 
 @router.get("/profile")
 async def get_profile(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    """Retorna perfil do advogado logado"""
-    
-    profile = db.query(AdvogadoProfile).filter(
-        AdvogadoProfile.user_id == current_user.id
-    ).first()
+    """
+    Retorna perfil do advogado logado.
+    Responde com ETag; If-None-Match com o mesmo valor recebe 304.
+    """
     
-    if not profile:
+    versao = await profile_version(db, current_user.id)
+    if versao is None:
         raise HTTPException(status_code=404, detail="Perfil não encontrado")
     
+    return await conditional_json(
+        request, current_user.id, "profile", "", versao, lambda: _profile_body(db, current_user.id)
+    )
+
+
+async def _profile_body(db: AsyncSession, user_id: str) -> dict:
+    result = await db.execute(
+        select(AdvogadoProfile).where(AdvogadoProfile.user_id == user_id)
+    )
+    profile = result.scalar_one()
+    
     return {
         "id": profile.id,
         "user_id": profile.user_id,
@@ -339,14 +561,15 @@ async def get_profile(
 @router.put("/profile")
 async def update_profile(
     profile_data: AdvogadoProfileUpdate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """Atualiza perfil do advogado"""
     
-    profile = db.query(AdvogadoProfile).filter(
-        AdvogadoProfile.user_id == current_user.id
-    ).first()
+    result = await db.execute(
+        select(AdvogadoProfile).where(AdvogadoProfile.user_id == current_user.id)
+    )
+    profile = result.scalar_one_or_none()
     
     if not profile:
         raise HTTPException(status_code=404, detail="Perfil não encontrado")
@@ -366,7 +589,9 @@ async def update_profile(
         profile.ativo = profile_data.ativo
     
     profile.updated_at = datetime.utcnow()
-    db.commit()
+    await db.commit()
+    matching_index.upsert(profile)
+    response_cache.invalidate(current_user.id, "profile")
     
     return {"message": "Perfil atualizado com sucesso"}
 
@@ -375,16 +600,33 @@ async def update_profile(
 # ENDPOINTS DE LEADS (CRM)
 # ============================================================================
 
-@router.post("/leads")
-async def create_lead(
-    lead_data: LeadCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    """Cria novo lead para o advogado"""
+async def _create_lead_for(db: AsyncSession, advogado_id: str, lead_data: LeadCreate) -> dict:
+    """
+    Grava um lead do advogado (criação direta ou via roteamento): dedup,
+    contadores, mapa, análise IA e outbox de webhooks na mesma transação.
+    """
+    fingerprint = lead_fingerprint(
+        lead_data.nome_cliente, lead_data.email_cliente, lead_data.telefone_cliente,
+        lead_data.cpf_cnpj, lead_data.descricao_caso
+    )
+    duplicado = await find_duplicate(db, advogado_id, fingerprint, lead_data.area_direito)
     
+    if duplicado and duplicado.acao == "mesclar":
+        lead = await merge_submission(db, advogado_id, duplicado.lead_id, lead_data)
+        await enqueue_webhook_event(db, advogado_id, "lead.mesclado", merge_webhook_data(lead))
+        await db.commit()
+        response_cache.invalidate(advogado_id, "lead", lead.id)
+        response_cache.invalidate(advogado_id, "anotacoes", lead.id)
+        return {
+            "id": lead.id,
+            "status": lead.status,
+            "criado_em": lead.criado_em,
+            "duplicado": duplicado.as_dict()
+        }
+    
+    uf, cidade = geo_from_endereco(lead_data.endereco)
     lead = Lead(
-        advogado_id=current_user.id,
+        advogado_id=advogado_id,
         nome_cliente=lead_data.nome_cliente,
         email_cliente=lead_data.email_cliente,
         telefone_cliente=lead_data.telefone_cliente,
@@ -394,63 +636,310 @@ async def create_lead(
         descricao_caso=lead_data.descricao_caso,
         urgencia=lead_data.urgencia,
         endereco=lead_data.endereco,
+        uf=uf or None,
+        cidade=cidade or None,
         canal_preferido=lead_data.canal_preferido,
-        horario_preferido=lead_data.horario_preferido
+        horario_preferido=lead_data.horario_preferido,
+        duplicado_de=duplicado.lead_id if duplicado else None
     )
     db.add(lead)
-    db.commit()
+    await db.flush()  # Flush para aplicar defaults (status, urgencia)
+    await apply_lead_counters(db, advogado_id, None, lead_counter_values(lead))
+    await apply_geo_deltas(db, advogado_id, geo_transition(None, lead_geo_key(lead)))
+    await index_lead(db, advogado_id, lead.id, fingerprint)
+    enqueue_analysis(db, lead.id)  # analise_ia é preenchida pelo worker de analysis.py
+    await enqueue_webhook_event(db, advogado_id, "lead.criado", {"lead": serialize_lead(lead)})
+    await db.commit()
+    matching_index.record_assignment(advogado_id)  # cota do plano no mês
     
     return {
         "id": lead.id,
         "status": lead.status,
-        "criado_em": lead.criado_em
+        "criado_em": lead.criado_em,
+        "duplicado": duplicado.as_dict() if duplicado else None
+    }
+
+
+@router.post("/leads")
+async def create_lead(
+    request: Request,
+    lead_data: LeadCreate,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Cria novo lead para o advogado.
+    
+    Reenvios do mesmo cliente (CPF/CNPJ, email ou telefone, ou nome e
+    descrição muito parecidos) são detectados pelo índice de dedup.py:
+    na mesma área, a submissão é mesclada no lead existente (nenhum lead
+    novo é criado); nos demais casos o lead é criado com `duplicado_de`.
+    """
+    
+    await enforce_rate_limit(request, "leads", usuario=current_user.id)
+    return await _create_lead_for(db, current_user.id, lead_data)
+
+
+@router.post("/leads/intake", status_code=201)
+async def intake_lead(
+    request: Request,
+    lead_data: LeadCreate,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Entrada pública de leads (formulário do site): escolhe o advogado pelo
+    índice de matching.py (área, cidade/estado, horário de atendimento e
+    cota do plano) e grava o lead para ele, com o mesmo fluxo de /leads.
+    O índice é recarregado em uma thread quando passa de
+    MATCHING_REFRESH_SECONDS (o primeiro uso no processo faz o rebuild).
+    """
+    
+    await enforce_rate_limit(request, "leads-intake", email=lead_data.email_cliente)
+    await asyncio.to_thread(matching_index.ensure_fresh, SessionLocal)
+    
+    candidatos = matching_index.match(
+        lead_data.area_direito,
+        cidade=lead_data.endereco.get("cidade"),
+        estado=lead_data.endereco.get("estado"),
+        urgencia=lead_data.urgencia,
+        limit=1
+    )
+    if not candidatos:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Nenhum advogado disponível para esta área e região no momento"
+        )
+    escolhido = candidatos[0]
+    
+    resultado = await _create_lead_for(db, escolhido.advogado_id, lead_data)
+    return {
+        "id": resultado["id"],
+        "status": resultado["status"],
+        "criado_em": resultado["criado_em"],
+        "advogado": {"nome": escolhido.nome, "aberto_agora": escolhido.aberto_agora}
     }
 
 
+@router.post("/leads/bulk")
+async def bulk_create_leads(
+    request: Request,
+    formato: Optional[str] = None,
+    batch_size: int = LEADS_BULK_BATCH_SIZE,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Importa leads em lote (campanhas pagas, migração de outros CRMs).
+    
+    Corpo em NDJSON (um LeadCreate por linha) ou CSV com cabeçalho
+    (Content-Type: text/csv ou ?formato=csv; colunas cidade/estado/cep/...
+    formam o endereço). O corpo é lido em streaming e gravado em lotes de
+    `batch_size`, cada lote comitado. Reenvios são deduplicados como em
+    POST /leads (mesmo índice de dedup.py): mesclados no lead existente ou
+    gravados com `duplicado_de`. Retorna contadores e o relatório de erros por linha.
+    """
+    
+    await enforce_rate_limit(request, "leads", usuario=current_user.id)
+    
+    try:
+        formato = detect_format(request.headers.get("content-type"), formato)
+    except ImportFormatError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    
+    report = await import_leads(
+        db, current_user.id, iter_records(request.stream(), formato), LeadCreate, batch_size
+    )
+    for lead_id in report.leads_mesclados:
+        response_cache.invalidate(current_user.id, "lead", lead_id)
+        response_cache.invalidate(current_user.id, "anotacoes", lead_id)
+    return report.as_dict()
+
+
 @router.get("/leads")
 async def list_leads(
     status: Optional[str] = None,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    area: Optional[str] = None,
+    urgencia: Optional[str] = None,
+    qualificacao: Optional[str] = None,
+    criado_de: Optional[datetime] = None,
+    criado_ate: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = PAGE_SIZE_DEFAULT,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    """Lista leads do advogado com filtros opcionais"""
+    """
+    Lista leads do advogado com filtros opcionais.
     
-    query = db.query(Lead).filter(Lead.advogado_id == current_user.id)
+    Paginação keyset em (criado_em, id): passe o `next_cursor` da resposta
+    anterior em `cursor`. Apenas as colunas da listagem são carregadas
+    (sem hidratar objetos ORM).
+    """
+    
+    limit = max(1, min(limit, PAGE_SIZE_MAX))
+    
+    query = select(
+        Lead.id,
+        Lead.nome_cliente,
+        Lead.area_direito,
+        Lead.status,
+        Lead.urgencia,
+        Lead.qualificacao,
+        Lead.criado_em
+    ).where(Lead.advogado_id == current_user.id)
     
     if status:
-        query = query.filter(Lead.status == status)
+        query = query.where(Lead.status == status)
+    if area:
+        query = query.where(Lead.area_direito == area)
+    if urgencia:
+        query = query.where(Lead.urgencia == urgencia)
+    if qualificacao:
+        query = query.where(Lead.qualificacao == qualificacao)
+    if criado_de:
+        query = query.where(Lead.criado_em >= criado_de)
+    if criado_ate:
+        query = query.where(Lead.criado_em < criado_ate)
+    
+    if cursor:
+        try:
+            cursor_criado_em, cursor_id = decode_cursor(cursor)
+            cursor_criado_em = datetime.fromisoformat(cursor_criado_em)
+        except (ValueError, TypeError):
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+        query = query.where(
+            tuple_(Lead.criado_em, Lead.id) < tuple_(cursor_criado_em, cursor_id)
+        )
     
-    leads = query.order_by(Lead.criado_em.desc()).all()
+    # Busca um item a mais para saber se existe próxima página
+    result = await db.execute(query.order_by(Lead.criado_em.desc(), Lead.id.desc()).limit(limit + 1))
+    rows = result.all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
     
-    return [
-        {
-            "id": lead.id,
-            "nome_cliente": lead.nome_cliente,
-            "area_direito": lead.area_direito,
-            "status": lead.status,
-            "urgencia": lead.urgencia,
-            "criado_em": lead.criado_em
-        }
-        for lead in leads
-    ]
+    return {
+        "leads": [
+            {
+                "id": row.id,
+                "nome_cliente": row.nome_cliente,
+                "area_direito": row.area_direito,
+                "status": row.status,
+                "urgencia": row.urgencia,
+                "qualificacao": row.qualificacao,
+                "criado_em": row.criado_em
+            }
+            for row in rows
+        ],
+        "next_cursor": encode_cursor(rows[-1].criado_em, rows[-1].id) if has_more else None,
+        "limit": limit
+    }
+
+
+def _export_params(formato: str, status: Optional[str], area: Optional[str],
+                   criado_de: Optional[datetime], criado_ate: Optional[datetime]) -> dict:
+    """Valida o formato e monta os filtros da exportação (serializáveis em JSON)"""
+    if formato not in EXPORT_WRITERS:
+        raise HTTPException(status_code=400, detail=f"Formato deve ser um de: {', '.join(EXPORT_WRITERS)}")
+    return {
+        "status": status,
+        "area": area,
+        "criado_de": criado_de.isoformat() if criado_de else None,
+        "criado_ate": criado_ate.isoformat() if criado_ate else None,
+    }
+
+
+@router.get("/leads/export")
+async def export_leads(
+    formato: str = "csv",
+    status: Optional[str] = None,
+    area: Optional[str] = None,
+    criado_de: Optional[datetime] = None,
+    criado_ate: Optional[datetime] = None,
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    Exporta todos os leads do advogado (com anotações e resumo das conversas)
+    em CSV, NDJSON ou XLSX, gerados em streaming a partir de um cursor no
+    servidor. Para arquivos grandes prefira POST /exportacoes.
+    """
+    
+    filtros = _export_params(formato, status, area, criado_de, criado_ate)
+    return StreamingResponse(
+        stream_export(current_user.id, formato, filtros),
+        media_type=EXPORT_WRITERS[formato].media_type,
+        headers={"Content-Disposition": f'attachment; filename="{export_filename(formato)}"'}
+    )
+
+
+@router.get("/leads/geo")
+async def get_leads_geo(
+    uf: Optional[str] = None,
+    cidade: Optional[str] = None,
+    area: Optional[str] = None,
+    status: Optional[str] = None,
+    de: Optional[date] = None,
+    ate: Optional[date] = None,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Leads por região para o MapaBrasil, lidos do rollup lead_geo_rollup.
+    
+    Sem `uf`: total por estado; com `uf`: total por cidade; com `uf` e
+    `cidade`: totais por área e status da cidade. Filtros opcionais por
+    área, status e dia de criação (`de` inclusivo, `ate` exclusivo).
+    """
+    
+    if uf is not None:
+        uf_normalizada = normalize_uf(uf)
+        if not uf_normalizada and uf.strip():
+            raise HTTPException(status_code=400, detail="UF inválida")
+        uf = uf_normalizada
+    elif cidade:
+        raise HTTPException(status_code=400, detail="Informe a UF da cidade")
+    
+    return await geo_rollup(
+        db, current_user.id,
+        uf=uf,
+        cidade=normalize_cidade(cidade) if cidade is not None else None,
+        area=area, status=status, de=de, ate=ate
+    )
 
 
 @router.get("/leads/{lead_id}")
 async def get_lead(
     lead_id: str,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    """Retorna detalhes de um lead específico"""
-    
-    lead = db.query(Lead).filter(
-        Lead.id == lead_id,
-        Lead.advogado_id == current_user.id
-    ).first()
+    """
+    Retorna detalhes de um lead específico.
+    Responde com ETag (versão = atualizado_em); If-None-Match igual recebe 304.
+    Casos encerrados já arquivados são lidos de leads_arquivo (`arquivado: true`).
+    """
     
-    if not lead:
-        raise HTTPException(status_code=404, detail="Lead não encontrado")
+    versao = await lead_version(db, current_user.id, lead_id)
+    if versao is None:
+        caso = await load_archived_case(db, current_user.id, lead_id)
+        if caso is None:
+            raise HTTPException(status_code=404, detail="Lead não encontrado")
+        return archived_lead_body(caso)
     
+    return await conditional_json(
+        request, current_user.id, "lead", lead_id, versao, lambda: _lead_body(db, current_user.id, lead_id)
+    )
+
+
+async def _lead_body(db: AsyncSession, advogado_id: str, lead_id: str) -> dict:
+    result = await db.execute(
+        select(Lead).where(Lead.id == lead_id, Lead.advogado_id == advogado_id)
+    )
+    return serialize_lead(result.scalar_one())
+
+
+def serialize_lead(lead: Lead) -> dict:
+    """Formato de detalhe do lead exposto pela API"""
     return {
         "id": lead.id,
         "nome_cliente": lead.nome_cliente,
@@ -463,28 +952,133 @@ async def get_lead(
         "qualificacao": lead.qualificacao,
         "analise_ia": lead.analise_ia,
         "endereco": lead.endereco,
+        "uf": lead.uf,
+        "cidade": lead.cidade,
         "canal_preferido": lead.canal_preferido,
+        "duplicado_de": lead.duplicado_de,
+        "submissoes": lead.submissoes,
         "criado_em": lead.criado_em
     }
 
 
+@router.get("/leads/{lead_id}/full")
+async def get_lead_full(
+    lead_id: str,
+    mensagens: int = MESSAGES_PAGE_SIZE,
+    anotacoes: int = PAGE_SIZE_DEFAULT,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Abre um caso em uma única chamada: lead, conversa com as `mensagens`
+    mais recentes, as `anotacoes` mais recentes e as tarefas pendentes.
+    
+    Número fixo de consultas (lead; conversas e tarefas via selectinload;
+    mensagens e anotações com LIMIT), independente do tamanho do histórico.
+    Os cursores devolvidos continuam em /mensagens (before/since).
+    """
+    
+    mensagens = max(0, min(mensagens, PAGE_SIZE_MAX))
+    anotacoes = max(0, min(anotacoes, PAGE_SIZE_MAX))
+    
+    result = await db.execute(
+        select(Lead)
+        .where(Lead.id == lead_id, Lead.advogado_id == current_user.id)
+        .options(
+            selectinload(Lead.conversas).options(
+                load_only(Conversa.id, Conversa.advogado_id, Conversa.nao_lidas)
+            ),
+            selectinload(Lead.tarefas.and_(
+                Tarefa.advogado_id == current_user.id,
+                Tarefa.concluida.is_(False)
+            ))
+        )
+    )
+    lead = result.scalar_one_or_none()
+    
+    if not lead:
+        caso = await load_archived_case(db, current_user.id, lead_id)
+        if caso is None:
+            raise HTTPException(status_code=404, detail="Lead não encontrado")
+        historico = archived_messages(caso)
+        notas = archived_anotacoes(caso)
+        return {
+            "lead": archived_lead_body(caso),
+            "conversa": {
+                "id": caso["conversas"][0]["id"] if caso["conversas"] else None,
+                "nao_lidas": 0,
+                "mensagens": historico[-mensagens:] if mensagens else [],
+                "since_cursor": None,
+                "before_cursor": None
+            },
+            "anotacoes": {"itens": notas[:anotacoes], "has_more": len(notas) > anotacoes},
+            "tarefas": []
+        }
+    
+    conversa = next((c for c in lead.conversas if c.advogado_id == current_user.id), None)
+    
+    ultimas = []
+    if conversa is not None and mensagens:
+        result = await db.execute(
+            select(Mensagem)
+            .where(Mensagem.conversa_id == conversa.id)
+            .order_by(Mensagem.timestamp.desc(), Mensagem.id.desc())
+            .limit(mensagens + 1)
+        )
+        ultimas = result.scalars().all()
+    mais_antigas = len(ultimas) > mensagens
+    ultimas = list(reversed(ultimas[:mensagens]))
+    
+    notas = []
+    if anotacoes:
+        result = await db.execute(
+            select(Anotacao)
+            .where(Anotacao.lead_id == lead.id, Anotacao.advogado_id == current_user.id)
+            .order_by(Anotacao.criada_em.desc(), Anotacao.id.desc())
+            .limit(anotacoes + 1)
+        )
+        notas = result.scalars().all()
+    
+    first, last = (ultimas[0], ultimas[-1]) if ultimas else (None, None)
+    tarefas = sorted(lead.tarefas, key=lambda t: (t.data_vencimento is None, t.data_vencimento or datetime.min))
+    
+    return {
+        "lead": serialize_lead(lead),
+        "conversa": {
+            "id": conversa.id if conversa else None,
+            "nao_lidas": conversa.nao_lidas if conversa else 0,
+            "mensagens": [serialize_mensagem(m) for m in ultimas],
+            "since_cursor": encode_cursor(last.timestamp, last.id) if last else None,
+            "before_cursor": encode_cursor(first.timestamp, first.id) if first and mais_antigas else None
+        },
+        "anotacoes": {
+            "itens": [serialize_anotacao(a) for a in notas[:anotacoes]],
+            "has_more": len(notas) > anotacoes
+        },
+        "tarefas": [serialize_tarefa(t) for t in tarefas]
+    }
+
+
 @router.put("/leads/{lead_id}")
 async def update_lead(
     lead_id: str,
     lead_data: LeadUpdate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """Atualiza status e qualificação de um lead"""
     
-    lead = db.query(Lead).filter(
-        Lead.id == lead_id,
-        Lead.advogado_id == current_user.id
-    ).first()
+    result = await db.execute(
+        select(Lead).where(Lead.id == lead_id, Lead.advogado_id == current_user.id)
+    )
+    lead = result.scalar_one_or_none()
     
     if not lead:
         raise HTTPException(status_code=404, detail="Lead não encontrado")
     
+    antes = lead_counter_values(lead)
+    geo_antes = lead_geo_key(lead)
+    
     if lead_data.status:
         lead.status = lead_data.status
     if lead_data.qualificacao:
@@ -495,7 +1089,27 @@ async def update_lead(
         lead.analise_ia = lead_data.analise_ia
     
     lead.atualizado_em = datetime.utcnow()
-    db.commit()
+    depois = lead_counter_values(lead)
+    await apply_lead_counters(db, current_user.id, antes, depois)
+    await apply_geo_deltas(db, current_user.id, geo_transition(geo_antes, lead_geo_key(lead)))
+    await enqueue_webhook_event(db, current_user.id, "lead.atualizado", {
+        "lead_id": lead_id,
+        "status": lead.status,
+        "status_anterior": antes["status"],
+        "urgencia": lead.urgencia,
+        "qualificacao": lead.qualificacao,
+        "atualizado_em": lead.atualizado_em
+    })
+    await db.commit()
+    response_cache.invalidate(current_user.id, "lead", lead_id)
+    
+    if depois["status"] != antes["status"]:
+        await publish_lead_event(current_user.id, lead_id, {
+            "type": "lead_status",
+            "status": lead.status,
+            "status_anterior": antes["status"],
+            "atualizado_em": lead.atualizado_em
+        })
     
     return {"message": "Lead atualizado com sucesso"}
 
@@ -507,71 +1121,467 @@ async def update_lead(
 @router.post("/leads/{lead_id}/mensagens")
 async def send_message(
     lead_id: str,
-    mensagem: str,
+    mensagem: str = Query(..., min_length=1, max_length=MENSAGEM_MAX_CHARS),
     tipo: str = "advogado",  # advogado | cliente
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """Envia mensagem em uma conversa"""
     
-    lead = db.query(Lead).filter(
-        Lead.id == lead_id,
-        Lead.advogado_id == current_user.id
-    ).first()
+    result = await db.execute(
+        select(Lead).where(Lead.id == lead_id, Lead.advogado_id == current_user.id)
+    )
+    lead = result.scalar_one_or_none()
     
     if not lead:
         raise HTTPException(status_code=404, detail="Lead não encontrado")
     
     # Buscar ou criar conversa
-    conversa = db.query(Conversa).filter(
-        Conversa.lead_id == lead_id,
-        Conversa.advogado_id == current_user.id
-    ).first()
+    result = await db.execute(
+        select(Conversa).where(
+            Conversa.lead_id == lead_id,
+            Conversa.advogado_id == current_user.id
+        )
+    )
+    conversa = result.scalar_one_or_none()
     
     if not conversa:
         conversa = Conversa(
             lead_id=lead_id,
-            advogado_id=current_user.id,
-            mensagens=[]
+            advogado_id=current_user.id
         )
         db.add(conversa)
+        await db.flush()  # Flush para obter o ID
     
-    # Adicionar mensagem
-    nova_mensagem = {
-        "tipo": tipo,
-        "texto": mensagem,
-        "timestamp": datetime.utcnow().isoformat(),
-        "lido": False
-    }
-    
-    if conversa.mensagens is None:
-        conversa.mensagens = []
+    # Adicionar mensagem (INSERT simples, sem reescrever o histórico)
+    agora = datetime.utcnow()
+    nova_mensagem = Mensagem(
+        conversa_id=conversa.id,
+        tipo=tipo,
+        texto=mensagem,
+        lido=False,
+        timestamp=agora
+    )
+    db.add(nova_mensagem)
+    # Resumo da caixa de entrada; incremento atômico (mensagens simultâneas não se perdem)
+    await db.execute(
+        update(Conversa).where(Conversa.id == conversa.id).values(
+            ultima_mensagem=agora,
+            ultima_mensagem_texto=preview_mensagem(mensagem),
+            ultima_mensagem_tipo=tipo,
+            nao_lidas=Conversa.nao_lidas + (1 if tipo == "cliente" else 0),
+            atualizada_em=agora
+        )
+    )
+    # O UPDATE acima já fez o flush: nova_mensagem tem id
+    await enqueue_webhook_event(db, current_user.id, "mensagem.criada", {
+        "lead_id": lead_id,
+        "conversa_id": conversa.id,
+        "mensagem": serialize_mensagem(nova_mensagem)
+    })
     
-    conversa.mensagens.append(nova_mensagem)
-    conversa.ultima_mensagem = datetime.utcnow()
+    await db.commit()
+    response_cache.invalidate(current_user.id, "mensagens", lead_id)
     
-    db.commit()
+    await publish_lead_event(current_user.id, lead_id, {
+        "type": "mensagem",
+        "mensagem": serialize_mensagem(nova_mensagem),
+        # since_cursor de /mensagens: o cliente retoma daqui após reconectar
+        "cursor": encode_cursor(nova_mensagem.timestamp, nova_mensagem.id)
+    })
     
-    return {"message": "Mensagem enviada com sucesso"}
+    return {
+        "message": "Mensagem enviada com sucesso",
+        "id": nova_mensagem.id,
+        "timestamp": agora
+    }
 
 
 @router.get("/leads/{lead_id}/mensagens")
 async def get_messages(
     lead_id: str,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    since: Optional[str] = None,
+    before: Optional[str] = None,
+    limit: int = MESSAGES_PAGE_SIZE,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    """Retorna histórico de mensagens de uma conversa"""
+    """
+    Retorna mensagens de uma conversa em ordem cronológica.
     
-    conversa = db.query(Conversa).filter(
-        Conversa.lead_id == lead_id,
-        Conversa.advogado_id == current_user.id
-    ).first()
+    - sem cursor: as `limit` mensagens mais recentes
+    - since=<since_cursor>: mensagens novas desde a última leitura (polling)
+    - before=<before_cursor>: página anterior do histórico
     
-    if not conversa:
-        return {"mensagens": []}
+    Responde com ETag (versão da conversa + parâmetros): um polling que
+    reenvia If-None-Match recebe 304 enquanto nada mudou.
+    """
+    
+    limit = max(1, min(limit, PAGE_SIZE_MAX))
+    
+    versao = await mensagens_version(db, current_user.id, lead_id)
+    
+    if versao is None:
+        # Caso arquivado: histórico somente leitura, as `limit` mais recentes
+        caso = await load_archived_case(db, current_user.id, lead_id) if not since else None
+        historico = archived_messages(caso)[-limit:] if caso else []
+        return {"mensagens": historico, "since_cursor": since, "before_cursor": None, "has_more": False}
+    
+    conversa_id = versao[0]
+    
+    async def corpo() -> dict:
+        query = select(Mensagem).where(Mensagem.conversa_id == conversa_id)
+        position = tuple_(Mensagem.timestamp, Mensagem.id)
+        
+        try:
+            if since:
+                ts, msg_id = decode_cursor(since)
+                query = query.where(position > tuple_(datetime.fromisoformat(ts), msg_id))
+            if before:
+                ts, msg_id = decode_cursor(before)
+                query = query.where(position < tuple_(datetime.fromisoformat(ts), msg_id))
+        except (ValueError, TypeError):
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+        
+        if since and not before:
+            # Polling: as mais antigas primeiro, a partir do cursor
+            result = await db.execute(query.order_by(Mensagem.timestamp, Mensagem.id).limit(limit + 1))
+            mensagens = result.scalars().all()
+            has_more = len(mensagens) > limit
+            mensagens = mensagens[:limit]
+            older_exists = True
+        else:
+            result = await db.execute(query.order_by(Mensagem.timestamp.desc(), Mensagem.id.desc()).limit(limit + 1))
+            mensagens = result.scalars().all()
+            older_exists = len(mensagens) > limit
+            mensagens = list(reversed(mensagens[:limit]))
+            has_more = False
+        
+        first, last = (mensagens[0], mensagens[-1]) if mensagens else (None, None)
+        
+        return {
+            "mensagens": [serialize_mensagem(m) for m in mensagens],
+            "since_cursor": encode_cursor(last.timestamp, last.id) if last else since,
+            "before_cursor": encode_cursor(first.timestamp, first.id) if first and older_exists else None,
+            "has_more": has_more
+        }
+    
+    return await conditional_json(request, current_user.id, "mensagens", lead_id, versao, corpo)
+
+
+@router.post("/leads/{lead_id}/mensagens/lidas")
+async def mark_messages_read(
+    lead_id: str,
+    tipo: str = "cliente",  # autor das mensagens a marcar: cliente | advogado
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Marca como lidas as mensagens não lidas de uma conversa (confirmação de leitura)"""
+    
+    # Lock na conversa: uma mensagem nova espera o commit e incrementa nao_lidas depois de zerado
+    conversa_id = await db.scalar(
+        select(Conversa.id).where(
+            Conversa.lead_id == lead_id,
+            Conversa.advogado_id == current_user.id
+        ).with_for_update()
+    )
+    
+    if not conversa_id:
+        raise HTTPException(status_code=404, detail="Conversa não encontrada")
+    
+    agora = datetime.utcnow()
+    result = await db.execute(
+        update(Mensagem)
+        .where(
+            Mensagem.conversa_id == conversa_id,
+            Mensagem.tipo == tipo,
+            Mensagem.lido.is_(False)
+        )
+        .values(lido=True)
+    )
+    if result.rowcount:
+        # Leitura não muda ultima_mensagem: atualizada_em versiona o ETag das mensagens
+        valores = {"atualizada_em": agora}
+        if tipo == "cliente":
+            valores["nao_lidas"] = 0
+        await db.execute(update(Conversa).where(Conversa.id == conversa_id).values(**valores))
+    await db.commit()
+    response_cache.invalidate(current_user.id, "mensagens", lead_id)
+    
+    if result.rowcount:
+        await publish_lead_event(current_user.id, lead_id, {
+            "type": "leitura",
+            "tipo": tipo,
+            "lidas_ate": agora
+        })
+    
+    return {"marcadas": result.rowcount}
+
+
+# ============================================================================
+# ENDPOINTS DE CONVERSAS (CAIXA DE ENTRADA)
+# ============================================================================
+
+@router.get("/conversas")
+async def list_conversas(
+    ativa: bool = True,
+    nao_lidas: bool = False,
+    cursor: Optional[str] = None,
+    limit: int = PAGE_SIZE_DEFAULT,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Caixa de entrada: conversas do advogado da mais recente para a mais
+    antiga, com trecho da última mensagem e quantidade de não lidas.
     
-    return {"mensagens": conversa.mensagens or []}
+    Uma consulta no índice (advogado_id, ativa, ultima_mensagem, id) com
+    paginação keyset; o histórico de mensagens não é lido.
+    `nao_lidas=true` mostra só conversas com mensagens do cliente não lidas.
+    """
+    
+    limit = max(1, min(limit, PAGE_SIZE_MAX))
+    
+    query = (
+        select(
+            Conversa.id,
+            Conversa.lead_id,
+            Lead.nome_cliente,
+            Conversa.ultima_mensagem,
+            Conversa.ultima_mensagem_texto,
+            Conversa.ultima_mensagem_tipo,
+            Conversa.nao_lidas
+        )
+        .join(Lead, Lead.id == Conversa.lead_id)
+        .where(
+            Conversa.advogado_id == current_user.id,
+            Conversa.ativa.is_(ativa),
+            Conversa.ultima_mensagem.isnot(None)
+        )
+    )
+    if nao_lidas:
+        query = query.where(Conversa.nao_lidas > 0)
+    
+    if cursor:
+        try:
+            cursor_ultima, cursor_id = decode_cursor(cursor)
+            cursor_ultima = datetime.fromisoformat(cursor_ultima)
+        except (ValueError, TypeError):
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+        query = query.where(
+            tuple_(Conversa.ultima_mensagem, Conversa.id) < tuple_(cursor_ultima, cursor_id)
+        )
+    
+    result = await db.execute(
+        query.order_by(Conversa.ultima_mensagem.desc(), Conversa.id.desc()).limit(limit + 1)
+    )
+    rows = result.all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    
+    return {
+        "conversas": [
+            {
+                "id": row.id,
+                "lead_id": row.lead_id,
+                "nome_cliente": row.nome_cliente,
+                "ultima_mensagem": row.ultima_mensagem,
+                "preview": row.ultima_mensagem_texto,
+                "ultima_mensagem_tipo": row.ultima_mensagem_tipo,
+                "nao_lidas": row.nao_lidas
+            }
+            for row in rows
+        ],
+        "next_cursor": encode_cursor(rows[-1].ultima_mensagem, rows[-1].id) if has_more else None,
+        "limit": limit
+    }
+
+
+@router.post("/conversas/lidas")
+async def mark_conversas_read(
+    dados: ConversasLidas,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Marca como lidas as mensagens do cliente de várias conversas de uma vez
+    (todas as do advogado quando `conversa_ids` não é informado).
+    """
+    
+    query = select(Conversa.id, Conversa.lead_id).where(
+        Conversa.advogado_id == current_user.id,
+        Conversa.nao_lidas > 0
+    )
+    if dados.conversa_ids is not None:
+        query = query.where(Conversa.id.in_(dados.conversa_ids))
+    result = await db.execute(query.with_for_update())
+    conversas = result.all()
+    
+    if not conversas:
+        return {"conversas": 0, "marcadas": 0}
+    
+    ids = [row.id for row in conversas]
+    agora = datetime.utcnow()
+    result = await db.execute(
+        update(Mensagem)
+        .where(
+            Mensagem.conversa_id.in_(ids),
+            Mensagem.tipo == "cliente",
+            Mensagem.lido.is_(False)
+        )
+        .values(lido=True)
+    )
+    marcadas = result.rowcount
+    await db.execute(
+        update(Conversa).where(Conversa.id.in_(ids)).values(nao_lidas=0, atualizada_em=agora)
+    )
+    await db.commit()
+    
+    for row in conversas:
+        response_cache.invalidate(current_user.id, "mensagens", row.lead_id)
+        await publish_lead_event(current_user.id, row.lead_id, {
+            "type": "leitura",
+            "tipo": "cliente",
+            "lidas_ate": agora
+        })
+    
+    return {"conversas": len(conversas), "marcadas": marcadas}
+
+
+# ============================================================================
+# ENDPOINTS DE EXPORTAÇÃO EM SEGUNDO PLANO
+# ============================================================================
+
+@router.post("/exportacoes", status_code=202)
+async def create_exportacao(
+    background_tasks: BackgroundTasks,
+    formato: str = "csv",
+    status: Optional[str] = None,
+    area: Optional[str] = None,
+    criado_de: Optional[datetime] = None,
+    criado_ate: Optional[datetime] = None,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Agenda uma exportação completa gravada em arquivo comprimido.
+    Acompanhe por GET /exportacoes/{id}; quando pronta, baixe pelo download_url.
+    """
+    
+    exportacao = Exportacao(
+        advogado_id=current_user.id,
+        formato=formato,
+        filtros=_export_params(formato, status, area, criado_de, criado_ate)
+    )
+    db.add(exportacao)
+    await db.commit()
+    
+    background_tasks.add_task(run_export_job, exportacao.id)
+    return serialize_exportacao(exportacao)
+
+
+async def _get_exportacao(db: AsyncSession, exportacao_id: str, advogado_id: str) -> Exportacao:
+    exportacao = await db.scalar(
+        select(Exportacao).where(
+            Exportacao.id == exportacao_id,
+            Exportacao.advogado_id == advogado_id
+        )
+    )
+    if not exportacao:
+        raise HTTPException(status_code=404, detail="Exportação não encontrada")
+    return exportacao
+
+
+@router.get("/exportacoes/{exportacao_id}")
+async def get_exportacao(
+    exportacao_id: str,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Estado de uma exportação em segundo plano"""
+    
+    await expire_stale_exports(db, current_user.id)
+    return serialize_exportacao(await _get_exportacao(db, exportacao_id, current_user.id))
+
+
+@router.get("/exportacoes/{exportacao_id}/download")
+async def download_exportacao(
+    exportacao_id: str,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Baixa o arquivo de uma exportação pronta"""
+    
+    exportacao = await _get_exportacao(db, exportacao_id, current_user.id)
+    if exportacao.status != "pronto":
+        raise HTTPException(status_code=409, detail="Exportação ainda não está pronta")
+    if not exportacao.arquivo or not os.path.exists(exportacao.arquivo):
+        raise HTTPException(status_code=410, detail="Arquivo expirado, gere uma nova exportação")
+    
+    return FileResponse(
+        exportacao.arquivo,
+        media_type="application/gzip" if exportacao.arquivo.endswith(".gz") else EXPORT_WRITERS[exportacao.formato].media_type,
+        filename=export_filename(exportacao.formato, compressed=True)
+    )
+
+
+# ============================================================================
+# ENDPOINTS DE EVENTOS EM TEMPO REAL (SSE)
+# ============================================================================
+
+@router.post("/eventos/token")
+async def create_stream_events_token(current_user: Principal = Depends(get_current_user)):
+    """
+    Token curto para abrir /eventos e /leads/{id}/eventos via ?token=
+    (o EventSource não envia Authorization). Peça um novo a cada conexão.
+    """
+    
+    return {"token": create_stream_token(current_user), "expires_in": STREAM_TOKEN_SECONDS}
+
+
+@router.get("/eventos")
+async def stream_advogado_events(
+    request: Request,
+    current_user: Principal = Depends(get_stream_user)
+):
+    """
+    Stream SSE com todos os eventos do advogado
+    (novas mensagens, leituras e mudanças de status de qualquer lead).
+    Substitui o polling dos dashboards abertos.
+    """
+    
+    subscription = broker.subscribe(advogado_channel(current_user.id))
+    return StreamingResponse(
+        sse_stream(request, subscription),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+
+@router.get("/leads/{lead_id}/eventos")
+async def stream_lead_events(
+    lead_id: str,
+    request: Request,
+    current_user: Principal = Depends(get_stream_user)
+):
+    """Stream SSE com os eventos de um lead específico"""
+    
+    # Sessão curta: nenhuma conexão do pool fica presa durante o stream
+    async with AsyncSessionLocal() as db:
+        owns_lead = await db.scalar(
+            select(Lead.id).where(Lead.id == lead_id, Lead.advogado_id == current_user.id)
+        )
+    
+    if not owns_lead:
+        raise HTTPException(status_code=404, detail="Lead não encontrado")
+    
+    subscription = broker.subscribe(lead_channel(lead_id))
+    return StreamingResponse(
+        sse_stream(request, subscription),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
 
 
 # ============================================================================
@@ -580,32 +1590,16 @@ async def get_messages(
 
 @router.get("/dashboard/stats")
 async def get_dashboard_stats(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    """Retorna estatísticas do dashboard"""
-    
-    total_leads = db.query(Lead).filter(Lead.advogado_id == current_user.id).count()
-    leads_novos = db.query(Lead).filter(
-        Lead.advogado_id == current_user.id,
-        Lead.status == "novo"
-    ).count()
-    leads_em_andamento = db.query(Lead).filter(
-        Lead.advogado_id == current_user.id,
-        Lead.status == "em_andamento"
-    ).count()
-    leads_fechados = db.query(Lead).filter(
-        Lead.advogado_id == current_user.id,
-        Lead.status == "fechado"
-    ).count()
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Retorna estatísticas do dashboard.
+    Contagens por status, área e urgência vêm dos contadores incrementais
+    (ou de um único GROUP BY enquanto os contadores não existem).
+    """
     
-    return {
-        "total_leads": total_leads,
-        "leads_novos": leads_novos,
-        "leads_em_andamento": leads_em_andamento,
-        "leads_fechados": leads_fechados,
-        "taxa_conversao": (leads_fechados / total_leads * 100) if total_leads > 0 else 0
-    }
+    return await get_lead_stats(db, current_user.id)
 
 
 # ============================================================================
@@ -618,10 +1612,16 @@ async def create_anotacao(
     titulo: str,
     conteudo: str,
     prioridade: str = "media",
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    """Cria anotação para um lead"""
+    """Cria anotação para um lead do advogado"""
+    
+    lead_id = await db.scalar(
+        select(Lead.id).where(Lead.id == lead_id, Lead.advogado_id == current_user.id)
+    )
+    if not lead_id:
+        raise HTTPException(status_code=404, detail="Lead não encontrado")
     
     anotacao = Anotacao(
         lead_id=lead_id,
@@ -631,7 +1631,8 @@ async def create_anotacao(
         prioridade=prioridade
     )
     db.add(anotacao)
-    db.commit()
+    await db.commit()
+    response_cache.invalidate(current_user.id, "anotacoes", lead_id)
     
     return {"message": "Anotação criada com sucesso"}
 
@@ -639,23 +1640,469 @@ async def create_anotacao(
 @router.get("/leads/{lead_id}/anotacoes")
 async def get_anotacoes(
     lead_id: str,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    """Retorna anotações de um lead"""
-    
-    anotacoes = db.query(Anotacao).filter(
-        Anotacao.lead_id == lead_id,
-        Anotacao.advogado_id == current_user.id
-    ).order_by(Anotacao.criada_em.desc()).all()
-    
-    return [
-        {
-            "id": a.id,
-            "titulo": a.titulo,
-            "conteudo": a.conteudo,
-            "prioridade": a.prioridade,
-            "criada_em": a.criada_em
-        }
-        for a in anotacoes
-    ]
+    request: Request,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Retorna anotações de um lead.
+    Responde com ETag (quantidade + última alteração); If-None-Match igual recebe 304.
+    """
+    
+    versao = await anotacoes_version(db, current_user.id, lead_id)
+    if versao is None:
+        caso = await load_archived_case(db, current_user.id, lead_id)
+        if caso is None:
+            raise HTTPException(status_code=404, detail="Lead não encontrado")
+        return archived_anotacoes(caso)
+    
+    return await conditional_json(
+        request, current_user.id, "anotacoes", lead_id, versao,
+        lambda: _anotacoes_body(db, current_user.id, lead_id)
+    )
+
+
+async def _anotacoes_body(db: AsyncSession, advogado_id: str, lead_id: str) -> list:
+    result = await db.execute(
+        select(Anotacao)
+        .join(Lead, Lead.id == Anotacao.lead_id)
+        .where(
+            Anotacao.lead_id == lead_id,
+            Anotacao.advogado_id == advogado_id,
+            Lead.advogado_id == advogado_id
+        ).order_by(Anotacao.criada_em.desc())
+    )
+    return [serialize_anotacao(a) for a in result.scalars().all()]
+
+
+def serialize_anotacao(a: Anotacao) -> dict:
+    """Formato de anotação exposto pela API"""
+    return {
+        "id": a.id,
+        "titulo": a.titulo,
+        "conteudo": a.conteudo,
+        "prioridade": a.prioridade,
+        "criada_em": a.criada_em
+    }
+
+
+# ============================================================================
+# ENDPOINTS DE TAREFAS
+# ============================================================================
+
+def serialize_tarefa(t: Tarefa) -> dict:
+    """Formato de tarefa exposto pela API"""
+    return {
+        "id": t.id,
+        "lead_id": t.lead_id,
+        "titulo": t.titulo,
+        "descricao": t.descricao,
+        "prioridade": t.prioridade,
+        "concluida": t.concluida,
+        "data_vencimento": t.data_vencimento,
+        "lembrete_enviado_em": t.lembrete_enviado_em,
+        "criada_em": t.criada_em
+    }
+
+async def _get_tarefa(db: AsyncSession, advogado_id: str, tarefa_id: str) -> Tarefa:
+    result = await db.execute(
+        select(Tarefa).where(Tarefa.id == tarefa_id, Tarefa.advogado_id == advogado_id)
+    )
+    tarefa = result.scalar_one_or_none()
+    if not tarefa:
+        raise HTTPException(status_code=404, detail="Tarefa não encontrada")
+    return tarefa
+
+
+@router.post("/tarefas", status_code=201)
+async def create_tarefa(
+    tarefa_data: TarefaCreate,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Cria tarefa (opcionalmente ligada a um lead); o lembrete sai antes do vencimento"""
+    
+    if tarefa_data.lead_id:
+        lead_id = await db.scalar(
+            select(Lead.id).where(Lead.id == tarefa_data.lead_id, Lead.advogado_id == current_user.id)
+        )
+        if not lead_id:
+            raise HTTPException(status_code=404, detail="Lead não encontrado")
+    
+    tarefa = Tarefa(advogado_id=current_user.id, **tarefa_data.model_dump())
+    db.add(tarefa)
+    await db.commit()
+    await db.refresh(tarefa)
+    tarefa_scheduler.reschedule(tarefa.id, tarefa.data_vencimento)
+    
+    return serialize_tarefa(tarefa)
+
+
+@router.get("/tarefas")
+async def list_tarefas(
+    concluida: Optional[bool] = None,
+    lead_id: Optional[str] = None,
+    vence_de: Optional[datetime] = None,
+    vence_ate: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = PAGE_SIZE_DEFAULT,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Lista tarefas do advogado com filtros opcionais.
+    Paginação keyset em (criada_em, id), como em /leads.
+    """
+    
+    limit = max(1, min(limit, PAGE_SIZE_MAX))
+    
+    query = select(Tarefa).where(Tarefa.advogado_id == current_user.id)
+    
+    if concluida is not None:
+        query = query.where(Tarefa.concluida.is_(concluida))
+    if lead_id:
+        query = query.where(Tarefa.lead_id == lead_id)
+    if vence_de:
+        query = query.where(Tarefa.data_vencimento >= utc_naive(vence_de))
+    if vence_ate:
+        query = query.where(Tarefa.data_vencimento < utc_naive(vence_ate))
+    
+    if cursor:
+        try:
+            cursor_criada_em, cursor_id = decode_cursor(cursor)
+            cursor_criada_em = datetime.fromisoformat(cursor_criada_em)
+        except (ValueError, TypeError):
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+        query = query.where(
+            tuple_(Tarefa.criada_em, Tarefa.id) < tuple_(cursor_criada_em, cursor_id)
+        )
+    
+    result = await db.execute(query.order_by(Tarefa.criada_em.desc(), Tarefa.id.desc()).limit(limit + 1))
+    tarefas = result.scalars().all()
+    has_more = len(tarefas) > limit
+    tarefas = tarefas[:limit]
+    
+    return {
+        "tarefas": [serialize_tarefa(t) for t in tarefas],
+        "next_cursor": encode_cursor(tarefas[-1].criada_em, tarefas[-1].id) if has_more else None,
+        "limit": limit
+    }
+
+
+@router.get("/tarefas/{tarefa_id}")
+async def get_tarefa(
+    tarefa_id: str,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Retorna uma tarefa"""
+    
+    return serialize_tarefa(await _get_tarefa(db, current_user.id, tarefa_id))
+
+
+@router.put("/tarefas/{tarefa_id}")
+async def update_tarefa(
+    tarefa_id: str,
+    tarefa_data: TarefaUpdate,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Atualiza tarefa. Um novo vencimento rearma o lembrete
+    (lembrete_enviado_em volta a NULL e a tarefa reentra no índice do agendador).
+    """
+    
+    tarefa = await _get_tarefa(db, current_user.id, tarefa_id)
+    
+    # descricao e data_vencimento aceitam null explícito (limpar o campo)
+    dados = {
+        campo: valor for campo, valor in tarefa_data.model_dump(exclude_unset=True).items()
+        if valor is not None or campo in ("descricao", "data_vencimento")
+    }
+    if "data_vencimento" in dados and dados["data_vencimento"] != tarefa.data_vencimento:
+        tarefa.lembrete_enviado_em = None
+    for campo, valor in dados.items():
+        setattr(tarefa, campo, valor)
+    
+    await db.commit()
+    await db.refresh(tarefa)
+    tarefa_scheduler.reschedule(
+        tarefa.id, tarefa.data_vencimento,
+        ativa=not tarefa.concluida and tarefa.lembrete_enviado_em is None
+    )
+    
+    return serialize_tarefa(tarefa)
+
+
+@router.delete("/tarefas/{tarefa_id}", status_code=204)
+async def delete_tarefa(
+    tarefa_id: str,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Remove tarefa"""
+    
+    tarefa = await _get_tarefa(db, current_user.id, tarefa_id)
+    await db.delete(tarefa)
+    await db.commit()
+    tarefa_scheduler.reschedule(tarefa_id, None, ativa=False)
+
+
+# ============================================================================
+# ENDPOINTS DE WEBHOOKS
+# ============================================================================
+
+def serialize_webhook(w: Webhook, contagem: Optional[dict] = None) -> dict:
+    """Formato de webhook exposto pela API (o segredo só sai na criação)"""
+    return {
+        "id": w.id,
+        "url": w.url,
+        "eventos": list(w.eventos or []),
+        "max_concorrencia": w.max_concorrencia,
+        "eventos_por_status": contagem or {},
+        "criado_em": w.criado_em
+    }
+
+async def _get_webhook(db: AsyncSession, advogado_id: str, webhook_id: str) -> Webhook:
+    result = await db.execute(
+        select(Webhook).where(Webhook.id == webhook_id, Webhook.advogado_id == advogado_id)
+    )
+    webhook = result.scalar_one_or_none()
+    if not webhook:
+        raise HTTPException(status_code=404, detail="Webhook não encontrado")
+    return webhook
+
+
+@router.post("/webhooks", status_code=201)
+async def create_webhook(
+    webhook_data: WebhookCreate,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Registra uma URL para receber eventos do CRM. As entregas saem em lotes
+    ({"eventos": [...]}) assinados com HMAC-SHA256 no cabeçalho
+    X-Advocacia-Assinatura; o segredo é devolvido só nesta resposta.
+    """
+    
+    try:
+        url = validate_webhook_url(webhook_data.url)
+        eventos = validate_eventos(webhook_data.eventos)
+        await check_webhook_destination(url)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except OSError:
+        raise HTTPException(status_code=400, detail="Não foi possível resolver o host do webhook")
+    
+    total = await db.scalar(
+        select(func.count(Webhook.id)).where(Webhook.advogado_id == current_user.id)
+    )
+    if total >= WEBHOOK_MAX_POR_ADVOGADO:
+        raise HTTPException(status_code=400, detail=f"Limite de {WEBHOOK_MAX_POR_ADVOGADO} webhooks atingido")
+    
+    segredo = new_webhook_secret()
+    webhook = Webhook(
+        advogado_id=current_user.id,
+        url=url,
+        eventos=eventos,
+        segredo_encrypted=encrypt_data(segredo),
+        max_concorrencia=webhook_data.max_concorrencia
+    )
+    db.add(webhook)
+    await db.commit()
+    await db.refresh(webhook)
+    webhook_registry.invalidate(current_user.id)
+    
+    return {**serialize_webhook(webhook), "segredo": segredo}
+
+
+@router.get("/webhooks")
+async def list_webhooks(
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Lista os webhooks do advogado com a contagem de eventos por status"""
+    
+    result = await db.execute(
+        select(Webhook).where(Webhook.advogado_id == current_user.id).order_by(Webhook.criado_em)
+    )
+    webhooks = result.scalars().all()
+    
+    contagem = {}
+    if webhooks:
+        result = await db.execute(
+            select(WebhookEvento.webhook_id, WebhookEvento.status, func.count(WebhookEvento.id))
+            .where(WebhookEvento.webhook_id.in_([w.id for w in webhooks]))
+            .group_by(WebhookEvento.webhook_id, WebhookEvento.status)
+        )
+        for webhook_id, status_evento, total in result.all():
+            contagem.setdefault(webhook_id, {})[status_evento] = total
+    
+    return {"webhooks": [serialize_webhook(w, contagem.get(w.id)) for w in webhooks]}
+
+
+@router.delete("/webhooks/{webhook_id}", status_code=204)
+async def delete_webhook(
+    webhook_id: str,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Remove webhook (eventos ainda não entregues são descartados pelo dispatcher)"""
+    
+    webhook = await _get_webhook(db, current_user.id, webhook_id)
+    await db.delete(webhook)
+    await db.commit()
+    webhook_registry.invalidate(current_user.id)
+
+
+@router.get("/webhooks/{webhook_id}/falhas")
+async def list_webhook_falhas(
+    webhook_id: str,
+    cursor: Optional[str] = None,
+    limit: int = PAGE_SIZE_DEFAULT,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Fila de mortos do webhook: eventos que esgotaram as tentativas ou
+    receberam 4xx definitivo. Paginação keyset em (criado_em, id).
+    """
+    
+    await _get_webhook(db, current_user.id, webhook_id)
+    limit = max(1, min(limit, PAGE_SIZE_MAX))
+    
+    query = select(WebhookEvento).where(
+        WebhookEvento.webhook_id == webhook_id, WebhookEvento.status == "falhou"
+    )
+    if cursor:
+        try:
+            cursor_criado_em, cursor_id = decode_cursor(cursor)
+            cursor_criado_em = datetime.fromisoformat(cursor_criado_em)
+        except (ValueError, TypeError):
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+        query = query.where(
+            tuple_(WebhookEvento.criado_em, WebhookEvento.id) < tuple_(cursor_criado_em, cursor_id)
+        )
+    
+    result = await db.execute(
+        query.order_by(WebhookEvento.criado_em.desc(), WebhookEvento.id.desc()).limit(limit + 1)
+    )
+    eventos = result.scalars().all()
+    has_more = len(eventos) > limit
+    eventos = eventos[:limit]
+    
+    return {
+        "falhas": [
+            {
+                "id": e.id,
+                "evento": e.evento,
+                "tentativas": e.tentativas,
+                "ultimo_erro": e.ultimo_erro,
+                "criado_em": e.criado_em,
+                "payload": json.loads(e.payload)
+            }
+            for e in eventos
+        ],
+        "next_cursor": encode_cursor(eventos[-1].criado_em, eventos[-1].id) if has_more else None,
+        "limit": limit
+    }
+
+
+@router.post("/webhooks/{webhook_id}/falhas/reenviar")
+async def requeue_webhook_falhas(
+    webhook_id: str,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Devolve a fila de mortos do webhook para entrega (tentativas zeradas)"""
+    
+    await _get_webhook(db, current_user.id, webhook_id)
+    reenfileirados = await requeue_failed(db, webhook_id)
+    await db.commit()
+    
+    return {"reenfileirados": reenfileirados}
+
+
+# ============================================================================
+# ENDPOINTS DE BUSCA
+# ============================================================================
+
+@router.get("/search")
+async def search_crm(
+    q: str,
+    cursor: Optional[str] = None,
+    limit: int = SEARCH_PAGE_SIZE,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Busca por palavras-chave na descrição dos leads, nas anotações e nas
+    mensagens do advogado (sem acentos, com stemming em português).
+    Resultados ordenados por relevância, com trecho destacado em <mark>.
+    """
+    
+    q = q.strip()
+    if not q or len(q) > 200:
+        raise HTTPException(status_code=400, detail="Consulta deve ter entre 1 e 200 caracteres")
+    limit = max(1, min(limit, PAGE_SIZE_MAX))
+    
+    offset = 0
+    if cursor:
+        try:
+            offset = int(decode_cursor(cursor)[0])
+        except (ValueError, TypeError, IndexError):
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+    
+    hits, has_more = await search(db, current_user.id, q, limit, offset)
+    next_offset = offset + limit
+    
+    return {
+        "resultados": [hit.as_dict() for hit in hits],
+        "next_cursor": encode_cursor(next_offset) if has_more and next_offset <= SEARCH_MAX_OFFSET else None,
+        "limit": limit
+    }
+
+
+# ============================================================================
+# ENDPOINTS DE MONITORAMENTO
+# ============================================================================
+
+@router.get("/metrics", dependencies=[Depends(require_metrics_token)])
+async def get_metrics(db: AsyncSession = Depends(get_db)):
+    """
+    Métricas internas (pool de hash de senhas, cache de tokens, eventos, outbox de email, análise IA, tarefas, webhooks, rate limiting, rotas).
+    "workers": vazão e falhas dos workers de fundo deste processo (vazio com WORKERS_IN_API=false)
+    """
+    
+    return {
+        "password_pool": password_hasher.metrics(),
+        "principal_cache": principal_cache.metrics(),
+        "realtime": broker.metrics(),
+        "email_outbox": await outbox_status_counts(db),
+        "analysis": {
+            "jobs": await analysis_status_counts(db),
+            "cache": analysis_cache.metrics(),
+            "stages": analysis_stats.metrics()
+        },
+        "matching": matching_index.metrics(),
+        "search_fallback": search_index.metrics(),
+        "http_cache": response_cache.metrics(),
+        "rate_limit": rate_limiter.metrics(),
+        "tarefas": tarefa_scheduler.metrics(),
+        "webhooks": {
+            "eventos": await webhook_status_counts(db),
+            "registro": webhook_registry.metrics()
+        },
+        "workers": background_workers.metrics(),
+        "profiling": profiling_registry.summary()
+    }
+
+
+@router.get("/metrics/prometheus", response_class=PlainTextResponse, dependencies=[Depends(require_metrics_token)])
+async def get_prometheus_metrics():
+    """Métricas por rota no formato de exposição do Prometheus"""
+    
+    return PlainTextResponse(
+        profiling_registry.render_prometheus(),
+        media_type="text/plain; version=0.0.4"
+    )
@@ -0,0 +1,471 @@
+# backend/app/export.py
+# Exportação completa do CRM (leads + anotações + resumo das conversas)
+# em CSV, NDJSON ou XLSX, em streaming ou em arquivo comprimido em segundo plano
+
+import asyncio
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+import re
+import time
+import zipfile
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List, Optional
+from xml.sax.saxutils import escape
+
+from sqlalchemy import and_, case, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .database import AsyncSessionLocal
+from .models import Anotacao, Conversa, Exportacao, Lead, Mensagem
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# CONFIGURAÇÕES
+# ============================================================================
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 1000))  # linhas por fetch do cursor
+EXPORT_DIR = os.getenv("EXPORT_DIR", "/tmp/painel-exports")  # compartilhado entre workers
+EXPORT_TTL_HOURS = int(os.getenv("EXPORT_TTL_HOURS", 24))
+EXPORT_MAX_ANOTACOES = int(os.getenv("EXPORT_MAX_ANOTACOES", 50))  # por lead
+# Exportação "processando" sem progresso (progresso_em) há mais tempo que isso
+# foi interrompida (restart do servidor); o job grava o progresso a cada EXPORT_HEARTBEAT_SECONDS
+EXPORT_JOB_TIMEOUT_MINUTES = int(os.getenv("EXPORT_JOB_TIMEOUT_MINUTES", 15))
+EXPORT_HEARTBEAT_SECONDS = int(os.getenv("EXPORT_HEARTBEAT_SECONDS", 30))
+
+EXPORT_COLUMNS = [
+    "id", "nome_cliente", "email_cliente", "telefone_cliente", "tipo_cliente", "cpf_cnpj",
+    "area_direito", "descricao_caso", "urgencia", "status", "qualificacao",
+    "cidade", "estado", "canal_preferido", "criado_em", "atualizado_em",
+    "total_mensagens", "mensagens_nao_lidas", "ultima_mensagem", "total_anotacoes", "anotacoes",
+]
+
+
+# ============================================================================
+# CONSULTA EM LOTES
+# ============================================================================
+
+def _lead_query(advogado_id: str, filtros: dict):
+    query = select(
+        Lead.id, Lead.nome_cliente, Lead.email_cliente, Lead.telefone_cliente, Lead.tipo_cliente,
+        Lead.cpf_cnpj, Lead.area_direito, Lead.descricao_caso, Lead.urgencia, Lead.status,
+        Lead.qualificacao, Lead.endereco, Lead.canal_preferido, Lead.criado_em, Lead.atualizado_em,
+    ).where(Lead.advogado_id == advogado_id)
+    if filtros.get("status"):
+        query = query.where(Lead.status == filtros["status"])
+    if filtros.get("area"):
+        query = query.where(Lead.area_direito == filtros["area"])
+    if filtros.get("criado_de"):
+        query = query.where(Lead.criado_em >= datetime.fromisoformat(filtros["criado_de"]))
+    if filtros.get("criado_ate"):
+        query = query.where(Lead.criado_em < datetime.fromisoformat(filtros["criado_ate"]))
+    return query.order_by(Lead.criado_em, Lead.id)
+
+async def _anotacoes_por_lead(db: AsyncSession, lead_ids: List[str]) -> Dict[str, list]:
+    result = await db.execute(
+        select(Anotacao.lead_id, Anotacao.titulo, Anotacao.conteudo, Anotacao.prioridade, Anotacao.criada_em)
+        .where(Anotacao.lead_id.in_(lead_ids))
+        .order_by(Anotacao.lead_id, Anotacao.criada_em)
+    )
+    por_lead = {}
+    for row in result.all():
+        itens = por_lead.setdefault(row.lead_id, [])
+        if len(itens) < EXPORT_MAX_ANOTACOES:
+            itens.append({
+                "titulo": row.titulo,
+                "conteudo": row.conteudo,
+                "prioridade": row.prioridade,
+                "criada_em": row.criada_em.isoformat() if row.criada_em else None,
+            })
+    return por_lead
+
+async def _conversas_por_lead(db: AsyncSession, lead_ids: List[str]) -> Dict[str, dict]:
+    """Resumo por lead: total de mensagens, não lidas do cliente e última mensagem"""
+    result = await db.execute(
+        select(
+            Conversa.lead_id,
+            func.count(Mensagem.id),
+            func.coalesce(func.sum(case((and_(Mensagem.tipo == "cliente", Mensagem.lido.is_(False)), 1), else_=0)), 0),
+            func.max(Mensagem.timestamp),
+        )
+        .join(Mensagem, Mensagem.conversa_id == Conversa.id)
+        .where(Conversa.lead_id.in_(lead_ids))
+        .group_by(Conversa.lead_id)
+    )
+    return {
+        lead_id: {"total_mensagens": total, "mensagens_nao_lidas": int(nao_lidas), "ultima_mensagem": ultima}
+        for lead_id, total, nao_lidas, ultima in result.all()
+    }
+
+def _export_row(lead, anotacoes: list, conversa: Optional[dict]) -> dict:
+    endereco = lead.endereco or {}
+    conversa = conversa or {}
+    ultima = conversa.get("ultima_mensagem")
+    return {
+        "id": lead.id,
+        "nome_cliente": lead.nome_cliente,
+        "email_cliente": lead.email_cliente,
+        "telefone_cliente": lead.telefone_cliente,
+        "tipo_cliente": lead.tipo_cliente,
+        "cpf_cnpj": lead.cpf_cnpj,
+        "area_direito": lead.area_direito,
+        "descricao_caso": lead.descricao_caso,
+        "urgencia": lead.urgencia,
+        "status": lead.status,
+        "qualificacao": lead.qualificacao,
+        "cidade": endereco.get("cidade"),
+        "estado": endereco.get("estado"),
+        "canal_preferido": lead.canal_preferido,
+        "criado_em": lead.criado_em.isoformat() if lead.criado_em else None,
+        "atualizado_em": lead.atualizado_em.isoformat() if lead.atualizado_em else None,
+        "total_mensagens": conversa.get("total_mensagens", 0),
+        "mensagens_nao_lidas": conversa.get("mensagens_nao_lidas", 0),
+        "ultima_mensagem": ultima.isoformat() if ultima else None,
+        "total_anotacoes": len(anotacoes),
+        "anotacoes": anotacoes,
+    }
+
+async def iter_export_batches(advogado_id: str, filtros: dict) -> AsyncIterator[List[dict]]:
+    """
+    Percorre os leads com cursor no servidor (yield_per) e, para cada lote,
+    busca anotações e resumo das conversas com uma query cada: 3 queries por
+    EXPORT_BATCH_SIZE leads, com memória limitada a um lote.
+
+    Abre a própria sessão: o corpo do StreamingResponse é gerado depois que
+    a sessão da requisição (get_db) já foi fechada.
+    """
+    async with AsyncSessionLocal() as db:
+        stmt = _lead_query(advogado_id, filtros).execution_options(yield_per=EXPORT_BATCH_SIZE)
+        result = await db.stream(stmt)
+        async for partition in result.partitions():
+            lead_ids = [row.id for row in partition]
+            anotacoes = await _anotacoes_por_lead(db, lead_ids)
+            conversas = await _conversas_por_lead(db, lead_ids)
+            yield [_export_row(row, anotacoes.get(row.id, []), conversas.get(row.id)) for row in partition]
+
+
+# ============================================================================
+# FORMATOS
+# ============================================================================
+
+# Início de célula que Excel/LibreOffice interpretam como fórmula
+_INICIO_FORMULA = ("=", "+", "-", "@", "\t", "\r")
+
+def _planilha_segura(value):
+    """
+    Texto vindo do cliente (nome, descrição, anotações) começando com = + - @
+    vira fórmula ao abrir o CSV/XLSX (CSV injection): prefixa com apóstrofo
+    """
+    if isinstance(value, str) and value.startswith(_INICIO_FORMULA):
+        return "'" + value
+    return value
+
+def _flat_value(row: dict, column: str):
+    """Valor da coluna para CSV/XLSX, já neutralizado contra fórmulas"""
+    if column == "anotacoes":
+        value = " | ".join(f"[{a['prioridade']}] {a['titulo']}: {a['conteudo']}" for a in row["anotacoes"])
+    else:
+        value = row.get(column)
+    return "" if value is None else _planilha_segura(value)
+
+
+class CsvExportWriter:
+    media_type = "text/csv; charset=utf-8"
+    extension = "csv"
+    compress = True
+
+    def begin(self) -> bytes:
+        # BOM para o Excel reconhecer UTF-8
+        return "\ufeff".encode() + self._encode([EXPORT_COLUMNS])
+
+    def write(self, rows: List[dict]) -> bytes:
+        return self._encode([[_flat_value(row, c) for c in EXPORT_COLUMNS] for row in rows])
+
+    def end(self) -> bytes:
+        return b""
+
+    def _encode(self, rows: list) -> bytes:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        return buffer.getvalue().encode()
+
+
+class NdjsonExportWriter:
+    media_type = "application/x-ndjson"
+    extension = "ndjson"
+    compress = True
+
+    def begin(self) -> bytes:
+        return b""
+
+    def write(self, rows: List[dict]) -> bytes:
+        return "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows).encode()
+
+    def end(self) -> bytes:
+        return b""
+
+
+class _ZipSink:
+    """Destino não-posicionável do zipfile: acumula bytes até serem drenados"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+_XML_INVALIDO = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+_NS_MAIN = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_NS_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_NS_PKG = "http://schemas.openxmlformats.org/package/2006/relationships"
+_XLSX_ESTATICOS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    "_rels/.rels": (
+        f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><Relationships xmlns="{_NS_PKG}">'
+        f'<Relationship Id="rId1" Type="{_NS_REL}/officeDocument" Target="xl/workbook.xml"/></Relationships>'
+    ),
+    "xl/workbook.xml": (
+        f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><workbook xmlns="{_NS_MAIN}" xmlns:r="{_NS_REL}">'
+        '<sheets><sheet name="Leads" sheetId="1" r:id="rId1"/></sheets></workbook>'
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><Relationships xmlns="{_NS_PKG}">'
+        f'<Relationship Id="rId1" Type="{_NS_REL}/worksheet" Target="worksheets/sheet1.xml"/></Relationships>'
+    ),
+}
+
+
+class XlsxExportWriter:
+    """
+    XLSX em streaming sem dependências: o pacote zip é escrito em um destino
+    não-posicionável (data descriptors) e a planilha usa inline strings,
+    então cada lote de linhas vira bytes prontos para enviar.
+    """
+    media_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    extension = "xlsx"
+    compress = False  # o zip já é comprimido
+
+    def __init__(self):
+        self._sink = _ZipSink()
+        self._zip = zipfile.ZipFile(self._sink, "w", compression=zipfile.ZIP_DEFLATED)
+        self._sheet = None
+
+    def begin(self) -> bytes:
+        for name, content in _XLSX_ESTATICOS.items():
+            self._zip.writestr(name, content)
+        self._sheet = self._zip.open("xl/worksheets/sheet1.xml", "w", force_zip64=True)
+        self._sheet.write(
+            f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><worksheet xmlns="{_NS_MAIN}"><sheetData>'.encode()
+        )
+        self._sheet.write(self._row(EXPORT_COLUMNS))
+        return self._sink.drain()
+
+    def write(self, rows: List[dict]) -> bytes:
+        self._sheet.write(b"".join(self._row([_flat_value(row, c) for c in EXPORT_COLUMNS]) for row in rows))
+        return self._sink.drain()
+
+    def end(self) -> bytes:
+        self._sheet.write(b"</sheetData></worksheet>")
+        self._sheet.close()
+        self._zip.close()
+        return self._sink.drain()
+
+    @staticmethod
+    def _row(values: list) -> bytes:
+        cells = []
+        for value in values:
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                cells.append(f"<c><v>{value}</v></c>")
+            else:
+                texto = escape(_XML_INVALIDO.sub("", str(_planilha_segura(value))))
+                cells.append(f'<c t="inlineStr"><is><t xml:space="preserve">{texto}</t></is></c>')
+        return f"<row>{''.join(cells)}</row>".encode()
+
+
+EXPORT_WRITERS = {
+    "csv": CsvExportWriter,
+    "ndjson": NdjsonExportWriter,
+    "xlsx": XlsxExportWriter,
+}
+
+
+def export_filename(formato: str, compressed: bool = False) -> str:
+    writer = EXPORT_WRITERS[formato]
+    suffix = ".gz" if compressed and writer.compress else ""
+    return f"leads-{datetime.utcnow():%Y%m%d-%H%M%S}.{writer.extension}{suffix}"
+
+
+async def stream_export(advogado_id: str, formato: str, filtros: dict) -> AsyncIterator[bytes]:
+    """Corpo do StreamingResponse: um chunk por lote de leads"""
+    writer = EXPORT_WRITERS[formato]()
+    yield writer.begin()
+    async for rows in iter_export_batches(advogado_id, filtros):
+        chunk = writer.write(rows)
+        if chunk:
+            yield chunk
+    yield writer.end()
+
+
+# ============================================================================
+# EXPORTAÇÃO EM SEGUNDO PLANO
+# ============================================================================
+
+def export_path(exportacao: Exportacao) -> str:
+    writer = EXPORT_WRITERS[exportacao.formato]
+    suffix = ".gz" if writer.compress else ""
+    return os.path.join(EXPORT_DIR, f"{exportacao.id}.{writer.extension}{suffix}")
+
+class ExportCancelled(Exception):
+    """A exportação deixou de estar "processando" enquanto o arquivo era gerado"""
+
+async def run_export_job(exportacao_id: str):
+    """
+    Gera o arquivo da exportação (gzip para CSV/NDJSON) e marca como pronta.
+    Executado como BackgroundTask após a resposta do POST.
+    """
+    async with AsyncSessionLocal() as db:
+        exportacao = await db.get(Exportacao, exportacao_id)
+        if exportacao is None or exportacao.status != "processando":
+            return
+        await purge_expired_exports(db)
+        await expire_stale_exports(db)
+
+        path = export_path(exportacao)
+        writer = EXPORT_WRITERS[exportacao.formato]()
+        linhas = 0
+        ultimo_progresso = time.monotonic()
+        try:
+            os.makedirs(EXPORT_DIR, exist_ok=True)
+            opener = gzip.open if writer.compress else open
+            with opener(path, "wb") as f:
+                await asyncio.to_thread(f.write, writer.begin())
+                async for rows in iter_export_batches(exportacao.advogado_id, exportacao.filtros or {}):
+                    await asyncio.to_thread(f.write, writer.write(rows))
+                    linhas += len(rows)
+                    if time.monotonic() - ultimo_progresso >= EXPORT_HEARTBEAT_SECONDS:
+                        ultimo_progresso = time.monotonic()
+                        if not await _record_progress(db, exportacao_id, linhas):
+                            raise ExportCancelled()
+                await asyncio.to_thread(f.write, writer.end())
+        except ExportCancelled:
+            logger.warning("Exportação %s expirada durante a geração", exportacao_id)
+            _remove_file(path)
+            return
+        except Exception as exc:
+            logger.exception("Falha na exportação %s", exportacao_id)
+            _remove_file(path)
+            valores = {"status": "falhou", "erro": str(exc)[:1000]}
+        else:
+            valores = {
+                "status": "pronto",
+                "arquivo": path,
+                "linhas": linhas,
+                "expira_em": datetime.utcnow() + timedelta(hours=EXPORT_TTL_HOURS),
+            }
+        # Condicional: se a varredura de expire_stale_exports já marcou a
+        # exportação como falhou, o resultado não a ressuscita
+        result = await db.execute(
+            update(Exportacao)
+            .where(Exportacao.id == exportacao_id, Exportacao.status == "processando")
+            .values(concluida_em=datetime.utcnow(), progresso_em=datetime.utcnow(), **valores)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        if result.rowcount == 0 and valores["status"] == "pronto":
+            _remove_file(path)
+
+def _remove_file(path: str):
+    if os.path.exists(path):
+        os.remove(path)
+
+async def _record_progress(db: AsyncSession, exportacao_id: str, linhas: int) -> bool:
+    """Heartbeat do job (progresso_em); False se a exportação já saiu de "processando" (expirada)"""
+    result = await db.execute(
+        update(Exportacao)
+        .where(Exportacao.id == exportacao_id, Exportacao.status == "processando")
+        .values(progresso_em=datetime.utcnow(), linhas=linhas)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount > 0
+
+async def purge_expired_exports(db: AsyncSession) -> int:
+    """Remove arquivos de exportações expiradas (a linha fica, sem arquivo)"""
+    result = await db.execute(
+        select(Exportacao).where(Exportacao.expira_em < datetime.utcnow(), Exportacao.arquivo.isnot(None))
+    )
+    expiradas = result.scalars().all()
+    for exportacao in expiradas:
+        if os.path.exists(exportacao.arquivo):
+            os.remove(exportacao.arquivo)
+        exportacao.arquivo = None
+    if expiradas:
+        await db.commit()
+    return len(expiradas)
+
+async def expire_stale_exports(db: AsyncSession, advogado_id: Optional[str] = None) -> int:
+    """
+    Marca como falhou as exportações em "processando" sem progresso há mais de
+    EXPORT_JOB_TIMEOUT_MINUTES: a BackgroundTask morre junto com o processo
+    (deploy, restart) e nada mais atualizaria a linha. Um job vivo grava
+    progresso_em a cada EXPORT_HEARTBEAT_SECONDS, então exportações longas
+    não são afetadas. Remove o arquivo parcial.
+    """
+    limite = datetime.utcnow() - timedelta(minutes=EXPORT_JOB_TIMEOUT_MINUTES)
+    query = select(Exportacao).where(
+        Exportacao.status == "processando",
+        func.coalesce(Exportacao.progresso_em, Exportacao.criada_em) < limite,
+    )
+    if advogado_id is not None:
+        query = query.where(Exportacao.advogado_id == advogado_id)
+    presas = (await db.execute(query)).scalars().all()
+    for exportacao in presas:
+        path = export_path(exportacao)
+        if os.path.exists(path):
+            os.remove(path)
+    if presas:
+        await db.execute(
+            update(Exportacao)
+            .where(Exportacao.id.in_([e.id for e in presas]), Exportacao.status == "processando")
+            .values(status="falhou", erro="Exportação interrompida, gere uma nova", concluida_em=datetime.utcnow())
+            .execution_options(synchronize_session="fetch")
+        )
+        await db.commit()
+    return len(presas)
+
+def serialize_exportacao(exportacao: Exportacao) -> dict:
+    return {
+        "id": exportacao.id,
+        "formato": exportacao.formato,
+        "status": exportacao.status,
+        "linhas": exportacao.linhas,
+        "erro": exportacao.erro,
+        "criada_em": exportacao.criada_em,
+        "concluida_em": exportacao.concluida_em,
+        "expira_em": exportacao.expira_em,
+        "download_url": f"/auth/exportacoes/{exportacao.id}/download" if exportacao.status == "pronto" else None,
+    }
@@ -0,0 +1,264 @@
+# backend/app/geo.py
+# Dados geográficos dos leads: UF/cidade extraídas do endereço na escrita
+# e contagem incremental por região (lead_geo_rollup) para o mapa do dashboard
+
+import os
+import unicodedata
+from datetime import date, datetime
+from typing import Optional, Tuple
+
+from sqlalchemy import bindparam, delete, func, select, text, union_all, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from .models import Lead, LeadArquivo, LeadGeoRollup
+
+# ============================================================================
+# CONFIGURAÇÕES
+# ============================================================================
+
+GEO_ROLLUP_ENABLED = os.getenv("GEO_ROLLUP_ENABLED", "true").lower() == "true"
+
+UFS = {
+    "AC": "Acre", "AL": "Alagoas", "AP": "Amapá", "AM": "Amazonas", "BA": "Bahia",
+    "CE": "Ceará", "DF": "Distrito Federal", "ES": "Espírito Santo", "GO": "Goiás",
+    "MA": "Maranhão", "MT": "Mato Grosso", "MS": "Mato Grosso do Sul", "MG": "Minas Gerais",
+    "PA": "Pará", "PB": "Paraíba", "PR": "Paraná", "PE": "Pernambuco", "PI": "Piauí",
+    "RJ": "Rio de Janeiro", "RN": "Rio Grande do Norte", "RS": "Rio Grande do Sul",
+    "RO": "Rondônia", "RR": "Roraima", "SC": "Santa Catarina", "SP": "São Paulo",
+    "SE": "Sergipe", "TO": "Tocantins",
+}
+
+# Preposições mantidas em minúsculas no nome da cidade ("Rio de Janeiro")
+_PARTICULAS = {"de", "da", "do", "das", "dos", "e"}
+
+
+# ============================================================================
+# EXTRAÇÃO DO ENDEREÇO
+# ============================================================================
+
+def _sem_acentos(value: str) -> str:
+    return "".join(
+        c for c in unicodedata.normalize("NFKD", value) if not unicodedata.combining(c)
+    ).lower()
+
+_UF_POR_NOME = {_sem_acentos(nome): uf for uf, nome in UFS.items()}
+
+def normalize_uf(estado: Optional[str]) -> str:
+    """Sigla ("sp", "SP") ou nome ("São Paulo", "sao paulo") -> "SP"; "" se não reconhecido"""
+    estado = " ".join((estado or "").split())
+    if len(estado) == 2 and estado.upper() in UFS:
+        return estado.upper()
+    return _UF_POR_NOME.get(_sem_acentos(estado), "")
+
+def normalize_cidade(cidade: Optional[str]) -> str:
+    """Espaços colapsados e capitalização estável, para "SAO PAULO " e "São paulo" caírem juntas"""
+    palavras = " ".join((cidade or "").split()).lower().split(" ")
+    return " ".join(
+        p if i and p in _PARTICULAS else p[:1].upper() + p[1:]
+        for i, p in enumerate(palavras) if p
+    )[:120]
+
+def geo_from_endereco(endereco) -> Tuple[str, str]:
+    """(uf, cidade) do JSON de endereço do lead (chaves estado/uf e cidade/municipio)"""
+    if not isinstance(endereco, dict):
+        return "", ""
+    uf = normalize_uf(endereco.get("estado") or endereco.get("uf"))
+    cidade = normalize_cidade(endereco.get("cidade") or endereco.get("municipio"))
+    return uf, cidade
+
+
+# ============================================================================
+# ROLLUP INCREMENTAL
+# ============================================================================
+
+def geo_key(uf: Optional[str], cidade: Optional[str], area_direito: Optional[str],
+            status: Optional[str], criado_em: Optional[datetime]) -> tuple:
+    """Chave da linha de lead_geo_rollup de um lead (sem o advogado)"""
+    dia = (criado_em or datetime.utcnow()).date()
+    return (uf or "", cidade or "", area_direito or "", status or "", dia)
+
+def lead_geo_key(lead: Lead) -> tuple:
+    return geo_key(lead.uf, lead.cidade, lead.area_direito, lead.status, lead.criado_em)
+
+def add_geo_delta(deltas: dict, key: tuple, delta: int):
+    """Acumula deltas {chave: delta} antes de gravar (um upsert por linha distinta)"""
+    deltas[key] = deltas.get(key, 0) + delta
+
+def geo_transition(before: Optional[tuple], after: Optional[tuple]) -> dict:
+    """Deltas de uma transição de lead (before=None criação, after=None remoção)"""
+    deltas = {}
+    if before == after:
+        return deltas
+    if before is not None:
+        add_geo_delta(deltas, before, -1)
+    if after is not None:
+        add_geo_delta(deltas, after, 1)
+    return deltas
+
+async def apply_geo_deltas(db: AsyncSession, advogado_id: str, deltas: dict):
+    """Aplica os deltas na mesma transação da escrita dos leads"""
+    if not GEO_ROLLUP_ENABLED:
+        return
+    for key, delta in deltas.items():
+        if delta:
+            await db.execute(_rollup_upsert(db, advogado_id, key, delta))
+
+def apply_geo_deltas_sync(db: Session, advogado_id: str, deltas: dict):
+    """Versão de apply_geo_deltas para workers com Session síncrona"""
+    if not GEO_ROLLUP_ENABLED:
+        return
+    for key, delta in deltas.items():
+        if delta:
+            db.execute(_rollup_upsert(db, advogado_id, key, delta))
+
+def _rollup_upsert(db, advogado_id: str, key: tuple, delta: int):
+    """Incremento atômico (INSERT ... ON CONFLICT DO UPDATE) no dialeto da sessão"""
+    dialect = sqlite if db.get_bind().dialect.name == "sqlite" else postgresql
+    uf, cidade, area_direito, status, dia = key
+    stmt = dialect.insert(LeadGeoRollup).values(
+        advogado_id=advogado_id, uf=uf, cidade=cidade, area_direito=area_direito,
+        status=status, dia=dia, total=delta,
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=[LeadGeoRollup.advogado_id, LeadGeoRollup.uf, LeadGeoRollup.cidade,
+                        LeadGeoRollup.area_direito, LeadGeoRollup.status, LeadGeoRollup.dia],
+        set_={"total": LeadGeoRollup.total + stmt.excluded.total},
+    )
+
+
+# ============================================================================
+# LEITURA (mapa e drill-down)
+# ============================================================================
+
+async def geo_rollup(db: AsyncSession, advogado_id: str, uf: Optional[str] = None, cidade: Optional[str] = None,
+                     area: Optional[str] = None, status: Optional[str] = None,
+                     de: Optional[date] = None, ate: Optional[date] = None) -> dict:
+    """
+    Sem uf: total por estado; com uf: total por cidade do estado; com uf e
+    cidade: total por área e por status da cidade. Lê só lead_geo_rollup
+    (linhas = combinações distintas, não leads).
+    """
+    filtros = [LeadGeoRollup.advogado_id == advogado_id, LeadGeoRollup.total != 0]
+    if area:
+        filtros.append(LeadGeoRollup.area_direito == area)
+    if status:
+        filtros.append(LeadGeoRollup.status == status)
+    if de:
+        filtros.append(LeadGeoRollup.dia >= de)
+    if ate:
+        filtros.append(LeadGeoRollup.dia < ate)
+
+    if uf is None:
+        nivel, colunas = "estado", (LeadGeoRollup.uf,)
+    elif cidade is None:
+        nivel, colunas = "cidade", (LeadGeoRollup.cidade,)
+        filtros.append(LeadGeoRollup.uf == uf)
+    else:
+        nivel, colunas = "cidade_detalhe", (LeadGeoRollup.area_direito, LeadGeoRollup.status)
+        filtros.extend([LeadGeoRollup.uf == uf, LeadGeoRollup.cidade == cidade])
+
+    result = await db.execute(
+        select(*colunas, func.sum(LeadGeoRollup.total)).where(*filtros).group_by(*colunas)
+    )
+    rows = result.all()
+
+    if nivel == "cidade_detalhe":
+        por_area, por_status = {}, {}
+        for area_direito, status_lead, total in rows:
+            por_area[area_direito] = por_area.get(area_direito, 0) + total
+            por_status[status_lead] = por_status.get(status_lead, 0) + total
+        return {
+            "nivel": nivel, "uf": uf, "cidade": cidade,
+            "total": sum(por_area.values()),
+            "por_area": por_area,
+            "por_status": por_status,
+        }
+
+    chave = "uf" if nivel == "estado" else "cidade"
+    itens = sorted(
+        ({chave: valor, "total": int(total)} for valor, total in rows if total),
+        key=lambda item: -item["total"]
+    )
+    if nivel == "estado":
+        for item in itens:
+            item["nome"] = UFS.get(item["uf"], "Não informado")
+    return {
+        "nivel": nivel,
+        "uf": uf,
+        "total": sum(item["total"] for item in itens),
+        "itens": itens,
+    }
+
+
+# ============================================================================
+# BACKFILL (migração "geo")
+# ============================================================================
+
+GEO_DDL = [
+    "ALTER TABLE leads ADD COLUMN IF NOT EXISTS uf VARCHAR(2)",
+    "ALTER TABLE leads ADD COLUMN IF NOT EXISTS cidade VARCHAR(120)",
+    "CREATE INDEX IF NOT EXISTS ix_leads_advogado_uf_cidade ON leads (advogado_id, uf, cidade)",
+]
+
+
+def backfill_lead_geo(db: Session, batch_size: int = 500) -> int:
+    """
+    Preenche uf/cidade de todos os leads a partir do endereço (keyset por id,
+    um executemany por lote) e reconstrói lead_geo_rollup com um único
+    INSERT ... SELECT ... GROUP BY (leads + leads_arquivo). Idempotente: pode
+    rodar de novo para reparo.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        for ddl in GEO_DDL:
+            db.execute(text(ddl))
+        db.commit()
+
+    atualizados = 0
+    cursor = None
+    lead_table = Lead.__table__
+    while True:
+        query = select(Lead.id, Lead.endereco, Lead.uf, Lead.cidade)
+        if cursor is not None:
+            query = query.where(Lead.id > cursor)
+        rows = db.execute(query.order_by(Lead.id).limit(batch_size)).all()
+        if not rows:
+            break
+        params = []
+        for lead_id, endereco, uf_atual, cidade_atual in rows:
+            uf, cidade = geo_from_endereco(endereco)
+            if (uf or None, cidade or None) != (uf_atual, cidade_atual):
+                params.append({"b_id": lead_id, "b_uf": uf or None, "b_cidade": cidade or None})
+        if params:
+            db.execute(
+                update(lead_table).where(lead_table.c.id == bindparam("b_id"))
+                .values(uf=bindparam("b_uf"), cidade=bindparam("b_cidade")),
+                params,
+            )
+        db.commit()
+        atualizados += len(params)
+        cursor = rows[-1].id
+
+    # Casos arquivados (leads_arquivo) continuam no mapa
+    fontes = union_all(*(
+        select(m.advogado_id, m.uf, m.cidade, m.area_direito, m.status, m.criado_em)
+        for m in (Lead, LeadArquivo)
+    )).subquery()
+    colunas = (
+        fontes.c.advogado_id,
+        func.coalesce(fontes.c.uf, ""),
+        func.coalesce(fontes.c.cidade, ""),
+        func.coalesce(fontes.c.area_direito, ""),
+        func.coalesce(fontes.c.status, ""),
+        func.date(fontes.c.criado_em),
+    )
+    agregado = select(*colunas, func.count()).group_by(*colunas)
+    db.execute(delete(LeadGeoRollup))
+    db.execute(
+        LeadGeoRollup.__table__.insert().from_select(
+            ["advogado_id", "uf", "cidade", "area_direito", "status", "dia", "total"], agregado
+        )
+    )
+    db.commit()
+    return atualizados
@@ -0,0 +1,260 @@
+# backend/app/http_cache.py
+# Cache HTTP das leituras do painel: ETags fracos a partir da versão do recurso
+# (If-None-Match -> 304 sem hidratar o ORM) e cache de respostas já serializadas
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+from sqlalchemy import and_, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import AdvogadoProfile, Anotacao, Conversa, Lead
+from .profiling import ProfiledJSONResponse
+
+# ============================================================================
+# CONFIGURAÇÕES
+# ============================================================================
+
+HTTP_CACHE_ENABLED = os.getenv("HTTP_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", 5000))
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", 30))  # segundos
+RESPONSE_CACHE_MAX_BODY = int(os.getenv("RESPONSE_CACHE_MAX_BODY", 256 * 1024))  # bytes
+
+# O cliente sempre revalida (no-cache), mas só baixa o corpo quando mudou
+CACHE_HEADERS = {"Cache-Control": "private, no-cache", "Vary": "Authorization"}
+
+
+# ============================================================================
+# VERSÕES DOS RECURSOS (consultas de poucas colunas, sem objetos ORM)
+# ============================================================================
+
+async def profile_version(db: AsyncSession, user_id: str) -> Optional[tuple]:
+    result = await db.execute(
+        select(AdvogadoProfile.id, AdvogadoProfile.updated_at).where(AdvogadoProfile.user_id == user_id)
+    )
+    row = result.first()
+    return tuple(row) if row else None
+
+async def lead_version(db: AsyncSession, advogado_id: str, lead_id: str) -> Optional[tuple]:
+    """atualizado_em muda em toda escrita do lead (endpoints, análise, mescla de duplicados)"""
+    atualizado_em = await db.scalar(
+        select(Lead.atualizado_em).where(Lead.id == lead_id, Lead.advogado_id == advogado_id)
+    )
+    return (atualizado_em,) if atualizado_em else None
+
+async def mensagens_version(db: AsyncSession, advogado_id: str, lead_id: str) -> Optional[tuple]:
+    """
+    (conversa_id, ultima_mensagem, atualizada_em): ultima_mensagem muda a cada
+    mensagem; atualizada_em também ao marcar como lidas. None sem conversa.
+    """
+    result = await db.execute(
+        select(Conversa.id, Conversa.ultima_mensagem, Conversa.atualizada_em).where(
+            Conversa.lead_id == lead_id,
+            Conversa.advogado_id == advogado_id
+        )
+    )
+    row = result.first()
+    return tuple(row) if row else None
+
+async def anotacoes_version(db: AsyncSession, advogado_id: str, lead_id: str) -> Optional[tuple]:
+    """
+    Quantidade + última alteração (índice ix_anotacoes_lead_id), a partir do
+    lead do advogado: None se o lead não existe ou pertence a outro advogado.
+    """
+    result = await db.execute(
+        select(func.count(Anotacao.id), func.max(Anotacao.atualizada_em))
+        .select_from(Lead)
+        .outerjoin(Anotacao, and_(Anotacao.lead_id == Lead.id, Anotacao.advogado_id == advogado_id))
+        .where(Lead.id == lead_id, Lead.advogado_id == advogado_id)
+        .group_by(Lead.id)
+    )
+    row = result.first()
+    return tuple(row) if row else None
+
+
+# ============================================================================
+# ETAGS
+# ============================================================================
+
+def make_etag(user_id: str, resource: str, resource_id: str, version: tuple, variant: str = "") -> str:
+    raw = "|".join([user_id, resource, resource_id or "", repr(version), variant])
+    return f'W/"{hashlib.sha1(raw.encode()).hexdigest()[:20]}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Comparação fraca (RFC 9110 §13.1.2): ignora o prefixo W/"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    alvo = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == alvo for tag in if_none_match.split(","))
+
+def request_variant(request: Request) -> str:
+    """Parâmetros de query em ordem estável (since/before/limit mudam o corpo)"""
+    return "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+
+
+# ============================================================================
+# CACHE DE RESPOSTAS
+# ============================================================================
+
+class _ResourceStats:
+    __slots__ = ("requests", "not_modified", "hits", "misses", "bytes_sent", "bytes_saved", "build_seconds")
+
+    def __init__(self):
+        self.requests = 0
+        self.not_modified = 0
+        self.hits = 0
+        self.misses = 0
+        self.bytes_sent = 0
+        self.bytes_saved = 0
+        self.build_seconds = 0.0
+
+
+class ResponseCache:
+    """
+    LRU com TTL de (usuário, recurso, id, variante) -> (etag, corpo JSON).
+    Uma entrada só é servida se o etag guardado for o da versão atual, então
+    uma escrita em outro processo nunca devolve dado velho; a invalidação
+    pelos endpoints de escrita apenas libera a memória mais cedo.
+    """
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_SIZE, ttl: int = RESPONSE_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # chave -> (etag, body, expires_at)
+        self._by_resource = {}  # (usuário, recurso, id) -> {chave, ...}
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._invalidations = 0
+
+    def get(self, key: tuple, etag: str) -> Optional[bytes]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            cached_etag, body, expires_at = entry
+            if cached_etag != etag or expires_at <= now:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return body
+
+    def put(self, key: tuple, etag: str, body: bytes):
+        if len(body) > RESPONSE_CACHE_MAX_BODY:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (etag, body, time.monotonic() + self.ttl)
+            self._by_resource.setdefault(key[:3], set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, user_id: str, resource: str, resource_id: str = ""):
+        """Remove todas as variantes de um recurso (chamado pelos endpoints de escrita)"""
+        with self._lock:
+            for key in list(self._by_resource.get((user_id, resource, resource_id), ())):
+                self._remove(key)
+            self._invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_resource.clear()
+
+    def _remove(self, key: tuple):
+        self._entries.pop(key, None)
+        keys = self._by_resource.get(key[:3])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_resource[key[:3]]
+
+    # --- métricas ----------------------------------------------------------
+
+    def record(self, resource: str, outcome: str, body_size: int, build_seconds: float = 0.0):
+        with self._lock:
+            stats = self._stats.get(resource)
+            if stats is None:
+                stats = self._stats[resource] = _ResourceStats()
+            stats.requests += 1
+            if outcome == "not_modified":
+                stats.not_modified += 1
+                stats.bytes_saved += body_size
+            elif outcome == "hit":
+                stats.hits += 1
+                stats.bytes_sent += body_size
+            else:
+                stats.misses += 1
+                stats.bytes_sent += body_size
+                stats.build_seconds += build_seconds
+
+    def metrics(self) -> dict:
+        with self._lock:
+            recursos = {}
+            for resource, s in self._stats.items():
+                build_ms = s.build_seconds / s.misses * 1000 if s.misses else 0.0
+                recursos[resource] = {
+                    "requests": s.requests,
+                    "not_modified": s.not_modified,
+                    "cache_hits": s.hits,
+                    "misses": s.misses,
+                    "bytes_sent": s.bytes_sent,
+                    "bytes_saved": s.bytes_saved,
+                    "build_ms_mean": round(build_ms, 3),
+                    # Consulta completa + serialização evitadas (estimativa pela média dos misses)
+                    "build_ms_saved": round(build_ms * (s.not_modified + s.hits), 1),
+                }
+            return {
+                "entries": len(self._entries),
+                "invalidations": self._invalidations,
+                "resources": recursos,
+            }
+
+
+response_cache = ResponseCache()
+
+
+# ============================================================================
+# RESPOSTA CONDICIONAL
+# ============================================================================
+
+async def conditional_json(request: Request, user_id: str, resource: str, resource_id: str,
+                           version: tuple, build: Callable[[], Awaitable[Any]]) -> Response:
+    """
+    Responde uma leitura versionada:
+    - If-None-Match igual ao etag atual -> 304 sem corpo (build não roda);
+    - corpo da mesma versão no cache -> bytes prontos (build não roda);
+    - caso contrário roda `build`, serializa e guarda no cache.
+    """
+    if not HTTP_CACHE_ENABLED:
+        return ProfiledJSONResponse(jsonable_encoder(await build()))
+
+    variant = request_variant(request)
+    etag = make_etag(user_id, resource, resource_id, version, variant)
+    headers = {"ETag": etag, **CACHE_HEADERS}
+    key = (user_id, resource, resource_id, variant)
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        cached = response_cache.get(key, etag)
+        response_cache.record(resource, "not_modified", len(cached) if cached else 0)
+        return Response(status_code=304, headers=headers)
+
+    body = response_cache.get(key, etag)
+    if body is not None:
+        response_cache.record(resource, "hit", len(body))
+    else:
+        started = time.perf_counter()
+        body = ProfiledJSONResponse(jsonable_encoder(await build())).body
+        response_cache.record(resource, "miss", len(body), time.perf_counter() - started)
+        response_cache.put(key, etag, body)
+    return Response(content=body, media_type="application/json", headers=headers)
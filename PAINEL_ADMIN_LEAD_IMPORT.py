@@ -0,0 +1,350 @@
+# backend/app/lead_import.py
+# Importação em lote de leads (NDJSON ou CSV) em streaming:
+# validação linha a linha, inserts em lotes, deduplicação (dedup.py) e relatório de erros
+
+import codecs
+import csv
+import json
+import os
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .analysis import enqueue_analysis_many
+from .dedup import (
+    DedupBatch, canonical_cpf_cnpj, index_leads, lead_fingerprint, merge_submission, merge_webhook_data
+)
+from .geo import add_geo_delta, apply_geo_deltas, geo_from_endereco, geo_key
+from .models import Lead, gen_uuid
+from .stats import LEAD_COUNTER_DIMENSIONS, apply_lead_counter_deltas
+from .webhooks import enqueue_webhook_events
+
+# ============================================================================
+# CONFIGURAÇÕES
+# ============================================================================
+
+LEADS_BULK_BATCH_SIZE = int(os.getenv("LEADS_BULK_BATCH_SIZE", 1000))
+LEADS_BULK_BATCH_MAX = int(os.getenv("LEADS_BULK_BATCH_MAX", 5000))
+LEADS_BULK_MAX_ERRORS = int(os.getenv("LEADS_BULK_MAX_ERRORS", 1000))  # detalhes no relatório
+LEADS_BULK_MAX_LINE_BYTES = int(os.getenv("LEADS_BULK_MAX_LINE_BYTES", 64 * 1024))
+
+FORMATOS = ("ndjson", "csv")
+
+# Colunas planas do CSV que vão para Lead.endereco
+ENDERECO_CAMPOS = ("logradouro", "numero", "complemento", "bairro", "cep", "cidade", "estado")
+
+
+class ImportFormatError(Exception):
+    """Formato inválido (cabeçalho ausente, linha grande demais): aborta a importação"""
+
+
+def detect_format(content_type: Optional[str], formato: Optional[str] = None) -> str:
+    """?formato= tem prioridade; senão, pelo Content-Type (padrão NDJSON)"""
+    if formato:
+        formato = formato.lower()
+        if formato not in FORMATOS:
+            raise ImportFormatError(f"Formato não suportado: {formato}")
+        return formato
+    if content_type and "csv" in content_type.lower():
+        return "csv"
+    return "ndjson"
+
+
+# ============================================================================
+# LEITURA EM STREAMING
+# ============================================================================
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """
+    Quebra o corpo da requisição em linhas sem carregá-lo inteiro.
+    O decoder incremental lida com caracteres UTF-8 divididos entre chunks.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    pendente = ""
+    async for chunk in chunks:
+        pendente += decoder.decode(chunk)
+        *linhas, pendente = pendente.split("\n")
+        for linha in linhas:
+            yield linha.rstrip("\r")
+        if len(pendente) > LEADS_BULK_MAX_LINE_BYTES:
+            raise ImportFormatError(f"Linha maior que {LEADS_BULK_MAX_LINE_BYTES} bytes")
+    pendente += decoder.decode(b"", final=True)
+    if pendente:
+        yield pendente.rstrip("\r")
+
+
+async def iter_records(chunks: AsyncIterator[bytes], formato: str) -> AsyncIterator[Tuple[int, object]]:
+    """
+    Gera (linha, registro) onde registro é um dict ou uma string de erro de parsing.
+    No CSV, campos entre aspas podem conter quebras de linha: as linhas são
+    acumuladas até o número de aspas ficar par (registro completo).
+    """
+    numero = 0
+    if formato == "ndjson":
+        async for linha in iter_lines(chunks):
+            numero += 1
+            if not linha.strip():
+                continue
+            try:
+                registro = json.loads(linha)
+            except ValueError as exc:
+                yield numero, f"JSON inválido: {exc}"
+                continue
+            yield numero, registro if isinstance(registro, dict) else "Cada linha deve ser um objeto JSON"
+        return
+
+    cabecalho = None
+    acumulado, inicio = [], 0
+    async for linha in iter_lines(chunks):
+        numero += 1
+        if not acumulado:
+            inicio = numero
+        acumulado.append(linha)
+        texto = "\n".join(acumulado)
+        if texto.count('"') % 2:
+            if len(texto) > LEADS_BULK_MAX_LINE_BYTES:
+                raise ImportFormatError(f"Registro maior que {LEADS_BULK_MAX_LINE_BYTES} bytes (linha {inicio})")
+            continue
+        acumulado = []
+        if not texto.strip():
+            continue
+        valores = next(csv.reader([texto]))
+        if cabecalho is None:
+            cabecalho = [c.strip().lower() for c in valores]
+            continue
+        if len(valores) != len(cabecalho):
+            yield inicio, f"Esperadas {len(cabecalho)} colunas, encontradas {len(valores)}"
+            continue
+        yield inicio, _csv_row(dict(zip(cabecalho, valores)))
+    if acumulado:
+        yield inicio, "Aspas não fechadas no fim do arquivo"
+
+
+def _csv_row(row: Dict[str, str]) -> dict:
+    """Colunas vazias viram ausentes; colunas de endereço são agrupadas em `endereco`"""
+    registro = {k: v.strip() for k, v in row.items() if v is not None and v.strip() != ""}
+    endereco = {}
+    if "endereco" in registro:
+        try:
+            endereco = json.loads(registro.pop("endereco"))
+        except ValueError:
+            endereco = {}
+    for campo in ENDERECO_CAMPOS:
+        if campo in registro:
+            endereco[campo] = registro.pop(campo)
+    if endereco:
+        registro["endereco"] = endereco
+    return registro
+
+
+# ============================================================================
+# IMPORTAÇÃO
+# ============================================================================
+
+@dataclass
+class ImportReport:
+    recebidas: int = 0
+    inseridas: int = 0
+    mescladas: int = 0  # reenvios incorporados a um lead existente (merge_submission)
+    duplicadas: int = 0  # inseridos com duplicado_de (mesma pessoa, outro caso)
+    invalidas: int = 0
+    lotes: int = 0
+    erros: List[dict] = field(default_factory=list)
+    erros_truncados: bool = False
+    interrompida: Optional[str] = None  # erro de formato que abortou a leitura
+    leads_mesclados: Set[str] = field(default_factory=set)  # para invalidar caches (fora do relatório)
+
+    def erro(self, linha: int, motivo: str, detalhes: Optional[List[str]] = None):
+        if len(self.erros) >= LEADS_BULK_MAX_ERRORS:
+            self.erros_truncados = True
+            return
+        item = {"linha": linha, "motivo": motivo}
+        if detalhes:
+            item["detalhes"] = detalhes
+        self.erros.append(item)
+
+    def as_dict(self) -> dict:
+        return {
+            "recebidas": self.recebidas,
+            "inseridas": self.inseridas,
+            "mescladas": self.mescladas,
+            "duplicadas": self.duplicadas,
+            "invalidas": self.invalidas,
+            "lotes": self.lotes,
+            "erros": self.erros,
+            "erros_truncados": self.erros_truncados,
+            "interrompida": self.interrompida,
+        }
+
+
+def _lead_webhook(row: dict) -> dict:
+    """Lead recém-inserido no formato de serialize_lead (payload de lead.criado)"""
+    return {
+        "id": row["id"],
+        "nome_cliente": row["nome_cliente"],
+        "email_cliente": row["email_cliente"],
+        "telefone_cliente": row["telefone_cliente"],
+        "area_direito": row["area_direito"],
+        "descricao_caso": row["descricao_caso"],
+        "status": row["status"],
+        "urgencia": row["urgencia"],
+        "qualificacao": None,
+        "analise_ia": None,
+        "endereco": row["endereco"],
+        "uf": row["uf"],
+        "cidade": row["cidade"],
+        "canal_preferido": row["canal_preferido"],
+        "duplicado_de": row["duplicado_de"],
+        "submissoes": 1,
+        "criado_em": row["criado_em"],
+    }
+
+
+async def _flush_batch(db: AsyncSession, advogado_id: str, batch: List[dict], report: ImportReport):
+    """
+    Deduplica o lote com as regras e o índice de dedup.py (os mesmos de
+    POST /leads, incluindo as linhas anteriores do lote), insere os novos com
+    executemany, mescla os reenvios nos leads existentes, registra as chaves,
+    enfileira a análise e os webhooks (lead.criado, lead.mesclado) e comita
+    """
+    dedup = DedupBatch(advogado_id)
+    await dedup.load(db, [row["_fp"] for row in batch])
+    rows, fingerprints, mesclagens = [], [], []
+    duplicadas = 0
+    deltas = {}
+    geo_deltas = {}
+    for row in batch:
+        row.pop("_linha")
+        fp, lead = row.pop("_fp"), row.pop("_lead")
+        match = dedup.match(fp, row["area_direito"], row["criado_em"])
+        if match is not None and match.acao == "mesclar":
+            mesclagens.append((match.lead_id, lead))
+            continue
+        row["duplicado_de"] = match.lead_id if match is not None else None
+        if match is not None:
+            duplicadas += 1
+        dedup.add(row["id"], fp, row["nome_cliente"], row["descricao_caso"], row["area_direito"],
+                  row["criado_em"], row["duplicado_de"])
+        rows.append(row)
+        fingerprints.append((row["id"], fp))
+        for dimensao in LEAD_COUNTER_DIMENSIONS:
+            chave = (dimensao, row.get(dimensao) or "")
+            deltas[chave] = deltas.get(chave, 0) + 1
+        add_geo_delta(geo_deltas, geo_key(row["uf"], row["cidade"], row["area_direito"], row["status"],
+                                          row["criado_em"]), 1)
+
+    if rows:
+        await db.execute(insert(Lead), rows)
+        await apply_lead_counter_deltas(db, advogado_id, deltas)
+        await apply_geo_deltas(db, advogado_id, geo_deltas)
+        await index_leads(db, advogado_id, fingerprints)
+        await enqueue_analysis_many(db, [row["id"] for row in rows])
+        await enqueue_webhook_events(db, advogado_id, "lead.criado", [{"lead": _lead_webhook(row)} for row in rows])
+    # Depois do insert: o lead que recebe o reenvio pode ser do próprio lote
+    mescladas = []
+    for lead_id, lead in mesclagens:
+        mesclado = await merge_submission(db, advogado_id, lead_id, lead)
+        mescladas.append(merge_webhook_data(mesclado))
+    await enqueue_webhook_events(db, advogado_id, "lead.mesclado", mescladas)
+    await db.commit()
+    # O relatório só conta o que foi comitado (um lote rejeitado é regravado linha a linha)
+    report.leads_mesclados.update(lead_id for lead_id, _ in mesclagens)
+    report.duplicadas += duplicadas
+    report.inseridas += len(rows)
+    report.mescladas += len(mesclagens)
+    report.lotes += 1
+
+
+async def _flush_or_isolate(db: AsyncSession, advogado_id: str, batch: List[dict], report: ImportReport):
+    """
+    Grava o lote; se o banco o rejeitar (ex.: DataError de uma linha que
+    passou na validação), desfaz e regrava linha a linha, para que só as
+    linhas rejeitadas fiquem de fora (motivo "banco" no relatório)
+    """
+    copias = [dict(row) for row in batch]  # _flush_batch consome as chaves internas
+    try:
+        await _flush_batch(db, advogado_id, batch, report)
+        return
+    except DBAPIError as exc:
+        await db.rollback()
+        if len(copias) == 1:
+            report.invalidas += 1
+            report.erro(copias[0]["_linha"], "banco", [str(exc.orig)[:500]])
+            return
+
+    for row in copias:
+        await _flush_or_isolate(db, advogado_id, [row], report)
+
+
+async def import_leads(db: AsyncSession, advogado_id: str, records: AsyncIterator[Tuple[int, object]],
+                       schema, batch_size: int = LEADS_BULK_BATCH_SIZE) -> ImportReport:
+    """
+    Valida cada registro com `schema` (LeadCreate) à medida que chega e grava
+    em lotes de `batch_size`, cada lote na sua transação. A memória usada é
+    a de um lote. Reenvios do mesmo cliente são tratados como em POST /leads:
+    mesclados no lead existente (mesma área, dentro da janela) ou gravados
+    com `duplicado_de`.
+    Um erro de formato interrompe a leitura, mas os lotes válidos já lidos são gravados;
+    linhas recusadas pelo banco entram no relatório sem derrubar as demais.
+    """
+    batch_size = max(1, min(batch_size, LEADS_BULK_BATCH_MAX))
+    report = ImportReport()
+    batch: List[dict] = []
+
+    try:
+        async for linha, registro in records:
+            report.recebidas += 1
+            if isinstance(registro, str):
+                report.invalidas += 1
+                report.erro(linha, "formato", [registro])
+                continue
+            try:
+                lead = schema(**registro)
+            except ValidationError as exc:
+                report.invalidas += 1
+                report.erro(linha, "validacao", [
+                    f"{'.'.join(str(p) for p in e['loc'])}: {e['msg']}" for e in exc.errors()
+                ])
+                continue
+
+            agora = datetime.utcnow()
+            uf, cidade = geo_from_endereco(lead.endereco)
+            batch.append({
+                "id": gen_uuid(),
+                "advogado_id": advogado_id,
+                "nome_cliente": lead.nome_cliente,
+                "email_cliente": lead.email_cliente,
+                "telefone_cliente": lead.telefone_cliente,
+                "tipo_cliente": lead.tipo_cliente,
+                "cpf_cnpj": canonical_cpf_cnpj(lead.cpf_cnpj),
+                "area_direito": lead.area_direito,
+                "descricao_caso": lead.descricao_caso,
+                "urgencia": lead.urgencia,
+                "status": "novo",
+                "endereco": lead.endereco,
+                "uf": uf or None,
+                "cidade": cidade or None,
+                "canal_preferido": lead.canal_preferido,
+                "horario_preferido": lead.horario_preferido,
+                "criado_em": agora,
+                "atualizado_em": agora,
+                "_linha": linha,
+                "_lead": lead,
+                "_fp": lead_fingerprint(lead.nome_cliente, lead.email_cliente, lead.telefone_cliente,
+                                        lead.cpf_cnpj, lead.descricao_caso),
+            })
+
+            if len(batch) >= batch_size:
+                await _flush_or_isolate(db, advogado_id, batch, report)
+                batch = []
+    except ImportFormatError as exc:
+        report.interrompida = str(exc)
+
+    if batch:
+        await _flush_or_isolate(db, advogado_id, batch, report)
+    return report
@@ -0,0 +1,370 @@
+# backend/app/matching.py
+# Roteamento de leads: escolhe os advogados elegíveis para um lead
+# (área, cidade/estado, horário de atendimento e cota do plano)
+
+import heapq
+import os
+import threading
+import time
+import unicodedata
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from .geo import normalize_uf
+from .models import AdvogadoProfile, Lead
+
+# ============================================================================
+# CONFIGURAÇÕES
+# ============================================================================
+
+MATCHING_REFRESH_SECONDS = int(os.getenv("MATCHING_REFRESH_SECONDS", 30))
+MATCHING_TIMEZONE = ZoneInfo(os.getenv("MATCHING_TIMEZONE", "America/Sao_Paulo"))
+
+# Pesos do ranking
+SCORE_CIDADE = 3.0
+SCORE_ESTADO = 1.0
+SCORE_ABERTO_AGORA = 2.0
+SCORE_COTA = 1.0
+
+URGENCIAS_PRIORITARIAS = {"alta", "urgente"}
+
+# Chaves aceitas em horario_atendimento (weekday() -> chaves)
+DIAS_SEMANA = {
+    0: ("mon", "seg"), 1: ("tue", "ter"), 2: ("wed", "qua"), 3: ("thu", "qui"),
+    4: ("fri", "sex"), 5: ("sat", "sab"), 6: ("sun", "dom"),
+}
+
+
+
+def normalize(value: Optional[str]) -> str:
+    """Normaliza para comparação: sem acentos, minúsculo, sem espaços nas pontas"""
+    if not value:
+        return ""
+    value = unicodedata.normalize("NFKD", value)
+    value = "".join(c for c in value if not unicodedata.combining(c))
+    return value.strip().casefold()
+
+def normalize_estado(value: Optional[str]) -> str:
+    """Sigla da UF ("São Paulo", "sp" -> "SP"), para o formulário e o perfil baterem
+    em qualquer das formas; valor não reconhecido cai em normalize()"""
+    return normalize_uf(value) or normalize(value)
+
+
+# ============================================================================
+# ESTRUTURAS
+# ============================================================================
+
+@dataclass
+class ProfileEntry:
+    """Snapshot do perfil usado pelo roteamento"""
+    profile_id: str
+    user_id: str
+    nome: str
+    areas: Set[str]
+    cidades: Set[str]
+    estados: Set[str]
+    horario: Dict[int, List[tuple]] = field(default_factory=dict)  # weekday -> [(inicio, fim)]
+    limite_leads: Optional[int] = None
+
+    @classmethod
+    def from_profile(cls, profile: AdvogadoProfile) -> "ProfileEntry":
+        plano = profile.plano or {}
+        limite = plano.get("limite_leads")
+        return cls(
+            profile_id=profile.id,
+            user_id=profile.user_id,
+            nome=profile.nome,
+            areas={normalize(a) for a in profile.areas or []},
+            cidades={normalize(c) for c in profile.cidades or []},
+            estados={normalize_estado(e) for e in profile.estados or []},
+            horario=parse_horario(profile.horario_atendimento),
+            limite_leads=int(limite) if limite is not None else None,
+        )
+
+    def aberto(self, quando: datetime) -> bool:
+        if not self.horario:
+            return False
+        minuto = quando.hour * 60 + quando.minute
+        return any(inicio <= minuto < fim for inicio, fim in self.horario.get(quando.weekday(), ()))
+
+
+@dataclass
+class MatchResult:
+    advogado_id: str  # users.id (mesma chave de Lead.advogado_id)
+    profile_id: str
+    nome: str
+    score: float
+    aberto_agora: bool
+    leads_no_mes: int
+    limite_leads: Optional[int]
+
+
+def parse_horario(horario: Optional[dict]) -> Dict[int, List[tuple]]:
+    """{mon: "09:00-18:00", ...} -> {0: [(540, 1080)]} (minutos desde 00:00)"""
+    parsed = {}
+    if not horario:
+        return parsed
+    for weekday, chaves in DIAS_SEMANA.items():
+        for chave in chaves:
+            faixa = horario.get(chave)
+            if not faixa:
+                continue
+            for trecho in str(faixa).split(","):
+                try:
+                    inicio, fim = trecho.strip().split("-")
+                    h1, m1 = inicio.split(":")
+                    h2, m2 = fim.split(":")
+                    parsed.setdefault(weekday, []).append((int(h1) * 60 + int(m1), int(h2) * 60 + int(m2)))
+                except ValueError:
+                    continue
+    return parsed
+
+
+# ============================================================================
+# ÍNDICE INVERTIDO
+# ============================================================================
+
+class MatchingIndex:
+    """
+    Índice invertido em memória sobre os perfis ativos:
+    área -> {profile_id}, cidade -> {profile_id}, estado -> {profile_id}.
+
+    Um match é a interseção de poucos conjuntos, então o custo depende do
+    número de candidatos da área e não do total de perfis. O índice é
+    atualizado por upsert/remove nos endpoints de perfil e, para refletir
+    escritas de outros workers, recarrega incrementalmente por updated_at.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._profiles: Dict[str, ProfileEntry] = {}
+        self._by_area: Dict[str, Set[str]] = {}
+        self._by_cidade: Dict[str, Set[str]] = {}
+        self._by_estado: Dict[str, Set[str]] = {}
+        self._sem_regiao: Set[str] = set()  # perfis sem cidades/estados: atendem qualquer localidade
+        self._leads_no_mes: Dict[str, int] = {}
+        self._mes: Optional[tuple] = None
+        self._watermark: Optional[datetime] = None
+        self._watermark_ids: Set[str] = set()  # perfis já lidos com updated_at == _watermark
+        self._refreshed_at = 0.0
+        self._refresh_lock = threading.Lock()
+        self._rebuilds = 0
+        self._refreshes = 0
+
+    # --- manutenção --------------------------------------------------------
+
+    def _index(self, entry: ProfileEntry):
+        for area in entry.areas:
+            self._by_area.setdefault(area, set()).add(entry.profile_id)
+        for cidade in entry.cidades:
+            self._by_cidade.setdefault(cidade, set()).add(entry.profile_id)
+        for estado in entry.estados:
+            self._by_estado.setdefault(estado, set()).add(entry.profile_id)
+        if not entry.cidades and not entry.estados:
+            self._sem_regiao.add(entry.profile_id)
+
+    def _unindex(self, entry: ProfileEntry):
+        for bucket, keys in (
+            (self._by_area, entry.areas),
+            (self._by_cidade, entry.cidades),
+            (self._by_estado, entry.estados),
+        ):
+            for key in keys:
+                ids = bucket.get(key)
+                if ids is not None:
+                    ids.discard(entry.profile_id)
+                    if not ids:
+                        del bucket[key]
+        self._sem_regiao.discard(entry.profile_id)
+
+    def upsert(self, profile: AdvogadoProfile):
+        """Atualiza um perfil no índice (remove se inativo)"""
+        with self._lock:
+            self.remove(profile.id)
+            if profile.ativo:
+                entry = ProfileEntry.from_profile(profile)
+                self._profiles[entry.profile_id] = entry
+                self._index(entry)
+
+    def remove(self, profile_id: str):
+        with self._lock:
+            entry = self._profiles.pop(profile_id, None)
+            if entry is not None:
+                self._unindex(entry)
+
+    def rebuild(self, db: Session):
+        """Recarrega todos os perfis e as contagens de leads do mês"""
+        with self._lock:
+            self._profiles.clear()
+            self._by_area.clear()
+            self._by_cidade.clear()
+            self._by_estado.clear()
+            self._sem_regiao.clear()
+            self._watermark = None
+            self._watermark_ids = set()
+            self._load_profiles(db)
+            self._load_lead_counts(db)
+            self._refreshed_at = time.monotonic()
+            self._rebuilds += 1
+
+    def refresh(self, db: Session):
+        """Aplica apenas os perfis alterados desde a última carga"""
+        with self._lock:
+            self._load_profiles(db)
+            self._load_lead_counts(db)
+            self._refreshed_at = time.monotonic()
+            self._refreshes += 1
+
+    def refresh_if_stale(self, db: Session):
+        if time.monotonic() - self._refreshed_at >= MATCHING_REFRESH_SECONDS:
+            if self._watermark is None:
+                self.rebuild(db)
+            else:
+                self.refresh(db)
+
+    def ensure_fresh(self, session_factory) -> bool:
+        """
+        refresh_if_stale com sessão própria, para ser chamado via
+        asyncio.to_thread no caminho de entrada de leads. O primeiro uso no
+        processo faz o rebuild completo. Só uma thread recarrega por vez; as
+        demais seguem com o índice atual. Retorna se recarregou.
+        """
+        if time.monotonic() - self._refreshed_at < MATCHING_REFRESH_SECONDS:
+            return False
+        if not self._refresh_lock.acquire(blocking=self._watermark is None):
+            return False
+        try:
+            db = session_factory()
+            try:
+                self.refresh_if_stale(db)
+            finally:
+                db.close()
+            return True
+        finally:
+            self._refresh_lock.release()
+
+    def _load_profiles(self, db: Session):
+        # >= na marca d'água: perfis gravados com o mesmo updated_at da última
+        # carga (mas comitados depois dela) não ficam para trás; os já lidos
+        # naquele instante são ignorados pelo id
+        query = db.query(AdvogadoProfile)
+        if self._watermark is not None:
+            query = query.filter(AdvogadoProfile.updated_at >= self._watermark)
+        query = query.order_by(AdvogadoProfile.updated_at, AdvogadoProfile.id)
+        for profile in query.yield_per(1000):
+            if profile.updated_at is not None and profile.updated_at == self._watermark:
+                if profile.id in self._watermark_ids:
+                    continue
+                self._watermark_ids.add(profile.id)
+            elif profile.updated_at is not None and (self._watermark is None or profile.updated_at > self._watermark):
+                self._watermark = profile.updated_at
+                self._watermark_ids = {profile.id}
+            self.upsert(profile)
+
+    def _load_lead_counts(self, db: Session):
+        agora = datetime.utcnow()
+        inicio_mes = agora.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        rows = db.query(Lead.advogado_id, func.count(Lead.id)).filter(
+            Lead.criado_em >= inicio_mes
+        ).group_by(Lead.advogado_id).all()
+        self._leads_no_mes = {advogado_id: total for advogado_id, total in rows}
+        self._mes = (agora.year, agora.month)
+
+    def record_assignment(self, advogado_id: str):
+        """Conta um lead atribuído no mês corrente (cota do plano)"""
+        with self._lock:
+            agora = datetime.utcnow()
+            if self._mes != (agora.year, agora.month):
+                self._leads_no_mes = {}
+                self._mes = (agora.year, agora.month)
+            self._leads_no_mes[advogado_id] = self._leads_no_mes.get(advogado_id, 0) + 1
+
+    # --- consulta ----------------------------------------------------------
+
+    def match(self, area_direito: str, cidade: Optional[str] = None, estado: Optional[str] = None,
+              urgencia: str = "media", limit: int = 5, quando: Optional[datetime] = None) -> List[MatchResult]:
+        """
+        Retorna os advogados elegíveis ordenados por score:
+        cidade atendida > estado atendido, aberto agora (peso dobrado para
+        urgência alta/urgente) e cota restante do plano.
+        Perfis inativos, de outra área, fora da região ou com cota esgotada são excluídos.
+        """
+        area = normalize(area_direito)
+        cidade = normalize(cidade)
+        estado = normalize_estado(estado)
+        quando = quando or datetime.now(MATCHING_TIMEZONE)
+        peso_aberto = SCORE_ABERTO_AGORA * (2 if normalize(urgencia) in URGENCIAS_PRIORITARIAS else 1)
+
+        with self._lock:
+            candidatos = self._by_area.get(area)
+            if not candidatos:
+                return []
+
+            por_cidade = self._by_cidade.get(cidade, set()) if cidade else set()
+            por_estado = self._by_estado.get(estado, set()) if estado else set()
+            elegiveis = candidatos & (por_cidade | por_estado | self._sem_regiao)
+
+            ranked = []
+            for profile_id in elegiveis:
+                entry = self._profiles[profile_id]
+                usados = self._leads_no_mes.get(entry.user_id, 0)
+                limite = entry.limite_leads
+                if limite is not None and usados >= limite:
+                    continue
+
+                score = 0.0
+                if cidade in entry.cidades:
+                    score += SCORE_CIDADE
+                if estado in entry.estados:
+                    score += SCORE_ESTADO
+                aberto = entry.aberto(quando)
+                if aberto:
+                    score += peso_aberto
+                if limite:
+                    score += SCORE_COTA * (1 - usados / limite)
+                # Empate: quem recebeu menos leads no mês primeiro (balanceamento)
+                ranked.append((score, -usados, profile_id, aberto))
+
+            top = heapq.nlargest(limit, ranked)
+            return [
+                MatchResult(
+                    advogado_id=self._profiles[profile_id].user_id,
+                    profile_id=profile_id,
+                    nome=self._profiles[profile_id].nome,
+                    score=round(score, 4),
+                    aberto_agora=aberto,
+                    leads_no_mes=-neg_usados,
+                    limite_leads=self._profiles[profile_id].limite_leads,
+                )
+                for score, neg_usados, profile_id, aberto in top
+            ]
+
+    def match_lead(self, lead: Lead, limit: int = 5) -> List[MatchResult]:
+        endereco = lead.endereco or {}
+        return self.match(
+            lead.area_direito,
+            cidade=endereco.get("cidade"),
+            estado=endereco.get("estado"),
+            urgencia=lead.urgencia or "media",
+            limit=limit,
+        )
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "profiles": len(self._profiles),
+                "areas": len(self._by_area),
+                "cidades": len(self._by_cidade),
+                "estados": len(self._by_estado),
+                "rebuilds": self._rebuilds,
+                "refreshes": self._refreshes,
+                "leads_no_mes": sum(self._leads_no_mes.values()),
+            }
+
+
+matching_index = MatchingIndex()
@@ -0,0 +1,356 @@
+# backend/app/migrations.py
+# Migrações de dados do Painel do Advogado
+#
+# Uso:
+#   python -m app.migrations mensagens [--batch-size 500]
+#   python -m app.migrations rotacionar-chaves [--batch-size 500]
+#   python -m app.migrations busca
+#   python -m app.migrations deduplicar [--batch-size 500]
+#   python -m app.migrations deduplicar-mesclar [--batch-size 500]
+#   python -m app.migrations geo [--batch-size 500]
+#   python -m app.migrations conversas-resumo [--batch-size 500]
+#   python -m app.migrations arquivo-particoes
+#   python -m app.migrations arquivar [--batch-size 200]
+#   python -m app.migrations cpf-cnpj [--batch-size 500]
+#   python -m app.migrations exportacoes-progresso
+#   python -m app.migrations matching-indices
+
+import argparse
+from datetime import datetime
+
+from sqlalchemy import bindparam, null, select, text, update
+from sqlalchemy.orm import Session
+
+from .archive import archive_leads, create_archive_partitions
+from .database import SessionLocal
+from .dedup import canonical_cpf_cnpj, deduplicate_leads, refresh_conversa_resumo
+from .geo import backfill_lead_geo
+from .models import AdvogadoProfile, Conversa, Lead, Mensagem, rotate_many
+from .search import SEARCH_DDL
+
+
+# ============================================================================
+# MIGRAÇÃO: Conversa.mensagens (JSON) -> tabela mensagens
+# ============================================================================
+
+def _parse_timestamp(value) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return datetime.utcnow()
+
+def migrate_conversa_mensagens(db: Session, batch_size: int = 500) -> int:
+    """
+    Move os arrays JSON de Conversa.mensagens para a tabela mensagens.
+
+    Percorre as conversas em lotes ordenados por id (keyset), insere as
+    mensagens de cada lote com um único executemany e limpa o JSON na
+    mesma transação. Pode ser interrompida e reexecutada com segurança:
+    conversas já migradas ficam com mensagens = NULL e são ignoradas.
+
+    Retorna o número de mensagens migradas.
+    """
+    migradas = 0
+    last_id = None
+
+    while True:
+        query = db.query(Conversa).filter(Conversa.mensagens.isnot(None))
+        if last_id is not None:
+            query = query.filter(Conversa.id > last_id)
+        conversas = query.order_by(Conversa.id).limit(batch_size).all()
+        if not conversas:
+            break
+
+        rows = []
+        for conversa in conversas:
+            for item in conversa.mensagens or []:
+                rows.append({
+                    "conversa_id": conversa.id,
+                    "tipo": item.get("tipo", "cliente"),
+                    "texto": item.get("texto", ""),
+                    "lido": bool(item.get("lido", False)),
+                    "timestamp": _parse_timestamp(item.get("timestamp")),
+                })
+            conversa.mensagens = null()
+
+        if rows:
+            db.bulk_insert_mappings(Mensagem, rows)
+        db.commit()
+
+        migradas += len(rows)
+        last_id = conversas[-1].id
+        db.expunge_all()
+
+    return migradas
+
+
+# ============================================================================
+# MIGRAÇÃO: rotação de chave de advogados.cpf_cnpj_encrypted
+# ============================================================================
+
+def rotate_cpf_cnpj_encryption(db: Session, batch_size: int = 500) -> int:
+    """
+    Recriptografa advogados.cpf_cnpj_encrypted com a chave primária de ENCRYPTION_KEYS.
+
+    Cada lote lê só (id, cpf_cnpj_encrypted) por keyset em id e grava com um
+    UPDATE em lote condicionado ao valor antigo. A transação de cada lote é
+    curta e trava apenas as linhas alteradas, nunca a tabela; se o perfil foi
+    alterado no meio do caminho o UPDATE não casa e o valor novo é preservado.
+
+    Retorna o número de registros recriptografados.
+    """
+    stmt = (
+        update(AdvogadoProfile.__table__)
+        .where(
+            AdvogadoProfile.__table__.c.id == bindparam("b_id"),
+            AdvogadoProfile.__table__.c.cpf_cnpj_encrypted == bindparam("b_old"),
+        )
+        .values(cpf_cnpj_encrypted=bindparam("b_new"))
+    )
+
+    rotacionados = 0
+    last_id = None
+
+    while True:
+        query = db.query(AdvogadoProfile.id, AdvogadoProfile.cpf_cnpj_encrypted).filter(
+            AdvogadoProfile.cpf_cnpj_encrypted.isnot(None)
+        )
+        if last_id is not None:
+            query = query.filter(AdvogadoProfile.id > last_id)
+        rows = query.order_by(AdvogadoProfile.id).limit(batch_size).all()
+        if not rows:
+            break
+
+        novos = rotate_many(row.cpf_cnpj_encrypted for row in rows)
+        params = [
+            {"b_id": row.id, "b_old": row.cpf_cnpj_encrypted, "b_new": novo}
+            for row, novo in zip(rows, novos)
+            if novo is not None
+        ]
+        if params:
+            db.execute(stmt, params)
+        db.commit()
+
+        rotacionados += len(params)
+        last_id = rows[-1].id
+
+    return rotacionados
+
+
+# ============================================================================
+# MIGRAÇÃO: índices de busca textual (tsvector + GIN)
+# ============================================================================
+
+def create_search_index(db: Session, batch_size: int = 500) -> int:
+    """
+    Cria a configuração pt_unaccent, as colunas tsvector geradas e os índices GIN.
+    Idempotente. Roda em autocommit (CREATE INDEX CONCURRENTLY não aceita
+    transação); o ADD COLUMN gerado reescreve a tabela, então rode fora do pico.
+    Em bancos que não são Postgres não faz nada (a busca usa o índice em Python).
+
+    Retorna o número de comandos executados.
+    """
+    engine = db.get_bind()
+    if engine.dialect.name != "postgresql":
+        return 0
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for statement in SEARCH_DDL:
+            conn.execute(text(statement))
+    return len(SEARCH_DDL)
+
+
+# ============================================================================
+# MIGRAÇÃO: deduplicação de leads existentes
+# ============================================================================
+
+def link_duplicate_leads(db: Session, batch_size: int = 500) -> int:
+    """Preenche leads.duplicado_de e reconstrói lead_assinaturas (não remove leads)"""
+    return deduplicate_leads(db, batch_size=batch_size, mesclar=False)
+
+def merge_duplicate_leads(db: Session, batch_size: int = 500) -> int:
+    """Como link_duplicate_leads, mas mescla e remove os reenvios da mesma pessoa na mesma área"""
+    return deduplicate_leads(db, batch_size=batch_size, mesclar=True)
+
+
+# ============================================================================
+# MIGRAÇÃO: uf/cidade dos leads e lead_geo_rollup
+# ============================================================================
+
+def backfill_geo(db: Session, batch_size: int = 500) -> int:
+    """Extrai uf/cidade do endereço dos leads existentes e reconstrói o rollup do mapa"""
+    return backfill_lead_geo(db, batch_size=batch_size)
+
+
+# ============================================================================
+# MIGRAÇÃO: resumo das conversas (caixa de entrada)
+# ============================================================================
+
+CONVERSAS_RESUMO_DDL = [
+    "ALTER TABLE conversas ADD COLUMN IF NOT EXISTS ultima_mensagem_texto VARCHAR(140)",
+    "ALTER TABLE conversas ADD COLUMN IF NOT EXISTS ultima_mensagem_tipo VARCHAR(20)",
+    "ALTER TABLE conversas ADD COLUMN IF NOT EXISTS nao_lidas INTEGER NOT NULL DEFAULT 0",
+    "CREATE INDEX IF NOT EXISTS ix_conversas_advogado_inbox "
+    "ON conversas (advogado_id, ativa, ultima_mensagem DESC, id DESC)",
+]
+
+def backfill_conversa_resumo(db: Session, batch_size: int = 500) -> int:
+    """
+    Preenche ultima_mensagem, trecho, tipo e nao_lidas das conversas a partir
+    da tabela mensagens (rodar depois de "mensagens"). Keyset por id; por lote,
+    uma consulta de última mensagem (row_number) e uma de não lidas, gravadas
+    com um executemany. Reexecutável: recalcula os valores do zero.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        for ddl in CONVERSAS_RESUMO_DDL:
+            db.execute(text(ddl))
+        db.commit()
+
+    atualizadas = 0
+    last_id = None
+    while True:
+        query = select(Conversa.id)
+        if last_id is not None:
+            query = query.where(Conversa.id > last_id)
+        ids = db.execute(query.order_by(Conversa.id).limit(batch_size)).scalars().all()
+        if not ids:
+            break
+
+        atualizadas += refresh_conversa_resumo(db, ids)
+        db.commit()
+        last_id = ids[-1]
+
+    return atualizadas
+
+
+# ============================================================================
+# MIGRAÇÃO: arquivamento de casos encerrados (leads_arquivo)
+# ============================================================================
+
+def archive_partitions(db: Session, batch_size: int = 500) -> int:
+    """Cria leads_arquivo particionada por mês e as partições até ARCHIVE_PARTITION_MONTHS_AHEAD"""
+    return create_archive_partitions(db, batch_size=batch_size)
+
+def archive_closed_leads(db: Session, batch_size: int = 500) -> int:
+    """Move casos fechados/rejeitados antigos para leads_arquivo (rodar depois de "arquivo-particoes")"""
+    return archive_leads(db, batch_size=batch_size)
+
+
+# ============================================================================
+# MIGRAÇÃO: leads.cpf_cnpj na forma canônica (só dígitos)
+# ============================================================================
+
+def normalize_lead_cpf_cnpj(db: Session, batch_size: int = 500) -> int:
+    """
+    Regrava leads.cpf_cnpj com canonical_cpf_cnpj: leads criados por POST /leads
+    antes da normalização guardavam o documento como digitado ("123.456.789-00"),
+    enquanto a importação em lote gravava só os dígitos. Keyset por id, UPDATE
+    em lote condicionado ao valor antigo. Reexecutável.
+    """
+    table = Lead.__table__
+    stmt = (
+        update(table)
+        .where(table.c.id == bindparam("b_id"), table.c.cpf_cnpj == bindparam("b_old"))
+        .values(cpf_cnpj=bindparam("b_new"))
+    )
+
+    normalizados = 0
+    last_id = None
+    while True:
+        query = select(Lead.id, Lead.cpf_cnpj)
+        if last_id is not None:
+            query = query.where(Lead.id > last_id)
+        rows = db.execute(query.order_by(Lead.id).limit(batch_size)).all()
+        if not rows:
+            break
+
+        params = [
+            {"b_id": row.id, "b_old": row.cpf_cnpj, "b_new": canonical_cpf_cnpj(row.cpf_cnpj)}
+            for row in rows
+            if canonical_cpf_cnpj(row.cpf_cnpj) != row.cpf_cnpj
+        ]
+        if params:
+            db.execute(stmt, params)
+        db.commit()
+
+        normalizados += len(params)
+        last_id = rows[-1].id
+
+    return normalizados
+
+
+# ============================================================================
+# MIGRAÇÃO: exportacoes.progresso_em (heartbeat das exportações em segundo plano)
+# ============================================================================
+
+EXPORTACOES_PROGRESSO_DDL = [
+    "ALTER TABLE exportacoes ADD COLUMN IF NOT EXISTS progresso_em TIMESTAMP",
+]
+
+def add_exportacao_progresso(db: Session, batch_size: int = 500) -> int:
+    """Coluna de heartbeat usada por export.expire_stale_exports (rodar antes do deploy)"""
+    if db.get_bind().dialect.name == "postgresql":
+        for ddl in EXPORTACOES_PROGRESSO_DDL:
+            db.execute(text(ddl))
+        db.commit()
+    return len(EXPORTACOES_PROGRESSO_DDL)
+
+
+# ============================================================================
+# MIGRAÇÃO: remove os índices GIN de advogados_profile (roteamento em memória)
+# ============================================================================
+
+MATCHING_DROP_DDL = [
+    "DROP INDEX IF EXISTS ix_advogados_areas_gin",
+    "DROP INDEX IF EXISTS ix_advogados_cidades_gin",
+    "DROP INDEX IF EXISTS ix_advogados_estados_gin",
+]
+
+def drop_matching_indexes(db: Session, batch_size: int = 500) -> int:
+    """
+    O roteamento consulta o índice em memória de matching.py; os índices GIN
+    em areas/cidades/estados só custavam escrita a cada atualização de perfil
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        for ddl in MATCHING_DROP_DDL:
+            db.execute(text(ddl))
+        db.commit()
+    return len(MATCHING_DROP_DDL)
+
+
+# ============================================================================
+# CLI
+# ============================================================================
+
+MIGRATIONS = {
+    "mensagens": migrate_conversa_mensagens,
+    "rotacionar-chaves": rotate_cpf_cnpj_encryption,
+    "busca": create_search_index,
+    "deduplicar": link_duplicate_leads,
+    "deduplicar-mesclar": merge_duplicate_leads,
+    "geo": backfill_geo,
+    "conversas-resumo": backfill_conversa_resumo,
+    "arquivo-particoes": archive_partitions,
+    "arquivar": archive_closed_leads,
+    "cpf-cnpj": normalize_lead_cpf_cnpj,
+    "exportacoes-progresso": add_exportacao_progresso,
+    "matching-indices": drop_matching_indexes,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrações de dados do Painel do Advogado")
+    parser.add_argument("migration", choices=sorted(MIGRATIONS))
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        total = MIGRATIONS[args.migration](db, batch_size=args.batch_size)
+        print(f"{args.migration}: {total} registros migrados")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,103 @@
 # backend/app/models.py
 # Modelos SQLAlchemy para Advocacia.AI - Painel do Advogado
 
-from sqlalchemy import Column, String, Boolean, DateTime, JSON, ARRAY, BYTEA, Integer, ForeignKey, Index
-from sqlalchemy.dialects.postgresql import UUID, JSON
+from sqlalchemy import Column, String, Text, Boolean, Date, DateTime, Float, LargeBinary, Integer, ForeignKey, Index
+from sqlalchemy.dialects.postgresql import UUID, JSON, ARRAY
 from sqlalchemy.orm import declarative_base, relationship
 from sqlalchemy.sql import func
 from datetime import datetime
 import uuid
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, MultiFernet, InvalidToken
+from typing import Iterable, List, Optional
+import threading
 import os
 
+from .profiling import timed
+
 Base = declarative_base()
 
 def gen_uuid():
     """Gera UUID v4 como string"""
     return str(uuid.uuid4())
 
+def string_array():
+    """ARRAY(String) no Postgres; JSON no SQLite (testes e benchmarks locais)"""
+    return ARRAY(String).with_variant(JSON(), "sqlite")
+
+
+# ============================================================================
+# CRIPTOGRAFIA DE DADOS SENSÍVEIS
+# ============================================================================
+#
+# ENCRYPTION_KEYS aceita várias chaves separadas por vírgula: a primeira
+# criptografa, todas descriptografam (rotação via MultiFernet).
+# ENCRYPTION_KEY continua aceita para instalações com chave única.
+
+_cipher = None
+_primary = None
+_cipher_lock = threading.Lock()
+
+def _load_keys() -> List[bytes]:
+    keys = os.getenv("ENCRYPTION_KEYS") or os.getenv("ENCRYPTION_KEY", "default-key-change-in-production")
+    return [k.strip().encode() for k in keys.split(",") if k.strip()]
+
+def get_cipher() -> MultiFernet:
+    """Cipher do processo, construído uma única vez"""
+    global _cipher, _primary
+    if _cipher is None:
+        with _cipher_lock:
+            if _cipher is None:
+                fernets = [Fernet(key) for key in _load_keys()]
+                _primary = fernets[0]
+                _cipher = MultiFernet(fernets)
+    return _cipher
+
+def reset_cipher():
+    """Descarta o cipher em cache (após trocar as chaves no ambiente)"""
+    global _cipher, _primary
+    with _cipher_lock:
+        _cipher = None
+        _primary = None
+
+@timed("crypto")
 def encrypt_data(data: str) -> bytes:
     """Criptografa dados sensíveis"""
-    key = os.getenv("ENCRYPTION_KEY", "default-key-change-in-production").encode()
-    cipher = Fernet(key)
-    return cipher.encrypt(data.encode())
+    return get_cipher().encrypt(data.encode())
 
+@timed("crypto")
 def decrypt_data(encrypted_data: bytes) -> str:
     """Descriptografa dados sensíveis"""
-    key = os.getenv("ENCRYPTION_KEY", "default-key-change-in-production").encode()
-    cipher = Fernet(key)
-    return cipher.decrypt(encrypted_data).decode()
+    return get_cipher().decrypt(bytes(encrypted_data)).decode()
+
+@timed("crypto")
+def encrypt_many(values: Iterable[Optional[str]]) -> List[Optional[bytes]]:
+    """Criptografa vários valores com o mesmo cipher (None é preservado)"""
+    encrypt = get_cipher().encrypt
+    return [encrypt(v.encode()) if v else None for v in values]
+
+@timed("crypto")
+def decrypt_many(values: Iterable[Optional[bytes]]) -> List[Optional[str]]:
+    """Descriptografa vários valores com o mesmo cipher (None é preservado)"""
+    decrypt = get_cipher().decrypt
+    return [decrypt(bytes(v)).decode() if v else None for v in values]
+
+def rotate_many(values: Iterable[Optional[bytes]]) -> List[Optional[bytes]]:
+    """
+    Recriptografa com a chave primária os valores que ainda usam chaves antigas.
+    Retorna None nas posições que já estão na chave primária (nada a fazer).
+    """
+    cipher = get_cipher()
+    rotated = []
+    for value in values:
+        if not value:
+            rotated.append(None)
+            continue
+        try:
+            _primary.decrypt(bytes(value))
+            rotated.append(None)
+        except InvalidToken:
+            rotated.append(cipher.rotate(bytes(value)))
+    return rotated
 
 
 # ============================================================================
@@ -81,7 +152,7 @@ class AdvogadoProfile(Base):
     tipo = Column(String(50), default="individual")  # individual | sociedade
     
     # Dados Profissionais (Criptografados)
-    cpf_cnpj_encrypted = Column(BYTEA, nullable=True)  # Criptografado
+    cpf_cnpj_encrypted = Column(LargeBinary, nullable=True)  # Criptografado (BYTEA)
     
     # Dados OAB
     oab_numero = Column(String(50), nullable=False, unique=True)
@@ -99,9 +170,9 @@ class AdvogadoProfile(Base):
     endereco = Column(JSON, nullable=True)  # {logradouro, numero, complemento, cep, cidade, estado}
     
     # Especialidades
-    areas = Column(ARRAY(String), nullable=True)  # e.g. ["Trabalho", "Cível"]
-    cidades = Column(ARRAY(String), nullable=True)  # e.g. ["São Paulo", "Guarulhos"]
-    estados = Column(ARRAY(String), nullable=True)  # e.g. ["SP", "RJ"]
+    areas = Column(string_array(), nullable=True)  # e.g. ["Trabalho", "Cível"]
+    cidades = Column(string_array(), nullable=True)  # e.g. ["São Paulo", "Guarulhos"]
+    estados = Column(string_array(), nullable=True)  # e.g. ["SP", "RJ"]
     
     # Horários de Atendimento
     horario_atendimento = Column(JSON, nullable=True)  # {mon: "09:00-18:00", ...}
@@ -121,6 +192,7 @@ class AdvogadoProfile(Base):
     __table_args__ = (
         Index("ix_advogados_user_id", "user_id"),
         Index("ix_advogados_oab", "oab_numero", "oab_estado"),
+        # Roteamento de leads usa o índice em memória de matching.py, não índices no banco
     )
 
     def __repr__(self):
@@ -178,11 +250,17 @@ class Lead(Base):
     
     # Endereço
     endereco = Column(JSON, nullable=True)  # {logradouro, numero, complemento, cep, cidade, estado}
+    uf = Column(String(2), nullable=True)  # extraídos de endereco na escrita (ver geo.py)
+    cidade = Column(String(120), nullable=True)
     
     # Preferências de Contato
     canal_preferido = Column(String(50), nullable=True)  # whatsapp | telefone | email
     horario_preferido = Column(String(100), nullable=True)
     
+    # Deduplicação (ver dedup.py)
+    duplicado_de = Column(UUID(as_uuid=False), ForeignKey("leads.id", ondelete="SET NULL"), nullable=True)
+    submissoes = Column(Integer, default=1, nullable=False)  # reenvios mesclados neste lead
+    
     # Metadados
     criado_em = Column(DateTime, default=datetime.utcnow)
     atualizado_em = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -192,10 +270,23 @@ class Lead(Base):
     
     # Relacionamento com Conversas
     conversas = relationship("Conversa", back_populates="lead", cascade="all, delete-orphan")
+    
+    # Anotações e tarefas do caso (carregadas com selectinload em /leads/{id}/full)
+    anotacoes = relationship("Anotacao", back_populates="lead", cascade="all, delete-orphan")
+    tarefas = relationship("Tarefa", back_populates="lead")
 
     __table_args__ = (
         Index("ix_leads_advogado_id", "advogado_id"),
         Index("ix_leads_status", "status"),
+        # Paginação keyset (criado_em, id) e filtros mais comuns do CRM
+        Index("ix_leads_advogado_criado", "advogado_id", criado_em.desc(), id.desc()),
+        Index("ix_leads_advogado_status_criado", "advogado_id", "status", criado_em.desc()),
+        Index("ix_leads_advogado_area_criado", "advogado_id", "area_direito", criado_em.desc()),
+        # Deduplicação na importação em lote
+        Index("ix_leads_advogado_cpf_cnpj", "advogado_id", "cpf_cnpj"),
+        Index("ix_leads_duplicado_de", "duplicado_de"),
+        # Filtros geográficos (MapaBrasil)
+        Index("ix_leads_advogado_uf_cidade", "advogado_id", "uf", "cidade"),
     )
 
     def __repr__(self):
@@ -206,10 +297,22 @@ class Lead(Base):
 # MODELO 4: Conversa (Chat/Comunicação)
 # ============================================================================
 
+MENSAGEM_PREVIEW_CHARS = 140
+
+def preview_mensagem(texto: Optional[str]) -> str:
+    """Trecho da última mensagem guardado na conversa (caixa de entrada)"""
+    texto = " ".join((texto or "").split())
+    if len(texto) <= MENSAGEM_PREVIEW_CHARS:
+        return texto
+    return texto[:MENSAGEM_PREVIEW_CHARS - 1].rstrip() + "…"
+
+
 class Conversa(Base):
     """
     Conversa entre advogado e cliente.
     Histórico de mensagens e comunicações.
+    O resumo (última mensagem, não lidas) é mantido por send_message e pelas
+    marcações de leitura, para a caixa de entrada não ler o histórico.
     """
     __tablename__ = "conversas"
 
@@ -217,13 +320,19 @@ class Conversa(Base):
     lead_id = Column(UUID(as_uuid=False), ForeignKey("leads.id"), nullable=False)
     advogado_id = Column(UUID(as_uuid=False), ForeignKey("users.id"), nullable=False)
     
-    # Mensagens (JSON array)
+    # Legado: mensagens em JSON array, migradas para a tabela mensagens
+    # (ver migrations.migrate_conversa_mensagens). Novas mensagens usam Mensagem.
     mensagens = Column(JSON, nullable=True)  # [{tipo: "cliente|advogado", texto, timestamp, lido}]
     
     # Status
     ativa = Column(Boolean, default=True)
     ultima_mensagem = Column(DateTime, nullable=True)
     
+    # Resumo para a caixa de entrada (desnormalizado)
+    ultima_mensagem_texto = Column(String(MENSAGEM_PREVIEW_CHARS), nullable=True)
+    ultima_mensagem_tipo = Column(String(20), nullable=True)  # cliente | advogado
+    nao_lidas = Column(Integer, default=0, nullable=False)  # mensagens do cliente ainda não lidas
+    
     # Timestamps
     criada_em = Column(DateTime, default=datetime.utcnow)
     atualizada_em = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -231,10 +340,13 @@ class Conversa(Base):
     # Relacionamentos
     lead = relationship("Lead", back_populates="conversas")
     advogado = relationship("User", back_populates="conversas")
+    historico = relationship("Mensagem", back_populates="conversa", cascade="all, delete-orphan")
 
     __table_args__ = (
         Index("ix_conversas_lead_id", "lead_id"),
         Index("ix_conversas_advogado_id", "advogado_id"),
+        # Caixa de entrada: keyset (ultima_mensagem, id) das conversas ativas
+        Index("ix_conversas_advogado_inbox", "advogado_id", "ativa", ultima_mensagem.desc(), id.desc()),
     )
 
     def __repr__(self):
@@ -266,6 +378,9 @@ class Anotacao(Base):
     criada_em = Column(DateTime, default=datetime.utcnow)
     atualizada_em = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    # Relacionamento com Lead
+    lead = relationship("Lead", back_populates="anotacoes")
+
     __table_args__ = (
         Index("ix_anotacoes_lead_id", "lead_id"),
     )
@@ -298,17 +413,402 @@ class Tarefa(Base):
     
     # Datas
     data_vencimento = Column(DateTime, nullable=True)
+    lembrete_enviado_em = Column(DateTime, nullable=True)  # marcado pelo agendador de tarefas.py
     criada_em = Column(DateTime, default=datetime.utcnow)
     atualizada_em = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    # Relacionamento com Lead
+    lead = relationship("Lead", back_populates="tarefas")
+
     __table_args__ = (
         Index("ix_tarefas_advogado_id", "advogado_id"),
+        Index("ix_tarefas_lead_id", "lead_id"),
+        # Varredura por intervalo do agendador: só tarefas ainda sem lembrete
+        Index(
+            "ix_tarefas_concluida_vencimento", "concluida", "data_vencimento",
+            postgresql_where=lembrete_enviado_em.is_(None),
+        ),
     )
 
     def __repr__(self):
         return f"<Tarefa(titulo='{self.titulo}', concluida={self.concluida})>"
 
 
+# ============================================================================
+# MODELO 7: LeadContador (Contadores do Dashboard)
+# ============================================================================
+
+class LeadContador(Base):
+    """
+    Contadores de leads por advogado, mantidos por create_lead/update_lead.
+    Uma linha por (advogado, dimensão, valor), ex.: ("status", "novo").
+    Permite montar o dashboard sem varrer a tabela leads.
+    """
+    __tablename__ = "lead_contadores"
+
+    advogado_id = Column(UUID(as_uuid=False), ForeignKey("users.id"), primary_key=True)
+    dimensao = Column(String(50), primary_key=True)  # status | area_direito | urgencia
+    valor = Column(String(100), primary_key=True)
+    total = Column(Integer, nullable=False, default=0)
+    atualizado_em = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<LeadContador({self.dimensao}='{self.valor}', total={self.total})>"
+
+
+# ============================================================================
+# MODELO 8: Mensagem (Mensagens de uma Conversa)
+# ============================================================================
+
+class Mensagem(Base):
+    """
+    Mensagem individual de uma conversa (append-only).
+    Substitui o array JSON Conversa.mensagens: inserir é O(1) e a leitura
+    pagina pelo índice (conversa_id, timestamp, id).
+    """
+    __tablename__ = "mensagens"
+
+    id = Column(UUID(as_uuid=False), primary_key=True, default=gen_uuid)
+    conversa_id = Column(UUID(as_uuid=False), ForeignKey("conversas.id"), nullable=False)
+    
+    # Conteúdo
+    tipo = Column(String(20), nullable=False)  # cliente | advogado
+    texto = Column(String(4000), nullable=False)
+    lido = Column(Boolean, default=False)
+    
+    # Timestamp
+    timestamp = Column(DateTime, default=datetime.utcnow, nullable=False)
+    
+    # Relacionamento
+    conversa = relationship("Conversa", back_populates="historico")
+
+    __table_args__ = (
+        Index("ix_mensagens_conversa_timestamp", "conversa_id", "timestamp", "id"),
+    )
+
+    def __repr__(self):
+        return f"<Mensagem(conversa_id='{self.conversa_id}', tipo='{self.tipo}')>"
+
+
+# ============================================================================
+# MODELO 9: EmailOutbox (Fila de Emails)
+# ============================================================================
+
+class EmailOutbox(Base):
+    """
+    Fila durável de emails de saída.
+    Os endpoints apenas inserem aqui (na mesma transação da operação);
+    o worker de email_outbox.py envia em lotes com retry.
+    """
+    __tablename__ = "email_outbox"
+
+    id = Column(UUID(as_uuid=False), primary_key=True, default=gen_uuid)
+    
+    # Mensagem
+    destinatario = Column(String(255), nullable=False)
+    assunto = Column(String(255), nullable=False)
+    corpo = Column(String(20000), nullable=False)  # HTML
+    
+    # Entrega
+    status = Column(String(20), default="pendente", nullable=False)  # pendente | enviando | enviado | falhou
+    tentativas = Column(Integer, default=0, nullable=False)
+    proxima_tentativa = Column(DateTime, default=datetime.utcnow, nullable=False)
+    ultimo_erro = Column(String(1000), nullable=True)
+    
+    # Timestamps
+    criado_em = Column(DateTime, default=datetime.utcnow)
+    enviado_em = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_email_outbox_status_proxima", "status", "proxima_tentativa"),
+    )
+
+    def __repr__(self):
+        return f"<EmailOutbox(destinatario='{self.destinatario}', status='{self.status}')>"
+
+
+# ============================================================================
+# MODELO 10: Exportacao (Exportações em Segundo Plano)
+# ============================================================================
+
+class Exportacao(Base):
+    """
+    Exportação completa do CRM gerada em segundo plano.
+    O arquivo comprimido fica em EXPORT_DIR; esta linha guarda o estado
+    e o caminho para download.
+    """
+    __tablename__ = "exportacoes"
+
+    id = Column(UUID(as_uuid=False), primary_key=True, default=gen_uuid)
+    advogado_id = Column(UUID(as_uuid=False), ForeignKey("users.id"), nullable=False)
+    
+    # Parâmetros
+    formato = Column(String(10), nullable=False)  # csv | ndjson | xlsx
+    filtros = Column(JSON, nullable=True)  # {status, area, criado_de, criado_ate}
+    
+    # Resultado
+    status = Column(String(20), default="processando", nullable=False)  # processando | pronto | falhou
+    arquivo = Column(String(500), nullable=True)
+    linhas = Column(Integer, default=0, nullable=False)
+    erro = Column(String(1000), nullable=True)
+    
+    # Timestamps
+    criada_em = Column(DateTime, default=datetime.utcnow)
+    progresso_em = Column(DateTime, nullable=True)  # heartbeat do job (ver export.expire_stale_exports)
+    concluida_em = Column(DateTime, nullable=True)
+    expira_em = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_exportacoes_advogado_criada", "advogado_id", "criada_em"),
+    )
+
+    def __repr__(self):
+        return f"<Exportacao(formato='{self.formato}', status='{self.status}')>"
+
+
+# ============================================================================
+# MODELO 11: AnaliseJob (Fila de Análise IA)
+# ============================================================================
+
+class AnaliseJob(Base):
+    """
+    Lead aguardando análise automática.
+    Inserido na mesma transação da criação do lead; o worker de analysis.py
+    consome em lotes e grava o resultado em Lead.analise_ia.
+    """
+    __tablename__ = "analise_jobs"
+
+    id = Column(UUID(as_uuid=False), primary_key=True, default=gen_uuid)
+    lead_id = Column(UUID(as_uuid=False), ForeignKey("leads.id", ondelete="CASCADE"), nullable=False)
+    
+    # Processamento
+    status = Column(String(20), default="pendente", nullable=False)  # pendente | analisando | concluido | falhou
+    tentativas = Column(Integer, default=0, nullable=False)
+    proxima_tentativa = Column(DateTime, default=datetime.utcnow, nullable=False)
+    ultimo_erro = Column(String(1000), nullable=True)
+    cache_hit = Column(Boolean, default=False, nullable=False)
+    
+    # Timestamps
+    criado_em = Column(DateTime, default=datetime.utcnow)
+    concluido_em = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_analise_jobs_status_proxima", "status", "proxima_tentativa"),
+        Index("ix_analise_jobs_lead_id", "lead_id"),
+    )
+
+    def __repr__(self):
+        return f"<AnaliseJob(lead_id='{self.lead_id}', status='{self.status}')>"
+
+
+# ============================================================================
+# MODELO 12: AnaliseCache (Resultados de Análise por Descrição)
+# ============================================================================
+
+class AnaliseCache(Base):
+    """
+    Resultado de análise indexado pelo hash da descrição normalizada.
+    Descrições repetidas (reenvio do formulário, campanhas) reaproveitam o
+    resultado em vez de chamar o analisador de novo.
+    """
+    __tablename__ = "analise_cache"
+
+    hash = Column(String(64), primary_key=True)  # sha256(analisador + descrição normalizada)
+    analisador = Column(String(100), nullable=False)
+    resultado = Column(JSON, nullable=False)
+    hits = Column(Integer, default=0, nullable=False)
+    criado_em = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<AnaliseCache(analisador='{self.analisador}', hits={self.hits})>"
+
+
+# ============================================================================
+# MODELO 13: LeadAssinatura (Índice de Deduplicação)
+# ============================================================================
+
+class LeadAssinatura(Base):
+    """
+    Chaves de deduplicação de um lead: HMAC do CPF/CNPJ, email e telefone
+    normalizados e as bandas LSH do MinHash de nome + descrição.
+    Um novo lead encontra os candidatos a duplicado com uma consulta
+    pela PK (advogado_id, chave).
+    """
+    __tablename__ = "lead_assinaturas"
+
+    advogado_id = Column(UUID(as_uuid=False), ForeignKey("users.id"), primary_key=True)
+    chave = Column(String(64), primary_key=True)  # cpf:<hmac> | email:<hmac> | tel:<hmac> | lsh<banda>:<hash>
+    lead_id = Column(UUID(as_uuid=False), ForeignKey("leads.id", ondelete="CASCADE"), primary_key=True)
+
+    __table_args__ = (
+        Index("ix_lead_assinaturas_lead_id", "lead_id"),
+    )
+
+    def __repr__(self):
+        return f"<LeadAssinatura(chave='{self.chave}', lead_id='{self.lead_id}')>"
+
+
+# ============================================================================
+# MODELO 14: RateLimitBucket (Rate Limiting Compartilhado)
+# ============================================================================
+
+class RateLimitBucket(Base):
+    """
+    Token bucket do rate limiting quando RATE_LIMIT_BACKEND=sql (vários
+    workers/instâncias). Cada requisição faz um único upsert atômico na
+    linha da chave; `negado` indica se a última tentativa foi recusada.
+    """
+    __tablename__ = "rate_limit_buckets"
+
+    chave = Column(String(128), primary_key=True)  # <rota>:<dimensão>:<valor>
+    tokens = Column(Float, nullable=False)
+    atualizado_em = Column(Float, nullable=False)  # epoch em segundos
+    negado = Column(Boolean, default=False, nullable=False)
+
+    __table_args__ = (
+        Index("ix_rate_limit_buckets_atualizado_em", "atualizado_em"),  # limpeza de chaves ociosas
+    )
+
+    def __repr__(self):
+        return f"<RateLimitBucket(chave='{self.chave}', tokens={self.tokens:.2f})>"
+
+
+# ============================================================================
+# MODELO 15: LeadGeoRollup (Contagem de Leads por Região)
+# ============================================================================
+
+class LeadGeoRollup(Base):
+    """
+    Leads por (advogado, UF, cidade, área, status, dia de criação), mantido
+    incrementalmente na mesma transação das escritas de lead. O mapa do
+    dashboard lê só estas linhas, sem abrir o JSON de endereço dos leads.
+    """
+    __tablename__ = "lead_geo_rollup"
+
+    advogado_id = Column(UUID(as_uuid=False), ForeignKey("users.id"), primary_key=True)
+    uf = Column(String(2), primary_key=True)  # "" quando o endereço não tem estado reconhecido
+    cidade = Column(String(120), primary_key=True)
+    area_direito = Column(String(100), primary_key=True)
+    status = Column(String(50), primary_key=True)
+    dia = Column(Date, primary_key=True)
+    total = Column(Integer, default=0, nullable=False)
+
+    def __repr__(self):
+        return f"<LeadGeoRollup(uf='{self.uf}', cidade='{self.cidade}', total={self.total})>"
+
+
+# ============================================================================
+# MODELO 16: LeadArquivo (Casos Encerrados, Armazenamento Frio)
+# ============================================================================
+
+class LeadArquivo(Base):
+    """
+    Caso encerrado (fechado/rejeitado) movido para fora das tabelas quentes
+    pelo job de archive.py: lead, conversas com mensagens, anotações e
+    tarefas concluídas em um único JSON comprimido (zlib). As colunas soltas
+    servem ao dashboard e ao mapa; o resto só é aberto na leitura do caso.
+    No Postgres a tabela é particionada por mês de criado_em (RANGE).
+    """
+    __tablename__ = "leads_arquivo"
+
+    id = Column(UUID(as_uuid=False), primary_key=True)  # mesmo id do lead original
+    criado_em = Column(DateTime, primary_key=True)  # chave de partição
+    advogado_id = Column(UUID(as_uuid=False), nullable=False)
+    
+    # Dimensões do dashboard/mapa (sem descomprimir)
+    status = Column(String(50), nullable=True)
+    area_direito = Column(String(100), nullable=True)
+    urgencia = Column(String(50), nullable=True)
+    uf = Column(String(2), nullable=True)
+    cidade = Column(String(120), nullable=True)
+    
+    # Caso completo
+    dados = Column(LargeBinary, nullable=False)  # zlib(JSON)
+    bytes_original = Column(Integer, nullable=False)
+    arquivado_em = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_leads_arquivo_advogado_id", "advogado_id", "id"),
+        {"postgresql_partition_by": "RANGE (criado_em)"},
+    )
+
+    def __repr__(self):
+        return f"<LeadArquivo(id='{self.id}', status='{self.status}')>"
+
+
+# ============================================================================
+# MODELO 17: Webhook (Destinos de Notificação do Advogado)
+# ============================================================================
+
+class Webhook(Base):
+    """
+    URL do advogado que recebe eventos do CRM (lead.criado, lead.atualizado,
+    lead.mesclado, mensagem.criada). O segredo assina cada entrega com HMAC-SHA256 e fica
+    criptografado como o CPF/CNPJ; só é devolvido na criação.
+    """
+    __tablename__ = "webhooks"
+
+    id = Column(UUID(as_uuid=False), primary_key=True, default=gen_uuid)
+    advogado_id = Column(UUID(as_uuid=False), ForeignKey("users.id"), nullable=False)
+    
+    # Destino
+    url = Column(String(500), nullable=False)
+    eventos = Column(string_array(), nullable=False)
+    segredo_encrypted = Column(LargeBinary, nullable=False)
+    max_concorrencia = Column(Integer, default=4, nullable=False)  # entregas simultâneas para esta URL
+    
+    # Timestamps
+    criado_em = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_webhooks_advogado_id", "advogado_id"),
+    )
+
+    def __repr__(self):
+        return f"<Webhook(url='{self.url}')>"
+
+
+# ============================================================================
+# MODELO 18: WebhookEvento (Outbox de Webhooks)
+# ============================================================================
+
+class WebhookEvento(Base):
+    """
+    Evento a entregar para um webhook, inserido na mesma transação da
+    operação que o gerou (outbox). O dispatcher de webhooks.py agrupa os
+    pendentes de cada URL em lotes; status "falhou" é a fila de mortos,
+    que pode ser reenviada pela API.
+    Sem FK para webhooks: o registro em cache pode enfileirar para um webhook
+    recém-removido sem derrubar a requisição; o dispatcher descarta esses eventos.
+    """
+    __tablename__ = "webhook_eventos"
+
+    id = Column(UUID(as_uuid=False), primary_key=True, default=gen_uuid)
+    webhook_id = Column(UUID(as_uuid=False), nullable=False)
+    
+    # Evento
+    evento = Column(String(50), nullable=False)
+    payload = Column(Text, nullable=False)  # envelope JSON já serializado
+    
+    # Entrega
+    status = Column(String(20), default="pendente", nullable=False)  # pendente | enviando | enviado | falhou
+    tentativas = Column(Integer, default=0, nullable=False)
+    proxima_tentativa = Column(DateTime, default=datetime.utcnow, nullable=False)
+    ultimo_erro = Column(String(1000), nullable=True)
+    
+    # Timestamps
+    criado_em = Column(DateTime, default=datetime.utcnow)
+    enviado_em = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_webhook_eventos_status_proxima", "status", "proxima_tentativa"),
+        Index("ix_webhook_eventos_webhook_status", "webhook_id", "status"),
+    )
+
+    def __repr__(self):
+        return f"<WebhookEvento(evento='{self.evento}', status='{self.status}')>"
+
+
 # ============================================================================
 # RESUMO DOS MODELOS
 # ============================================================================
@@ -349,14 +849,18 @@ leads (Clientes/Casos)
 ├── analise_ia (JSON)
 ├── endereco (JSON)
 ├── canal_preferido, horario_preferido
+├── duplicado_de (FK -> leads), submissoes
+├── uf, cidade (extraídos de endereco, índice com advogado_id)
+├── busca (tsvector gerado, GIN - migração "busca")
 └── timestamps
 
 conversas (Chat)
 ├── id (UUID)
 ├── lead_id (FK -> leads)
 ├── advogado_id (FK -> users)
-├── mensagens (JSON array)
+├── mensagens (JSON array - legado)
 ├── ativa, ultima_mensagem
+├── ultima_mensagem_texto, ultima_mensagem_tipo, nao_lidas (resumo da caixa de entrada)
 └── timestamps
 
 anotacoes (Notas)
@@ -365,6 +869,7 @@ anotacoes (Notas)
 ├── advogado_id (FK -> users)
 ├── titulo, conteudo
 ├── prioridade
+├── busca (tsvector gerado, GIN - migração "busca")
 └── timestamps
 
 tarefas (Tasks)
@@ -373,6 +878,77 @@ tarefas (Tasks)
 ├── lead_id (FK -> leads, opcional)
 ├── titulo, descricao
 ├── concluida, prioridade
-├── data_vencimento
+├── data_vencimento, lembrete_enviado_em (índice parcial com concluida)
 └── timestamps
+
+lead_contadores (Dashboard)
+├── advogado_id (FK -> users)
+├── dimensao, valor (PK composta com advogado_id)
+├── total
+└── atualizado_em
+
+mensagens (Mensagens do Chat)
+├── id (UUID)
+├── conversa_id (FK -> conversas)
+├── tipo, texto, lido
+├── busca (tsvector gerado, GIN - migração "busca")
+└── timestamp (índice com conversa_id)
+
+email_outbox (Fila de Emails)
+├── id (UUID)
+├── destinatario, assunto, corpo
+├── status, tentativas, proxima_tentativa, ultimo_erro
+└── criado_em, enviado_em
+
+exportacoes (Exportações em Segundo Plano)
+├── id (UUID)
+├── advogado_id (FK -> users)
+├── formato, filtros (JSON)
+├── status, arquivo, linhas, erro
+└── criada_em, concluida_em, expira_em
+
+analise_jobs (Fila de Análise IA)
+├── id (UUID)
+├── lead_id (FK -> leads)
+├── status, tentativas, proxima_tentativa, ultimo_erro, cache_hit
+└── criado_em, concluido_em
+
+analise_cache (Resultados por Descrição)
+├── hash (PK - sha256 da descrição normalizada)
+├── analisador, resultado (JSON)
+├── hits
+└── criado_em
+
+lead_assinaturas (Índice de Deduplicação)
+├── advogado_id, chave, lead_id (PK composta)
+└── chaves: HMAC de cpf_cnpj/email/telefone e bandas LSH
+
+rate_limit_buckets (Rate Limiting, backend sql)
+├── chave (PK: rota:dimensão:valor)
+├── tokens, negado
+└── atualizado_em (epoch, índice para limpeza)
+
+lead_geo_rollup (Mapa de Leads)
+├── advogado_id, uf, cidade, area_direito, status, dia (PK composta)
+└── total
+
+leads_arquivo (Casos Encerrados - particionada por mês de criado_em)
+├── id, criado_em (PK composta)
+├── advogado_id, status, area_direito, urgencia, uf, cidade
+├── dados (BYTEA - zlib do JSON do caso completo)
+└── bytes_original, arquivado_em
+
+webhooks (Destinos de Notificação)
+├── id (UUID)
+├── advogado_id (FK -> users)
+├── url, eventos (ARRAY), max_concorrencia
+├── segredo_encrypted (BYTEA - criptografado)
+└── criado_em
+
+webhook_eventos (Outbox de Webhooks)
+├── id (UUID)
+├── webhook_id (-> webhooks, sem FK)
+├── evento, payload (envelope JSON)
+├── status, tentativas, proxima_tentativa, ultimo_erro ("falhou" = fila de mortos)
+└── criado_em, enviado_em
 """
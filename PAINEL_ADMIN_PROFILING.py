@@ -0,0 +1,446 @@
+# backend/app/profiling.py
+# Instrumentação por requisição: queries SQL, tempo de banco, helpers caros
+# (bcrypt, JWT, Fernet, serialização), métricas Prometheus e Server-Timing
+#
+# Instalação (app/main.py):
+#   from .profiling import install_profiling
+#   install_profiling(app)
+
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from fastapi.responses import JSONResponse
+from sqlalchemy import event
+from sqlalchemy.orm import Mapper
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# CONFIGURAÇÕES
+# ============================================================================
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "true").lower() == "true"
+PROFILING_SERVER_TIMING = os.getenv("PROFILING_SERVER_TIMING", "true").lower() == "true"
+
+# Detector de N+1: orçamento de queries por requisição e repetição do mesmo SQL
+PROFILING_QUERY_BUDGET = int(os.getenv("PROFILING_QUERY_BUDGET", 10))
+PROFILING_QUERY_BUDGETS = os.getenv("PROFILING_QUERY_BUDGETS", "")  # "GET /auth/leads=3;GET /auth/dashboard/stats=2"
+PROFILING_REPEAT_THRESHOLD = int(os.getenv("PROFILING_REPEAT_THRESHOLD", 5))
+
+# Profiler por amostragem (opt-in): dump das pilhas de requisições lentas
+PROFILING_SAMPLER = os.getenv("PROFILING_SAMPLER", "false").lower() == "true"
+PROFILING_SLOW_MS = float(os.getenv("PROFILING_SLOW_MS", 500))
+PROFILING_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILING_SAMPLE_INTERVAL_MS", 5))
+PROFILING_DUMP_DIR = os.getenv("PROFILING_DUMP_DIR", "/tmp/painel-profiles")
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SLOWEST_SQL_CHARS = 300
+
+
+def _parse_budgets(raw: str) -> Dict[str, int]:
+    budgets = {}
+    for item in raw.split(";"):
+        route, _, budget = item.rpartition("=")
+        if route.strip() and budget.strip().isdigit():
+            budgets[route.strip()] = int(budget)
+    return budgets
+
+QUERY_BUDGETS = _parse_budgets(PROFILING_QUERY_BUDGETS)
+
+
+# ============================================================================
+# PERFIL DA REQUISIÇÃO CORRENTE
+# ============================================================================
+
+@dataclass
+class RequestProfile:
+    """Acumulado de uma requisição (vive em um ContextVar durante a chamada)"""
+    started: float = field(default_factory=time.perf_counter)
+    queries: int = 0
+    db_seconds: float = 0.0
+    slowest_seconds: float = 0.0
+    slowest_sql: str = ""
+    orm_objects: int = 0
+    spans: Dict[str, float] = field(default_factory=dict)  # helper -> segundos
+    statements: Dict[str, int] = field(default_factory=dict)  # SQL -> execuções
+
+    def add_span(self, name: str, seconds: float):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def server_timing(self, total_seconds: float) -> str:
+        parts = [f'db;dur={self.db_seconds * 1000:.1f};desc="{self.queries} queries"']
+        parts += [f"{name};dur={seconds * 1000:.1f}" for name, seconds in sorted(self.spans.items())]
+        parts.append(f"total;dur={total_seconds * 1000:.1f}")
+        return ", ".join(parts)
+
+
+_current: contextvars.ContextVar = contextvars.ContextVar("request_profile", default=None)
+
+def current_profile() -> Optional[RequestProfile]:
+    return _current.get()
+
+
+class span:
+    """
+    Mede um trecho e soma no perfil da requisição corrente:
+
+        with span("jwt"):
+            payload = jwt.decode(...)
+
+    Fora de uma requisição instrumentada o custo é um ContextVar.get().
+    """
+
+    __slots__ = ("name", "profile", "started")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.profile = _current.get()
+        if self.profile is not None:
+            self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.profile is not None:
+            self.profile.add_span(self.name, time.perf_counter() - self.started)
+        return False
+
+
+def timed(name: str):
+    """Decorator equivalente a `span` para funções síncronas e corrotinas"""
+    def decorator(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class ProfiledJSONResponse(JSONResponse):
+    """JSONResponse que contabiliza a renderização do corpo como 'serialization'"""
+
+    def render(self, content) -> bytes:
+        with span("serialization"):
+            return super().render(content)
+
+
+# ============================================================================
+# HOOKS DO SQLALCHEMY
+# ============================================================================
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("_profiling_started", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current.get()
+    started = conn.info.get("_profiling_started")
+    if profile is None or not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    profile.queries += 1
+    profile.db_seconds += elapsed
+    profile.statements[statement] = profile.statements.get(statement, 0) + 1
+    if elapsed > profile.slowest_seconds:
+        profile.slowest_seconds = elapsed
+        profile.slowest_sql = statement[:SLOWEST_SQL_CHARS]
+
+def _handle_error(exception_context):
+    started = exception_context.connection.info.get("_profiling_started") if exception_context.connection else None
+    if started:
+        started.pop()
+
+def _on_load(target, context):
+    profile = _current.get()
+    if profile is not None:
+        profile.orm_objects += 1
+
+def instrument_engine(engine):
+    """Liga os hooks de SQL em um Engine (para AsyncEngine, passe .sync_engine)"""
+    for name, fn in (
+        ("before_cursor_execute", _before_cursor_execute),
+        ("after_cursor_execute", _after_cursor_execute),
+        ("handle_error", _handle_error),
+    ):
+        if not event.contains(engine, name, fn):
+            event.listen(engine, name, fn)
+    if not event.contains(Mapper, "load", _on_load):
+        event.listen(Mapper, "load", _on_load)
+
+
+# ============================================================================
+# REGISTRO DE MÉTRICAS (formato Prometheus)
+# ============================================================================
+
+class RouteStats:
+    __slots__ = ("requests", "errors", "duration_sum", "buckets", "queries", "db_seconds",
+                 "orm_objects", "spans", "slowest_seconds", "slowest_sql", "budget_exceeded")
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.duration_sum = 0.0
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.orm_objects = 0
+        self.spans: Dict[str, float] = {}
+        self.slowest_seconds = 0.0
+        self.slowest_sql = ""
+        self.budget_exceeded = 0
+
+
+class ProfilingRegistry:
+    """Agregado por rota ("GET /auth/leads/{lead_id}") desde o início do processo"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes: Dict[str, RouteStats] = {}
+
+    def record(self, route: str, status_code: int, duration: float, profile: RequestProfile,
+               budget_exceeded: bool):
+        with self._lock:
+            stats = self._routes.get(route)
+            if stats is None:
+                stats = self._routes[route] = RouteStats()
+            stats.requests += 1
+            if status_code >= 500:
+                stats.errors += 1
+            stats.duration_sum += duration
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    stats.buckets[i] += 1
+            stats.queries += profile.queries
+            stats.db_seconds += profile.db_seconds
+            stats.orm_objects += profile.orm_objects
+            for name, seconds in profile.spans.items():
+                stats.spans[name] = stats.spans.get(name, 0.0) + seconds
+            if profile.slowest_seconds > stats.slowest_seconds:
+                stats.slowest_seconds = profile.slowest_seconds
+                stats.slowest_sql = profile.slowest_sql
+            if budget_exceeded:
+                stats.budget_exceeded += 1
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                route: {
+                    "requests": s.requests,
+                    "errors": s.errors,
+                    "mean_ms": round(s.duration_sum / s.requests * 1000, 2) if s.requests else 0,
+                    "queries_per_request": round(s.queries / s.requests, 2) if s.requests else 0,
+                    "db_ms_per_request": round(s.db_seconds / s.requests * 1000, 2) if s.requests else 0,
+                    "spans_ms_per_request": {
+                        name: round(seconds / s.requests * 1000, 3) for name, seconds in s.spans.items()
+                    },
+                    "slowest_statement_ms": round(s.slowest_seconds * 1000, 2),
+                    "slowest_statement": s.slowest_sql,
+                    "query_budget_exceeded": s.budget_exceeded,
+                }
+                for route, s in sorted(self._routes.items())
+            }
+
+    def render_prometheus(self) -> str:
+        lines = [
+            "# TYPE painel_requests_total counter",
+            "# TYPE painel_request_errors_total counter",
+            "# TYPE painel_request_duration_seconds histogram",
+            "# TYPE painel_db_queries_total counter",
+            "# TYPE painel_db_seconds_total counter",
+            "# TYPE painel_orm_objects_total counter",
+            "# TYPE painel_span_seconds_total counter",
+            "# TYPE painel_db_slowest_statement_seconds gauge",
+            "# TYPE painel_query_budget_exceeded_total counter",
+        ]
+        with self._lock:
+            for route, s in sorted(self._routes.items()):
+                method, _, path = route.partition(" ")
+                label = f'method="{method}",route="{_escape(path)}"'
+                lines.append(f"painel_requests_total{{{label}}} {s.requests}")
+                lines.append(f"painel_request_errors_total{{{label}}} {s.errors}")
+                for bound, count in zip(DURATION_BUCKETS, s.buckets):
+                    lines.append(f'painel_request_duration_seconds_bucket{{{label},le="{bound}"}} {count}')
+                lines.append(f'painel_request_duration_seconds_bucket{{{label},le="+Inf"}} {s.requests}')
+                lines.append(f"painel_request_duration_seconds_sum{{{label}}} {s.duration_sum:.6f}")
+                lines.append(f"painel_request_duration_seconds_count{{{label}}} {s.requests}")
+                lines.append(f"painel_db_queries_total{{{label}}} {s.queries}")
+                lines.append(f"painel_db_seconds_total{{{label}}} {s.db_seconds:.6f}")
+                lines.append(f"painel_orm_objects_total{{{label}}} {s.orm_objects}")
+                for name, seconds in sorted(s.spans.items()):
+                    lines.append(f'painel_span_seconds_total{{{label},span="{name}"}} {seconds:.6f}')
+                lines.append(f"painel_db_slowest_statement_seconds{{{label}}} {s.slowest_seconds:.6f}")
+                lines.append(f"painel_query_budget_exceeded_total{{{label}}} {s.budget_exceeded}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+profiling_registry = ProfilingRegistry()
+
+
+# ============================================================================
+# PROFILER POR AMOSTRAGEM (requisições lentas)
+# ============================================================================
+
+class SamplingProfiler:
+    """
+    Thread que amostra a pilha da thread do event loop a cada intervalo e
+    guarda as amostras recentes. Quando uma requisição passa de
+    PROFILING_SLOW_MS, as amostras do seu intervalo são gravadas em formato
+    "folded" (flamegraph.pl / speedscope). Com requisições concorrentes no
+    mesmo loop, o dump inclui pilhas das outras requisições do período.
+    """
+
+    def __init__(self, interval_ms: float = PROFILING_SAMPLE_INTERVAL_MS, max_samples: int = 20000):
+        self.interval = interval_ms / 1000
+        self._samples = deque(maxlen=max_samples)  # (instante, pilha)
+        self._target: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, target_thread_id: int):
+        if self._thread is not None:
+            return
+        self._target = target_thread_id
+        self._thread = threading.Thread(target=self._run, name="painel-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            self._samples.append((time.perf_counter(), ";".join(reversed(stack))))
+
+    def dump(self, started: float, finished: float, name: str) -> Optional[str]:
+        folded: Dict[str, int] = {}
+        for instante, stack in list(self._samples):
+            if started <= instante <= finished:
+                folded[stack] = folded.get(stack, 0) + 1
+        if not folded:
+            return None
+        os.makedirs(PROFILING_DUMP_DIR, exist_ok=True)
+        path = os.path.join(PROFILING_DUMP_DIR, f"{int(time.time() * 1000)}_{re.sub(r'[^A-Za-z0-9]+', '_', name)}.folded")
+        with open(path, "w") as f:
+            for stack, count in sorted(folded.items(), key=lambda item: -item[1]):
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+sampling_profiler = SamplingProfiler() if PROFILING_SAMPLER else None
+
+
+# ============================================================================
+# MIDDLEWARE ASGI
+# ============================================================================
+
+class ProfilingMiddleware:
+    """
+    Middleware ASGI puro (sem BaseHTTPMiddleware, para não bufferizar os
+    streams SSE). Abre um RequestProfile por requisição HTTP, adiciona o
+    header Server-Timing e registra o resultado por rota.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        if sampling_profiler is not None:
+            sampling_profiler.start(threading.get_ident())
+
+        profile = RequestProfile()
+        token = _current.set(profile)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if PROFILING_SERVER_TIMING:
+                    total = time.perf_counter() - profile.started
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", profile.server_timing(total).encode()))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            finished = time.perf_counter()
+            route = _route_name(scope)
+            exceeded = _check_query_budget(route, profile)
+            profiling_registry.record(route, status_code, finished - profile.started, profile, exceeded)
+            if sampling_profiler is not None and (finished - profile.started) * 1000 >= PROFILING_SLOW_MS:
+                path = await asyncio.to_thread(sampling_profiler.dump, profile.started, finished, route)
+                if path:
+                    logger.warning("Requisição lenta %s (%.0f ms): perfil em %s",
+                                   route, (finished - profile.started) * 1000, path)
+
+
+def _route_name(scope) -> str:
+    """Rota com os parâmetros como template, para não explodir a cardinalidade"""
+    route = scope.get("route")
+    path = getattr(route, "path", None) or "<sem rota>"
+    return f"{scope.get('method', '')} {path}"
+
+def _check_query_budget(route: str, profile: RequestProfile) -> bool:
+    """Avisa quando a rota passa do orçamento ou repete o mesmo SQL (padrão N+1)"""
+    budget = QUERY_BUDGETS.get(route, PROFILING_QUERY_BUDGET)
+    exceeded = profile.queries > budget
+    if exceeded:
+        logger.warning("Orçamento de queries excedido em %s: %s queries (orçamento %s)",
+                       route, profile.queries, budget)
+    for statement, count in profile.statements.items():
+        if count >= PROFILING_REPEAT_THRESHOLD:
+            exceeded = True
+            logger.warning("Possível N+1 em %s: mesmo SQL executado %s vezes: %s",
+                           route, count, statement[:SLOWEST_SQL_CHARS])
+    return exceeded
+
+
+def install_profiling(app):
+    """Registra o middleware e liga os hooks nos engines do banco"""
+    if not PROFILING_ENABLED:
+        return
+    from .database import async_engine, engine
+
+    instrument_engine(async_engine.sync_engine)
+    instrument_engine(engine)
+    app.add_middleware(ProfilingMiddleware)
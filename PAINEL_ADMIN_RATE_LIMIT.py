@@ -0,0 +1,293 @@
+# backend/app/rate_limit.py
+# Rate limiting por token bucket (IP, email, usuário) para login, reset de
+# senha, cadastro e entrada de leads, sem Redis: buckets em memória ou em uma
+# tabela compartilhada (RATE_LIMIT_BACKEND=sql) para vários workers
+
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import Request
+from sqlalchemy import case, delete, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import SQLAlchemyError
+
+from .database import AsyncSessionLocal
+from .models import RateLimitBucket
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# CONFIGURAÇÕES
+# ============================================================================
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")  # memory | sql
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", 100000))  # backend memory (LRU)
+RATE_LIMIT_TRUST_PROXY = os.getenv("RATE_LIMIT_TRUST_PROXY", "false").lower() == "true"  # X-Forwarded-For
+RATE_LIMIT_SQL_IDLE_SECONDS = int(os.getenv("RATE_LIMIT_SQL_IDLE_SECONDS", 86400))  # linhas ociosas removidas
+RATE_LIMIT_SQL_PURGE_SECONDS = int(os.getenv("RATE_LIMIT_SQL_PURGE_SECONDS", 300))
+
+
+@dataclass(frozen=True)
+class RateRule:
+    """Bucket com `capacidade` tokens, reabastecido por completo a cada `periodo` segundos"""
+    capacidade: int
+    periodo: float
+
+    @property
+    def taxa(self) -> float:
+        return self.capacidade / self.periodo
+
+    @classmethod
+    def parse(cls, env: str, default: str) -> "RateRule":
+        """Lê "capacidade/periodo_em_segundos" (ex.: "10/900") de uma variável de ambiente"""
+        capacidade, _, periodo = os.getenv(env, default).partition("/")
+        return cls(int(capacidade), float(periodo))
+
+
+# rota -> [(dimensão, regra)]; todas as dimensões precisam ter token
+RATE_LIMIT_RULES: Dict[str, List[Tuple[str, RateRule]]] = {
+    "login": [
+        ("ip", RateRule.parse("RATE_LIMIT_LOGIN_IP", "30/300")),
+        ("email", RateRule.parse("RATE_LIMIT_LOGIN_EMAIL", "10/900")),
+    ],
+    "reset-password": [
+        ("ip", RateRule.parse("RATE_LIMIT_RESET_IP", "10/3600")),
+        ("email", RateRule.parse("RATE_LIMIT_RESET_EMAIL", "3/3600")),
+    ],
+    "register": [
+        ("ip", RateRule.parse("RATE_LIMIT_REGISTER_IP", "5/3600")),
+    ],
+    "leads": [
+        ("usuario", RateRule.parse("RATE_LIMIT_LEADS_USER", "120/60")),
+        ("ip", RateRule.parse("RATE_LIMIT_LEADS_IP", "300/60")),
+    ],
+    "leads-intake": [
+        ("ip", RateRule.parse("RATE_LIMIT_INTAKE_IP", "10/600")),
+        ("email", RateRule.parse("RATE_LIMIT_INTAKE_EMAIL", "5/3600")),
+    ],
+}
+
+
+class RateLimited(Exception):
+    """Bucket vazio: a requisição deve ser rejeitada (429) sem fazer nenhum trabalho"""
+
+    def __init__(self, rota: str, dimensao: str, retry_after: int):
+        super().__init__(f"{rota}:{dimensao}")
+        self.rota = rota
+        self.dimensao = dimensao
+        self.retry_after = retry_after
+
+
+def client_ip(request: Request) -> str:
+    """IP do cliente; com RATE_LIMIT_TRUST_PROXY usa o primeiro X-Forwarded-For"""
+    if RATE_LIMIT_TRUST_PROXY:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "desconhecido"
+
+def bucket_key(rota: str, dimensao: str, valor: str) -> str:
+    """Emails entram como hash: nenhum dado pessoal na tabela/memória do limitador"""
+    if dimensao == "email":
+        valor = hashlib.sha1(valor.strip().lower().encode()).hexdigest()[:20]
+    return f"{rota}:{dimensao}:{valor}"[:128]
+
+def _retry_after(tokens: float, custo: float, rule: RateRule) -> int:
+    return max(1, math.ceil((custo - tokens) / rule.taxa))
+
+
+# ============================================================================
+# BACKENDS
+# ============================================================================
+
+class MemoryBucketStore:
+    """Buckets em um LRU limitado (um por processo); chave despejada volta cheia"""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # chave -> [tokens, atualizado_em]
+        self._lock = threading.Lock()
+        self._evictions = 0
+
+    def take(self, chave: str, rule: RateRule, custo: float = 1.0) -> Optional[int]:
+        """Consome `custo` tokens; retorna None se permitido ou o Retry-After em segundos"""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(chave)
+            if bucket is None:
+                bucket = self._buckets[chave] = [float(rule.capacidade), now]
+                while len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+                    self._evictions += 1
+            else:
+                self._buckets.move_to_end(chave)
+                bucket[0] = min(rule.capacidade, bucket[0] + (now - bucket[1]) * rule.taxa)
+                bucket[1] = now
+            if bucket[0] >= custo:
+                bucket[0] -= custo
+                return None
+            return _retry_after(bucket[0], custo, rule)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {"keys": len(self._buckets), "evictions": self._evictions}
+
+
+class SqlBucketStore:
+    """
+    Buckets na tabela rate_limit_buckets, compartilhados entre workers.
+    Reabastecimento, consumo e decisão acontecem em um único
+    INSERT ... ON CONFLICT DO UPDATE ... RETURNING, atômico por linha.
+    """
+
+    def __init__(self, session_factory=AsyncSessionLocal):
+        self.session_factory = session_factory
+        self._next_purge = 0.0
+
+    def _statement(self, dialect_name: str, chave: str, rule: RateRule, custo: float, now: float):
+        dialect = sqlite if dialect_name == "sqlite" else postgresql
+        least = func.min if dialect_name == "sqlite" else func.least
+        stmt = dialect.insert(RateLimitBucket).values(
+            chave=chave, tokens=rule.capacidade - custo, atualizado_em=now, negado=False
+        )
+        refilled = least(
+            rule.capacidade,
+            RateLimitBucket.tokens + (now - RateLimitBucket.atualizado_em) * rule.taxa
+        )
+        return stmt.on_conflict_do_update(
+            index_elements=[RateLimitBucket.chave],
+            set_={
+                "tokens": case((refilled >= custo, refilled - custo), else_=refilled),
+                "atualizado_em": now,
+                "negado": refilled < custo,
+            },
+        ).returning(RateLimitBucket.tokens, RateLimitBucket.negado)
+
+    async def take_many(self, itens: List[Tuple[str, RateRule]], custo: float = 1.0) -> Optional[Tuple[int, int]]:
+        """
+        Consome um token de cada chave na mesma transação; retorna None se
+        todas permitiram ou (índice da primeira negada, Retry-After).
+        """
+        now = time.time()
+        negado = None
+        async with self.session_factory() as db:
+            dialect_name = db.get_bind().dialect.name
+            for indice, (chave, rule) in enumerate(itens):
+                result = await db.execute(self._statement(dialect_name, chave, rule, custo, now))
+                tokens, recusado = result.one()
+                if recusado:
+                    negado = (indice, _retry_after(tokens, custo, rule))
+                    break
+            if now >= self._next_purge:
+                self._next_purge = now + RATE_LIMIT_SQL_PURGE_SECONDS
+                await db.execute(
+                    delete(RateLimitBucket).where(RateLimitBucket.atualizado_em < now - RATE_LIMIT_SQL_IDLE_SECONDS)
+                )
+            await db.commit()
+        return negado
+
+
+# ============================================================================
+# LIMITADOR
+# ============================================================================
+
+class _RouteStats:
+    __slots__ = ("allowed", "rejected", "by_dimension")
+
+    def __init__(self):
+        self.allowed = 0
+        self.rejected = 0
+        self.by_dimension = {}
+
+
+class RateLimiter:
+    """
+    Verifica todos os buckets de uma rota antes de qualquer trabalho caro
+    (bcrypt, consultas, emails). Se o backend sql falhar, a decisão cai
+    para os buckets em memória do processo em vez de liberar tudo.
+    """
+
+    def __init__(self, rules: Dict[str, List[Tuple[str, RateRule]]] = RATE_LIMIT_RULES,
+                 backend: str = RATE_LIMIT_BACKEND):
+        self.rules = rules
+        self.backend = backend
+        self.memory = MemoryBucketStore()
+        self.sql = SqlBucketStore() if backend == "sql" else None
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._backend_errors = 0
+        self._check_seconds = 0.0
+        self._checks = 0
+
+    async def check(self, rota: str, **valores: Optional[str]):
+        """Consome um token por dimensão configurada; levanta RateLimited se algum bucket estiver vazio"""
+        if not RATE_LIMIT_ENABLED:
+            return
+        started = time.perf_counter()
+        itens = [
+            (dimensao, bucket_key(rota, dimensao, valores[dimensao]), rule)
+            for dimensao, rule in self.rules.get(rota, ())
+            if valores.get(dimensao)
+        ]
+        negado = None
+        if self.sql is not None:
+            try:
+                negado = await self.sql.take_many([(chave, rule) for _, chave, rule in itens])
+            except SQLAlchemyError:
+                logger.exception("Backend sql do rate limiting indisponível; usando memória")
+                with self._lock:
+                    self._backend_errors += 1
+                negado = self._take_memory(itens)
+        else:
+            negado = self._take_memory(itens)
+
+        with self._lock:
+            stats = self._stats.get(rota)
+            if stats is None:
+                stats = self._stats[rota] = _RouteStats()
+            self._checks += 1
+            self._check_seconds += time.perf_counter() - started
+            if negado is None:
+                stats.allowed += 1
+                return
+            stats.rejected += 1
+            dimensao = itens[negado[0]][0]
+            stats.by_dimension[dimensao] = stats.by_dimension.get(dimensao, 0) + 1
+        raise RateLimited(rota, dimensao, negado[1])
+
+    def _take_memory(self, itens) -> Optional[Tuple[int, int]]:
+        for indice, (_, chave, rule) in enumerate(itens):
+            retry_after = self.memory.take(chave, rule)
+            if retry_after is not None:
+                return indice, retry_after
+        return None
+
+    def metrics(self) -> dict:
+        with self._lock:
+            rotas = {
+                rota: {
+                    "allowed": s.allowed,
+                    "rejected": s.rejected,
+                    "rejected_by": dict(s.by_dimension),
+                }
+                for rota, s in self._stats.items()
+            }
+            return {
+                "enabled": RATE_LIMIT_ENABLED,
+                "backend": self.backend,
+                "backend_errors": self._backend_errors,
+                "check_ms_mean": round(self._check_seconds / self._checks * 1000, 3) if self._checks else 0,
+                "memory": self.memory.metrics(),
+                "routes": rotas,
+            }
+
+
+rate_limiter = RateLimiter()
@@ -1,7 +1,7 @@
 // frontend/src/components/AdvogadoPanel/index.tsx
 // Componentes React para Painel do Advogado
 
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'wouter';
 import { Button } from '@/components/ui/button';
 import { Card } from '@/components/ui/card';
@@ -341,7 +341,7 @@ export function AdvogadoDashboard() {
         headers: { 'Authorization': `Bearer ${token}` }
       });
       const leadsData = await leadsRes.json();
-      setLeads(leadsData);
+      setLeads(leadsData.leads || []);
     } catch (error) {
       console.error('Erro ao buscar dados:', error);
     } finally {
@@ -457,12 +457,88 @@ export function LeadDetail({ leadId }: { leadId: string }) {
   const [messages, setMessages] = useState<any[]>([]);
   const [newMessage, setNewMessage] = useState('');
   const [loading, setLoading] = useState(true);
+  // Cursor da mensagem mais recente recebida (since_cursor de /mensagens)
+  const sinceCursor = useRef<string | null>(null);
 
   useEffect(() => {
+    sinceCursor.current = null;
     fetchLead();
     fetchMessages();
   }, [leadId]);
 
+  // Eventos em tempo real (SSE) em vez de polling
+  useEffect(() => {
+    let source: EventSource | null = null;
+    let retry: ReturnType<typeof setTimeout> | null = null;
+    let closed = false;
+    let reconnecting = false;
+
+    // Reconexão (queda de rede ou fila do servidor cheia): o token de stream
+    // só vale para abrir a conexão, então cada tentativa pede um novo em vez
+    // da reconexão automática do EventSource
+    const scheduleReconnect = () => {
+      reconnecting = true;
+      if (!closed) retry = setTimeout(connect, 3000);
+    };
+
+    const connect = async () => {
+      try {
+        const res = await fetch('/api/auth/eventos/token', {
+          method: 'POST',
+          headers: { 'Authorization': `Bearer ${localStorage.getItem('token')}` }
+        });
+        if (!res.ok) throw new Error(`HTTP ${res.status}`);
+        const { token } = await res.json();
+        if (closed) return;
+        source = new EventSource(
+          `/api/auth/leads/${leadId}/eventos?token=${encodeURIComponent(token)}`
+        );
+      } catch (error) {
+        console.error('Erro ao abrir eventos:', error);
+        scheduleReconnect();
+        return;
+      }
+
+      source.onerror = () => {
+        source?.close();
+        scheduleReconnect();
+      };
+      // Recupera o que chegou enquanto o stream esteve fechado via ?since=
+      source.onopen = () => {
+        if (reconnecting) {
+          reconnecting = false;
+          fetchLead();
+          catchUpMessages();
+        }
+      };
+
+      source.addEventListener('mensagem', (e) => {
+        const { mensagem, cursor } = JSON.parse((e as MessageEvent).data);
+        if (cursor) sinceCursor.current = cursor;
+        setMessages((prev) =>
+          prev.some((m) => m.id === mensagem.id) ? prev : [...prev, mensagem]
+        );
+      });
+
+      source.addEventListener('leitura', (e) => {
+        const { tipo } = JSON.parse((e as MessageEvent).data);
+        setMessages((prev) => prev.map((m) => (m.tipo === tipo ? { ...m, lido: true } : m)));
+      });
+
+      source.addEventListener('lead_status', (e) => {
+        const { status } = JSON.parse((e as MessageEvent).data);
+        setLead((prev: any) => (prev ? { ...prev, status } : prev));
+      });
+    };
+
+    connect();
+    return () => {
+      closed = true;
+      if (retry) clearTimeout(retry);
+      source?.close();
+    };
+  }, [leadId]);
+
   const fetchLead = async () => {
     try {
       const token = localStorage.getItem('token');
@@ -478,19 +554,39 @@ export function LeadDetail({ leadId }: { leadId: string }) {
     }
   };
 
-  const fetchMessages = async () => {
+  const fetchMessages = async (since: string | null = null) => {
     try {
       const token = localStorage.getItem('token');
-      const res = await fetch(`/api/auth/leads/${leadId}/mensagens`, {
+      const query = since ? `?since=${encodeURIComponent(since)}` : '';
+      const res = await fetch(`/api/auth/leads/${leadId}/mensagens${query}`, {
         headers: { 'Authorization': `Bearer ${token}` }
       });
       const data = await res.json();
-      setMessages(data.mensagens || []);
+      const recebidas = data.mensagens || [];
+      if (data.since_cursor) sinceCursor.current = data.since_cursor;
+      if (since) {
+        setMessages((prev) => [
+          ...prev,
+          ...recebidas.filter((m: any) => !prev.some((p) => p.id === m.id))
+        ]);
+      } else {
+        setMessages(recebidas);
+      }
+      return data;
     } catch (error) {
       console.error('Erro ao buscar mensagens:', error);
+      return null;
     }
   };
 
+  // Catch-up após reconectar: ?since= pagina de `limit` em `limit`
+  const catchUpMessages = async () => {
+    let data;
+    do {
+      data = await fetchMessages(sinceCursor.current);
+    } while (data?.has_more && sinceCursor.current);
+  };
+
   const handleSendMessage = async (e: React.FormEvent) => {
     e.preventDefault();
     if (!newMessage.trim()) return;
@@ -510,7 +606,6 @@ export function LeadDetail({ leadId }: { leadId: string }) {
       });
 
       setNewMessage('');
-      fetchMessages();
     } catch (error) {
       console.error('Erro ao enviar mensagem:', error);
     }
@@ -0,0 +1,261 @@
+# backend/app/realtime.py
+# Canal de eventos em tempo real (Server-Sent Events) para o painel do advogado
+#
+# Eventos publicados:
+#   mensagem     -> nova mensagem em uma conversa
+#   leitura      -> mensagens marcadas como lidas
+#   lead_status  -> mudança de status de um lead
+#   lead_analisado -> análise automática concluída (worker de analysis.py)
+#   tarefa_lembrete -> tarefa vencendo (agendador de tarefas.py)
+#
+# Workers em outro processo (python -m app.workers) publicam com pg_notify no
+# canal REALTIME_PG_CHANNEL; PgEventBridge, iniciado no lifespan da API,
+# escuta o canal (LISTEN) e repassa ao broker local.
+
+import asyncio
+import json
+import logging
+import os
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Optional
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# CONFIGURAÇÕES
+# ============================================================================
+
+SSE_HEARTBEAT_SECONDS = int(os.getenv("SSE_HEARTBEAT_SECONDS", 15))
+SSE_RETRY_MS = int(os.getenv("SSE_RETRY_MS", 3000))
+SUBSCRIPTION_QUEUE_SIZE = int(os.getenv("SUBSCRIPTION_QUEUE_SIZE", 100))
+REALTIME_PG_CHANNEL = os.getenv("REALTIME_PG_CHANNEL", "painel_eventos")
+
+_CLOSED = object()
+
+
+def advogado_channel(advogado_id: str) -> str:
+    return f"advogado:{advogado_id}"
+
+def lead_channel(lead_id: str) -> str:
+    return f"lead:{lead_id}"
+
+
+# ============================================================================
+# PUB/SUB
+# ============================================================================
+
+class Subscription:
+    """
+    Fila de eventos de um assinante.
+    Se o cliente não consome rápido o suficiente a fila enche e a assinatura
+    é encerrada; o EventSource reconecta e recupera o histórico via `since=`.
+    """
+
+    def __init__(self, broker: "Broker", channels: tuple, maxsize: int = SUBSCRIPTION_QUEUE_SIZE):
+        self.broker = broker
+        self.channels = channels
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.closed = False
+
+    def deliver(self, event: dict):
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self._overflow()
+
+    def _overflow(self):
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(_CLOSED)
+        self.closed = True
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[dict]:
+        """Próximo evento; None se a assinatura foi encerrada"""
+        event = await asyncio.wait_for(self.queue.get(), timeout)
+        return None if event is _CLOSED else event
+
+    def close(self):
+        self.closed = True
+        self.broker.unsubscribe(self)
+
+
+class Broker(ABC):
+    """
+    Interface de pub/sub. A implementação em processo atende um único worker;
+    para múltiplos workers basta trocar por um broker externo
+    (Redis pub/sub, Postgres LISTEN/NOTIFY) com a mesma interface.
+    """
+
+    @abstractmethod
+    async def publish(self, channel: str, event: dict):
+        ...
+
+    @abstractmethod
+    def subscribe(self, *channels: str) -> Subscription:
+        ...
+
+    @abstractmethod
+    def unsubscribe(self, subscription: Subscription):
+        ...
+
+
+class InProcessBroker(Broker):
+    """Fan-out em memória: canal -> conjunto de assinaturas"""
+
+    def __init__(self):
+        self._channels = {}
+        self.published = 0
+        self.delivered = 0
+
+    async def publish(self, channel: str, event: dict):
+        self.published += 1
+        for subscription in list(self._channels.get(channel, ())):
+            subscription.deliver(event)
+            self.delivered += 1
+
+    def subscribe(self, *channels: str) -> Subscription:
+        subscription = Subscription(self, channels)
+        for channel in channels:
+            self._channels.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        for channel in subscription.channels:
+            subscribers = self._channels.get(channel)
+            if subscribers is None:
+                continue
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._channels[channel]
+
+    def metrics(self) -> dict:
+        return {
+            "channels": len(self._channels),
+            "subscriptions": sum(len(s) for s in self._channels.values()),
+            "published": self.published,
+            "delivered": self.delivered,
+        }
+
+
+broker = InProcessBroker()
+
+
+async def publish_lead_event(advogado_id: str, lead_id: str, event: dict):
+    """Publica um evento no canal do lead e no canal do advogado"""
+    event = {"lead_id": lead_id, **event}
+    await broker.publish(lead_channel(lead_id), event)
+    await broker.publish(advogado_channel(advogado_id), event)
+
+async def publish_advogado_event(advogado_id: str, event: dict):
+    """Publica um evento só no canal do advogado (ex.: lembrete de tarefa sem lead)"""
+    await broker.publish(advogado_channel(advogado_id), event)
+
+def publish_advogado_event_threadsafe(loop: asyncio.AbstractEventLoop, advogado_id: str, event: dict):
+    """Como publish_lead_event_threadsafe, para eventos do advogado"""
+    asyncio.run_coroutine_threadsafe(publish_advogado_event(advogado_id, event), loop)
+
+def publish_lead_event_threadsafe(loop: asyncio.AbstractEventLoop, advogado_id: str, lead_id: str, event: dict):
+    """
+    Publica a partir de uma thread de worker (sem event loop próprio):
+    agenda publish_lead_event no loop da API e não espera a entrega.
+    """
+    asyncio.run_coroutine_threadsafe(publish_lead_event(advogado_id, lead_id, event), loop)
+
+
+# ============================================================================
+# PONTE ENTRE PROCESSOS (Postgres LISTEN/NOTIFY)
+# ============================================================================
+
+def _pg_notify(session_factory, dados: dict):
+    payload = json.dumps(dados, default=str, ensure_ascii=False)
+    db = session_factory()
+    try:
+        db.execute(text("SELECT pg_notify(:canal, :payload)"), {"canal": REALTIME_PG_CHANNEL, "payload": payload})
+        db.commit()
+    finally:
+        db.close()
+
+def notify_lead_event_pg(session_factory, advogado_id: str, lead_id: str, event: dict):
+    """Notifier de worker fora do processo da API (mesma assinatura de publish_lead_event_threadsafe)"""
+    _pg_notify(session_factory, {"advogado_id": advogado_id, "lead_id": lead_id, "event": event})
+
+def notify_advogado_event_pg(session_factory, advogado_id: str, event: dict):
+    """Como notify_lead_event_pg, para eventos só do advogado"""
+    _pg_notify(session_factory, {"advogado_id": advogado_id, "event": event})
+
+
+class PgEventBridge:
+    """
+    Mantém uma conexão asyncpg com LISTEN em REALTIME_PG_CHANNEL e publica
+    no broker local cada notificação recebida. Uma conexão por processo da API.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._conn = None
+        self._driver = None
+        self._tasks = set()
+        self.received = 0
+
+    async def start(self):
+        self._conn = await self.engine.connect()
+        raw = await self._conn.get_raw_connection()
+        self._driver = raw.driver_connection
+        await self._driver.add_listener(REALTIME_PG_CHANNEL, self._on_notify)
+
+    def _on_notify(self, connection, pid, channel, payload):
+        try:
+            dados = json.loads(payload)
+        except ValueError:
+            logger.warning("Notificação inválida em %s: %r", channel, payload[:200])
+            return
+        self.received += 1
+        if dados.get("lead_id"):
+            coro = publish_lead_event(dados["advogado_id"], dados["lead_id"], dados["event"])
+        else:
+            coro = publish_advogado_event(dados["advogado_id"], dados["event"])
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def stop(self):
+        if self._driver is not None:
+            await self._driver.remove_listener(REALTIME_PG_CHANNEL, self._on_notify)
+            self._driver = None
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+
+
+# ============================================================================
+# SERVER-SENT EVENTS
+# ============================================================================
+
+def format_sse(event: dict) -> str:
+    """Serializa um evento no formato text/event-stream"""
+    data = json.dumps(event, default=str, ensure_ascii=False)
+    return f"event: {event.get('type', 'message')}\ndata: {data}\n\n"
+
+async def sse_stream(request, subscription: Subscription) -> AsyncIterator[str]:
+    """
+    Gera o corpo da resposta SSE até o cliente desconectar.
+    Envia um comentário de heartbeat periodicamente para manter proxies abertos
+    e detectar desconexões.
+    """
+    try:
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+        while not await request.is_disconnected():
+            try:
+                event = await subscription.get(timeout=SSE_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            if event is None:
+                break
+            yield format_sse(event)
+    finally:
+        subscription.close()
@@ -0,0 +1,459 @@
+# backend/app/search.py
+# Busca textual em leads (descrição), anotações e mensagens:
+# tsvector + GIN no Postgres (stemming português, sem acentos) e
+# índice invertido em Python como fallback (SQLite em testes/benchmarks)
+
+import asyncio
+import heapq
+import html
+import math
+import os
+import re
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import func, literal, literal_column, select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .matching import normalize
+from .models import Anotacao, Conversa, Lead, Mensagem
+
+# ============================================================================
+# CONFIGURAÇÕES
+# ============================================================================
+
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "auto")  # auto | postgres | python
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_OFFSET = int(os.getenv("SEARCH_MAX_OFFSET", 1000))  # busca ranqueada: páginas iniciais
+SEARCH_SNIPPET_WORDS = 24
+# Fallback: intervalo da verificação de leads removidos (arquivados, mesclados)
+SEARCH_FALLBACK_PRUNE_SECONDS = int(os.getenv("SEARCH_FALLBACK_PRUNE_SECONDS", 60))
+
+# Configuração de text search criada pela migração "busca" (portuguese + unaccent)
+SEARCH_CONFIG = "pt_unaccent"
+_REGCONFIG = literal_column(f"'{SEARCH_CONFIG}'::regconfig")
+
+# Marcadores do ts_headline; o trecho é escapado e os marcadores viram <mark>
+_SEL_INICIO, _SEL_FIM = "«§", "§»"
+_HEADLINE_OPTS = f"StartSel={_SEL_INICIO}, StopSel={_SEL_FIM}, MaxWords={SEARCH_SNIPPET_WORDS}, MinWords=8, MaxFragments=2"
+
+SEARCH_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    f"""
+    DO $$ BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = '{SEARCH_CONFIG}') THEN
+            CREATE TEXT SEARCH CONFIGURATION {SEARCH_CONFIG} (COPY = portuguese);
+            ALTER TEXT SEARCH CONFIGURATION {SEARCH_CONFIG}
+                ALTER MAPPING FOR hword, hword_part, word WITH unaccent, portuguese_stem;
+        END IF;
+    END $$
+    """,
+    # Colunas geradas: o Postgres mantém o tsvector a cada INSERT/UPDATE
+    f"""
+    ALTER TABLE leads ADD COLUMN IF NOT EXISTS busca tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(nome_cliente, '')), 'A') ||
+        setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(area_direito, '')), 'B') ||
+        setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(descricao_caso, '')), 'C')
+    ) STORED
+    """,
+    f"""
+    ALTER TABLE anotacoes ADD COLUMN IF NOT EXISTS busca tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(titulo, '')), 'A') ||
+        setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(conteudo, '')), 'C')
+    ) STORED
+    """,
+    f"""
+    ALTER TABLE mensagens ADD COLUMN IF NOT EXISTS busca tsvector GENERATED ALWAYS AS (
+        to_tsvector('{SEARCH_CONFIG}', coalesce(texto, ''))
+    ) STORED
+    """,
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_leads_busca ON leads USING gin (busca)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_anotacoes_busca ON anotacoes USING gin (busca)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_mensagens_busca ON mensagens USING gin (busca)",
+]
+
+
+@dataclass
+class SearchHit:
+    tipo: str  # lead | anotacao | mensagem
+    id: str
+    lead_id: str
+    rank: float
+    criado_em: Optional[datetime]
+    trecho: str = ""
+    nome_cliente: Optional[str] = None
+
+    def as_dict(self) -> dict:
+        return {
+            "tipo": self.tipo,
+            "id": self.id,
+            "lead_id": self.lead_id,
+            "nome_cliente": self.nome_cliente,
+            "rank": round(self.rank, 6),
+            "trecho": self.trecho,
+            "criado_em": self.criado_em,
+        }
+
+
+def use_postgres(db: AsyncSession) -> bool:
+    if SEARCH_BACKEND != "auto":
+        return SEARCH_BACKEND == "postgres"
+    return db.get_bind().dialect.name == "postgresql"
+
+
+# ============================================================================
+# POSTGRES (tsvector + GIN)
+# ============================================================================
+
+def _highlight_markers(trecho: Optional[str]) -> str:
+    escaped = html.escape(trecho or "")
+    return escaped.replace(html.escape(_SEL_INICIO), "<mark>").replace(html.escape(_SEL_FIM), "</mark>")
+
+async def search_postgres(db: AsyncSession, advogado_id: str, q: str, limit: int, offset: int) -> List[SearchHit]:
+    """
+    Uma query: UNION ALL das três fontes filtrando pelo índice GIN (@@),
+    ordenada por ts_rank_cd e paginada; ts_headline só roda nas linhas da página.
+    """
+    tsquery = func.websearch_to_tsquery(_REGCONFIG, q)
+    lead_busca = literal_column("leads.busca")
+    anotacao_busca = literal_column("anotacoes.busca")
+    mensagem_busca = literal_column("mensagens.busca")
+
+    leads = select(
+        literal("lead").label("tipo"), Lead.id.label("id"), Lead.id.label("lead_id"),
+        func.ts_rank_cd(lead_busca, tsquery).label("rank"), Lead.criado_em.label("criado_em"),
+        Lead.descricao_caso.label("texto"),
+    ).where(Lead.advogado_id == advogado_id, lead_busca.op("@@")(tsquery))
+
+    anotacoes = select(
+        literal("anotacao").label("tipo"), Anotacao.id.label("id"), Anotacao.lead_id.label("lead_id"),
+        func.ts_rank_cd(anotacao_busca, tsquery).label("rank"), Anotacao.criada_em.label("criado_em"),
+        Anotacao.conteudo.label("texto"),
+    ).where(Anotacao.advogado_id == advogado_id, anotacao_busca.op("@@")(tsquery))
+
+    mensagens = select(
+        literal("mensagem").label("tipo"), Mensagem.id.label("id"), Conversa.lead_id.label("lead_id"),
+        func.ts_rank_cd(mensagem_busca, tsquery).label("rank"), Mensagem.timestamp.label("criado_em"),
+        Mensagem.texto.label("texto"),
+    ).join(Conversa, Conversa.id == Mensagem.conversa_id).where(
+        Conversa.advogado_id == advogado_id, mensagem_busca.op("@@")(tsquery)
+    )
+
+    page = (
+        union_all(leads, anotacoes, mensagens)
+        .order_by(literal_column("rank").desc(), literal_column("id"))
+        .limit(limit)
+        .offset(offset)
+        .subquery("page")
+    )
+    result = await db.execute(
+        select(
+            page.c.tipo, page.c.id, page.c.lead_id, page.c.rank, page.c.criado_em, Lead.nome_cliente,
+            func.ts_headline(_REGCONFIG, page.c.texto, tsquery, _HEADLINE_OPTS).label("trecho"),
+        )
+        .join(Lead, Lead.id == page.c.lead_id)
+        .order_by(page.c.rank.desc(), page.c.id)
+    )
+    return [
+        SearchHit(
+            tipo=row.tipo, id=row.id, lead_id=row.lead_id, rank=float(row.rank),
+            criado_em=row.criado_em, trecho=_highlight_markers(row.trecho), nome_cliente=row.nome_cliente,
+        )
+        for row in result.all()
+    ]
+
+
+# ============================================================================
+# FALLBACK: ÍNDICE INVERTIDO EM PYTHON (BM25)
+# ============================================================================
+
+STOPWORDS = frozenset("""
+a ao aos as ate com como da das de dela dele do dos e ela ele em entre era essa esse esta este eu foi
+ha isso isto ja la mais mas me meu minha muito na nao nas nem no nos o os ou para pela pelo por que
+se sem ser seu sua sao so tem um uma uns umas voce
+""".split())
+
+# Sufixos (sem acento) do stemmer leve: plural -> sufixo derivacional -> vogal final
+PLURAIS = (("oes", "ao"), ("aes", "ao"), ("aos", "ao"), ("ais", "al"), ("eis", "el"), ("ns", "m"))
+SUFIXOS = (
+    "amento", "imento", "adora", "ador", "encia", "mente", "idade", "ismo", "ista", "ucao", "acao",
+    "oria", "orio", "aria", "ario", "avel", "ivel", "iva", "ivo", "eza", "ado", "ada", "ido", "ida",
+    "ao", "al", "el",
+)
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def stem(token: str) -> str:
+    """
+    Stemmer leve para português (aproxima o portuguese_stem do Postgres):
+    rescisão, rescisões, rescisória -> rescis. Mantém ao menos 3 letras.
+    """
+    for plural, singular in PLURAIS:
+        if token.endswith(plural) and len(token) > len(plural) + 2:
+            token = token[:-len(plural)] + singular
+            break
+    else:
+        if token.endswith("es") and len(token) > 4 and token[-3] in "rsz":
+            token = token[:-2]
+        elif token.endswith("s") and len(token) > 3:
+            token = token[:-1]
+    for sufixo in SUFIXOS:
+        if token.endswith(sufixo) and len(token) - len(sufixo) >= 3:
+            token = token[:-len(sufixo)]
+            break
+    if token[-1:] in ("a", "e", "o") and len(token) > 3:
+        token = token[:-1]
+    return token
+
+def tokenize(texto: Optional[str]) -> List[str]:
+    """Texto -> termos normalizados (sem acento, minúsculos, sem stopwords, com stem)"""
+    return [
+        stem(token)
+        for token in _TOKEN.findall(normalize(texto))
+        if token not in STOPWORDS and len(token) > 1
+    ]
+
+def highlight(texto: Optional[str], termos: Set[str], palavras: int = SEARCH_SNIPPET_WORDS) -> str:
+    """Trecho em volta do primeiro termo encontrado, escapado, com <mark> nos termos"""
+    texto = texto or ""
+    matches = list(_TOKEN.finditer(texto))
+    hits = [i for i, m in enumerate(matches) if stem(normalize(m.group())) in termos]
+    if not matches:
+        return ""
+    inicio = max(0, (hits[0] if hits else 0) - palavras // 3)
+    fim = min(len(matches), inicio + palavras)
+    hits = set(hits)
+
+    partes = []
+    cursor = matches[inicio].start()
+    for i in range(inicio, fim):
+        m = matches[i]
+        partes.append(html.escape(texto[cursor:m.start()]))
+        palavra = html.escape(m.group())
+        partes.append(f"<mark>{palavra}</mark>" if i in hits else palavra)
+        cursor = m.end()
+    prefixo = "... " if inicio > 0 else ""
+    sufixo = " ..." if fim < len(matches) else ""
+    return prefixo + "".join(partes) + sufixo
+
+
+class _FirmIndex:
+    """Postings de um advogado: termo -> {doc: frequência}"""
+
+    __slots__ = ("postings", "docs", "terms", "total_len")
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.docs: Dict[int, tuple] = {}  # doc -> (tipo, id, lead_id, criado_em, tamanho)
+        self.terms: Dict[int, Tuple[str, ...]] = {}  # doc -> termos distintos (para remoção)
+        self.total_len = 0
+
+
+class InvertedIndex:
+    """
+    Índice invertido em memória, particionado por advogado (a busca só
+    percorre os documentos do escritório), com ranking BM25.
+    Documentos são identificados por (tipo, id); add() substitui a versão anterior.
+    """
+
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self):
+        self._firms: Dict[str, _FirmIndex] = {}
+        self._keys: Dict[Tuple[str, str], Tuple[str, int]] = {}  # (tipo, id) -> (advogado, doc)
+        self._by_lead: Dict[str, Set[Tuple[str, str]]] = {}  # lead_id -> {(tipo, id)}
+        self._next_doc = 0
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, advogado_id: str, tipo: str, doc_id: str, lead_id: str,
+            criado_em: Optional[datetime], texto: Optional[str]):
+        self.remove(tipo, doc_id)
+        termos = tokenize(texto)
+        if not termos:
+            return
+        firm = self._firms.setdefault(advogado_id, _FirmIndex())
+        doc = self._next_doc
+        self._next_doc += 1
+
+        frequencias: Dict[str, int] = {}
+        for termo in termos:
+            frequencias[termo] = frequencias.get(termo, 0) + 1
+        for termo, tf in frequencias.items():
+            firm.postings.setdefault(termo, {})[doc] = tf
+        firm.docs[doc] = (tipo, doc_id, lead_id, criado_em, len(termos))
+        firm.terms[doc] = tuple(frequencias)
+        firm.total_len += len(termos)
+        self._keys[(tipo, doc_id)] = (advogado_id, doc)
+        self._by_lead.setdefault(lead_id, set()).add((tipo, doc_id))
+
+    def remove(self, tipo: str, doc_id: str):
+        entry = self._keys.pop((tipo, doc_id), None)
+        if entry is None:
+            return
+        advogado_id, doc = entry
+        firm = self._firms[advogado_id]
+        for termo in firm.terms.pop(doc, ()):
+            postings = firm.postings.get(termo)
+            if postings is not None:
+                postings.pop(doc, None)
+                if not postings:
+                    del firm.postings[termo]
+        _, _, lead_id, _, tamanho = firm.docs.pop(doc)
+        firm.total_len -= tamanho
+        chaves = self._by_lead.get(lead_id)
+        if chaves is not None:
+            chaves.discard((tipo, doc_id))
+            if not chaves:
+                del self._by_lead[lead_id]
+
+    def remove_lead(self, lead_id: str):
+        """Remove o lead e todos os documentos ligados a ele (anotações, mensagens)"""
+        for tipo, doc_id in list(self._by_lead.get(lead_id, ())):
+            self.remove(tipo, doc_id)
+
+    def search(self, advogado_id: str, q: str, limit: int, offset: int = 0) -> List[SearchHit]:
+        firm = self._firms.get(advogado_id)
+        termos = set(tokenize(q))
+        if firm is None or not termos or not firm.docs:
+            return []
+
+        n = len(firm.docs)
+        media = firm.total_len / n
+        scores: Dict[int, float] = {}
+        for termo in termos:
+            postings = firm.postings.get(termo)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc, tf in postings.items():
+                tamanho = firm.docs[doc][4]
+                peso = tf * (self.K1 + 1) / (tf + self.K1 * (1 - self.B + self.B * tamanho / media))
+                scores[doc] = scores.get(doc, 0.0) + idf * peso
+
+        top = heapq.nlargest(offset + limit, scores.items(), key=lambda item: (item[1], -item[0]))
+        hits = []
+        for doc, score in top[offset:]:
+            tipo, doc_id, lead_id, criado_em, _ = firm.docs[doc]
+            hits.append(SearchHit(tipo=tipo, id=doc_id, lead_id=lead_id, rank=score, criado_em=criado_em))
+        return hits
+
+    def metrics(self) -> dict:
+        return {
+            "documentos": len(self._keys),
+            "escritorios": len(self._firms),
+            "termos": sum(len(f.postings) for f in self._firms.values()),
+        }
+
+
+class DatabaseInvertedIndex(InvertedIndex):
+    """
+    InvertedIndex alimentado pelo banco: antes de cada busca aplica as linhas
+    criadas/alteradas desde a última carga (marca d'água por fonte).
+    Remoções não aparecem na marca d'água: a cada SEARCH_FALLBACK_PRUNE_SECONDS
+    os leads indexados que sumiram da tabela (arquivados, mesclados, removidos
+    por outro processo) saem do índice, e anotações/mensagens são recarregadas
+    para seguir os filhos que a mesclagem moveu para o lead que ficou.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._lock = asyncio.Lock()
+        self._watermarks: Dict[str, Optional[datetime]] = {"lead": None, "anotacao": None, "mensagem": None}
+        self._pruned_at = 0.0
+
+    async def _prune_removed(self, db: AsyncSession):
+        self._pruned_at = time.monotonic()
+        indexados = {lead_id for (tipo, lead_id) in self._keys if tipo == "lead"}
+        if not indexados:
+            return
+        existentes = set((await db.execute(select(Lead.id))).scalars().all())
+        removidos = indexados - existentes
+        for lead_id in removidos:
+            self.remove_lead(lead_id)
+        if removidos:
+            self._watermarks["anotacao"] = self._watermarks["mensagem"] = None
+
+    async def refresh(self, db: AsyncSession):
+        async with self._lock:
+            if time.monotonic() - self._pruned_at >= SEARCH_FALLBACK_PRUNE_SECONDS:
+                await self._prune_removed(db)
+            fontes = (
+                ("lead", Lead.atualizado_em, select(
+                    Lead.advogado_id, Lead.id, Lead.id, Lead.criado_em,
+                    Lead.nome_cliente, Lead.area_direito, Lead.descricao_caso, Lead.atualizado_em,
+                )),
+                ("anotacao", Anotacao.atualizada_em, select(
+                    Anotacao.advogado_id, Anotacao.id, Anotacao.lead_id, Anotacao.criada_em,
+                    Anotacao.titulo, Anotacao.conteudo, literal(""), Anotacao.atualizada_em,
+                )),
+                ("mensagem", Mensagem.timestamp, select(
+                    Conversa.advogado_id, Mensagem.id, Conversa.lead_id, Mensagem.timestamp,
+                    Mensagem.texto, literal(""), literal(""), Mensagem.timestamp,
+                ).join(Conversa, Conversa.id == Mensagem.conversa_id)),
+            )
+            for tipo, coluna, query in fontes:
+                watermark = self._watermarks[tipo]
+                if watermark is not None:
+                    # >=: linhas com o mesmo timestamp da marca são reaplicadas (add é idempotente)
+                    query = query.where(coluna >= watermark)
+                result = await db.stream(query.execution_options(yield_per=1000))
+                async for advogado_id, doc_id, lead_id, criado_em, t1, t2, t3, alterado in result:
+                    self.add(advogado_id, tipo, doc_id, lead_id, criado_em, " ".join(filter(None, (t1, t2, t3))))
+                    if alterado and (self._watermarks[tipo] is None or alterado > self._watermarks[tipo]):
+                        self._watermarks[tipo] = alterado
+
+
+search_index = DatabaseInvertedIndex()
+
+
+async def _attach_texts(db: AsyncSession, hits: List[SearchHit], q: str):
+    """Fallback: carrega texto e nome do cliente só das linhas da página e destaca os termos"""
+    if not hits:
+        return
+    termos = set(tokenize(q))
+    fontes = {
+        "lead": (Lead.id, Lead.descricao_caso),
+        "anotacao": (Anotacao.id, Anotacao.conteudo),
+        "mensagem": (Mensagem.id, Mensagem.texto),
+    }
+    textos = {}
+    for tipo, (id_col, texto_col) in fontes.items():
+        ids = [h.id for h in hits if h.tipo == tipo]
+        if ids:
+            result = await db.execute(select(id_col, texto_col).where(id_col.in_(ids)))
+            textos.update({(tipo, doc_id): texto for doc_id, texto in result.all()})
+
+    result = await db.execute(
+        select(Lead.id, Lead.nome_cliente).where(Lead.id.in_({h.lead_id for h in hits}))
+    )
+    nomes = dict(result.all())
+    for hit in hits:
+        hit.trecho = highlight(textos.get((hit.tipo, hit.id)), termos)
+        hit.nome_cliente = nomes.get(hit.lead_id)
+
+
+# ============================================================================
+# API
+# ============================================================================
+
+async def search(db: AsyncSession, advogado_id: str, q: str, limit: int = SEARCH_PAGE_SIZE,
+                 offset: int = 0) -> Tuple[List[SearchHit], bool]:
+    """Retorna (resultados da página, existe próxima página)"""
+    offset = max(0, min(offset, SEARCH_MAX_OFFSET))
+    postgres = use_postgres(db)
+    if postgres:
+        hits = await search_postgres(db, advogado_id, q, limit + 1, offset)
+    else:
+        await search_index.refresh(db)
+        hits = search_index.search(advogado_id, q, limit + 1, offset)
+
+    has_more = len(hits) > limit
+    hits = hits[:limit]
+    if not postgres:
+        await _attach_texts(db, hits, q)
+    return hits, has_more
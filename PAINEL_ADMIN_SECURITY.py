@@ -0,0 +1,275 @@
+# backend/app/security.py
+# Hash de senhas (bcrypt) fora do event loop, em pool limitado de threads,
+# e cache de tokens já verificados para get_current_user
+
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+
+import bcrypt
+from sqlalchemy import event
+
+from .models import User
+from .profiling import timed
+
+# ============================================================================
+# CONFIGURAÇÕES
+# ============================================================================
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+PASSWORD_POOL_WORKERS = int(os.getenv("PASSWORD_POOL_WORKERS", os.cpu_count() or 2))
+PASSWORD_POOL_MAX_QUEUE = int(os.getenv("PASSWORD_POOL_MAX_QUEUE", 64))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", 10000))
+PRINCIPAL_CACHE_TTL = int(os.getenv("PRINCIPAL_CACHE_TTL", 60))  # segundos
+
+
+class PasswordPoolSaturated(Exception):
+    """Pool de hash cheio: a requisição deve ser rejeitada (503)"""
+
+
+# ============================================================================
+# POOL DE HASH DE SENHAS
+# ============================================================================
+
+class PasswordHasher:
+    """
+    Executa bcrypt em um ThreadPoolExecutor dedicado.
+    O bcrypt libera o GIL, então o event loop continua atendendo
+    outras requisições enquanto o hash é calculado.
+
+    O número de tarefas pendentes (em execução + na fila) é limitado;
+    acima do limite a chamada falha imediatamente com PasswordPoolSaturated.
+    """
+
+    def __init__(self, rounds: int = BCRYPT_ROUNDS, workers: int = PASSWORD_POOL_WORKERS,
+                 max_queue: int = PASSWORD_POOL_MAX_QUEUE):
+        self.rounds = rounds
+        self.workers = workers
+        self.max_pending = workers + max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._completed = 0
+        self._rejected = 0
+        self._wait_total = 0.0
+        self._exec_total = 0.0
+
+    def _reserve(self):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._rejected += 1
+                raise PasswordPoolSaturated()
+            self._pending += 1
+
+    async def _submit(self, fn, *args):
+        self._reserve()
+        enqueued = time.perf_counter()
+
+        def job():
+            started = time.perf_counter()
+            with self._lock:
+                self._running += 1
+            try:
+                return fn(*args)
+            finally:
+                finished = time.perf_counter()
+                with self._lock:
+                    self._running -= 1
+                    self._completed += 1
+                    self._wait_total += started - enqueued
+                    self._exec_total += finished - started
+
+        def release(_future):
+            # Roda ao terminar o job ou ao cancelá-lo ainda na fila (cliente
+            # desconectou): job() nunca executa nesse caso, a vaga não pode vazar
+            with self._lock:
+                self._pending -= 1
+
+        try:
+            future = self._executor.submit(job)
+        except BaseException:
+            release(None)
+            raise
+        future.add_done_callback(release)
+        return await asyncio.wrap_future(future)
+
+    @timed("hash")
+    async def hash(self, password: str) -> str:
+        """Faz hash da senha com o custo configurado"""
+        return await self._submit(hash_password_sync, password, self.rounds)
+
+    @timed("hash")
+    async def verify(self, password: str, hashed: str) -> bool:
+        """Verifica senha contra o hash armazenado"""
+        return await self._submit(verify_password_sync, password, hashed)
+
+    def needs_rehash(self, hashed: str) -> bool:
+        """True se o hash foi gerado com custo diferente do configurado"""
+        return get_hash_rounds(hashed) != self.rounds
+
+    def metrics(self) -> dict:
+        """Profundidade de fila e tempos médios do pool"""
+        with self._lock:
+            completed = self._completed or 1
+            return {
+                "rounds": self.rounds,
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "in_flight": self._running,
+                "queue_depth": self._pending - self._running,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "avg_wait_ms": round(self._wait_total / completed * 1000, 2),
+                "avg_exec_ms": round(self._exec_total / completed * 1000, 2),
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+# ============================================================================
+# FUNÇÕES AUXILIARES (síncronas, executadas dentro do pool)
+# ============================================================================
+
+def hash_password_sync(password: str, rounds: int = BCRYPT_ROUNDS) -> str:
+    """Faz hash da senha com bcrypt"""
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds=rounds)).decode()
+
+def verify_password_sync(password: str, hashed: str) -> bool:
+    """Verifica senha com bcrypt"""
+    return bcrypt.checkpw(password.encode(), hashed.encode())
+
+def get_hash_rounds(hashed: str) -> Optional[int]:
+    """Extrai o custo de um hash bcrypt ($2b$12$...)"""
+    try:
+        return int(hashed.split("$")[2])
+    except (IndexError, ValueError):
+        return None
+
+
+# ============================================================================
+# CACHE DE PRINCIPAIS (TOKENS JÁ VERIFICADOS)
+# ============================================================================
+
+@dataclass(frozen=True)
+class Principal:
+    """
+    Snapshot imutável do usuário autenticado.
+    Independe da sessão SQLAlchemy, então pode ser compartilhado entre requisições.
+    """
+    id: str
+    email: str
+    full_name: str
+    is_active: bool
+    email_verified: bool
+
+    @classmethod
+    def from_user(cls, user: User) -> "Principal":
+        return cls(
+            id=user.id,
+            email=user.email,
+            full_name=user.full_name,
+            is_active=bool(user.is_active),
+            email_verified=bool(user.email_verified),
+        )
+
+
+class PrincipalCache:
+    """
+    Cache LRU com TTL de token -> Principal.
+
+    Cada entrada expira no menor valor entre o TTL configurado e o `exp` do JWT,
+    então um token expirado nunca é servido do cache. Um índice por subject
+    (email) permite invalidar todos os tokens de um usuário de uma vez.
+    """
+
+    def __init__(self, max_entries: int = PRINCIPAL_CACHE_SIZE, ttl: int = PRINCIPAL_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # token -> (principal, expires_at)
+        self._by_subject = {}  # email -> {token, ...}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+
+    def get(self, token: str) -> Optional[Principal]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self._misses += 1
+                return None
+            principal, expires_at = entry
+            if expires_at <= now:
+                self._remove(token)
+                self._misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self._hits += 1
+            return principal
+
+    def put(self, token: str, principal: Principal, token_exp: Optional[float] = None):
+        expires_at = time.time() + self.ttl
+        if token_exp is not None:
+            expires_at = min(expires_at, token_exp)
+        with self._lock:
+            if token in self._entries:
+                self._remove(token)
+            self._entries[token] = (principal, expires_at)
+            self._by_subject.setdefault(principal.email, set()).add(token)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+
+    def invalidate_subject(self, email: str):
+        """Remove todos os tokens cacheados de um usuário"""
+        with self._lock:
+            for token in list(self._by_subject.get(email, ())):
+                self._remove(token)
+            self._invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_subject.clear()
+
+    def _remove(self, token: str):
+        principal, _ = self._entries.pop(token)
+        tokens = self._by_subject.get(principal.email)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._by_subject[principal.email]
+
+    def metrics(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0,
+                "invalidations": self._invalidations,
+            }
+
+
+password_hasher = PasswordHasher()
+principal_cache = PrincipalCache()
+
+
+# Invalida o cache quando o usuário é desativado ou troca de senha,
+# independente de qual endpoint/script fez a alteração.
+@event.listens_for(User.is_active, "set")
+@event.listens_for(User.password_hash, "set")
+def _invalidate_principal(target, value, oldvalue, initiator):
+    if target.email and value != oldvalue:
+        principal_cache.invalidate_subject(target.email)
@@ -0,0 +1,199 @@
+# backend/app/stats.py
+# Estatísticas do dashboard: agregado único por status/área/urgência
+# e contadores incrementais por advogado (leitura O(1))
+
+import os
+from typing import Optional
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from .models import Lead, LeadArquivo, LeadContador
+
+# ============================================================================
+# CONFIGURAÇÕES
+# ============================================================================
+
+LEAD_COUNTERS_ENABLED = os.getenv("LEAD_COUNTERS_ENABLED", "true").lower() == "true"
+
+# Colunas de Lead contabilizadas no dashboard
+LEAD_COUNTER_DIMENSIONS = ("status", "area_direito", "urgencia")
+
+# Linha-marcador gravada pelo rebuild: sem ela os contadores do advogado
+# são considerados incompletos (ex.: leads criados antes da tabela existir)
+COUNTERS_READY_MARKER = "_inicializado"
+
+
+# ============================================================================
+# AGREGADO (fonte da verdade)
+# ============================================================================
+
+async def aggregate_lead_stats(db: AsyncSession, advogado_id: str) -> dict:
+    """
+    Conta os leads do advogado em uma única query
+    (GROUP BY status, area_direito, urgencia) e consolida as dimensões em Python.
+    O número de linhas retornadas depende só das combinações distintas, não do total de leads.
+    Casos arquivados (leads_arquivo) continuam contando: o dashboard é histórico.
+    """
+    rows = []
+    for model in (Lead, LeadArquivo):
+        result = await db.execute(
+            select(model.status, model.area_direito, model.urgencia, func.count(model.id))
+            .where(model.advogado_id == advogado_id)
+            .group_by(model.status, model.area_direito, model.urgencia)
+        )
+        rows.extend(result.all())
+
+    breakdown = {dimensao: {} for dimensao in LEAD_COUNTER_DIMENSIONS}
+    for status, area, urgencia, total in rows:
+        for dimensao, valor in zip(LEAD_COUNTER_DIMENSIONS, (status, area, urgencia)):
+            valor = valor or ""
+            breakdown[dimensao][valor] = breakdown[dimensao].get(valor, 0) + total
+    return breakdown
+
+
+# ============================================================================
+# CONTADORES INCREMENTAIS
+# ============================================================================
+
+def lead_counter_values(lead: Lead) -> dict:
+    """Valores atuais das dimensões contabilizadas de um lead"""
+    return {dimensao: getattr(lead, dimensao) or "" for dimensao in LEAD_COUNTER_DIMENSIONS}
+
+async def apply_lead_counters(db: AsyncSession, advogado_id: str, before: Optional[dict], after: Optional[dict]):
+    """
+    Atualiza os contadores para uma transição de lead (before -> after).
+    before=None para criação, after=None para remoção.
+    Executa na mesma transação da escrita do lead.
+    """
+    if not LEAD_COUNTERS_ENABLED:
+        return
+
+    deltas = {}
+    for dimensao in LEAD_COUNTER_DIMENSIONS:
+        old = before.get(dimensao) if before else None
+        new = after.get(dimensao) if after else None
+        if old == new:
+            continue
+        if old is not None:
+            deltas[(dimensao, old)] = deltas.get((dimensao, old), 0) - 1
+        if new is not None:
+            deltas[(dimensao, new)] = deltas.get((dimensao, new), 0) + 1
+
+    await apply_lead_counter_deltas(db, advogado_id, deltas)
+
+async def apply_lead_counter_deltas(db: AsyncSession, advogado_id: str, deltas: dict):
+    """
+    Aplica deltas já consolidados {(dimensao, valor): delta}.
+    Usado em escritas em lote: um upsert por valor distinto, não por lead.
+    """
+    if not LEAD_COUNTERS_ENABLED:
+        return
+
+    for (dimensao, valor), delta in deltas.items():
+        if delta:
+            await _upsert_counter(db, advogado_id, dimensao, valor, delta)
+
+def apply_lead_counter_deltas_sync(db: Session, advogado_id: str, deltas: dict):
+    """Versão de apply_lead_counter_deltas para workers com Session síncrona"""
+    if not LEAD_COUNTERS_ENABLED:
+        return
+
+    for (dimensao, valor), delta in deltas.items():
+        if delta:
+            db.execute(_counter_upsert(db, advogado_id, dimensao, valor, delta))
+
+async def _upsert_counter(db: AsyncSession, advogado_id: str, dimensao: str, valor: str, delta: int):
+    await db.execute(_counter_upsert(db, advogado_id, dimensao, valor, delta))
+
+def _counter_upsert(db, advogado_id: str, dimensao: str, valor: str, delta: int, replace: bool = False):
+    """
+    Incremento atômico (INSERT ... ON CONFLICT DO UPDATE) no dialeto da sessão;
+    replace=True grava o valor absoluto (rebuild)
+    """
+    dialect = sqlite if db.get_bind().dialect.name == "sqlite" else postgresql
+    stmt = dialect.insert(LeadContador).values(
+        advogado_id=advogado_id, dimensao=dimensao, valor=valor, total=delta
+    )
+    total = stmt.excluded.total if replace else LeadContador.total + stmt.excluded.total
+    return stmt.on_conflict_do_update(
+        index_elements=[LeadContador.advogado_id, LeadContador.dimensao, LeadContador.valor],
+        set_={"total": total, "atualizado_em": func.now()},
+    )
+
+async def read_lead_counters(db: AsyncSession, advogado_id: str) -> Optional[dict]:
+    """Lê os contadores do advogado; None se ainda não foram inicializados"""
+    result = await db.execute(
+        select(LeadContador.dimensao, LeadContador.valor, LeadContador.total)
+        .where(LeadContador.advogado_id == advogado_id)
+    )
+    rows = result.all()
+
+    breakdown = {dimensao: {} for dimensao in LEAD_COUNTER_DIMENSIONS}
+    ready = False
+    for dimensao, valor, total in rows:
+        if dimensao == COUNTERS_READY_MARKER:
+            ready = True
+        elif dimensao in breakdown and total > 0:
+            breakdown[dimensao][valor] = total
+    return breakdown if ready else None
+
+async def rebuild_lead_counters(db: AsyncSession, advogado_id: str) -> dict:
+    """
+    Recalcula os contadores do advogado a partir do agregado (backfill/reparo).
+    No Postgres, rebuilds simultâneos do mesmo advogado (ex.: dois primeiros
+    acessos ao dashboard) são serializados por advisory lock da transação e o
+    segundo reaproveita o resultado do primeiro. As linhas são gravadas com
+    upsert, então um apply_lead_counters concorrente não gera conflito de PK.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        await db.execute(select(func.pg_advisory_xact_lock(func.hashtext(f"lead_contadores:{advogado_id}"))))
+        pronto = await read_lead_counters(db, advogado_id)
+        if pronto is not None:
+            await db.commit()
+            return pronto
+
+    breakdown = await aggregate_lead_stats(db, advogado_id)
+    await db.execute(delete(LeadContador).where(LeadContador.advogado_id == advogado_id))
+    linhas = [(dimensao, valor, total) for dimensao, valores in breakdown.items() for valor, total in valores.items()]
+    linhas.append((COUNTERS_READY_MARKER, "", 1))
+    for dimensao, valor, total in linhas:
+        await db.execute(_counter_upsert(db, advogado_id, dimensao, valor, total, replace=True))
+    await db.commit()
+    return breakdown
+
+
+# ============================================================================
+# DASHBOARD
+# ============================================================================
+
+async def get_lead_stats(db: AsyncSession, advogado_id: str) -> dict:
+    """
+    Estatísticas do dashboard.
+    Com contadores habilitados é uma leitura indexada de poucas linhas;
+    caso contrário (ou no primeiro acesso) usa o agregado único.
+    """
+    breakdown = None
+    if LEAD_COUNTERS_ENABLED:
+        breakdown = await read_lead_counters(db, advogado_id)
+        if breakdown is None:
+            breakdown = await rebuild_lead_counters(db, advogado_id)
+    else:
+        breakdown = await aggregate_lead_stats(db, advogado_id)
+
+    por_status = breakdown["status"]
+    total_leads = sum(por_status.values())
+    leads_fechados = por_status.get("fechado", 0)
+
+    return {
+        "total_leads": total_leads,
+        "leads_novos": por_status.get("novo", 0),
+        "leads_em_andamento": por_status.get("em_andamento", 0),
+        "leads_fechados": leads_fechados,
+        "taxa_conversao": (leads_fechados / total_leads * 100) if total_leads > 0 else 0,
+        "por_status": por_status,
+        "por_area": breakdown["area_direito"],
+        "por_urgencia": breakdown["urgencia"]
+    }
@@ -0,0 +1,339 @@
+# backend/app/tarefas.py
+# Agendador de lembretes de tarefas: heap com as próximas tarefas a vencer,
+# carregado por varredura de intervalo no índice (concluida, data_vencimento)
+#
+# Uso:
+#   python -m app.tarefas                 # agendador em processo dedicado
+#
+# Normalmente sobe junto com os demais workers (lifespan da API ou
+# python -m app.workers, ver workers.py); os lembretes também chegam ao painel via SSE.
+
+import heapq
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from html import escape
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import select, tuple_, update
+from sqlalchemy.orm import Session
+
+from .email_outbox import enqueue_email
+from .models import Tarefa, User
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# CONFIGURAÇÕES
+# ============================================================================
+
+TAREFA_LEMBRETE_ANTECEDENCIA = int(os.getenv("TAREFA_LEMBRETE_ANTECEDENCIA", 60))  # minutos antes do vencimento
+TAREFA_HORIZONTE_SECONDS = int(os.getenv("TAREFA_HORIZONTE_SECONDS", 900))  # janela mantida no heap
+TAREFA_RESCAN_SECONDS = int(os.getenv("TAREFA_RESCAN_SECONDS", 60))
+TAREFA_LOAD_BATCH = int(os.getenv("TAREFA_LOAD_BATCH", 1000))
+# Tarefas vencidas há mais que isso não recebem lembrete: sem o limite, a primeira
+# varredura (deploy, tabela antiga) enviaria email de todas as tarefas atrasadas
+TAREFA_ATRASO_MAX_MINUTOS = int(os.getenv("TAREFA_ATRASO_MAX_MINUTOS", 24 * 60))
+TAREFA_FIRE_BATCH = int(os.getenv("TAREFA_FIRE_BATCH", 200))
+TAREFA_EMAIL_ENABLED = os.getenv("TAREFA_EMAIL_ENABLED", "true").lower() == "true"
+TAREFA_PAINEL_URL = os.getenv("TAREFA_PAINEL_URL", "https://seu-dominio.com/painel/tarefas")
+
+
+def lembrete_em(data_vencimento: datetime) -> datetime:
+    """Momento do lembrete: TAREFA_LEMBRETE_ANTECEDENCIA minutos antes do vencimento"""
+    return data_vencimento - timedelta(minutes=TAREFA_LEMBRETE_ANTECEDENCIA)
+
+def vencimento_minimo() -> datetime:
+    """Vencimento mais antigo que ainda recebe lembrete (TAREFA_ATRASO_MAX_MINUTOS)"""
+    return datetime.utcnow() - timedelta(minutes=TAREFA_ATRASO_MAX_MINUTOS)
+
+
+def reminder_email(nome: str, titulo: str, data_vencimento: datetime) -> str:
+    return f"""
+    <h2>Lembrete de tarefa</h2>
+    <p>Olá, {escape(nome or '')}.</p>
+    <p>A tarefa <strong>{escape(titulo)}</strong> vence em {data_vencimento:%d/%m/%Y %H:%M} (UTC).</p>
+    <a href="{TAREFA_PAINEL_URL}">Abrir tarefas</a>
+    """
+
+
+# ============================================================================
+# AGENDADOR
+# ============================================================================
+
+class TarefaScheduler:
+    """
+    Mantém em um min-heap só as tarefas cujo lembrete cai na janela
+    [agora, agora + TAREFA_HORIZONTE_SECONDS]; o resto da tabela fica no banco.
+
+    - Carga: a cada TAREFA_RESCAN_SECONDS, uma varredura keyset no índice
+      parcial (concluida, data_vencimento) WHERE lembrete_enviado_em IS NULL.
+      Tarefas já lembradas saem do índice, então a varredura lê só a janela,
+      não as centenas de milhares de tarefas abertas. Tarefas vencidas há mais
+      de TAREFA_ATRASO_MAX_MINUTOS ficam de fora (nada de rajada de emails
+      atrasados no primeiro start).
+    - Espera: a thread dorme até o próximo lembrete ou a próxima varredura
+      (Event.wait), sem polling; `reschedule` acorda a thread se a tarefa
+      nova vence antes da cabeça do heap.
+    - Disparo: reivindica as tarefas com FOR UPDATE SKIP LOCKED, confere que
+      o vencimento é o mesmo que foi agendado, marca lembrete_enviado_em e
+      enfileira o email na outbox na mesma transação. Após um restart o heap
+      é reconstruído do banco: nada enviado é repetido e nada pendente é perdido.
+    - Entradas obsoletas (tarefa reagendada/concluída) são descartadas de forma
+      preguiçosa ao sair do heap.
+    """
+
+    def __init__(self):
+        self.session_factory = None
+        self.notifier: Optional[Callable[[str, dict], None]] = None
+        self._heap: List[tuple] = []  # (lembrete_em, tarefa_id, data_vencimento)
+        self._agendadas: Dict[str, datetime] = {}  # tarefa_id -> data_vencimento agendado
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._next_scan = 0.0
+        self._loaded = 0
+        self._fired = 0
+        self._stale = 0
+        self._scans = 0
+        self._last_scan_ms = 0.0
+        self._lag_ms_total = 0.0
+        self._lag_ms_max = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    # --- heap --------------------------------------------------------------
+
+    def _push(self, tarefa_id: str, data_vencimento: datetime) -> bool:
+        """Agenda (ou reagenda) uma tarefa; chamar com self._lock"""
+        if self._agendadas.get(tarefa_id) == data_vencimento:
+            return False
+        self._agendadas[tarefa_id] = data_vencimento
+        heapq.heappush(self._heap, (lembrete_em(data_vencimento), tarefa_id, data_vencimento))
+        return True
+
+    def reschedule(self, tarefa_id: str, data_vencimento: Optional[datetime], ativa: bool = True):
+        """
+        Chamado pelos endpoints após criar/alterar/concluir/remover uma tarefa.
+        Só antecipa o que a próxima varredura faria; sem agendador no processo é no-op.
+        """
+        if not self.running:
+            return
+        with self._lock:
+            if not ativa or data_vencimento is None or data_vencimento < vencimento_minimo():
+                self._agendadas.pop(tarefa_id, None)
+                return
+            if lembrete_em(data_vencimento) > datetime.utcnow() + timedelta(seconds=TAREFA_HORIZONTE_SECONDS):
+                self._agendadas.pop(tarefa_id, None)  # fora da janela: a varredura carrega depois
+                return
+            cabeca = self._heap[0][0] if self._heap else None
+            if self._push(tarefa_id, data_vencimento) and (cabeca is None or lembrete_em(data_vencimento) < cabeca):
+                self._wake.set()
+
+    def scan(self, db: Session) -> int:
+        """
+        Carrega no heap as tarefas sem lembrete cujo lembrete cai até o fim da
+        janela, a partir de vencimento_minimo() (atrasadas demais são ignoradas)
+        """
+        started = time.perf_counter()
+        limite = datetime.utcnow() + timedelta(
+            seconds=TAREFA_HORIZONTE_SECONDS, minutes=TAREFA_LEMBRETE_ANTECEDENCIA
+        )
+        minimo = vencimento_minimo()
+        carregadas = 0
+        cursor = None
+        vistos = set()
+        while True:
+            query = select(Tarefa.id, Tarefa.data_vencimento).where(
+                Tarefa.concluida.is_(False),
+                Tarefa.lembrete_enviado_em.is_(None),
+                Tarefa.data_vencimento >= minimo,
+                Tarefa.data_vencimento <= limite,
+            )
+            if cursor is not None:
+                query = query.where(tuple_(Tarefa.data_vencimento, Tarefa.id) > tuple_(*cursor))
+            rows = db.execute(
+                query.order_by(Tarefa.data_vencimento, Tarefa.id).limit(TAREFA_LOAD_BATCH)
+            ).all()
+            if not rows:
+                break
+            with self._lock:
+                for tarefa_id, data_vencimento in rows:
+                    vistos.add(tarefa_id)
+                    if self._push(tarefa_id, data_vencimento):
+                        carregadas += 1
+            cursor = tuple(rows[-1])
+        db.commit()
+
+        # Tarefas agendadas que sumiram da janela (concluídas, removidas, adiadas)
+        with self._lock:
+            for tarefa_id in [t for t in self._agendadas if t not in vistos]:
+                del self._agendadas[tarefa_id]
+            self._loaded += carregadas
+            self._scans += 1
+            self._last_scan_ms = (time.perf_counter() - started) * 1000
+        return carregadas
+
+    def _pop_due(self, agora: datetime) -> Dict[str, datetime]:
+        """Retira do heap os lembretes vencidos (até TAREFA_FIRE_BATCH), descartando obsoletos"""
+        devidos = {}
+        with self._lock:
+            while self._heap and self._heap[0][0] <= agora and len(devidos) < TAREFA_FIRE_BATCH:
+                quando, tarefa_id, data_vencimento = heapq.heappop(self._heap)
+                if self._agendadas.get(tarefa_id) != data_vencimento:
+                    self._stale += 1
+                    continue
+                del self._agendadas[tarefa_id]
+                devidos[tarefa_id] = data_vencimento
+                lag = (agora - quando).total_seconds() * 1000
+                self._lag_ms_total += lag
+                self._lag_ms_max = max(self._lag_ms_max, lag)
+        return devidos
+
+    def fire(self, db: Session, devidos: Dict[str, datetime]) -> int:
+        """Marca e enfileira os lembretes em uma transação; retorna quantos foram enviados"""
+        if not devidos:
+            return 0
+        agora = datetime.utcnow()
+        rows = db.execute(
+            select(Tarefa.id, Tarefa.advogado_id, Tarefa.lead_id, Tarefa.titulo, Tarefa.prioridade,
+                   Tarefa.data_vencimento, User.email, User.full_name)
+            .join(User, User.id == Tarefa.advogado_id)
+            .where(
+                Tarefa.id.in_(devidos.keys()),
+                Tarefa.concluida.is_(False),
+                Tarefa.lembrete_enviado_em.is_(None),
+            )
+            .with_for_update(of=Tarefa, skip_locked=True)
+        ).all()
+        # Vencimento diferente do agendado: a tarefa foi adiada, a varredura reagenda
+        rows = [row for row in rows if row.data_vencimento == devidos[row.id]]
+        if not rows:
+            db.commit()
+            return 0
+
+        db.execute(
+            update(Tarefa)
+            .where(Tarefa.id.in_([row.id for row in rows]), Tarefa.lembrete_enviado_em.is_(None))
+            .values(lembrete_enviado_em=agora)
+        )
+        if TAREFA_EMAIL_ENABLED:
+            for row in rows:
+                enqueue_email(db, row.email, f"Lembrete: {row.titulo}",
+                              reminder_email(row.full_name, row.titulo, row.data_vencimento))
+        db.commit()
+
+        if self.notifier is not None:
+            for row in rows:
+                try:
+                    self.notifier(row.advogado_id, {
+                        "type": "tarefa_lembrete",
+                        "tarefa_id": row.id,
+                        "lead_id": row.lead_id,
+                        "titulo": row.titulo,
+                        "prioridade": row.prioridade,
+                        "data_vencimento": row.data_vencimento,
+                    })
+                except Exception:
+                    logger.exception("Falha ao notificar lembrete da tarefa %s", row.id)
+
+        with self._lock:
+            self._fired += len(rows)
+        return len(rows)
+
+    # --- ciclo -------------------------------------------------------------
+
+    def run_once(self) -> float:
+        """Varre se for a hora, dispara os lembretes vencidos; retorna quanto pode dormir"""
+        if time.monotonic() >= self._next_scan:
+            db = self.session_factory()
+            try:
+                self.scan(db)
+            finally:
+                db.close()
+            self._next_scan = time.monotonic() + TAREFA_RESCAN_SECONDS
+
+        while True:
+            devidos = self._pop_due(datetime.utcnow())
+            if not devidos:
+                break
+            db = self.session_factory()
+            try:
+                self.fire(db, devidos)
+            finally:
+                db.close()
+
+        espera = self._next_scan - time.monotonic()
+        with self._lock:
+            if self._heap:
+                espera = min(espera, (self._heap[0][0] - datetime.utcnow()).total_seconds())
+        return max(espera, 0.0)
+
+    def run_forever(self):
+        while not self._stop.is_set():
+            try:
+                espera = self.run_once()
+            except Exception:
+                logger.exception("Erro no agendador de tarefas")
+                espera = TAREFA_RESCAN_SECONDS
+            self._wake.wait(espera)
+            self._wake.clear()
+
+    def start(self, session_factory, notifier: Optional[Callable[[str, dict], None]] = None) -> threading.Thread:
+        """Roda o agendador em uma thread daemon (para uso dentro do processo da API)"""
+        self.session_factory = session_factory
+        self.notifier = notifier
+        self._stop.clear()
+        self._next_scan = 0.0
+        self._thread = threading.Thread(target=self.run_forever, name="tarefas", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    # --- métricas ----------------------------------------------------------
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "running": self.running,
+                "heap": len(self._heap),
+                "scheduled": len(self._agendadas),
+                "next_reminder": self._heap[0][0] if self._heap else None,
+                "loaded": self._loaded,
+                "fired": self._fired,
+                "stale_discarded": self._stale,
+                "scans": self._scans,
+                "last_scan_ms": round(self._last_scan_ms, 2),
+                "lag_ms_mean": round(self._lag_ms_total / self._fired, 1) if self._fired else 0,
+                "lag_ms_max": round(self._lag_ms_max, 1),
+            }
+
+
+tarefa_scheduler = TarefaScheduler()
+
+
+if __name__ == "__main__":
+    import functools
+
+    from .database import SessionLocal, engine
+    from .realtime import notify_advogado_event_pg
+
+    logging.basicConfig(level=logging.INFO)
+    tarefa_scheduler.session_factory = SessionLocal
+    if engine.dialect.name == "postgresql":
+        tarefa_scheduler.notifier = functools.partial(notify_advogado_event_pg, SessionLocal)
+    try:
+        tarefa_scheduler.run_forever()
+    except KeyboardInterrupt:
+        tarefa_scheduler.stop()
@@ -0,0 +1,724 @@
+# backend/app/webhooks.py
+# Webhooks do advogado: outbox transacional (webhook_eventos) e dispatcher
+# assíncrono com cliente HTTP em pool, lotes por URL, retry e fila de mortos
+#
+# Uso:
+#   python -m app.webhooks                # dispatcher em processo dedicado
+#
+# Teste local com um receptor de mentira (verifica a assinatura e responde 200;
+# --falhas 0.2 devolve 503 em 20% das entregas para exercitar o retry):
+#   python -m app.webhooks receptor --porta 9000 --segredo <segredo> [--falhas 0.2]
+#   WEBHOOK_ALLOW_HTTP=true WEBHOOK_ALLOW_PRIVATE=true python -m app.webhooks
+#
+# Em testes sem rede, o dispatcher aceita um transporte httpx:
+#   WebhookDispatcher(SessionLocal, transport=httpx.MockTransport(handler))
+
+import argparse
+import asyncio
+import hashlib
+import hmac
+import ipaddress
+import json
+import logging
+import os
+import random
+import secrets
+import socket
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from sqlalchemy import and_, bindparam, delete, func, insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import Webhook, WebhookEvento, decrypt_data, gen_uuid
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# CONFIGURAÇÕES
+# ============================================================================
+
+WEBHOOK_EVENTOS = ("lead.criado", "lead.atualizado", "lead.mesclado", "mensagem.criada")
+WEBHOOK_MAX_POR_ADVOGADO = int(os.getenv("WEBHOOK_MAX_POR_ADVOGADO", 10))
+WEBHOOK_ALLOW_HTTP = os.getenv("WEBHOOK_ALLOW_HTTP", "false").lower() == "true"  # só para testes locais
+# Destinos em loopback/rede interna (só para testes locais com o receptor)
+WEBHOOK_ALLOW_PRIVATE = os.getenv("WEBHOOK_ALLOW_PRIVATE", "false").lower() == "true"
+
+WEBHOOK_REGISTRY_TTL = float(os.getenv("WEBHOOK_REGISTRY_TTL", 30))  # segundos
+WEBHOOK_REGISTRY_MAX = int(os.getenv("WEBHOOK_REGISTRY_MAX", 10000))
+
+WEBHOOK_CLAIM_BATCH = int(os.getenv("WEBHOOK_CLAIM_BATCH", 1000))  # eventos reivindicados por ciclo
+WEBHOOK_MAX_EVENTS_PER_POST = int(os.getenv("WEBHOOK_MAX_EVENTS_PER_POST", 100))
+WEBHOOK_MAX_CONCORRENCIA = int(os.getenv("WEBHOOK_MAX_CONCORRENCIA", 16))  # teto por host de destino
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", 200))  # pool total
+WEBHOOK_TIMEOUT = float(os.getenv("WEBHOOK_TIMEOUT", 10))
+WEBHOOK_POLL_SECONDS = float(os.getenv("WEBHOOK_POLL_SECONDS", 1))
+WEBHOOK_LEASE_SECONDS = int(os.getenv("WEBHOOK_LEASE_SECONDS", 120))
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", 8))
+WEBHOOK_BACKOFF_BASE = float(os.getenv("WEBHOOK_BACKOFF_BASE", 10))  # segundos
+WEBHOOK_BACKOFF_MAX = float(os.getenv("WEBHOOK_BACKOFF_MAX", 3600))
+WEBHOOK_SIGNATURE_TOLERANCE = int(os.getenv("WEBHOOK_SIGNATURE_TOLERANCE", 300))  # segundos
+WEBHOOK_RETENTION_DAYS = int(os.getenv("WEBHOOK_RETENTION_DAYS", 7))  # eventos entregues
+WEBHOOK_PURGE_SECONDS = int(os.getenv("WEBHOOK_PURGE_SECONDS", 3600))
+WEBHOOK_PURGE_BATCH = int(os.getenv("WEBHOOK_PURGE_BATCH", 5000))
+
+SIGNATURE_HEADER = "X-Advocacia-Assinatura"
+DELIVERY_HEADER = "X-Advocacia-Entrega"
+USER_AGENT = "Advocacia.AI-Webhooks/1.0"
+
+# Snapshot de um evento reivindicado: não depende da sessão
+_Entrega = namedtuple("_Entrega", "id webhook_id url segredo max_concorrencia payload tentativas")
+
+# 4xx que valem nova tentativa; os demais 4xx vão direto para a fila de mortos
+RETRYABLE_STATUS = {408, 409, 425, 429}
+
+
+# ============================================================================
+# VALIDAÇÃO E ASSINATURA
+# ============================================================================
+
+def validate_webhook_url(url: str) -> str:
+    """URL absoluta https (http só com WEBHOOK_ALLOW_HTTP); ValueError se inválida"""
+    url = (url or "").strip()
+    partes = urlparse(url)
+    esquemas = ("https", "http") if WEBHOOK_ALLOW_HTTP else ("https",)
+    if partes.scheme not in esquemas or not partes.netloc or len(url) > 500:
+        raise ValueError("URL do webhook deve ser https:// absoluta (até 500 caracteres)")
+    if not partes.hostname:
+        raise ValueError("URL do webhook sem host")
+    return url
+
+def _endereco_interno(ip) -> bool:
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return (ip.is_loopback or ip.is_private or ip.is_link_local or ip.is_reserved
+            or ip.is_multicast or ip.is_unspecified or not ip.is_global)
+
+class WebhookDestinoBloqueado(ValueError):
+    """Host do webhook resolve para loopback/rede interna (SSRF)"""
+
+
+async def resolve_webhook_host(host: str, porta: int) -> List[str]:
+    """
+    Endereços do host, recusando (WebhookDestinoBloqueado) se algum for de
+    loopback, rede privada, link-local, reservado, multicast ou não
+    especificado. Falha de DNS sobe como OSError.
+    """
+    try:
+        enderecos = [ipaddress.ip_address(host)]
+    except ValueError:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, porta, type=socket.SOCK_STREAM)
+        enderecos = [ipaddress.ip_address(info[4][0].split("%", 1)[0]) for info in infos]
+    if not enderecos or (not WEBHOOK_ALLOW_PRIVATE and any(_endereco_interno(ip) for ip in enderecos)):
+        raise WebhookDestinoBloqueado("URL do webhook aponta para um endereço interno")
+    return [str(ip) for ip in dict.fromkeys(enderecos)]
+
+async def check_webhook_destination(url: str):
+    """
+    Validação no cadastro (ValueError/OSError, ver resolve_webhook_host).
+    Na entrega o dispatcher resolve de novo e conecta no endereço validado
+    (_PinnedNetworkBackend), então trocar o DNS depois do cadastro não
+    leva o POST para dentro da rede.
+    """
+    partes = urlparse(url)
+    await resolve_webhook_host(partes.hostname, partes.port or (443 if partes.scheme == "https" else 80))
+
+
+class _PinnedNetworkBackend:
+    """
+    Backend de rede do httpcore que resolve o host, valida os endereços e
+    conecta no IP validado. O TLS (SNI e certificado) e o cabeçalho Host
+    continuam usando o nome da URL: o httpcore os monta a partir da
+    requisição, não do endereço conectado. Fecha a janela de DNS rebinding
+    entre validar e conectar. Sem redirecionamentos (follow_redirects=False).
+    """
+
+    def __init__(self):
+        import httpcore
+
+        self._backend = httpcore.AnyIOBackend()
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        erro = None
+        for ip in await resolve_webhook_host(host, port):
+            try:
+                return await self._backend.connect_tcp(
+                    ip, port, timeout=timeout, local_address=local_address, socket_options=socket_options,
+                )
+            except Exception as e:  # próximo endereço (ex.: IPv6 sem rota)
+                erro = e
+        raise erro
+
+    async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        raise WebhookDestinoBloqueado("Webhooks não conectam em sockets unix")
+
+    async def sleep(self, seconds: float):
+        await self._backend.sleep(seconds)
+
+
+def pinned_transport(limits):
+    """Transporte httpx das entregas: o pool de conexões usa _PinnedNetworkBackend"""
+    import httpcore
+    import httpx
+
+    transport = httpx.AsyncHTTPTransport(limits=limits)
+    # O AsyncHTTPTransport não expõe o backend de rede; o pool é o mesmo que
+    # ele montaria, com o backend que fixa o IP validado
+    transport._pool = httpcore.AsyncConnectionPool(
+        ssl_context=httpx.create_ssl_context(),
+        max_connections=limits.max_connections,
+        max_keepalive_connections=limits.max_keepalive_connections,
+        keepalive_expiry=limits.keepalive_expiry,
+        network_backend=_PinnedNetworkBackend(),
+    )
+    return transport
+
+def destination_host(url: str) -> str:
+    """Host normalizado (esquema://host:porta) que agrupa a concorrência no dispatcher"""
+    partes = urlparse(url)
+    porta = partes.port or (443 if partes.scheme == "https" else 80)
+    return f"{partes.scheme}://{(partes.hostname or '').lower()}:{porta}"
+
+def validate_eventos(eventos: List[str]) -> List[str]:
+    desconhecidos = sorted(set(eventos) - set(WEBHOOK_EVENTOS))
+    if not eventos or desconhecidos:
+        raise ValueError(f"Eventos válidos: {', '.join(WEBHOOK_EVENTOS)}")
+    return sorted(set(eventos))
+
+def new_webhook_secret() -> str:
+    return "whsec_" + secrets.token_urlsafe(32)
+
+def sign_payload(segredo: str, corpo: bytes, timestamp: Optional[int] = None) -> str:
+    """Cabeçalho de assinatura: t=<epoch>,v1=<HMAC-SHA256(segredo, "<t>." + corpo)>"""
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    digest = hmac.new(segredo.encode(), f"{timestamp}.".encode() + corpo, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={digest}"
+
+def verify_signature(segredo: str, corpo: bytes, header: Optional[str],
+                     tolerancia: int = WEBHOOK_SIGNATURE_TOLERANCE) -> bool:
+    """Verificação do lado do receptor (tempo constante, rejeita replays fora da tolerância)"""
+    try:
+        campos = dict(parte.split("=", 1) for parte in (header or "").split(","))
+        timestamp = int(campos["t"])
+    except (ValueError, KeyError):
+        return False
+    if abs(time.time() - timestamp) > tolerancia:
+        return False
+    esperado = sign_payload(segredo, corpo, timestamp).split("v1=", 1)[1]
+    return hmac.compare_digest(esperado, campos.get("v1", ""))
+
+
+# ============================================================================
+# REGISTRO (cache das assinaturas por advogado)
+# ============================================================================
+
+class WebhookRegistry:
+    """
+    Webhooks de cada advogado em memória por WEBHOOK_REGISTRY_TTL segundos
+    (LRU limitado), para que enfileirar um evento não custe uma consulta por
+    requisição. A API invalida a entrada do advogado ao criar/remover um
+    webhook; em outras instâncias a mudança aparece em até TTL segundos.
+    """
+
+    def __init__(self, ttl: float = WEBHOOK_REGISTRY_TTL, max_entries: int = WEBHOOK_REGISTRY_MAX):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # advogado_id -> (expira_em, [(webhook_id, eventos)])
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    async def subscriptions(self, db: AsyncSession, advogado_id: str) -> List[Tuple[str, frozenset]]:
+        agora = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(advogado_id)
+            if entry is not None and entry[0] > agora:
+                self._entries.move_to_end(advogado_id)
+                self._hits += 1
+                return entry[1]
+            self._misses += 1
+
+        result = await db.execute(
+            select(Webhook.id, Webhook.eventos).where(Webhook.advogado_id == advogado_id)
+        )
+        inscricoes = [(webhook_id, frozenset(eventos or ())) for webhook_id, eventos in result.all()]
+
+        with self._lock:
+            self._entries[advogado_id] = (agora + self.ttl, inscricoes)
+            self._entries.move_to_end(advogado_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return inscricoes
+
+    def invalidate(self, advogado_id: str):
+        with self._lock:
+            self._entries.pop(advogado_id, None)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / total, 4) if total else 0,
+            }
+
+
+webhook_registry = WebhookRegistry()
+
+
+# ============================================================================
+# ENFILEIRAMENTO (usado pelos endpoints)
+# ============================================================================
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+async def enqueue_webhook_event(db: AsyncSession, advogado_id: str, evento: str, dados: dict) -> int:
+    """
+    Registra o evento na outbox para cada webhook do advogado inscrito nele.
+    Não faz I/O de rede (o commit fica a cargo do chamador, junto com a
+    operação); sem webhooks inscritos custa só a consulta ao registro em memória.
+    Retorna quantas entregas foram enfileiradas.
+    """
+    return await enqueue_webhook_events(db, advogado_id, evento, [dados])
+
+async def enqueue_webhook_events(db: AsyncSession, advogado_id: str, evento: str, lista: List[dict]) -> int:
+    """Versão em lote (importação): uma consulta ao registro e um INSERT executemany"""
+    alvos = [
+        webhook_id for webhook_id, eventos in await webhook_registry.subscriptions(db, advogado_id)
+        if evento in eventos
+    ]
+    if not alvos or not lista:
+        return 0
+
+    agora = datetime.utcnow()
+    rows = []
+    for dados in lista:
+        for webhook_id in alvos:
+            evento_id = gen_uuid()
+            payload = json.dumps(
+                {"id": evento_id, "evento": evento, "criado_em": agora, "dados": dados},
+                default=_json_default, ensure_ascii=False, separators=(",", ":"),
+            )
+            rows.append({
+                "id": evento_id, "webhook_id": webhook_id, "evento": evento,
+                "payload": payload, "proxima_tentativa": agora,
+            })
+    await db.execute(insert(WebhookEvento), rows)
+    return len(rows)
+
+async def webhook_status_counts(db: AsyncSession) -> dict:
+    """Quantidade de eventos por status (uma query agregada)"""
+    result = await db.execute(
+        select(WebhookEvento.status, func.count(WebhookEvento.id)).group_by(WebhookEvento.status)
+    )
+    return {status: total for status, total in result.all()}
+
+
+# ============================================================================
+# DISPATCHER
+# ============================================================================
+
+def backoff_delay(tentativas: int) -> float:
+    """Backoff exponencial com jitter: base * 2^(n-1), limitado a WEBHOOK_BACKOFF_MAX"""
+    delay = min(WEBHOOK_BACKOFF_BASE * (2 ** max(tentativas - 1, 0)), WEBHOOK_BACKOFF_MAX)
+    return delay * random.uniform(0.5, 1.5)
+
+def batch_body(itens: List[_Entrega]) -> bytes:
+    """Corpo de um POST: {"eventos": [envelope, ...]} montado dos JSON já serializados"""
+    return ('{"eventos":[' + ",".join(item.payload for item in itens) + "]}").encode()
+
+def _retry_after(valor: Optional[str]) -> float:
+    try:
+        return max(float(valor), 0.0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class WebhookDispatcher:
+    """
+    Entrega a outbox de webhooks:
+    1. reivindica até `batch_size` eventos com FOR UPDATE SKIP LOCKED e marca
+       como "enviando" com um lease (vários dispatchers podem rodar em paralelo);
+    2. agrupa os eventos por webhook e divide em POSTs de até
+       WEBHOOK_MAX_EVENTS_PER_POST eventos, assinados com HMAC;
+    3. envia pelo httpx.AsyncClient compartilhado (keep-alive, até
+       WEBHOOK_MAX_CONNECTIONS conexões), com no máximo `max_concorrencia`
+       POSTs simultâneos por webhook e WEBHOOK_MAX_CONCORRENCIA por host de
+       destino (webhooks de advogados diferentes podem apontar para o mesmo
+       receptor); cada conexão nova vai para um IP validado contra SSRF;
+    4. grava o resultado: enviado, nova tentativa com backoff (respeitando
+       Retry-After) ou "falhou" (fila de mortos) após WEBHOOK_MAX_ATTEMPTS
+       tentativas ou resposta 4xx definitiva.
+    O acesso ao banco usa a Session síncrona em threads (asyncio.to_thread);
+    o laço de eventos fica livre para as requisições HTTP.
+    """
+
+    def __init__(self, session_factory, batch_size: int = WEBHOOK_CLAIM_BATCH,
+                 max_per_post: int = WEBHOOK_MAX_EVENTS_PER_POST,
+                 poll_interval: float = WEBHOOK_POLL_SECONDS, transport=None):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.max_per_post = max_per_post
+        self.poll_interval = poll_interval
+        self.transport = transport
+        self._semaforos: Dict[str, asyncio.Semaphore] = {}  # webhook_id -> max_concorrencia
+        self._semaforos_host: Dict[str, asyncio.Semaphore] = {}  # host -> WEBHOOK_MAX_CONCORRENCIA
+        self._segredos: Dict[bytes, str] = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._attempted = 0
+        self._delivered = 0
+        self._retried = 0
+        self._failed = 0
+        self._posts = 0
+        self._batches = 0
+        self._last_batch_size = 0
+        self._last_batch_ms = 0.0
+        self._last_purge = 0.0
+        self._started_at = time.monotonic()
+
+    # --- banco (executado em thread) ---------------------------------------
+
+    def _segredo(self, segredo_encrypted: bytes) -> str:
+        segredo = self._segredos.get(segredo_encrypted)
+        if segredo is None:
+            segredo = self._segredos[segredo_encrypted] = decrypt_data(segredo_encrypted)
+        return segredo
+
+    def _claim(self) -> List[_Entrega]:
+        db = self.session_factory()
+        try:
+            agora = datetime.utcnow()
+            rows = db.execute(
+                select(
+                    WebhookEvento.id, WebhookEvento.webhook_id, WebhookEvento.payload, WebhookEvento.tentativas,
+                    Webhook.url, Webhook.segredo_encrypted, Webhook.max_concorrencia,
+                )
+                .join(Webhook, Webhook.id == WebhookEvento.webhook_id)
+                .where(
+                    or_(WebhookEvento.status == "pendente", WebhookEvento.status == "enviando"),
+                    WebhookEvento.proxima_tentativa <= agora,
+                )
+                .order_by(WebhookEvento.proxima_tentativa)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True, of=WebhookEvento)
+            ).all()
+            if not rows:
+                db.commit()
+                return []
+
+            # A tentativa conta no claim: um lote que derruba o dispatcher volta
+            # pelo lease expirado e esgota WEBHOOK_MAX_ATTEMPTS em vez de repetir para sempre
+            esgotados = [row.id for row in rows if row.tentativas >= WEBHOOK_MAX_ATTEMPTS]
+            rows = [row for row in rows if row.tentativas < WEBHOOK_MAX_ATTEMPTS]
+            if esgotados:
+                db.execute(
+                    update(WebhookEvento)
+                    .where(WebhookEvento.id.in_(esgotados))
+                    .values(status="falhou", ultimo_erro="Lease expirado na última tentativa")
+                )
+                logger.error("Webhooks: %d eventos na fila de mortos por lease expirado", len(esgotados))
+                with self._lock:
+                    self._failed += len(esgotados)
+            if rows:
+                db.execute(
+                    update(WebhookEvento)
+                    .where(WebhookEvento.id.in_([row.id for row in rows]))
+                    .values(
+                        status="enviando",
+                        tentativas=WebhookEvento.tentativas + 1,
+                        proxima_tentativa=agora + timedelta(seconds=WEBHOOK_LEASE_SECONDS),
+                    )
+                )
+            db.commit()
+            return [
+                _Entrega(row.id, row.webhook_id, row.url, self._segredo(row.segredo_encrypted),
+                         row.max_concorrencia, row.payload, row.tentativas + 1)
+                for row in rows
+            ]
+        finally:
+            db.close()
+
+    def _finish(self, enviados: List[str], falhas: List[dict]):
+        db = self.session_factory()
+        try:
+            if enviados:
+                db.execute(
+                    update(WebhookEvento)
+                    .where(WebhookEvento.id.in_(enviados))
+                    .values(status="enviado", enviado_em=datetime.utcnow(), ultimo_erro=None)
+                )
+            if falhas:
+                table = WebhookEvento.__table__
+                db.execute(
+                    update(table)
+                    .where(table.c.id == bindparam("b_id"))
+                    .values(
+                        status=bindparam("b_status"),
+                        tentativas=bindparam("b_tentativas"),
+                        proxima_tentativa=bindparam("b_proxima"),
+                        ultimo_erro=bindparam("b_erro"),
+                    ),
+                    falhas,
+                )
+            db.commit()
+        finally:
+            db.close()
+
+    def _purge(self) -> int:
+        """
+        Remove um lote de eventos entregues há mais de WEBHOOK_RETENTION_DAYS
+        dias e os eventos de webhooks que não existem mais
+        """
+        db = self.session_factory()
+        try:
+            limite = datetime.utcnow() - timedelta(days=WEBHOOK_RETENTION_DAYS)
+            orfao = ~select(Webhook.id).where(Webhook.id == WebhookEvento.webhook_id).exists()
+            ids = select(WebhookEvento.id).where(
+                or_(and_(WebhookEvento.status == "enviado", WebhookEvento.enviado_em < limite), orfao)
+            ).limit(WEBHOOK_PURGE_BATCH)
+            removidos = db.execute(delete(WebhookEvento).where(WebhookEvento.id.in_(ids))).rowcount
+            db.commit()
+            return removidos
+        finally:
+            db.close()
+
+    # --- HTTP --------------------------------------------------------------
+
+    def _client(self):
+        import httpx
+
+        limits = httpx.Limits(
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            max_keepalive_connections=WEBHOOK_MAX_CONNECTIONS,
+        )
+        return httpx.AsyncClient(
+            transport=self.transport or pinned_transport(limits),
+            timeout=httpx.Timeout(WEBHOOK_TIMEOUT),
+            headers={"User-Agent": USER_AGENT, "Content-Type": "application/json"},
+            follow_redirects=False,
+            trust_env=False,  # um HTTP(S)_PROXY do ambiente contornaria o transporte
+        )
+
+    def _semaforo(self, item: _Entrega) -> asyncio.Semaphore:
+        semaforo = self._semaforos.get(item.webhook_id)
+        if semaforo is None:
+            limite = max(1, min(item.max_concorrencia or 1, WEBHOOK_MAX_CONCORRENCIA))
+            semaforo = self._semaforos[item.webhook_id] = asyncio.Semaphore(limite)
+        return semaforo
+
+    def _semaforo_host(self, item: _Entrega) -> asyncio.Semaphore:
+        host = destination_host(item.url)
+        semaforo = self._semaforos_host.get(host)
+        if semaforo is None:
+            semaforo = self._semaforos_host[host] = asyncio.Semaphore(max(1, WEBHOOK_MAX_CONCORRENCIA))
+        return semaforo
+
+    async def _post(self, client, itens: List[_Entrega]) -> Tuple[Optional[str], bool, float]:
+        """Entrega um lote; retorna (erro ou None, definitivo, Retry-After em segundos)"""
+        corpo = batch_body(itens)
+        headers = {SIGNATURE_HEADER: sign_payload(itens[0].segredo, corpo), DELIVERY_HEADER: itens[0].id}
+        async with self._semaforo(itens[0]), self._semaforo_host(itens[0]):
+            try:
+                response = await client.post(itens[0].url, content=corpo, headers=headers)
+            except WebhookDestinoBloqueado as e:
+                return str(e), True, 0.0
+            except Exception as e:
+                return f"{type(e).__name__}: {e}"[:1000], False, 0.0
+        if response.status_code < 300:
+            return None, False, 0.0
+        definitivo = 400 <= response.status_code < 500 and response.status_code not in RETRYABLE_STATUS
+        return f"HTTP {response.status_code}", definitivo, _retry_after(response.headers.get("Retry-After"))
+
+    # --- ciclo -------------------------------------------------------------
+
+    def _lotes(self, itens: List[_Entrega]) -> List[List[_Entrega]]:
+        """Eventos agrupados por webhook (ordem de chegada) em lotes de até max_per_post"""
+        por_webhook: Dict[str, List[_Entrega]] = {}
+        for item in itens:
+            por_webhook.setdefault(item.webhook_id, []).append(item)
+        return [
+            eventos[i:i + self.max_per_post]
+            for eventos in por_webhook.values()
+            for i in range(0, len(eventos), self.max_per_post)
+        ]
+
+    async def run_once(self, client) -> int:
+        """Processa um lote; retorna quantos eventos foram tentados"""
+        started = time.perf_counter()
+        itens = await asyncio.to_thread(self._claim)
+        if not itens:
+            return 0
+
+        lotes = self._lotes(itens)
+        resultados = await asyncio.gather(*(self._post(client, lote) for lote in lotes))
+
+        agora = datetime.utcnow()
+        enviados, falhas = [], []
+        retried = failed = 0
+        for lote, (erro, definitivo, retry_after) in zip(lotes, resultados):
+            if erro is None:
+                enviados.extend(item.id for item in lote)
+                continue
+            mortos = 0
+            for item in lote:
+                tentativas = item.tentativas  # já contada em _claim
+                morto = definitivo or tentativas >= WEBHOOK_MAX_ATTEMPTS
+                mortos += morto
+                espera = max(backoff_delay(tentativas), retry_after)
+                falhas.append({
+                    "b_id": item.id,
+                    "b_status": "falhou" if morto else "pendente",
+                    "b_tentativas": tentativas,
+                    "b_proxima": agora + timedelta(seconds=espera),
+                    "b_erro": erro,
+                })
+            failed += mortos
+            retried += len(lote) - mortos
+            if mortos:
+                logger.error("Webhook %s: %d eventos na fila de mortos: %s", lote[0].webhook_id, mortos, erro)
+
+        await asyncio.to_thread(self._finish, enviados, falhas)
+
+        with self._lock:
+            self._attempted += len(itens)
+            self._delivered += len(enviados)
+            self._retried += retried
+            self._failed += failed
+            self._posts += len(lotes)
+            self._batches += 1
+            self._last_batch_size = len(itens)
+            self._last_batch_ms = (time.perf_counter() - started) * 1000
+        return len(itens)
+
+    async def run(self):
+        """Laço do dispatcher; o cliente HTTP (e suas conexões) vive o laço inteiro"""
+        async with self._client() as client:
+            while not self._stop.is_set():
+                try:
+                    processed = await self.run_once(client)
+                    if time.monotonic() - self._last_purge > WEBHOOK_PURGE_SECONDS:
+                        self._last_purge = time.monotonic()
+                        await asyncio.to_thread(self._purge)
+                except Exception:
+                    logger.exception("Erro no dispatcher de webhooks")
+                    processed = 0
+                # Lote cheio: provavelmente há mais na fila, não espera
+                if processed < self.batch_size:
+                    await asyncio.sleep(self.poll_interval)
+
+    def run_forever(self):
+        asyncio.run(self.run())
+
+    def start(self) -> threading.Thread:
+        """Roda o dispatcher com seu próprio laço de eventos em uma thread daemon"""
+        self._thread = threading.Thread(target=self.run_forever, name="webhooks", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    # --- métricas ----------------------------------------------------------
+
+    def metrics(self) -> dict:
+        with self._lock:
+            elapsed = time.monotonic() - self._started_at
+            return {
+                "attempted": self._attempted,
+                "delivered": self._delivered,
+                "retried": self._retried,
+                "failed": self._failed,
+                "posts": self._posts,
+                "batches": self._batches,
+                "events_per_post": round(self._attempted / self._posts, 2) if self._posts else 0,
+                "last_batch_size": self._last_batch_size,
+                "last_batch_ms": round(self._last_batch_ms, 2),
+                "throughput_per_sec": round(self._delivered / elapsed, 2) if elapsed else 0,
+            }
+
+
+# ============================================================================
+# FILA DE MORTOS (usado pelos endpoints)
+# ============================================================================
+
+async def requeue_failed(db: AsyncSession, webhook_id: str) -> int:
+    """Devolve os eventos "falhou" do webhook para a fila, com tentativas zeradas"""
+    result = await db.execute(
+        update(WebhookEvento)
+        .where(WebhookEvento.webhook_id == webhook_id, WebhookEvento.status == "falhou")
+        .values(status="pendente", tentativas=0, proxima_tentativa=datetime.utcnow())
+    )
+    return result.rowcount
+
+
+# ============================================================================
+# RECEPTOR LOCAL (testes)
+# ============================================================================
+
+def run_receiver(porta: int, segredo: str, falhas: float = 0.0):
+    """Servidor HTTP mínimo que valida a assinatura e conta os eventos recebidos"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    contagem = {"posts": 0, "eventos": 0, "rejeitados": 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            corpo = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if not verify_signature(segredo, corpo, self.headers.get(SIGNATURE_HEADER)):
+                status = 401
+            elif random.random() < falhas:
+                status = 503
+            else:
+                status = 200
+            with lock:
+                if status == 200:
+                    contagem["posts"] += 1
+                    contagem["eventos"] += len(json.loads(corpo)["eventos"])
+                else:
+                    contagem["rejeitados"] += 1
+                resumo = dict(contagem)
+            self.send_response(status)
+            self.end_headers()
+            logger.info("%s %s", status, resumo)
+
+        def log_message(self, *args):
+            pass
+
+    logger.info("Receptor de webhooks em http://localhost:%d", porta)
+    ThreadingHTTPServer(("", porta), Handler).serve_forever()
+
+
+if __name__ == "__main__":
+    from .database import SessionLocal
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Dispatcher de webhooks do Painel do Advogado")
+    sub = parser.add_subparsers(dest="comando")
+    receptor = sub.add_parser("receptor", help="receptor HTTP local para testes")
+    receptor.add_argument("--porta", type=int, default=9000)
+    receptor.add_argument("--segredo", required=True)
+    receptor.add_argument("--falhas", type=float, default=0.0)
+    args = parser.parse_args()
+
+    if args.comando == "receptor":
+        run_receiver(args.porta, args.segredo, args.falhas)
+    else:
+        dispatcher = WebhookDispatcher(SessionLocal)
+        try:
+            dispatcher.run_forever()
+        except KeyboardInterrupt:
+            dispatcher.stop()
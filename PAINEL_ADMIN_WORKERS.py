@@ -0,0 +1,140 @@
+# backend/app/workers.py
+# Workers de fundo do painel: análise IA (analysis.py), outbox de email
+# (email_outbox.py), lembretes de tarefas (tarefas.py) e webhooks (webhooks.py)
+#
+# Uso:
+#   # main.py: os workers sobem e descem junto com a API
+#   app = FastAPI(title="Advocacia.AI API", lifespan=lifespan)
+#
+#   # ou em processo dedicado (API com WORKERS_IN_API=false):
+#   python -m app.workers
+#
+# Todos reivindicam trabalho com FOR UPDATE SKIP LOCKED, então é seguro
+# rodá-los em vários processos ao mesmo tempo (vários workers do uvicorn).
+# No Postgres os eventos SSE dos workers passam por pg_notify e chegam a
+# todos os processos da API (realtime.PgEventBridge).
+
+import asyncio
+import functools
+import logging
+import os
+import signal
+import threading
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, Optional
+
+from .analysis import AnalysisWorker
+from .database import SessionLocal, async_engine, engine
+from .email_outbox import OutboxWorker
+from .realtime import (
+    PgEventBridge, notify_advogado_event_pg, notify_lead_event_pg,
+    publish_advogado_event_threadsafe, publish_lead_event_threadsafe,
+)
+from .tarefas import tarefa_scheduler
+from .webhooks import WebhookDispatcher
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# CONFIGURAÇÕES
+# ============================================================================
+
+WORKERS_IN_API = os.getenv("WORKERS_IN_API", "true").lower() == "true"
+WORKERS_ENABLED = tuple(
+    w.strip() for w in os.getenv("WORKERS_ENABLED", "analise,email,tarefas,webhooks").split(",") if w.strip()
+)
+
+
+# ============================================================================
+# WORKERS
+# ============================================================================
+
+class BackgroundWorkers:
+    """Sobe e derruba, na ordem, os workers habilitados em WORKERS_ENABLED"""
+
+    def __init__(self, session_factory, enabled: tuple = WORKERS_ENABLED):
+        self.session_factory = session_factory
+        self.enabled = enabled
+        self._workers: Dict[str, object] = {}
+
+    def start(self, lead_notifier: Optional[Callable] = None, advogado_notifier: Optional[Callable] = None):
+        if "analise" in self.enabled:
+            self._workers["analise"] = AnalysisWorker(self.session_factory, notifier=lead_notifier)
+            self._workers["analise"].start()
+        if "email" in self.enabled:
+            self._workers["email"] = OutboxWorker(self.session_factory)
+            self._workers["email"].start()
+        if "tarefas" in self.enabled:
+            tarefa_scheduler.start(self.session_factory, notifier=advogado_notifier)
+            self._workers["tarefas"] = tarefa_scheduler
+        if "webhooks" in self.enabled:
+            self._workers["webhooks"] = WebhookDispatcher(self.session_factory)
+            self._workers["webhooks"].start()
+        logger.info("Workers iniciados: %s", ", ".join(self._workers) or "nenhum")
+
+    def stop(self):
+        for nome, worker in reversed(list(self._workers.items())):
+            try:
+                worker.stop()
+            except Exception:
+                logger.exception("Falha ao parar o worker %s", nome)
+        self._workers.clear()
+
+    def metrics(self) -> dict:
+        return {nome: worker.metrics() for nome, worker in self._workers.items()}
+
+
+background_workers = BackgroundWorkers(SessionLocal)
+
+
+def _notifiers(loop: Optional[asyncio.AbstractEventLoop]) -> tuple:
+    """
+    (lead_notifier, advogado_notifier) dos workers: pg_notify no Postgres
+    (chega a todos os processos da API); sem Postgres, o broker do próprio
+    processo quando há um loop da API, senão nenhum
+    """
+    if engine.dialect.name == "postgresql":
+        return (functools.partial(notify_lead_event_pg, SessionLocal),
+                functools.partial(notify_advogado_event_pg, SessionLocal))
+    if loop is not None:
+        return (functools.partial(publish_lead_event_threadsafe, loop),
+                functools.partial(publish_advogado_event_threadsafe, loop))
+    return None, None
+
+
+# ============================================================================
+# LIFESPAN DA API
+# ============================================================================
+
+@asynccontextmanager
+async def lifespan(app):
+    """
+    Lifespan do FastAPI: ponte LISTEN/NOTIFY (Postgres) e, com
+    WORKERS_IN_API, os workers em threads do processo da API
+    """
+    bridge = None
+    if async_engine.dialect.name == "postgresql":
+        bridge = PgEventBridge(async_engine)
+        await bridge.start()
+    if WORKERS_IN_API:
+        background_workers.start(*_notifiers(asyncio.get_running_loop()))
+    try:
+        yield
+    finally:
+        if WORKERS_IN_API:
+            await asyncio.to_thread(background_workers.stop)
+        if bridge is not None:
+            await bridge.stop()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parar = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: parar.set())
+    background_workers.start(*_notifiers(None))
+    try:
+        parar.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        background_workers.stop()